@@ -0,0 +1,117 @@
+"""Time the columnar transaction snapshot against scanning SQL.
+
+Seeds ``--rows`` lines of ``qb_transactions`` for one client in a throwaway
+SQLite file (same generator as ``bench_sheets``), then reports:
+
+1. a full snapshot build and a ``load`` (maps the files)
+2. sum by (account, month) from the snapshot vs ``GROUP BY`` in SQL
+3. an incremental refresh after ``--changed`` lines were replaced, the way
+   the daily sync rewrites changed transactions
+
+    python benchmarks/bench_columnar.py --rows 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _best(fn, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return round(best * 1000, 2)
+
+
+def _replace_lines(cid: int, count: int) -> None:
+    """Delete ``count`` lines and insert them again as new rows, bumping the data version."""
+    from qb_app import data_version
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cols = ("client_auth_id, TxnId, DocNumber, TxnType, TxnDate, LineAmount, AccountName, AccountId, Class, "
+            "Customer, Vendor, Description")
+    cur.execute(f"SELECT TOP {int(count)} id, {cols} FROM qb_transactions WHERE client_auth_id = ? ORDER BY id", (cid,))
+    rows = cur.fetchall()
+    cur.executemany("DELETE FROM qb_transactions WHERE id = ?", [(r[0],) for r in rows])
+    cur.executemany(f"INSERT INTO qb_transactions ({cols}) VALUES ({', '.join(['?'] * 12)})", [r[1:] for r in rows])
+    data_version.bump(cur, cid)
+    conn.commit()
+    conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark qb_app.columnar_cache")
+    p.add_argument("--rows", type=int, default=500_000)
+    p.add_argument("--changed", type=int, default=2_000)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench_columnar_")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tmp, "columnar.sqlite3")
+    os.environ["COLUMNAR_CACHE_DIR"] = os.path.join(tmp, "columnar")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from bench_sheets import _seed
+    from qb_app import columnar_cache, data_version
+    from qb_app.db import get_connection
+
+    t0 = time.perf_counter()
+    cid = _seed(args.rows, args.seed)
+    conn = get_connection()
+    data_version.bump(conn.cursor(), cid)
+    conn.commit()
+    seed_s = round(time.perf_counter() - t0, 2)
+
+    build = columnar_cache.refresh(conn, cid)
+    load_ms = _best(lambda: columnar_cache._open(cid, columnar_cache.read_meta(cid)))
+    snap = columnar_cache.load(conn, cid)
+    sql = ("SELECT AccountName, DATEFROMPARTS(YEAR(TxnDate), MONTH(TxnDate), 1), SUM(LineAmount) "
+           "FROM qb_transactions WHERE client_auth_id = ? AND TxnDate IS NOT NULL "
+           "GROUP BY AccountName, DATEFROMPARTS(YEAR(TxnDate), MONTH(TxnDate), 1)")
+
+    def _sql():
+        cur = conn.cursor()
+        cur.execute(sql, (cid,))
+        return cur.fetchall()
+
+    groups = len(snap.group_sum(("account", "month"))[0])
+    scans = {
+        "snapshot sum by account, month": _best(lambda: snap.group_sum(("account", "month"))),
+        "SQL GROUP BY account, month": _best(_sql),
+        "snapshot sum by class, filtered": _best(
+            lambda: snap.group_sum(("class",), snap.mask(exclude_types=("Deposit",), vendor=["Vendor 1", "Vendor 2"]))),
+    }
+    _replace_lines(cid, args.changed)
+    incremental = columnar_cache.refresh(conn, cid)
+    conn.close()
+
+    config = {"rows": args.rows, "changed": args.changed, "groups": groups, "seed_seconds": seed_s}
+    refreshes = {"build": build, "incremental": incremental}
+    if args.json:
+        print(json.dumps({"config": config, "load_ms": load_ms, "scans_ms": scans, "refreshes": refreshes}, indent=2))
+        return 0
+    print(f"config: {config}")
+    print(f"{'load (map files)':<34} {load_ms:>10} ms")
+    for case, ms in scans.items():
+        print(f"{case:<34} {ms:>10} ms")
+    keys = ("rows", "appended", "deleted", "segments", "compacted", "duration_ms")
+    print(f"{'':<34} " + "  ".join(f"{k:>11}" for k in keys))
+    for case, r in refreshes.items():
+        print(f"{'refresh, ' + case:<34} " + "  ".join(f"{str(r[k]):>11}" for k in keys))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Time single-driver edits on a large driver graph.
+
+Builds ``--accounts`` account drivers plus ``--drivers`` derived ones
+(growth, percent_of, product and sum layered on top of each other), then
+reports the median time of ``DriverGraph.set_driver`` for an edit at the
+root (large downstream subgraph), in the middle and at a leaf, next to a
+full rebuild of the graph. ``--scenarios`` what-if scenarios overriding a
+few drivers each are then evaluated as overlays on the base graph and, for
+comparison, as full graphs with the overrides merged in.
+
+    python benchmarks/bench_drivers.py --drivers 500
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from qb_app import drivers  # noqa: E402
+
+
+def synthetic(accounts: int, derived: int, horizon: int, seed: int):
+    rng = random.Random(seed)
+    baselines = {str(i): np.full(horizon, 1000.0 + i) for i in range(accounts)}
+    months = [dt.date(2025 + k // 12, k % 12 + 1, 1) for k in range(horizon)]
+    definitions = {"headcount": ("constant", {"value": 25.0}), "cost_per_head": ("constant", {"value": 6500.0})}
+    for i in range(accounts):
+        definitions[f"acct_{i}"] = ("account", {"account_ids": [str(i)], "sign": 1})
+    names = list(definitions)
+    for i in range(derived):
+        kind = ("growth", "percent_of", "product", "sum")[i % 4]
+        name = f"d_{i}"
+        # Lean on recent drivers so the graph is deep, not just wide
+        pool = names[-50:] if rng.random() < 0.7 else names
+        if kind == "growth":
+            params = {"base": rng.choice(pool), "rate_pct": 5.0, "period": "year"}
+        elif kind == "percent_of":
+            params = {"base": rng.choice(pool), "pct": 12.5}
+        elif kind == "product":
+            params = {"inputs": ["headcount", rng.choice(pool)]}
+        else:
+            params = {"inputs": rng.sample(pool, min(3, len(pool)))}
+        definitions[name] = (kind, drivers.validate(name, kind, params))
+        names.append(name)
+    return definitions, baselines, months
+
+
+def _median_ms(fn, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark qb_app.drivers")
+    p.add_argument("--accounts", type=int, default=200)
+    p.add_argument("--drivers", type=int, default=500, help="derived drivers on top of the account drivers")
+    p.add_argument("--horizon", type=int, default=24)
+    p.add_argument("--repeats", type=int, default=21)
+    p.add_argument("--scenarios", type=int, default=10)
+    p.add_argument("--overrides", type=int, default=3, help="drivers overridden per scenario")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    definitions, baselines, months = synthetic(args.accounts, args.drivers, args.horizon, args.seed)
+    graph = drivers.DriverGraph(definitions, baselines, months)
+    mid = f"d_{args.drivers // 2}"
+    leaf = graph.order[-1]
+    results = [{"case": "full build", "ms": _median_ms(
+        lambda: drivers.DriverGraph(definitions, baselines, months), max(1, args.repeats // 3)), "recomputed": len(graph.order)}]
+    for label, name in (("edit root (headcount)", "headcount"), (f"edit middle ({mid})", mid), (f"edit leaf ({leaf})", leaf)):
+        kind, params = graph.definitions[name]
+        dirty = graph.downstream(name)
+        results.append({"case": label, "ms": _median_ms(lambda: graph.set_driver(name, kind, dict(params)), args.repeats),
+                        "recomputed": len(dirty)})
+    # Alternate the inputs so every edit changes edges (full re-sort)
+    rewire = f"d_{args.drivers - 1}"
+    flip = iter(range(10 ** 9))
+    results.append({"case": f"rewire {rewire}", "ms": _median_ms(
+        lambda: graph.set_driver(rewire, "sum", {"inputs": ["acct_0", f"acct_{1 + next(flip) % 2}"]}), args.repeats),
+        "recomputed": len(graph.downstream(rewire))})
+
+    graph = drivers.DriverGraph(definitions, baselines, months)
+    rng = random.Random(args.seed)
+    candidates = [n for n in definitions if definitions[n][0] in ("constant", "growth", "percent_of")]
+    scenarios = []
+    for _ in range(args.scenarios):
+        overrides = {}
+        for name in rng.sample(candidates, args.overrides):
+            kind, params = definitions[name]
+            params = dict(params)
+            key = {"constant": "value", "growth": "rate_pct", "percent_of": "pct"}[kind]
+            params[key] = params[key] * rng.uniform(0.8, 1.2)
+            overrides[name] = (kind, params)
+        scenarios.append(overrides)
+    changed = sum(len(graph.overlay(o).changed) for o in scenarios)
+    results.append({"case": f"{args.scenarios} scenarios (overlay)", "ms": _median_ms(
+        lambda: [graph.overlay(o) for o in scenarios], max(1, args.repeats // 3)), "recomputed": changed})
+    results.append({"case": f"{args.scenarios} scenarios (full graphs)", "ms": _median_ms(
+        lambda: [drivers.DriverGraph(dict(definitions, **o), baselines, months) for o in scenarios],
+        max(1, args.repeats // 3)), "recomputed": args.scenarios * len(definitions)})
+
+    config = {"drivers": len(definitions), "horizon": args.horizon}
+    if args.json:
+        print(json.dumps({"config": config, "results": results}, indent=2))
+        return 0
+    print(f"config: {config}")
+    width = max(len(r["case"]) for r in results)
+    print(f"{'case'.ljust(width)}  {'ms':>9}  recomputed")
+    for r in results:
+        print(f"{r['case'].ljust(width)}  {r['ms']:>9}  {r['recomputed']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Time the vectorized forecast models on a synthetic chart of accounts.
+
+Builds ``--accounts`` monthly series of ``--months`` (trend + yearly season
++ noise), then reports per method the median time to forecast every row
+``--horizon`` months ahead and the mean absolute error on a held-out final
+year. ``holt_winters`` is also run one account at a time, which is what a
+per-account Python loop would cost. ``--db`` seeds ``gl_monthly`` in a
+throwaway SQLite file and times ``load_matrix`` as well.
+
+    python benchmarks/bench_forecast.py --accounts 500 --months 60
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def synthetic(accounts: int, months: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    t = np.arange(months)
+    base = rng.uniform(1_000, 50_000, (accounts, 1))
+    slope = rng.normal(0, 0.01, (accounts, 1)) * base
+    amp = rng.uniform(0, 0.3, (accounts, 1)) * base
+    phase = rng.uniform(0, 2 * np.pi, (accounts, 1))
+    noise = rng.normal(0, 0.05, (accounts, months)) * base
+    return base + slope * t + amp * np.sin(2 * np.pi * t / 12 + phase) + noise
+
+
+def _median_ms(fn, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def _time_load_matrix(y: np.ndarray, repeats: int) -> float:
+    import datetime as dt
+
+    from qb_app import forecast, gl_cube
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    cur = conn.cursor()
+    gl_cube.ensure_gl_monthly_table(cur)
+    rows = []
+    for i in range(y.shape[0]):
+        for j in range(y.shape[1]):
+            month = dt.date(2020 + j // 12, j % 12 + 1, 1)
+            rows.append((1, str(i), "", "", month, round(float(y[i, j]), 2), 1))
+    cur.executemany(
+        "INSERT INTO gl_monthly (client_auth_id, AccountId, Class, Department, month, amount, line_count) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    ms = _median_ms(lambda: forecast.load_matrix(conn, 1), repeats)
+    conn.close()
+    return ms
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark qb_app.forecast")
+    p.add_argument("--accounts", type=int, default=500)
+    p.add_argument("--months", type=int, default=60)
+    p.add_argument("--horizon", type=int, default=12)
+    p.add_argument("--repeats", type=int, default=7)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--db", action="store_true", help="also time load_matrix from SQLite")
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    if args.db:
+        # Before qb_app.storage is imported: the backend is chosen at import
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_forecast_"), "forecast.sqlite3")
+    from qb_app import forecast
+
+    y = synthetic(args.accounts, args.months, args.seed)
+    train, test = y[:, :-12], y[:, -12:]
+    results = []
+    for method in forecast.METHODS:
+        ms = _median_ms(lambda: forecast.forecast(y, args.horizon, method), args.repeats)
+        mae = float(np.abs(forecast.forecast(train, 12, method) - test).mean())
+        results.append({"method": method, "ms": ms, "holdout_mae": round(mae, 2)})
+
+    loop_ms = _median_ms(
+        lambda: [forecast.holt_winters(y[i:i + 1], args.horizon) for i in range(y.shape[0])],
+        max(1, args.repeats // 3),
+    )
+    results.append({"method": "holt_winters (per-account loop)", "ms": loop_ms, "holdout_mae": None})
+    if args.db:
+        results.append({"method": "load_matrix (sqlite)", "ms": _time_load_matrix(y, args.repeats),
+                        "holdout_mae": None})
+
+    config = {k: getattr(args, k) for k in ("accounts", "months", "horizon")}
+    if args.json:
+        print(json.dumps({"config": config, "results": results}, indent=2))
+        return 0
+    print(f"config: {config}")
+    width = max(len(r["method"]) for r in results)
+    print(f"{'method'.ljust(width)}  {'ms':>10}  holdout_mae")
+    for r in results:
+        mae = "" if r["holdout_mae"] is None else r["holdout_mae"]
+        print(f"{r['method'].ljust(width)}  {r['ms']:>10}  {mae}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Time the nightly forecast refresh over many synthetic clients.
+
+Seeds ``--clients`` clients with ``--accounts`` x ``--months`` cells of
+``gl_monthly`` in a throwaway SQLite file, then runs
+``forecast_refresh.run`` four times:
+
+1. full refresh in this process (``processes=1``)
+2. full refresh in a process pool (``--processes``, default one per CPU)
+3. nothing changed: every client is skipped
+4. ``--changed`` clients had new data: only those are recomputed
+
+    python benchmarks/bench_forecast_refresh.py --clients 40 --processes 4
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _seed(clients: int, accounts: int, months: int, seed: int) -> List[int]:
+    from qb_app import data_version, gl_cube
+    from qb_app.db import get_connection
+
+    rng = np.random.default_rng(seed)
+    conn = get_connection()
+    cur = conn.cursor()
+    gl_cube.ensure_gl_monthly_table(cur)
+    ids = []
+    for c in range(clients):
+        cur.execute(
+            "INSERT INTO client_auth (client_name, realm_id, active) OUTPUT inserted.id VALUES (?, ?, 1)",
+            (f"bench {c}", f"bench-realm-{c}"),
+        )
+        cid = int(cur.fetchone()[0])
+        ids.append(cid)
+        t = np.arange(months)
+        base = rng.uniform(1_000, 50_000, (accounts, 1))
+        y = base * (1 + 0.2 * np.sin(2 * np.pi * t / 12 + rng.uniform(0, 6, (accounts, 1))))
+        y += rng.normal(0, 0.05, (accounts, months)) * base
+        rows = [
+            (cid, str(a), "", "", dt.date(2020 + j // 12, j % 12 + 1, 1), round(float(y[a, j]), 2), 1)
+            for a in range(accounts) for j in range(months)
+        ]
+        cur.executemany(
+            "INSERT INTO gl_monthly (client_auth_id, AccountId, Class, Department, month, amount, line_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        data_version.bump(cur, cid)
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def _reset_state() -> None:
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    conn.cursor().execute("DELETE FROM forecast_refresh_state")
+    conn.commit()
+    conn.close()
+
+
+def _bump(ids: List[int]) -> None:
+    from qb_app import data_version
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    cur = conn.cursor()
+    for cid in ids:
+        data_version.bump(cur, cid)
+    conn.commit()
+    conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark qb_app.forecast_refresh")
+    p.add_argument("--clients", type=int, default=40)
+    p.add_argument("--accounts", type=int, default=150)
+    p.add_argument("--months", type=int, default=48)
+    p.add_argument("--method", default="auto")
+    p.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--changed", type=int, default=3)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    # Before qb_app.storage is imported: the backend is chosen at import, and
+    # the pool's spawned workers inherit this environment
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_refresh_"), "refresh.sqlite3")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from qb_app import applog, forecast_refresh
+
+    applog.configure()
+    t0 = time.perf_counter()
+    ids = _seed(args.clients, args.accounts, args.months, args.seed)
+    seed_s = round(time.perf_counter() - t0, 2)
+
+    runs = []
+    runs.append(("full, in process", forecast_refresh.run(args.method, processes=1)))
+    _reset_state()
+    runs.append((f"full, {args.processes} processes", forecast_refresh.run(args.method, processes=args.processes)))
+    runs.append(("unchanged", forecast_refresh.run(args.method, processes=args.processes)))
+    _bump(ids[:args.changed])
+    runs.append((f"{args.changed} changed", forecast_refresh.run(args.method, processes=args.processes)))
+
+    keys = ("pending", "refreshed", "failed", "skipped", "processes", "rows_written", "duration_ms")
+    config = {"clients": args.clients, "accounts": args.accounts, "months": args.months, "method": args.method,
+              "seed_seconds": seed_s}
+    if args.json:
+        print(json.dumps({"config": config, "runs": [dict({k: s[k] for k in keys}, case=c) for c, s in runs]},
+                         indent=2))
+        return 0
+    print(f"config: {config}")
+    width = max(len(c) for c, _ in runs)
+    print(f"{'case'.ljust(width)}  " + "  ".join(f"{k:>12}" for k in keys))
+    for case, s in runs:
+        print(f"{case.ljust(width)}  " + "  ".join(f"{s[k]:>12}" for k in keys))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+"""End-to-end ingest benchmark against the local fake QuickBooks server.
+
+Runs the real sync code paths against ``fake_qb_server`` and reports
+rows/sec, QuickBooks API calls and peak RSS per scenario:
+
+- ``onboarding``   ``load_all_transactions.main(client_id)`` per client
+                   (transactions + reference data)
+- ``reference``    ``load_all_reference_data`` per client
+- ``daily_sync``   ``daily_qb_sync.main`` over all clients (report email skipped)
+
+Each scenario runs in a fresh subprocess so peak RSS is its own. Storage:
+
+- ``--db null`` (default): an in-memory stand-in connection that answers
+  the client_auth/INFORMATION_SCHEMA lookups and discards writes, which
+  isolates API + parsing + statement-building cost
+- ``--db sqlite``: a fresh SQLite file per scenario (``STORAGE_BACKEND=sqlite``),
+  which exercises the real insert/upsert statements without a server
+- ``--db sql``: the database configured by SQL_* env vars (use a scratch
+  database); benchmark clients are inserted and removed afterwards
+
+Regression gate: ``--save-baseline bench.json`` records results;
+``--baseline bench.json --max-regression 0.2`` exits 1 if any scenario's
+rows/sec drops by more than 20%.
+
+    python benchmarks/bench_ingest.py --realms 2 --txns 1000 --latency-ms 20
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import fake_qb_server  # noqa: E402
+
+SCENARIOS = ("onboarding", "reference", "daily_sync")
+
+
+# ---- in-memory stand-in for --db null ----
+
+class _NullCursor:
+    def __init__(self, db: "NullDB") -> None:
+        self.db = db
+        self.description = None
+        self.rowcount = -1
+        self._rows: List[tuple] = []
+
+    def execute(self, sql: str, *params):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            params = tuple(params[0])
+        self.db.statements += 1
+        s = " ".join(sql.split())
+        low = s.lower()
+        self._rows, self.description, self.rowcount = [], None, 1
+        if low.startswith("select") and " from client_auth" in low:
+            cols = [c.strip().split()[-1] for c in s[6:low.index(" from ")].split(",")]
+            clients = [c for c in self.db.clients if c["active"]]
+            if "id = ?" in low and params:
+                clients = [c for c in clients if c["id"] == int(params[-1])]
+            self.description = [(c,) for c in cols]
+            self._rows = [tuple(c.get(col) for col in cols) for c in clients]
+        elif "information_schema.columns" in low:
+            table = str(params[0]) if params else low.split("table_name = '", 1)[1].split("'", 1)[0]
+            self.description = [("COLUMN_NAME",)]
+            self._rows = [(c,) for c in sorted(self._columns(table))]
+        elif low.startswith("select col_length("):
+            table, col = [a.strip(" '") for a in s[len("SELECT COL_LENGTH("):s.index(")")].split(",")]
+            self.description = [("len",)]
+            self._rows = [(1 if col in self._columns(table) else None,)]
+        elif low.startswith("alter table") and " add " in low:
+            table = low.split()[2].replace("dbo.", "")
+            col = s.split("[", 1)[1].split("]", 1)[0]
+            self._columns(table).add(col)
+        elif low.startswith(("insert", "merge")):
+            self.db.writes += 1
+        return self
+
+    def _columns(self, table: str) -> set:
+        return self.db.columns.setdefault(table.replace("dbo.", ""), {"client_auth_id", "Id"})
+
+    def executemany(self, sql: str, seq):
+        for p in seq:
+            self.execute(sql, p)
+        return self
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self) -> None:
+        pass
+
+
+class _NullConnection:
+    def __init__(self, db: "NullDB") -> None:
+        self.db = db
+
+    def cursor(self):
+        return _NullCursor(self.db)
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class NullDB:
+    def __init__(self, clients: List[dict]) -> None:
+        self.clients = clients
+        self.columns: Dict[str, set] = {}
+        self.statements = 0
+        self.writes = 0
+
+    def connect(self):
+        return _NullConnection(self)
+
+
+def _install_connection_factory(factory) -> None:
+    """Point every loaded module's ``get_connection`` at ``factory``."""
+    for name, mod in list(sys.modules.items()):
+        if mod is None or not name.startswith(("qb_app", "daily_qb_sync", "qb_token_refresh")):
+            continue
+        if hasattr(mod, "get_connection"):
+            setattr(mod, "get_connection", factory)
+
+
+# ---- child process: run one scenario ----
+
+def _server_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/__stats", timeout=10) as r:
+        return json.loads(r.read())
+
+
+def _seed_sql_clients(realms: List[str], enc: str) -> List[dict]:
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    cur = conn.cursor()
+    clients = []
+    for realm in realms:
+        cur.execute(
+            """
+            INSERT INTO client_auth (client_name, realm_id, access_token_enc, refresh_token_enc, token_expiry, active)
+            OUTPUT inserted.id
+            VALUES (?, ?, ?, ?, DATEADD(SECOND, 3600, GETUTCDATE()), 1)
+            """,
+            (f"bench {realm}", realm, enc, enc),
+        )
+        clients.append({"id": int(cur.fetchone()[0]), "realm_id": realm})
+    conn.commit()
+    conn.close()
+    return clients
+
+
+def _cleanup_sql_clients(clients: List[dict]) -> None:
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    cur = conn.cursor()
+    tables = ["qb_transactions", "qb_accounts", "qb_classes", "qb_customers", "qb_employees",
+              "qb_items", "qb_vendors", "sync_run_log"]
+    for c in clients:
+        for t in tables:
+            try:
+                cur.execute(f"DELETE FROM {t} WHERE client_auth_id = ?", (c["id"],))
+            except Exception:
+                conn.rollback()
+        cur.execute("DELETE FROM client_auth WHERE id = ?", (c["id"],))
+    conn.commit()
+    conn.close()
+
+
+def _sqlite_row_count(path: str) -> int:
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    try:
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'qb_%'")]
+        return sum(conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables)
+    finally:
+        conn.close()
+
+
+def run_child(args: argparse.Namespace) -> None:
+    from cryptography.fernet import Fernet
+
+    os.environ["QB_API_BASE"] = args.base_url
+    os.environ["QB_OAUTH_TOKEN_URL"] = f"{args.base_url}/oauth2/v1/tokens/bearer"
+    os.environ.setdefault("ENCRYPTION_SECRET", Fernet.generate_key().decode())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("SCHEDULER_DISABLED", "1")
+    os.environ.setdefault("JOB_WORKERS_DISABLED", "1")
+    if args.db == "sqlite":
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = args.sqlite_path
+    realms = args.realm_ids.split(",")
+
+    from qb_app import load_all_transactions, load_qb_reference_data, telemetry
+    import daily_qb_sync
+
+    token_enc = Fernet(os.environ["ENCRYPTION_SECRET"].encode()).encrypt(b"fake-access-token").decode()
+    null_db: Optional[NullDB] = None
+    if args.db == "null":
+        null_db = NullDB([
+            {"id": i + 1, "client_name": f"bench {r}", "realm_id": r, "access_token_enc": token_enc,
+             "refresh_token_enc": token_enc, "active": 1}
+            for i, r in enumerate(realms)
+        ])
+        _install_connection_factory(null_db.connect)
+        clients = [{"id": c["id"], "realm_id": c["realm_id"]} for c in null_db.clients]
+    else:
+        clients = _seed_sql_clients(realms, token_enc)
+    daily_qb_sync.send_sync_report = lambda logger, results: None  # no SMTP from benchmarks
+
+    def _onboarding():
+        for c in clients:
+            load_all_transactions.main(client_id=c["id"])
+
+    def _reference():
+        for c in clients:
+            conn = load_all_transactions.get_connection()
+            try:
+                load_qb_reference_data.load_all_reference_data(c["realm_id"], "fake-access-token", c["id"], conn)
+            finally:
+                conn.close()
+
+    def _daily_sync():
+        daily_qb_sync.main(None)
+
+    fn = {"onboarding": _onboarding, "reference": _reference, "daily_sync": _daily_sync}[args.child]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    calls_before = _server_stats(args.base_url).get("total", 0)
+    rows_in_db = None
+    t0 = time.perf_counter()
+    try:
+        with telemetry.record_run(f"bench:{args.child}") as run:
+            fn()
+    finally:
+        wall = time.perf_counter() - t0
+        if args.db == "sql":
+            _cleanup_sql_clients(clients)
+        elif args.db == "sqlite":
+            rows_in_db = _sqlite_row_count(args.sqlite_path)
+    calls = _server_stats(args.base_url).get("total", 0) - calls_before
+    rows = run["counters"].get("rows_synced", 0)
+    out = {
+        "scenario": args.child,
+        "clients": len(clients),
+        "seconds": round(wall, 3),
+        "rows": rows,
+        "rows_per_sec": round(rows / wall, 1) if wall > 0 else None,
+        "api_calls": calls,
+        "errors": run["counters"].get("errors", 0),
+        "sql_statements": null_db.statements if null_db else None,
+        "db_rows": rows_in_db,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "import_rss_mb": round(rss_before / 1024, 1),
+    }
+    print("BENCH_RESULT " + json.dumps(out), flush=True)
+
+
+# ---- parent: start the server, run scenarios, report ----
+
+def _run_scenario(name: str, args: argparse.Namespace, base_url: str, realm_ids: List[str]) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", name, "--base-url", base_url,
+           "--realm-ids", ",".join(realm_ids), "--db", args.db]
+    with tempfile.TemporaryDirectory(prefix="bench_ingest_") as tmp:
+        if args.db == "sqlite":
+            cmd += ["--sqlite-path", os.path.join(tmp, "bench.sqlite3")]
+        proc = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT, timeout=args.timeout)
+    for line in proc.stdout.splitlines():
+        if line.startswith("BENCH_RESULT "):
+            return json.loads(line[len("BENCH_RESULT "):])
+    sys.stderr.write(proc.stdout[-4000:] + proc.stderr[-4000:])
+    return {"scenario": name, "error": f"exit {proc.returncode}"}
+
+
+def _print_table(results: List[dict]) -> None:
+    cols = ["scenario", "clients", "seconds", "rows", "rows_per_sec", "api_calls", "errors", "peak_rss_mb"]
+    if any(r.get("db_rows") is not None for r in results):
+        cols.insert(4, "db_rows")
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).ljust(widths[c]) for c in cols))
+
+
+def _check_baseline(results: List[dict], path: str, max_regression: float) -> int:
+    with open(path, "r", encoding="utf-8") as f:
+        base = {r["scenario"]: r for r in json.load(f).get("results", [])}
+    failed = 0
+    for r in results:
+        b = base.get(r["scenario"])
+        if not b or not b.get("rows_per_sec") or not r.get("rows_per_sec"):
+            continue
+        change = r["rows_per_sec"] / b["rows_per_sec"] - 1.0
+        flag = "REGRESSION" if change < -max_regression else "ok"
+        failed += flag != "ok"
+        print(f"{r['scenario']}: {b['rows_per_sec']} -> {r['rows_per_sec']} rows/s ({change:+.1%}) {flag}")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Ingest benchmark against a fake QuickBooks API")
+    fake_qb_server.add_arguments(p)
+    p.add_argument("--scenarios", default=",".join(SCENARIOS))
+    p.add_argument("--db", choices=("null", "sqlite", "sql"), default="null")
+    p.add_argument("--timeout", type=float, default=1800)
+    p.add_argument("--json", action="store_true", help="print results as JSON")
+    p.add_argument("--save-baseline")
+    p.add_argument("--baseline")
+    p.add_argument("--max-regression", type=float, default=0.2)
+    # internal (child process)
+    p.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    p.add_argument("--base-url", help=argparse.SUPPRESS)
+    p.add_argument("--realm-ids", help=argparse.SUPPRESS)
+    p.add_argument("--sqlite-path", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.child:
+        run_child(args)
+        return 0
+
+    cfg = fake_qb_server.config_from_args(args)
+    server, base_url = fake_qb_server.start_in_thread(cfg)
+    results = []
+    try:
+        for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            results.append(_run_scenario(name, args, base_url, cfg.realms))
+    finally:
+        server.shutdown()
+
+    config = {k: getattr(args, k) for k in ("realms", "txns", "refs", "accounts", "latency_ms", "db")}
+    if args.json:
+        print(json.dumps({"config": config, "results": results}, indent=2))
+    else:
+        print(f"config: {config}")
+        _print_table(results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+    if args.baseline:
+        return _check_baseline(results, args.baseline, args.max_regression)
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Compare the cost of one ``log()`` call: legacy vs. queued logging.
+
+The legacy callback ``log()`` printed, logged through ``app.logger`` and
+opened/appended/closed the debug file on every call. The new one only
+enqueues a record; a background thread does the writing.
+
+    python benchmarks/bench_logging.py [calls]
+
+Stdout is redirected to /dev/null and the log file goes to a temp dir, so
+the numbers measure the caller-side cost only.
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def _legacy_log(logger: logging.Logger, log_path: str):
+    def log(message: str) -> None:
+        print(message)
+        try:
+            logger.info(message)
+        except Exception:
+            pass
+        try:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            with open(log_path, "a") as f:
+                f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
+        except Exception:
+            pass
+
+    return log
+
+
+def _time_calls(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(f"Step {i}: benchmark message with some payload realm_id=1234567890")
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    tmp = tempfile.mkdtemp(prefix="bench_logging_")
+    os.environ["APP_LOG_PATH"] = os.path.join(tmp, "new", "callback_debug.log")
+
+    real_stdout = sys.stdout
+    devnull = open(os.devnull, "w")
+    sys.stdout = devnull
+    try:
+        # Legacy: basicConfig stdout handler + extra app.logger stdout handler
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+        legacy_logger = logging.getLogger("bench.legacy")
+        legacy_logger.addHandler(logging.StreamHandler(sys.stdout))
+        legacy = _legacy_log(legacy_logger, os.path.join(tmp, "legacy", "callback_debug.log"))
+        legacy_us = _time_calls(legacy, n)
+
+        from qb_app import applog
+
+        logging.getLogger().handlers.clear()
+        applog.configure()
+        new_logger = applog.get_logger("bench.new")
+        new_us = _time_calls(new_logger.info, n)
+        t0 = time.perf_counter()
+        applog.shutdown()  # drain the queue
+        drain_s = time.perf_counter() - t0
+    finally:
+        sys.stdout = real_stdout
+        devnull.close()
+
+    print(f"calls: {n}")
+    print(f"legacy log(): {legacy_us:8.2f} us/call")
+    print(f"queued log(): {new_us:8.2f} us/call  (background drain after loop: {drain_s:.3f}s)")
+    if new_us:
+        print(f"speedup:      {legacy_us / new_us:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
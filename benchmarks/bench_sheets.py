@@ -0,0 +1,161 @@
+"""Time Sheets paging and exports over a large synthetic ledger.
+
+Seeds ``--rows`` lines of ``qb_transactions`` for one client in a throwaway
+SQLite file, then reports:
+
+1. a page near the end of the ledger by keyset cursor vs by OFFSET
+2. the CSV export (``routes_sheets._csv_stream``) at two sizes, with
+   tracemalloc's peak: the peak should not grow with the row count
+
+    python benchmarks/bench_sheets.py --rows 1000000
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _seed(rows: int, seed: int) -> int:
+    from qb_app.db import get_connection
+
+    rng = random.Random(seed)
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO client_auth (client_name, realm_id, active) OUTPUT inserted.id VALUES ('bench', 'bench-realm', 1)"
+    )
+    cid = int(cur.fetchone()[0])
+    start = dt.date(2019, 1, 1)
+    types = ("Invoice", "Bill", "Purchase", "JournalEntry", "Deposit")
+    batch = []
+    for i in range(rows):
+        batch.append((
+            cid, str(i // 3), f"DOC-{i // 3:07d}", rng.choice(types), start + dt.timedelta(days=rng.randrange(2500)),
+            round(rng.uniform(-5_000, 20_000), 2), f"Account {rng.randrange(120)}", str(rng.randrange(120)),
+            f"Class {rng.randrange(8)}", f"Customer {rng.randrange(900)}", f"Vendor {rng.randrange(400)}",
+            f"line {i}",
+        ))
+        if len(batch) == 50_000:
+            _insert(cur, batch)
+            batch = []
+    if batch:
+        _insert(cur, batch)
+    conn.commit()
+    conn.close()
+    return cid
+
+
+def _insert(cur, batch) -> None:
+    cur.executemany(
+        """
+        INSERT INTO qb_transactions (client_auth_id, TxnId, DocNumber, TxnType, TxnDate, LineAmount,
+            AccountName, AccountId, Class, Customer, Vendor, Description)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        batch,
+    )
+
+
+def _time_page(sql: str, params: tuple, repeats: int = 5) -> float:
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    cur = conn.cursor()
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        best = min(best, time.perf_counter() - t0)
+    conn.close()
+    return round(best * 1000, 2)
+
+
+def _export(cid: int, columns: List[str], end: Optional[dt.date]) -> dict:
+    from qb_app import routes_sheets
+
+    where, params = "client_auth_id = ? AND TxnDate IS NOT NULL", [cid]
+    if end:
+        where += " AND TxnDate <= ?"
+        params.append(end)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = lines = 0
+    for chunk in routes_sheets._csv_stream(columns, routes_sheets._batches(cid, columns, where, params)):
+        size += len(chunk)
+        lines += chunk.count("\n")
+    seconds = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"rows": lines - 1, "mb": round(size / 1e6, 1), "seconds": round(seconds, 2),
+            "rows_per_s": int((lines - 1) / seconds) if seconds else 0, "peak_mb": round(peak / 1e6, 2)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark qb_app.routes_sheets")
+    p.add_argument("--rows", type=int, default=500_000)
+    p.add_argument("--page", type=int, default=100)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_sheets_"), "sheets.sqlite3")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from qb_app import routes_sheets
+
+    t0 = time.perf_counter()
+    cid = _seed(args.rows, args.seed)
+    seed_s = round(time.perf_counter() - t0, 2)
+
+    cols = ", ".join(routes_sheets.DEFAULT_COLUMNS)
+    base = "FROM qb_transactions WHERE client_auth_id = ? AND TxnDate IS NOT NULL"
+    deep = args.rows - 2 * args.page
+    from qb_app.db import get_connection
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(f"SELECT TxnDate, id {base} ORDER BY TxnDate DESC, id DESC LIMIT 1 OFFSET {deep}", (cid,))
+    after_date, after_id = cur.fetchone()
+    conn.close()
+    paging = {
+        "first page": _time_page(
+            f"SELECT TOP {args.page + 1} {cols}, id {base} ORDER BY TxnDate DESC, id DESC", (cid,)),
+        f"keyset, row {deep}": _time_page(
+            f"SELECT TOP {args.page + 1} {cols}, id {base} AND TxnDate <= ? AND (TxnDate < ? OR id < ?) "
+            f"ORDER BY TxnDate DESC, id DESC", (cid, after_date, after_date, after_id)),
+        f"OFFSET {deep}": _time_page(
+            f"SELECT {cols}, id {base} ORDER BY TxnDate DESC, id DESC LIMIT {args.page + 1} OFFSET {deep}", (cid,)),
+    }
+    columns = list(routes_sheets.DEFAULT_COLUMNS)
+    exports = {
+        "export, ~10% of rows": _export(cid, columns, dt.date(2019, 9, 1)),
+        "export, all rows": _export(cid, columns, None),
+    }
+
+    config = {"rows": args.rows, "page": args.page, "seed_seconds": seed_s}
+    if args.json:
+        print(json.dumps({"config": config, "paging_ms": paging, "exports": exports}, indent=2))
+        return 0
+    print(f"config: {config}")
+    for case, ms in paging.items():
+        print(f"{case:<24} {ms:>10} ms")
+    keys = ("rows", "mb", "seconds", "rows_per_s", "peak_mb")
+    print(f"{'':<24} " + "  ".join(f"{k:>10}" for k in keys))
+    for case, r in exports.items():
+        print(f"{case:<24} " + "  ".join(f"{r[k]:>10}" for k in keys))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Cold-start cost of the web app: import time, RSS and loaded modules.
+
+``import`` mode runs ``import wsgi`` (i.e. ``create_app()``) in fresh
+interpreters and reports the median wall time, peak RSS, module count and
+which heavy optional modules (pandas, azure.functions, apscheduler) got
+loaded. ``gunicorn`` mode boots ``gunicorn wsgi:app`` with ``--workers``
+and reports time until the first request succeeds plus RSS of the master
+and each worker (read from /proc, so Linux only).
+
+Background threads are disabled and the app runs on a throwaway SQLite
+database, so the numbers are import/boot cost only.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --mode gunicorn --workers 4
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+HEAVY_MODULES = ("pandas", "numpy", "azure.functions", "apscheduler", "openpyxl")
+
+
+def _env(tmp: str) -> dict:
+    from cryptography.fernet import Fernet
+
+    env = dict(os.environ)
+    env.update({
+        "STORAGE_BACKEND": "sqlite",
+        "SQLITE_PATH": os.path.join(tmp, "startup.sqlite3"),
+        "APP_BACKGROUND": "0",
+        "SCHEDULER_DISABLED": "1",
+        "JOB_WORKERS_DISABLED": "1",
+        "APP_LOG_PATH": os.path.join(tmp, "app.log"),
+        "LOG_LEVEL": "WARNING",
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    env.setdefault("ENCRYPTION_SECRET", Fernet.generate_key().decode())
+    return env
+
+
+def child() -> None:
+    """Child mode: time one cold ``import wsgi`` and print a result line."""
+    t0 = time.perf_counter()
+    import wsgi  # noqa: F401
+
+    seconds = time.perf_counter() - t0
+    result = {
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        "modules": len(sys.modules),
+        "heavy": [m for m in HEAVY_MODULES if m in sys.modules],
+        "routes": len(list(wsgi.app.url_map.iter_rules())),
+    }
+    print("BENCH_RESULT " + json.dumps(result), flush=True)
+
+
+def run_import(runs: int, tmp: str) -> dict:
+    env = _env(tmp)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], cwd=ROOT, env=env,
+                             capture_output=True, text=True, timeout=120)
+        line = next((ln for ln in out.stdout.splitlines() if ln.startswith("BENCH_RESULT ")), None)
+        if line is None:
+            raise RuntimeError(f"child failed:\n{out.stdout}\n{out.stderr}")
+        samples.append(json.loads(line[len("BENCH_RESULT "):]))
+    return {
+        "mode": "import",
+        "runs": runs,
+        "seconds": round(statistics.median(s["seconds"] for s in samples), 4),
+        "peak_rss_mb": round(statistics.median(s["peak_rss_mb"] for s in samples), 1),
+        "modules": samples[-1]["modules"],
+        "heavy": samples[-1]["heavy"],
+        "routes": samples[-1]["routes"],
+    }
+
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r", encoding="utf-8") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(workers: int, tmp: str, extra: List[str], timeout: float) -> dict:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+           "--log-level", "warning", *extra, "wsgi:app"]
+    out = open(os.path.join(tmp, "gunicorn.out"), "w")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=_env(tmp), stdout=out, stderr=subprocess.STDOUT)
+    try:
+        ready = None
+        while time.perf_counter() - t0 < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {proc.returncode}; see {out.name}")
+            try:
+                requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+                ready = time.perf_counter() - t0
+                break
+            except requests.RequestException:
+                time.sleep(0.05)
+        if ready is None:
+            raise RuntimeError("gunicorn did not become ready in time")
+        # Let every worker finish booting before sampling memory
+        deadline = time.perf_counter() + timeout
+        while len(_children(proc.pid)) < workers and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        all_ready = time.perf_counter() - t0
+        time.sleep(0.5)
+        worker_rss = [round(_rss_mb(p), 1) for p in _children(proc.pid)]
+        return {
+            "mode": "gunicorn",
+            "workers": workers,
+            "first_response_seconds": round(ready, 3),
+            "all_workers_seconds": round(all_ready, 3),
+            "master_rss_mb": round(_rss_mb(proc.pid), 1),
+            "worker_rss_mb": worker_rss,
+            "worker_rss_mean_mb": round(statistics.mean(worker_rss), 1) if worker_rss else None,
+        }
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        out.close()
+
+
+def _check_baseline(result: dict, path: str, max_regression: float) -> int:
+    with open(path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    keys = ("seconds", "peak_rss_mb") if result["mode"] == "import" else ("all_workers_seconds", "worker_rss_mean_mb")
+    failed = 0
+    for key in keys:
+        b, r = base.get(key), result.get(key)
+        if not b or r is None:
+            continue
+        flag = "REGRESSION" if r > b * (1 + max_regression) else "ok"
+        failed += flag != "ok"
+        print(f"{key}: {b} -> {r} {flag}")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Measure web app cold start")
+    p.add_argument("--mode", choices=("import", "gunicorn"), default="import")
+    p.add_argument("--runs", type=int, default=5, help="fresh interpreters (import mode)")
+    p.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    p.add_argument("--gunicorn-arg", action="append", default=[], help="extra gunicorn argument (repeatable)")
+    p.add_argument("--timeout", type=float, default=60.0)
+    p.add_argument("--save-baseline")
+    p.add_argument("--baseline")
+    p.add_argument("--max-regression", type=float, default=0.2)
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.child:
+        child()
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        if args.mode == "gunicorn":
+            result = run_gunicorn(args.workers, tmp, args.gunicorn_arg, args.timeout)
+        else:
+            result = run_import(args.runs, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(json.dumps(result, indent=2))
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        return _check_baseline(result, args.baseline, args.max_regression)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
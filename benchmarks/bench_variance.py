@@ -0,0 +1,147 @@
+"""Time budget vs actual variance reports over synthetic clients.
+
+Seeds ``--clients`` clients in a throwaway SQLite file, each with
+``--accounts`` posting accounts three levels under their parent accounts
+(``ParentId``, built into ``qb_account_hierarchy``), ``--months`` of
+``gl_monthly`` and a 12-month budget for every account, then times
+``variance.report`` for one client and consolidated over all of them
+(uncached: the route caches the payload per data version).
+
+    python benchmarks/bench_variance.py --clients 5 --accounts 400
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _seed(clients: int, accounts: int, months: int, year: int, seed: int) -> List[int]:
+    from qb_app import account_hierarchy, budgets, gl_cube, storage
+    from qb_app.db import get_connection
+
+    rng = np.random.default_rng(seed)
+    conn = get_connection()
+    cur = conn.cursor()
+    store = storage.get_storage()
+    gl_cube.ensure_gl_monthly_table(cur)
+    for col in ("Name", "FullyQualifiedName", "Classification", "ParentId"):
+        store.add_column(cur, "qb_accounts", col)
+    first = (year + 1) * 12 - months  # history ends with the budget year
+    ids = []
+    for c in range(clients):
+        cur.execute(
+            "INSERT INTO client_auth (client_name, realm_id, active) OUTPUT inserted.id VALUES (?, ?, 1)",
+            (f"bench {c}", f"bench-realm-{c}"),
+        )
+        cid = int(cur.fetchone()[0])
+        ids.append(cid)
+        chart = {}  # path -> (Id, Name, ParentId, Classification)
+        for a in range(accounts):
+            top = "Income" if a % 4 == 0 else "Expenses"
+            classification = "Revenue" if top == "Income" else "Expense"
+            parts = [top, f"Group {a % 10}", f"Sub {a % 3}"]
+            parent = None
+            for depth in range(len(parts)):
+                path = ":".join(parts[:depth + 1])
+                if path not in chart:
+                    chart[path] = (f"p{len(chart)}", parts[depth], parent, classification)
+                parent = chart[path][0]
+            chart[f"{path}:Account {a}"] = (str(a), f"Account {a}", parent, classification)
+        cur.executemany(
+            "INSERT INTO qb_accounts (client_auth_id, Id, Name, FullyQualifiedName, ParentId, Classification) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(cid, i, name, path, parent, c) for path, (i, name, parent, c) in chart.items()],
+        )
+        account_hierarchy.rebuild(cur, cid)
+        base = rng.uniform(1_000, 50_000, accounts)
+        cells = rng.normal(1, 0.1, (accounts, months)) * base[:, None]
+        cur.executemany(
+            "INSERT INTO gl_monthly (client_auth_id, AccountId, Class, Department, month, amount, line_count) "
+            "VALUES (?, ?, '', '', ?, ?, 1)",
+            [(cid, str(a), dt.date((first + j) // 12, (first + j) % 12 + 1, 1), round(float(cells[a, j]), 2))
+             for a in range(accounts) for j in range(months)],
+        )
+        lines = [(str(a), dt.date(year, m, 1), round(float(base[a]), 2)) for a in range(accounts) for m in range(1, 13)]
+        budgets.save_budget(cur, cid, "plan", None, lines)
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def _best(fn, repeats: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return round(best * 1000, 2)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmark qb_app.variance")
+    p.add_argument("--clients", type=int, default=5)
+    p.add_argument("--accounts", type=int, default=400)
+    p.add_argument("--months", type=int, default=36)
+    p.add_argument("--year", type=int, default=2024)
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--json", action="store_true")
+    args = p.parse_args(argv)
+
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_variance_"), "variance.sqlite3")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from qb_app import account_hierarchy, budgets, variance
+    from qb_app.db import get_connection
+
+    ids = _seed(args.clients, args.accounts, args.months, args.year, args.seed)
+    months = variance.month_range(dt.date(args.year, 1, 1), dt.date(args.year, 12, 1))
+    conn = get_connection()
+    found = budgets.find_budgets(conn.cursor(), ids, "plan")
+    single = {ids[0]: found[ids[0]]}
+    everyone = {cid: found[cid] for cid in ids}
+    rows = len(variance.report(conn, everyone, months)["rows"])
+    timings = {
+        "1 client": _best(lambda: variance.report(conn, single, months)),
+        f"{args.clients} clients, consolidated": _best(lambda: variance.report(conn, everyone, months)),
+        f"{args.clients} clients, by_client": _best(lambda: variance.report(conn, everyone, months, by_client=True)),
+    }
+    # Engine only: matrices already loaded
+    loaded = [
+        (variance.actual_matrix(conn, cid, months),
+         variance.budget_matrix(budgets.load_lines(conn.cursor(), found[cid]["id"]), months),
+         account_hierarchy.load(conn.cursor(), cid))
+        for cid in ids
+    ]
+    conn.close()
+
+    def _engine():
+        trees = []
+        for (a_ids, actual, _), (b_ids, budget), tree in loaded:
+            j_ids, a, b = variance.join(a_ids, actual, b_ids, budget)
+            trees.append(variance.rollup(j_ids, tree, a, b))
+        variance.rows_payload(variance.consolidate(trees))
+
+    timings[f"{args.clients} clients, engine only"] = _best(_engine)
+
+    config = {"clients": args.clients, "accounts": args.accounts, "months": args.months, "report_rows": rows}
+    if args.json:
+        print(json.dumps({"config": config, "timings_ms": timings}, indent=2))
+        return 0
+    print(f"config: {config}")
+    for case, ms in timings.items():
+        print(f"{case:<32} {ms:>10} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
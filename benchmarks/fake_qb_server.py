@@ -0,0 +1,435 @@
+"""Local stand-in for the QuickBooks Online API (benchmarks only).
+
+Serves synthetic realms of configurable size with an artificial per-request
+latency:
+
+- ``GET|POST /v3/company/<realm>/query``   (``select * from X [where ...] startposition N maxresults M``)
+- ``GET      /v3/company/<realm>/cdc?entities=A,B&changedSince=<ts>``
+- ``POST     /v3/company/<realm>/batch``   (``BatchItemRequest`` of queries)
+- ``GET      /v3/company/<realm>/companyinfo/<realm>``
+- ``POST     /oauth2/v1/tokens/bearer``    (refresh / authorization_code)
+- ``GET      /__stats``, ``POST /__stats/reset``  request counters
+
+Point the app at it with ``QB_API_BASE=http://127.0.0.1:<port>`` and
+``QB_OAUTH_TOKEN_URL=http://127.0.0.1:<port>/oauth2/v1/tokens/bearer``.
+
+    python benchmarks/fake_qb_server.py --port 8765 --realms 3 --txns 2000 --latency-ms 40
+
+Data is deterministic per (seed, realm, entity). A ``--changed-fraction``
+of records carry a LastUpdatedTime within the last day, so incremental
+(``LastUpdatedTime >``/CDC) queries return a realistic small delta.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+SALES_ENTITIES = {"Invoice", "SalesReceipt", "CreditMemo", "RefundReceipt", "Estimate"}
+EXPENSE_ENTITIES = {"Purchase", "Bill", "Check", "VendorCredit", "PurchaseOrder"}
+PAYMENT_ENTITIES = {"Payment", "BillPayment"}
+TXN_ENTITIES = SALES_ENTITIES | EXPENSE_ENTITIES | PAYMENT_ENTITIES | {"JournalEntry", "Deposit", "Transfer", "TimeActivity"}
+REF_ENTITIES = {"Account", "Class", "Department", "Customer", "Vendor", "Employee", "Item"}
+
+ACCOUNT_TYPES = [
+    ("Income", "Revenue", "SalesOfProductIncome"),
+    ("Cost of Goods Sold", "Expense", "SuppliesMaterialsCogs"),
+    ("Expense", "Expense", "OfficeGeneralAdministrativeExpenses"),
+    ("Expense", "Expense", "Travel"),
+    ("Bank", "Asset", "Checking"),
+    ("Accounts Receivable", "Asset", "AccountsReceivable"),
+    ("Accounts Payable", "Liability", "AccountsPayable"),
+    ("Other Current Liability", "Liability", "OtherCurrentLiabilities"),
+    ("Equity", "Equity", "RetainedEarnings"),
+]
+
+
+class Config:
+    def __init__(self, realms: int = 3, txns: int = 2000, refs: int = 200, accounts: int = 60,
+                 latency_ms: float = 40.0, jitter_ms: float = 10.0, changed_fraction: float = 0.02,
+                 error_rate: float = 0.0, seed: int = 7) -> None:
+        self.realms = [str(9130000000000000 + i + 1) for i in range(realms)]
+        self.txns = txns
+        self.refs = refs
+        self.accounts = accounts
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.changed_fraction = changed_fraction
+        self.error_rate = error_rate
+        self.seed = seed
+
+
+def _ts(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S-00:00")
+
+
+def _parse_ts(value: str) -> datetime:
+    value = value.strip().strip("'")
+    value = re.sub(r"(-00:00|Z)$", "", value)
+    value = re.sub(r"[+-]\d\d:\d\d$", "", value)
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return datetime.strptime(value[:10], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+class DataSet:
+    """Lazily generated, cached synthetic records per (realm, entity)."""
+
+    def __init__(self, cfg: Config) -> None:
+        self.cfg = cfg
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self._cache: Dict[Tuple[str, str], List[dict]] = {}
+        self._lock = threading.RLock()  # generating a txn set pulls in its ref sets
+
+    def records(self, realm: str, entity: str) -> List[dict]:
+        key = (realm, entity)
+        recs = self._cache.get(key)
+        if recs is None:
+            with self._lock:
+                recs = self._cache.get(key)
+                if recs is None:
+                    recs = self._cache[key] = self._generate(realm, entity)
+        return recs
+
+    def _rng(self, realm: str, entity: str) -> random.Random:
+        return random.Random(f"{self.cfg.seed}:{realm}:{entity}")
+
+    def _meta(self, rng: random.Random) -> dict:
+        created = self.now - timedelta(days=rng.randint(30, 5 * 365), seconds=rng.randint(0, 86399))
+        if rng.random() < self.cfg.changed_fraction:
+            updated = self.now - timedelta(seconds=rng.randint(60, 20 * 3600))
+        else:
+            updated = created + timedelta(days=rng.randint(0, 20))
+            updated = min(updated, self.now - timedelta(days=2))
+        return {"CreateTime": _ts(created), "LastUpdatedTime": _ts(updated)}
+
+    def _ref(self, realm: str, entity: str, rng: random.Random) -> dict:
+        pool = self.records(realm, entity)
+        if not pool:
+            return {}
+        r = pool[rng.randrange(len(pool))]
+        return {"value": r["Id"], "name": r.get("FullyQualifiedName") or r.get("DisplayName") or r.get("Name")}
+
+    def _generate(self, realm: str, entity: str) -> List[dict]:
+        rng = self._rng(realm, entity)
+        if entity == "Account":
+            return self._accounts(rng)
+        if entity in ("Class", "Department"):
+            return [
+                {"Id": str(i + 1), "Name": f"{entity} {i + 1}", "FullyQualifiedName": f"{entity} {i + 1}",
+                 "Active": True, "SubClass": False, "MetaData": self._meta(rng)}
+                for i in range(6 if entity == "Class" else 3)
+            ]
+        if entity in REF_ENTITIES:
+            return [self._ref_record(entity, i, rng) for i in range(self.cfg.refs)]
+        if entity in TXN_ENTITIES:
+            return [self._txn(realm, entity, i, rng) for i in range(self.cfg.txns)]
+        return []
+
+    def _accounts(self, rng: random.Random) -> List[dict]:
+        out = []
+        for i in range(self.cfg.accounts):
+            acct_type, classification, sub = ACCOUNT_TYPES[i % len(ACCOUNT_TYPES)]
+            rec = {
+                "Id": str(i + 1),
+                "Name": f"{acct_type} {i + 1}",
+                "AccountType": acct_type,
+                "AccountSubType": sub,
+                "Classification": classification,
+                "Active": True,
+                "CurrentBalance": round(rng.uniform(-5e4, 5e5), 2),
+                "SubAccount": False,
+                "FullyQualifiedName": f"{acct_type} {i + 1}",
+                "MetaData": self._meta(rng),
+            }
+            # Every fourth account is a sub-account of an earlier one of the same type
+            parent_idx = i - len(ACCOUNT_TYPES)
+            if i % 4 == 3 and parent_idx >= 0:
+                parent = out[parent_idx]
+                rec["SubAccount"] = True
+                rec["ParentRef"] = {"value": parent["Id"]}
+                rec["FullyQualifiedName"] = f"{parent['FullyQualifiedName']}:{rec['Name']}"
+            out.append(rec)
+        return out
+
+    def _ref_record(self, entity: str, i: int, rng: random.Random) -> dict:
+        name = f"{entity} {i + 1:05d}"
+        rec = {
+            "Id": str(i + 1),
+            "Active": True,
+            "DisplayName": name,
+            "Name": name,
+            "FullyQualifiedName": name,
+            "Balance": round(rng.uniform(0, 2e4), 2),
+            "MetaData": self._meta(rng),
+            "PrimaryEmailAddr": {"Address": f"{entity.lower()}{i + 1}@example.com"},
+        }
+        if entity == "Item":
+            rec.update({"Type": "Service", "UnitPrice": round(rng.uniform(10, 500), 2),
+                        "IncomeAccountRef": {"value": "1"}})
+        return rec
+
+    def _txn(self, realm: str, entity: str, i: int, rng: random.Random) -> dict:
+        txn_date = (self.now - timedelta(days=rng.randint(0, 5 * 365))).date().isoformat()
+        lines = []
+        n_lines = rng.randint(1, 4)
+        for ln in range(n_lines):
+            amount = round(rng.uniform(5, 5000), 2)
+            line = {"Id": str(ln + 1), "LineNum": ln + 1, "Amount": amount, "Description": f"{entity} line {ln + 1}"}
+            if entity in SALES_ENTITIES:
+                line["DetailType"] = "SalesItemLineDetail"
+                line["SalesItemLineDetail"] = {
+                    "ItemRef": self._ref(realm, "Item", rng),
+                    "ClassRef": self._ref(realm, "Class", rng),
+                    "ItemAccountRef": self._ref(realm, "Account", rng),
+                    "TaxCodeRef": {"value": "NON"},
+                }
+            elif entity in EXPENSE_ENTITIES:
+                line["DetailType"] = "AccountBasedExpenseLineDetail"
+                line["AccountBasedExpenseLineDetail"] = {
+                    "AccountRef": self._ref(realm, "Account", rng),
+                    "ClassRef": self._ref(realm, "Class", rng),
+                    "BillableStatus": "NotBillable",
+                    "TaxCodeRef": {"value": "NON"},
+                }
+            elif entity == "JournalEntry":
+                line["DetailType"] = "JournalEntryLineDetail"
+                line["JournalEntryLineDetail"] = {
+                    "PostingType": "Debit" if ln % 2 == 0 else "Credit",
+                    "AccountRef": self._ref(realm, "Account", rng),
+                    "ClassRef": self._ref(realm, "Class", rng),
+                    "DepartmentRef": self._ref(realm, "Department", rng),
+                }
+            elif entity == "Deposit":
+                line["DetailType"] = "DepositLineDetail"
+                line["DepositLineDetail"] = {"AccountRef": self._ref(realm, "Account", rng)}
+            elif entity in PAYMENT_ENTITIES:
+                line["LinkedTxn"] = [{"TxnId": str(rng.randint(1, max(self.cfg.txns, 1))), "TxnType": "Invoice"}]
+            else:
+                continue
+            lines.append(line)
+        rec = {
+            "Id": str(i + 1),
+            "SyncToken": "0",
+            "DocNumber": f"{entity[:3].upper()}-{i + 1:06d}",
+            "TxnDate": txn_date,
+            "TotalAmt": round(sum(l["Amount"] for l in lines), 2),
+            "CurrencyRef": {"value": "USD", "name": "United States Dollar"},
+            "PrivateNote": "",
+            "Line": lines,
+            "MetaData": self._meta(rng),
+        }
+        if entity in SALES_ENTITIES or entity == "Payment":
+            rec["CustomerRef"] = self._ref(realm, "Customer", rng)
+        if entity in EXPENSE_ENTITIES or entity == "BillPayment":
+            rec["VendorRef"] = self._ref(realm, "Vendor", rng)
+        if entity == "Purchase":
+            rec["AccountRef"] = self._ref(realm, "Account", rng)
+        return rec
+
+
+_SELECT_RE = re.compile(r"select\s+(\*|count\(\*\))\s+from\s+(\w+)", re.I)
+_START_RE = re.compile(r"startposition\s+(\d+)", re.I)
+_MAX_RE = re.compile(r"maxresults\s+(\d+)", re.I)
+_UPDATED_RE = re.compile(r"metadata\.lastupdatedtime\s*(>=|>)\s*'([^']+)'", re.I)
+_TXNDATE_RE = re.compile(r"txndate\s*(>=|>)\s*'([^']+)'", re.I)
+
+
+def run_query(data: DataSet, realm: str, query: str) -> dict:
+    m = _SELECT_RE.search(query or "")
+    if not m:
+        return {"Fault": {"Error": [{"Message": "Error parsing query", "code": "4000"}], "type": "ValidationFault"}}
+    entity = m.group(2)
+    entity = next((e for e in TXN_ENTITIES | REF_ENTITIES if e.lower() == entity.lower()), entity)
+    recs = data.records(realm, entity)
+    um = _UPDATED_RE.search(query)
+    if um:
+        since = _parse_ts(um.group(2))
+        recs = [r for r in recs if _parse_ts(r["MetaData"]["LastUpdatedTime"]) > since]
+    tm = _TXNDATE_RE.search(query)
+    if tm:
+        since_d = tm.group(2)[:10]
+        recs = [r for r in recs if r.get("TxnDate", "") >= since_d]
+    if m.group(1).lower().startswith("count"):
+        return {"QueryResponse": {"totalCount": len(recs)}}
+    start = int((_START_RE.search(query) or [None, 1])[1])
+    max_results = min(int((_MAX_RE.search(query) or [None, 100])[1]), 1000)
+    page = recs[start - 1:start - 1 + max_results]
+    qr: dict = {}
+    if page:
+        qr = {entity: page, "startPosition": start, "maxResults": len(page)}
+    return {"QueryResponse": qr, "time": _ts(datetime.now(timezone.utc))}
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FakeQB/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # Populated by make_server
+    cfg: Config
+    data: DataSet
+    stats: Dict[str, int]
+    stats_lock: threading.Lock
+
+    def log_message(self, fmt, *args) -> None:  # keep benchmark output clean
+        pass
+
+    def _count(self, key: str) -> None:
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+            self.stats["total"] = self.stats.get("total", 0) + 1
+
+    def _send(self, status: int, body: dict) -> None:
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def _delay(self) -> None:
+        ms = self.cfg.latency_ms + (random.uniform(-1, 1) * self.cfg.jitter_ms if self.cfg.jitter_ms else 0)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def _route(self, method: str) -> None:
+        url = urlparse(self.path)
+        qs = parse_qs(url.query)
+        body = self._body() if method == "POST" else b""
+        parts = [p for p in url.path.split("/") if p]
+
+        if url.path == "/__stats":
+            with self.stats_lock:
+                return self._send(200, dict(self.stats))
+        if url.path == "/__stats/reset":
+            with self.stats_lock:
+                self.stats.clear()
+            return self._send(200, {"ok": True})
+
+        self._delay()
+        if url.path.endswith("/oauth2/v1/tokens/bearer"):
+            self._count("token")
+            return self._send(200, {
+                "access_token": f"fake-access-{uuid.uuid4().hex}",
+                "refresh_token": f"fake-refresh-{uuid.uuid4().hex}",
+                "token_type": "bearer",
+                "expires_in": 3600,
+                "x_refresh_token_expires_in": 8726400,
+            })
+
+        if len(parts) < 4 or parts[0] != "v3" or parts[1] != "company":
+            return self._send(404, {"error": "not found"})
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            self._count("unauthorized")
+            return self._send(401, {"Fault": {"Error": [{"Message": "AuthenticationFailed"}], "type": "AUTHENTICATION"}})
+        realm, op = parts[2], parts[3].lower()
+        if realm not in self.cfg.realms:
+            self._count("unknown_realm")
+            return self._send(404, {"Fault": {"Error": [{"Message": "Company not found"}]}})
+        if self.cfg.error_rate and random.random() < self.cfg.error_rate:
+            self._count("throttled")
+            return self._send(429, {"Fault": {"Error": [{"Message": "ThrottleExceeded"}]}})
+
+        if op == "query":
+            self._count("query")
+            query = qs.get("query", [""])[0] if method == "GET" else body.decode("utf-8", "replace")
+            result = run_query(self.data, realm, query)
+            return self._send(400 if "Fault" in result else 200, result)
+        if op == "cdc":
+            self._count("cdc")
+            entities = [e for e in (qs.get("entities", [""])[0]).split(",") if e]
+            since = qs.get("changedSince", [""])[0]
+            responses = []
+            for e in entities:
+                q = f"select * from {e} where Metadata.LastUpdatedTime > '{since}' maxresults 1000"
+                responses.append(run_query(self.data, realm, q)["QueryResponse"])
+            return self._send(200, {"CDCResponse": [{"QueryResponse": responses}], "time": _ts(datetime.now(timezone.utc))})
+        if op == "batch":
+            self._count("batch")
+            try:
+                items = (json.loads(body or b"{}").get("BatchItemRequest") or [])[:30]
+            except ValueError:
+                return self._send(400, {"Fault": {"Error": [{"Message": "bad batch body"}]}})
+            out = []
+            for item in items:
+                res = run_query(self.data, realm, item.get("Query", ""))
+                out.append({"bId": item.get("bId"), **res})
+            return self._send(200, {"BatchItemResponse": out, "time": _ts(datetime.now(timezone.utc))})
+        if op == "companyinfo":
+            self._count("companyinfo")
+            return self._send(200, {"CompanyInfo": {"Id": "1", "CompanyName": f"Bench Co {realm[-3:]}", "Country": "US"}})
+        return self._send(404, {"error": f"unsupported operation {op}"})
+
+    def do_GET(self) -> None:
+        self._route("GET")
+
+    def do_POST(self) -> None:
+        self._route("POST")
+
+
+def make_server(cfg: Config, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("BoundHandler", (Handler,), {
+        "cfg": cfg, "data": DataSet(cfg), "stats": {}, "stats_lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(cfg: Config, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the server on a daemon thread; returns (server, base_url)."""
+    server = make_server(cfg, host, port)
+    threading.Thread(target=server.serve_forever, name="fake-qb", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--realms", type=int, default=3)
+    p.add_argument("--txns", type=int, default=2000, help="records per transaction entity per realm")
+    p.add_argument("--refs", type=int, default=200, help="records per reference entity per realm")
+    p.add_argument("--accounts", type=int, default=60)
+    p.add_argument("--latency-ms", type=float, default=40.0)
+    p.add_argument("--jitter-ms", type=float, default=10.0)
+    p.add_argument("--changed-fraction", type=float, default=0.02)
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of API calls answered 429")
+    p.add_argument("--seed", type=int, default=7)
+
+
+def config_from_args(args: argparse.Namespace) -> Config:
+    return Config(
+        realms=args.realms, txns=args.txns, refs=args.refs, accounts=args.accounts,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, changed_fraction=args.changed_fraction,
+        error_rate=args.error_rate, seed=args.seed,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    add_arguments(p)
+    args = p.parse_args(argv)
+    cfg = config_from_args(args)
+    server = make_server(cfg, args.host, args.port)
+    print(f"fake QuickBooks on http://{args.host}:{server.server_address[1]} realms={','.join(cfg.realms)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
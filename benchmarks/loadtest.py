@@ -0,0 +1,323 @@
+"""HTTP load test for the Flask app on a local SQLite database.
+
+Boots ``wsgi:app`` in a separate process (Werkzeug threaded server, or
+Gunicorn with ``--server gunicorn``) against a fresh SQLite file
+(``STORAGE_BACKEND=sqlite``). It seeds users and company members through
+the API, then drives a weighted mix of traffic from concurrent clients:
+
+- ``POST /api/users/login``
+- ``GET /api/users/me``, ``/api/company/info``, ``/api/company/users``,
+  ``/api/company/audit-log`` (JWT)
+- ``GET /api/admin/users``, ``/api/admin/business_summary``,
+  ``/api/admin/payments``, ``/api/admin/system_health`` (x-admin-key)
+
+It reports requests/sec, errors and p50/p95/p99 latency per endpoint.
+``--connect-delay-ms`` adds latency to every DB connect (as Azure SQL
+would) to expose per-request connection cost. ``--save-baseline`` and
+``--baseline`` with ``--max-regression`` work as in ``bench_ingest``; p95
+latency and throughput are compared per endpoint.
+
+    python benchmarks/loadtest.py --duration 20 --concurrency 16
+    python benchmarks/loadtest.py --server gunicorn --workers 2 --threads 8 --connect-delay-ms 30
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+ADMIN_KEY = "loadtest-admin-key"
+PASSWORD = "loadtest-pw-123"
+
+# (name, method, path, auth, weight); auth = "jwt" | "admin" | None
+ENDPOINTS = [
+    ("login", "POST", "/api/users/login", None, 1),
+    ("me", "GET", "/api/users/me", "jwt", 6),
+    ("company_info", "GET", "/api/company/info", "jwt", 4),
+    ("company_users", "GET", "/api/company/users", "jwt", 3),
+    ("audit_log", "GET", "/api/company/audit-log", "jwt", 2),
+    ("admin_users", "GET", "/api/admin/users", "admin", 1),
+    ("admin_summary", "GET", "/api/admin/business_summary", "admin", 1),
+    ("admin_payments", "GET", "/api/admin/payments", "admin", 1),
+    ("admin_health", "GET", "/api/admin/system_health", "admin", 1),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server_env(args: argparse.Namespace, db_path: str, log_dir: str) -> dict:
+    from cryptography.fernet import Fernet
+
+    env = dict(os.environ)
+    env.update({
+        "STORAGE_BACKEND": "sqlite",
+        "SQLITE_PATH": db_path,
+        "SQLITE_CONNECT_DELAY_MS": str(args.connect_delay_ms),
+        "SCHEDULER_DISABLED": "1",
+        "JOB_WORKERS_DISABLED": "1",
+        "ADMIN_KEY": ADMIN_KEY,
+        "APP_LOG_PATH": os.path.join(log_dir, "app.log"),
+        "PROFILE_DIR": os.path.join(log_dir, "profiles"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    env.setdefault("ENCRYPTION_SECRET", Fernet.generate_key().decode())
+    return env
+
+
+def start_server(args: argparse.Namespace, db_path: str, log_dir: str) -> Tuple[subprocess.Popen, str]:
+    port = args.port or _free_port()
+    env = _server_env(args, db_path, log_dir)
+    if args.server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers),
+               "--threads", str(args.threads), "--timeout", "120", "--log-level", "warning", "wsgi:app"]
+    else:
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port)]
+    out = open(os.path.join(log_dir, "server.out"), "w")
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=out, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.boot_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}; see {out.name}")
+        try:
+            requests.get(base + "/", timeout=1)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not start in time")
+
+
+def serve(port: int) -> None:
+    """Child mode: run wsgi:app on Werkzeug's threaded server."""
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+
+    import wsgi
+
+    make_server("127.0.0.1", port, wsgi.app, threaded=True).serve_forever()
+
+
+# ---- seeding ----
+
+def seed(base: str, users: int, members: int) -> List[dict]:
+    """Register ``users`` owners (each with ``members`` company users); returns credentials + tokens."""
+    accounts = []
+    s = requests.Session()
+    for i in range(users):
+        email = f"owner{i}@loadtest.local"
+        s.post(f"{base}/api/users/register",
+               json={"email": email, "password": PASSWORD, "company_name": f"Load Co {i}"}, timeout=30)
+        r = s.post(f"{base}/api/users/login", json={"email": email, "password": PASSWORD}, timeout=30)
+        r.raise_for_status()
+        token = r.json()["token"]
+        h = {"Authorization": f"Bearer {token}"}
+        s.get(f"{base}/api/company/info", headers=h, timeout=30)
+        for j in range(members):
+            s.post(f"{base}/api/company/users", headers=h, timeout=30,
+                   json={"email": f"member{i}-{j}@loadtest.local", "name": f"Member {j}", "role": "Viewer"})
+        accounts.append({"email": email, "token": token})
+    s.post(f"{base}/api/admin/promote", headers={"x-admin-key": ADMIN_KEY},
+           json={"email": accounts[0]["email"]}, timeout=30)
+    return accounts
+
+
+# ---- load generation ----
+
+class Recorder:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.samples.clear()
+            self.errors.clear()
+
+    def add(self, name: str, seconds: float, ok: bool) -> None:
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _is_ok(resp: requests.Response) -> bool:
+    if resp.status_code >= 400:
+        return False
+    # Several routes report failures as 200 + {"error": ...}
+    if resp.headers.get("Content-Type", "").startswith("application/json"):
+        try:
+            body = resp.json()
+        except ValueError:
+            return False
+        return not (isinstance(body, dict) and body.get("error"))
+    return True
+
+
+def _client(base: str, accounts: List[dict], rec: Recorder, stop: threading.Event, seed_: int) -> None:
+    rng = random.Random(seed_)
+    s = requests.Session()
+    acct = accounts[seed_ % len(accounts)]
+    weights = [e[4] for e in ENDPOINTS]
+    while not stop.is_set():
+        name, method, path, auth, _ = rng.choices(ENDPOINTS, weights)[0]
+        headers, body = {}, None
+        if auth == "jwt":
+            headers["Authorization"] = f"Bearer {acct['token']}"
+        elif auth == "admin":
+            headers["x-admin-key"] = ADMIN_KEY
+        if name == "login":
+            body = {"email": acct["email"], "password": PASSWORD}
+        t0 = time.perf_counter()
+        try:
+            r = s.request(method, base + path, headers=headers, json=body, timeout=60)
+            ok = _is_ok(r)
+            if ok and name == "login":
+                acct = dict(acct, token=r.json()["token"])
+        except requests.RequestException:
+            ok = False
+        rec.add(name, time.perf_counter() - t0, ok)
+
+
+def _pct(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def summarize(rec: Recorder, wall: float) -> List[dict]:
+    out = []
+    everything: List[float] = []
+    for name, _, path, _, _ in ENDPOINTS:
+        vals = sorted(rec.samples.get(name, []))
+        everything.extend(vals)
+        out.append(_row(name, path, vals, rec.errors.get(name, 0), wall))
+    out.append(_row("ALL", "", sorted(everything), sum(rec.errors.values()), wall))
+    return out
+
+
+def _row(name: str, path: str, vals: List[float], errors: int, wall: float) -> dict:
+    ms = lambda v: round(v * 1000, 1)  # noqa: E731
+    return {
+        "endpoint": name, "path": path, "requests": len(vals), "errors": errors,
+        "rps": round(len(vals) / wall, 1) if wall > 0 else 0.0,
+        "p50_ms": ms(_pct(vals, 50)), "p95_ms": ms(_pct(vals, 95)), "p99_ms": ms(_pct(vals, 99)),
+        "max_ms": ms(vals[-1]) if vals else 0.0,
+    }
+
+
+def _print_table(rows: List[dict]) -> None:
+    cols = ["endpoint", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in rows:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in cols))
+
+
+def _check_baseline(rows: List[dict], path: str, max_regression: float) -> int:
+    with open(path, "r", encoding="utf-8") as f:
+        base = {r["endpoint"]: r for r in json.load(f).get("results", [])}
+    failed = 0
+    for r in rows:
+        b = base.get(r["endpoint"])
+        if not b or not r["requests"] or not b.get("requests"):
+            continue
+        slower = b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + max_regression)
+        fewer = b["rps"] and r["rps"] < b["rps"] * (1 - max_regression)
+        flag = "REGRESSION" if (slower or fewer) else "ok"
+        failed += flag != "ok"
+        print(f"{r['endpoint']}: p95 {b['p95_ms']} -> {r['p95_ms']} ms, rps {b['rps']} -> {r['rps']} {flag}")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Load test the Flask API on SQLite")
+    p.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    p.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    p.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--duration", type=float, default=20.0, help="seconds of measured load")
+    p.add_argument("--warmup", type=float, default=2.0)
+    p.add_argument("--users", type=int, default=8, help="seeded owner accounts")
+    p.add_argument("--members", type=int, default=5, help="company users per owner")
+    p.add_argument("--connect-delay-ms", type=float, default=0.0)
+    p.add_argument("--boot-timeout", type=float, default=60.0)
+    p.add_argument("--json", action="store_true")
+    p.add_argument("--save-baseline")
+    p.add_argument("--baseline")
+    p.add_argument("--max-regression", type=float, default=0.2)
+    p.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.serve:
+        serve(args.port)
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="loadtest_")
+    proc = None
+    try:
+        proc, base = start_server(args, os.path.join(tmp, "loadtest.sqlite3"), tmp)
+        accounts = seed(base, args.users, args.members)
+
+        stop = threading.Event()
+        rec = Recorder()
+        threads = [threading.Thread(target=_client, args=(base, accounts, rec, stop, i), daemon=True)
+                   for i in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        time.sleep(args.warmup)
+        rec.reset()
+        t0 = time.perf_counter()
+        time.sleep(args.duration)
+        stop.set()
+        wall = time.perf_counter() - t0
+        for t in threads:
+            t.join(timeout=60)
+        rows = summarize(rec, wall)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    config = {k: getattr(args, k) for k in ("server", "workers", "threads", "concurrency", "duration",
+                                            "users", "members", "connect_delay_ms")}
+    if args.json:
+        print(json.dumps({"config": config, "results": rows}, indent=2))
+    else:
+        print(f"config: {config}")
+        _print_table(rows)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": rows}, f, indent=2)
+    if args.baseline:
+        return _check_baseline(rows, args.baseline, args.max_regression)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
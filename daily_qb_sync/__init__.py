@@ -1,15 +1,14 @@
 import os
 import time
 import json
-import pyodbc
-import requests
-import pandas as pd
 import smtplib
-import azure.functions as func
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from qb_app.db import get_connection
+from qb_app import applog, gl_cube, qb_http, storage, telemetry
+from qb_app.load_all_transactions import TRANSACTION_ENTITIES, replace_transactions
 
 # === (OPTIONAL) decrypt helper ===
 # If encrypt_qb_token.py exists in same folder later, import instead
@@ -28,6 +27,14 @@ EMAIL_ALERT = os.getenv("EMAIL_ALERT")
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
+# Changes are fetched from the last successful sync minus this overlap.
+# The watermark is client_auth.sync_watermark, written only by this sync:
+# last_run_time is also moved by the token refresh and by the old full-copy
+# sync, which stored nothing, so it cannot say what has been fetched.
+SYNC_OVERLAP_MINUTES = int(os.getenv("DAILY_SYNC_OVERLAP_MINUTES", "60") or 60)
+FULL_SYNC_SINCE = "2020-01-01T00:00:00Z"
+PAGE_SIZE = 1000
+
 # === SQL Connection with retry ===
 def connect_with_retry(logger, max_retries=5, delay=20):
     for attempt in range(1, max_retries + 1):
@@ -46,10 +53,11 @@ def connect_with_retry(logger, max_retries=5, delay=20):
 
 # === Verify realm with QuickBooks ===
 def verify_realm(logger, realm_id, access_token):
-    url = f"https://quickbooks.api.intuit.com/v3/company/{realm_id}/companyinfo/{realm_id}"
+    url = qb_http.company_url(realm_id, f"companyinfo/{realm_id}")
     headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json"}
     try:
-        resp = requests.get(url, headers=headers)
+        resp = qb_http.get(url, entity="CompanyInfo", headers=headers)
+        telemetry.incr("api_calls")
         if resp.status_code == 200:
             logger.info(f"✅ Realm verified: {realm_id}")
             return True
@@ -68,22 +76,66 @@ def verify_realm(logger, realm_id, access_token):
 
 # === Fetch QuickBooks entity data ===
 def fetch_qb_data(logger, entity, realm_id, access_token, since_datetime):
-    base_url = f"https://quickbooks.api.intuit.com/v3/company/{realm_id}/query"
-    query = f"SELECT * FROM {entity} WHERE Metadata.LastUpdatedTime > '{since_datetime}' ORDERBY Metadata.LastUpdatedTime"
+    """Every record of ``entity`` updated after ``since_datetime`` (all pages), or None on error."""
+    base_url = qb_http.company_url(realm_id, "query")
     headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json", "Content-Type": "application/text"}
-    try:
-        r = requests.post(base_url, headers=headers, data=query)
-        if r.status_code == 200:
-            return r.json()
-        else:
-            logger.warning(f"❌ {entity} API error {r.status_code}: {r.text[:200]}")
+    records = []
+    start = 1
+    while True:
+        query = (
+            f"SELECT * FROM {entity} WHERE Metadata.LastUpdatedTime > '{since_datetime}' "
+            f"ORDERBY Metadata.LastUpdatedTime STARTPOSITION {start} MAXRESULTS {PAGE_SIZE}"
+        )
+        try:
+            r = qb_http.post(base_url, entity=entity, headers=headers, data=query)
+            telemetry.incr("api_calls")
+            if r.status_code != 200:
+                logger.warning(f"❌ {entity} API error {r.status_code}: {r.text[:200]}")
+                return None
+            page = (r.json().get("QueryResponse") or {}).get(entity) or []
+        except Exception as e:
+            logger.error(f"❌ Request failed for {entity}: {e}")
             return None
-    except Exception as e:
-        logger.error(f"❌ Request failed for {entity}: {e}")
+        records.extend(page)
+        if len(page) < PAGE_SIZE:
+            return records
+        start += PAGE_SIZE
+
+
+def changes_since(watermark):
+    """QuickBooks timestamp to sync from: the watermark (UTC) minus the overlap, else full history."""
+    if not watermark:
+        return FULL_SYNC_SINCE
+    if isinstance(watermark, str):
+        try:
+            watermark = datetime.fromisoformat(watermark.replace("Z", ""))
+        except ValueError:
+            return FULL_SYNC_SINCE
+    return (watermark - timedelta(minutes=SYNC_OVERLAP_MINUTES)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def stored_watermark(cursor, client_id):
+    """Latest LastUpdatedTime (naive UTC) among the client's stored transactions, or None.
+
+    Starting point for a client's first incremental sync: everything
+    changed after what onboarding stored is fetched again.
+    """
+    cursor.execute("SELECT MAX(UpdatedTime) FROM qb_transactions WHERE client_auth_id = ?", (client_id,))
+    row = cursor.fetchone()
+    if not row or not row[0]:
         return None
+    try:
+        updated = datetime.fromisoformat(str(row[0]).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if updated.tzinfo is not None:
+        updated = updated.astimezone(timezone.utc).replace(tzinfo=None)
+    return updated
 
 # === Log sync results ===
 def log_sync_result(conn, client_auth_id, client_name, status, message, runtime_seconds):
+    if status == "failed":
+        telemetry.incr("errors")
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO sync_run_log (client_auth_id, client_name, status, message, runtime_seconds)
@@ -97,6 +149,8 @@ def send_sync_report(logger, results):
         logger.info("No results to report.")
         return
 
+    import pandas as pd  # only the report needs it; keeps the web app's import light
+
     df = pd.DataFrame(results)
     # Ensure a valid, existing temp directory on Linux containers
     tmp_dir = "/tmp" if os.name != "nt" else (os.getenv("TEMP") or os.getenv("TMP") or ".")
@@ -152,9 +206,142 @@ def send_sync_report(logger, results):
     except Exception as e:
         logger.error(f"❌ Failed to send email report: {e}")
 
+ENTITIES = TRANSACTION_ENTITIES
+
+
+# === Active clients ===
+def load_active_clients(cursor, client_id=None):
+    storage.get_storage().add_column(cursor, "client_auth", "sync_watermark", "DATETIME NULL")
+    sql = """
+        SELECT id, client_name, realm_id, access_token_enc, refresh_token_enc, sync_watermark
+        FROM client_auth
+        WHERE active = 1
+    """
+    params = ()
+    if client_id is not None:
+        sql += " AND id = ?"
+        params = (int(client_id),)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    cols = [c[0] for c in cursor.description]
+    return [dict(zip(cols, r)) for r in rows]
+
+
+# === Sync a single client ===
+def sync_client(logger, conn, client):
+    """Sync one client's entities; returns the per-entity result dicts."""
+    cursor = conn.cursor()
+    client_id = client["id"]
+    client_name = client.get("client_name", f"Client {client_id}")
+    realm_id = client["realm_id"]
+    results = []
+    start_time = time.time()
+
+    try:
+        access_token = decrypt_token(client["access_token_enc"])
+        refresh_token = decrypt_token(client["refresh_token_enc"])
+    except Exception as e:
+        msg = f"Token decryption failed: {e}"
+        logger.error(msg)
+        log_sync_result(conn, client_id, client_name, "failed", msg, 0)
+        return [{"client_id": client_id, "client_name": client_name, "status": "failed", "runtime_seconds": 0, "message": msg}]
+
+    if not verify_realm(logger, realm_id, access_token):
+        msg = f"Realm {realm_id} not recognized – skipped"
+        logger.warning(msg)
+        log_sync_result(conn, client_id, client_name, "skipped", msg, 0)
+        return [{"client_id": client_id, "client_name": client_name, "status": "skipped", "runtime_seconds": 0, "message": msg}]
+
+    # Clients onboarded before the cube existed get it built once
+    try:
+        if gl_cube.ensure_built(cursor, client_id):
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"gl cube backfill failed: {e}", extra={"client_auth_id": client_id})
+
+    run_started = datetime.utcnow()
+    watermark = client.get("sync_watermark")
+    if not watermark:
+        watermark = stored_watermark(cursor, client_id)
+    since = changes_since(watermark)
+    all_ok = True
+    for entity in ENTITIES:
+        fields = {"client_auth_id": client_id, "realm_id": realm_id, "entity": entity}
+        logger.debug(f"Syncing {entity} for {client_name} since {since}", extra=fields)
+        t0 = time.perf_counter()
+        try:
+            records = fetch_qb_data(logger, entity, realm_id, access_token, since)
+            written = 0
+            if records is None:
+                status, msg = "failed", f"{entity} sync failed."
+                all_ok = False
+            else:
+                # Changed transactions replace their stored lines (and gl_monthly cells)
+                written, failed = replace_transactions(conn, client_id, entity, records)
+                if failed:
+                    status, msg = "failed", f"{entity} sync: {failed} of {len(records)} changed not saved."
+                    all_ok = False
+                else:
+                    status, msg = "successful", f"{entity} sync completed ({len(records)} changed)."
+            runtime = round(time.time() - start_time, 2)
+            log_sync_result(conn, client_id, client_name, status, msg, runtime)
+            results.append({"client_id": client_id, "client_name": client_name, "status": status, "runtime_seconds": runtime, "message": msg})
+            # One summary line per entity: rows/duration give throughput
+            logger.info("entity synced", extra={
+                **fields, "status": status, "records": len(records or []), "rows": written,
+                "duration_ms": int((time.perf_counter() - t0) * 1000),
+            })
+        except Exception as e:
+            all_ok = False
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            runtime = round(time.time() - start_time, 2)
+            msg = f"Error syncing {entity}: {e}"
+            logger.error(msg, extra=fields)
+            log_sync_result(conn, client_id, client_name, "failed", msg, runtime)
+            continue
+
+    # Only advance the watermark when every entity synced, so failures are retried
+    if all_ok:
+        cursor.execute(
+            "UPDATE client_auth SET last_run_time = ?, sync_watermark = ? WHERE id = ?",
+            (run_started, run_started, client_id),
+        )
+        conn.commit()
+    # Whatever did sync goes into this host's columnar snapshot (no-op if unchanged)
+    from qb_app import columnar_cache
+    columnar_cache.refresh_after_sync(conn, client_id)
+    return results
+
+
+def sync_one(client_id):
+    """Sync a single active client (used by the per-client scheduled jobs).
+
+    Raises if SQL is unreachable so the job queue can retry; returns the
+    per-entity results otherwise (empty if the client is inactive).
+    """
+    import logging
+    logger = logging.getLogger("azure")
+    conn = connect_with_retry(logger, max_retries=2, delay=10)
+    try:
+        clients = load_active_clients(conn.cursor(), client_id)
+        if not clients:
+            logger.warning(f"⚠️ Client {client_id} not active – skipped")
+            return []
+        return sync_client(logger, conn, clients[0])
+    finally:
+        conn.close()
+
+
 # === Main Function (Azure Entry Point) ===
-def main(mytimer: func.TimerRequest) -> None:
+# mytimer is left unannotated (the binding comes from function.json) so the
+# web app can import this module without loading azure.functions
+def main(mytimer) -> None:
     import logging
+    applog.configure()
     logger = logging.getLogger("azure")
     utc_timestamp = datetime.utcnow().replace(tzinfo=None)
 
@@ -162,68 +349,19 @@ def main(mytimer: func.TimerRequest) -> None:
 
     try:
         conn = connect_with_retry(logger)
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT id, client_name, realm_id, access_token_enc, refresh_token_enc
-            FROM client_auth
-            WHERE active = 1
-        """)
-        rows = cursor.fetchall()
-        cols = [c[0] for c in cursor.description]
-        clients = [dict(zip(cols, r)) for r in rows]
+        clients = load_active_clients(conn.cursor())
 
         if not clients:
             logger.warning("⚠️ No active clients found.")
             return
 
-        entities = ['Invoice', 'SalesReceipt', 'Payment', 'CreditMemo', 'Purchase', 'Bill', 'BillPayment']
         results = []
         total_clients = len(clients)
 
         for i, client in enumerate(clients, start=1):
-            client_id = client["id"]
-            client_name = client.get("client_name", f"Client {client_id}")
-            realm_id = client["realm_id"]
-
+            client_name = client.get("client_name", f"Client {client['id']}")
             logger.info(f"\n=== Processing {client_name} ({i}/{total_clients}) ===")
-            start_time = time.time()
-
-            try:
-                access_token = decrypt_token(client["access_token_enc"])
-                refresh_token = decrypt_token(client["refresh_token_enc"])
-            except Exception as e:
-                msg = f"Token decryption failed: {e}"
-                logger.error(msg)
-                log_sync_result(conn, client_id, client_name, "failed", msg, 0)
-                continue
-
-            if not verify_realm(logger, realm_id, access_token):
-                msg = f"Realm {realm_id} not recognized – skipped"
-                logger.warning(msg)
-                log_sync_result(conn, client_id, client_name, "skipped", msg, 0)
-                continue
-
-            for entity in entities:
-                since = "2020-01-01T00:00:00Z"
-                logger.info(f"🔁 Syncing {entity} for {client_name} ({realm_id})...")
-                try:
-                    data = fetch_qb_data(logger, entity, realm_id, access_token, since)
-                    status = "successful" if data else "failed"
-                    msg = f"{entity} sync {'completed' if data else 'no data'}."
-                    runtime = round(time.time() - start_time, 2)
-                    log_sync_result(conn, client_id, client_name, status, msg, runtime)
-                    results.append({"client_id": client_id, "client_name": client_name, "status": status, "runtime_seconds": runtime, "message": msg})
-                    logger.info(f"🕒 {msg} ({runtime}s)")
-                except Exception as e:
-                    runtime = round(time.time() - start_time, 2)
-                    msg = f"Error syncing {entity}: {e}"
-                    logger.error(msg)
-                    log_sync_result(conn, client_id, client_name, "failed", msg, runtime)
-                    continue
-
-            cursor.execute("UPDATE client_auth SET last_run_time = GETUTCDATE() WHERE id = ?", (client_id,))
-            conn.commit()
+            results.extend(sync_client(logger, conn, client))
             logger.info(f"✅ Finished {client_name} ({i}/{total_clients})")
 
         conn.close()
@@ -232,4 +370,3 @@ def main(mytimer: func.TimerRequest) -> None:
 
     except Exception as e:
         logger.error(f"❌ Fatal error during sync: {e}")
-from qb_app.db import get_connection
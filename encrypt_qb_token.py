@@ -1,20 +1,25 @@
-from cryptography.fernet import Fernet
-from dotenv import load_dotenv
 import os
+from functools import lru_cache
 
-# Load environment variables (works locally or in Azure)
-load_dotenv()
 
-key = os.getenv("ENCRYPTION_SECRET")
-if not key:
-    raise ValueError("❌ ENCRYPTION_SECRET not found in environment variables")
+@lru_cache(maxsize=1)
+def _fernet():
+    """Build the Fernet key on first use so importing this module is free."""
+    from cryptography.fernet import Fernet
+    from dotenv import load_dotenv
 
-fernet = Fernet(key.encode())
+    # Load environment variables (works locally or in Azure)
+    load_dotenv()
+
+    key = os.getenv("ENCRYPTION_SECRET")
+    if not key:
+        raise ValueError("❌ ENCRYPTION_SECRET not found in environment variables")
+    return Fernet(key.encode())
 
 def encrypt_token(value: str) -> str:
     """Encrypt a string using Fernet encryption."""
-    return fernet.encrypt(value.encode()).decode()
+    return _fernet().encrypt(value.encode()).decode()
 
 def decrypt_token(value: str) -> str:
     """Decrypt a Fernet-encrypted string."""
-    return fernet.decrypt(value.encode()).decode()
+    return _fernet().decrypt(value.encode()).decode()
@@ -0,0 +1,53 @@
+"""Gunicorn settings for the Web App (``gunicorn -c gunicorn.conf.py wsgi:app``).
+
+The app is preloaded in the master so workers share its imported code, and
+nothing process-bound is created before the fork: ``create_app()`` runs with
+background threads off, and each worker then gets its own DB pool, HTTP
+session, log writer, job dispatcher and scheduler campaign (only the lease
+holder runs APScheduler). Every setting can be overridden from the env.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND") or f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")  # gthread | gevent | sync
+workers = int(os.getenv("GUNICORN_WORKERS") or min(multiprocessing.cpu_count() * 2 + 1, 4))
+threads = int(os.getenv("GUNICORN_THREADS", "8") or 8)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "200") or 200)  # gevent only
+# gevent patches the stdlib when the worker starts, which is too late for
+# modules a preloading master already imported; default preload off there
+preload_app = os.getenv("GUNICORN_PRELOAD", "0" if worker_class == "gevent" else "1") == "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120") or 120)
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30") or 30)
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5") or 5)
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-")
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+# create_app() must not start threads in the master (the fork would not copy
+# them); post_worker_init starts them in each worker instead
+os.environ["APP_BACKGROUND"] = "0"
+
+
+def post_fork(server, worker):
+    """Drop anything inherited from the master before the worker serves."""
+    from qb_app import applog, db, qb_http
+
+    db.reset_pool()
+    qb_http.reset_session()
+    applog.configure()  # fork-aware: new queue and writer thread
+
+
+def post_worker_init(worker):
+    """App is loaded in this worker: start its job dispatcher and scheduler campaign."""
+    import qb_app
+
+    qb_app.start_background()
+
+
+def worker_exit(server, worker):
+    """Release the scheduler lease so another worker takes over at once."""
+    import qb_app
+
+    qb_app.stop_background()
@@ -1,12 +1,104 @@
 import os
-import sys
-import logging
-from flask import Flask
+import threading
+from typing import Optional
 
-# Send logs to stdout for Azure Log Stream
-logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+from flask import Flask
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "fallback_key")
-# Let Flask app logs propagate to root (handled above)
-app.logger.propagate = True
+
+_CONFIGURED = False
+_CONFIGURE_LOCK = threading.Lock()
+
+
+def _register_blueprints(flask_app: Flask) -> None:
+    try:
+        from qb_app.routes_auth import auth_bp
+        from qb_app.routes_qb_connect import qb_connect_bp
+        from qb_app.routes_user_dashboard import user_dashboard_bp
+        from qb_app.admin_routes import admin_bp
+        from qb_app.routes_integrations import integrations_bp
+        from qb_app.routes_forecast import forecast_bp
+        from qb_app.routes_sheets import sheets_bp
+        from qb_app.routes_budgets import budgets_bp
+
+        flask_app.register_blueprint(auth_bp)
+        flask_app.register_blueprint(qb_connect_bp)
+        flask_app.register_blueprint(user_dashboard_bp)
+        flask_app.register_blueprint(admin_bp)
+        flask_app.register_blueprint(integrations_bp)
+        flask_app.register_blueprint(forecast_bp)
+        flask_app.register_blueprint(sheets_bp)
+        flask_app.register_blueprint(budgets_bp)
+    except Exception as e:  # avoid crashing startup if optional
+        print(f"Blueprint registration warning: {e}")
+
+
+def start_background() -> None:
+    """Start this process's job dispatcher and scheduler campaign (idempotent).
+
+    Both are fork-aware, so call it in each gunicorn worker rather than in a
+    preloading master.
+    """
+    try:
+        from qb_app import job_runner, scheduler
+
+        job_runner.start_workers()  # resume durable jobs queued before a restart
+        scheduler.start()
+    except Exception as e:
+        print(f"[scheduler] start warning: {e}")
+
+
+def stop_background() -> None:
+    """Stop the job dispatcher and hand off scheduler leadership (worker exit)."""
+    try:
+        from qb_app import job_runner, scheduler
+
+        job_runner.stop_workers()
+        scheduler.stop()
+    except Exception as e:
+        print(f"[scheduler] stop warning: {e}")
+
+
+def create_app(background: Optional[bool] = None) -> Flask:
+    """Configure and return the app: env, logging, CORS, metrics, routes.
+
+    Importing ``qb_app`` (or any route module) has no side effects; all
+    startup work happens here, once per process. Background threads start
+    unless ``background`` is false (default: on unless APP_BACKGROUND=0).
+    """
+    global _CONFIGURED
+    with _CONFIGURE_LOCK:
+        if not _CONFIGURED:
+            from dotenv import load_dotenv
+            from flask.logging import default_handler
+            from flask_cors import CORS
+            from qb_app import applog, metrics, profiling
+
+            load_dotenv()
+            # Send logs to stdout for Azure Log Stream (and the debug file)
+            # via a background writer thread
+            applog.configure()
+            # Let Flask app logs propagate to root (handled above); Flask's own
+            # stderr handler would print every qb_app.* record a second time
+            app.logger.removeHandler(default_handler)
+            app.logger.propagate = True
+            if os.environ.get("SECRET_KEY"):
+                app.config["SECRET_KEY"] = os.environ["SECRET_KEY"]
+            app.config["PROPAGATE_EXCEPTIONS"] = True
+            CORS(app, resources={r"/*": {"origins": "*"}}, allow_headers=["Content-Type", "Authorization"])
+            metrics.init_app(app)  # per-endpoint request timing + GET /metrics
+            profiling.init_app(app)  # admin-only ?__profile=1
+
+            # These register routes on ``app`` when imported
+            import qb_app.qb_callback_app  # noqa: F401
+            import qb_app.web_routes  # noqa: F401
+
+            _register_blueprints(app)
+            _CONFIGURED = True
+
+    if background is None:
+        background = os.getenv("APP_BACKGROUND", "1") != "0"
+    if background:
+        start_background()
+    return app
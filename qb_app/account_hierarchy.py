@@ -0,0 +1,211 @@
+"""Chart of accounts hierarchy as nested-set intervals.
+
+QuickBooks sub-accounts point at their parent through ``ParentRef``, which
+the reference loader stores as ``qb_accounts.ParentId``. ``rebuild`` walks
+that tree once per accounts load and writes ``qb_account_hierarchy``: one
+row per account with its depth, path and preorder interval ``lft..rgt``.
+An account's descendants are exactly the rows with ``lft`` inside its
+interval, so a subtotal at any level is a single range aggregate instead of
+a recursive query per request::
+
+    SELECT SUM(g.amount) FROM qb_account_hierarchy h
+    JOIN gl_monthly g ON g.client_auth_id = h.client_auth_id AND g.AccountId = h.AccountId
+    WHERE h.client_auth_id = ? AND h.lft BETWEEN ? AND ?
+
+Siblings are ordered by name, so preorder is also the report order.
+Accounts loaded before ``ParentId`` was kept fall back to the parent in
+their ``FullyQualifiedName``. A rebuild that changes the tree bumps the
+client's ``accounts_version`` so cached roll-ups are recomputed.
+"""
+
+import datetime as dt
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from qb_app import applog, data_version, storage
+
+
+_logger = applog.get_logger("qb_app.account_hierarchy")
+
+_ACCOUNT_FIELDS = ("Name", "FullyQualifiedName", "Classification", "ParentId")
+_COLUMNS = ("AccountId", "ParentId", "Name", "path", "Classification", "depth", "lft", "rgt")
+INSERT_BATCH = 5000
+
+Row = Tuple[str, Optional[str], str, str, Optional[str], int, int, int]  # _COLUMNS order
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
+
+
+def ensure_hierarchy_table(cur) -> None:
+    storage.get_storage().ensure_table(
+        cur,
+        "qb_account_hierarchy",
+        """
+        client_auth_id INT NOT NULL,
+        AccountId NVARCHAR(50) NOT NULL,
+        ParentId NVARCHAR(50) NULL,
+        Name NVARCHAR(255) NOT NULL,
+        path NVARCHAR(1000) NOT NULL,
+        Classification NVARCHAR(50) NULL,
+        depth INT NOT NULL,
+        lft INT NOT NULL,
+        rgt INT NOT NULL,
+        CONSTRAINT PK_qb_account_hierarchy PRIMARY KEY (client_auth_id, AccountId)
+        """,
+        ("CREATE INDEX IX_qb_account_hierarchy_lft ON qb_account_hierarchy (client_auth_id, lft)",),
+    )
+
+
+def _read_accounts(cur, client_auth_id: int) -> Dict[str, dict]:
+    store = storage.get_storage()
+    if not store.table_exists(cur, "qb_accounts"):
+        return {}
+    fields = [f for f in _ACCOUNT_FIELDS if f in set(store.columns(cur, "qb_accounts"))]
+    cols = ", ".join(["Id"] + fields)
+    cur.execute(f"SELECT {cols} FROM qb_accounts WHERE client_auth_id = ?", (int(client_auth_id),))
+    return {str(r[0]): dict(zip(fields, r[1:])) for r in cur.fetchall()}
+
+
+def _parents(accounts: Dict[str, dict]) -> Dict[str, Optional[str]]:
+    """AccountId -> parent AccountId (ParentId, else the FullyQualifiedName parent)."""
+    by_path = {info.get("FullyQualifiedName"): a for a, info in accounts.items() if info.get("FullyQualifiedName")}
+    parents = {}
+    for account_id, info in accounts.items():
+        parent = info.get("ParentId")
+        if parent is None and ":" in (info.get("FullyQualifiedName") or ""):
+            parent = by_path.get(info["FullyQualifiedName"].rsplit(":", 1)[0])
+        parent = str(parent) if parent is not None else None
+        parents[account_id] = parent if parent in accounts and parent != account_id else None
+    return parents
+
+
+def build(accounts: Dict[str, dict]) -> List[Row]:
+    """Nested-set rows in preorder for ``accounts`` (AccountId -> qb_accounts fields)."""
+    parents = _parents(accounts)
+    children: Dict[Optional[str], List[str]] = {}
+    for account_id, parent in parents.items():
+        children.setdefault(parent, []).append(account_id)
+
+    def name(a: str) -> str:
+        return str(accounts[a].get("Name") or f"Account {a}")
+
+    for kids in children.values():
+        kids.sort(key=lambda a: (name(a).lower(), a))
+    rows: List[list] = []
+    seen = set()
+    counter = 0
+    # Roots first; accounts on a ParentId cycle never hang off a root, so they become roots too
+    roots = children.get(None, []) + sorted(a for a in accounts if parents[a] is not None)
+    for root in roots:
+        if root in seen:
+            continue
+        # (account, parent row) to enter a node; (None, its row) to close its interval
+        stack: List[Tuple[Optional[str], Optional[int]]] = [(root, None)]
+        while stack:
+            account_id, parent_ix = stack.pop()
+            if account_id is None:
+                counter += 1
+                rows[parent_ix][7] = counter
+                continue
+            if account_id in seen:
+                continue
+            seen.add(account_id)
+            counter += 1
+            parent = rows[parent_ix] if parent_ix is not None else None
+            path = f"{parent[3]}:{name(account_id)}" if parent else name(account_id)
+            rows.append([
+                account_id,
+                parent[0] if parent else None,
+                name(account_id),
+                path,
+                accounts[account_id].get("Classification"),
+                parent[5] + 1 if parent else 0,
+                counter,
+                0,
+            ])
+            ix = len(rows) - 1
+            stack.append((None, ix))
+            stack.extend((kid, ix) for kid in reversed(children.get(account_id, [])))
+    return [tuple(r) for r in rows]
+
+
+def load(cur, client_auth_id: int) -> List[dict]:
+    """The client's hierarchy rows ordered by ``lft`` (preorder)."""
+    ensure_hierarchy_table(cur)
+    cur.execute(
+        f"SELECT {', '.join(_COLUMNS)} FROM qb_account_hierarchy WHERE client_auth_id = ? ORDER BY lft",
+        (int(client_auth_id),),
+    )
+    return [
+        {"account_id": str(r[0]), "parent_id": r[1], "name": r[2], "path": r[3], "classification": r[4],
+         "depth": int(r[5]), "lft": int(r[6]), "rgt": int(r[7])}
+        for r in cur.fetchall()
+    ]
+
+
+def rebuild(cur, client_auth_id: int) -> bool:
+    """Recompute a client's hierarchy from qb_accounts (no commit); True when it changed."""
+    ensure_hierarchy_table(cur)
+    cid = int(client_auth_id)
+    rows = build(_read_accounts(cur, cid))
+    current = [
+        (r["account_id"], r["parent_id"], r["name"], r["path"], r["classification"], r["depth"], r["lft"], r["rgt"])
+        for r in load(cur, cid)
+    ]
+    if current == rows:
+        return False
+    cur.execute("DELETE FROM qb_account_hierarchy WHERE client_auth_id = ?", (cid,))
+    cur.fast_executemany = True  # pyodbc: one round trip per batch
+    values = [(cid, *r) for r in rows]
+    for i in range(0, len(values), INSERT_BATCH):
+        cur.executemany(
+            f"INSERT INTO qb_account_hierarchy (client_auth_id, {', '.join(_COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * (len(_COLUMNS) + 1))})",
+            values[i:i + INSERT_BATCH],
+        )
+    data_version.bump(cur, cid, "accounts_version")
+    _log("account hierarchy rebuilt", client_auth_id=cid, accounts=len(rows))
+    return True
+
+
+def ensure_built(cur, client_auth_id: int) -> bool:
+    """Backfill the hierarchy for a client that has accounts but no hierarchy rows yet."""
+    ensure_hierarchy_table(cur)
+    cid = int(client_auth_id)
+    cur.execute("SELECT TOP 1 1 FROM qb_account_hierarchy WHERE client_auth_id = ?", (cid,))
+    if cur.fetchone():
+        return False
+    if not storage.get_storage().table_exists(cur, "qb_accounts"):
+        return False
+    cur.execute("SELECT TOP 1 1 FROM qb_accounts WHERE client_auth_id = ?", (cid,))
+    if not cur.fetchone():
+        return False
+    return rebuild(cur, cid)
+
+
+def subtotal(cur, client_auth_id: int, account_id: str, start: Optional[dt.date] = None,
+             end: Optional[dt.date] = None) -> float:
+    """``gl_monthly`` total of an account and all its sub-accounts (one range aggregate)."""
+    cid = int(client_auth_id)
+    cur.execute("SELECT lft, rgt FROM qb_account_hierarchy WHERE client_auth_id = ? AND AccountId = ?",
+                (cid, str(account_id)))
+    row = cur.fetchone()
+    if not row:
+        return 0.0
+    sql = (
+        "SELECT SUM(g.amount) FROM qb_account_hierarchy h "
+        "JOIN gl_monthly g ON g.client_auth_id = h.client_auth_id AND g.AccountId = h.AccountId "
+        "WHERE h.client_auth_id = ? AND h.lft BETWEEN ? AND ?"
+    )
+    params: list = [cid, int(row[0]), int(row[1])]
+    if start is not None:
+        sql += " AND g.month >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND g.month <= ?"
+        params.append(end)
+    cur.execute(sql, tuple(params))
+    total = cur.fetchone()[0]
+    return float(total or 0)
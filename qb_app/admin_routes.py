@@ -1,37 +1,35 @@
 import os
+import json
+import time
 from datetime import datetime
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 from qb_app.db import get_connection, fetchall_dict, fetchone_dict
 from qb_app.utils import admin_required
+from qb_app import applog, storage
 
 
 admin_bp = Blueprint("admin_bp", __name__, url_prefix="/api/admin")
 
 
 def _ensure_subscriptions_table(cur) -> None:
-    cur.execute(
-        """
-        IF NOT EXISTS (
-          SELECT 1 FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[subscriptions]') AND type in (N'U')
-        )
-        BEGIN
-          CREATE TABLE [dbo].[subscriptions](
-            [id] INT IDENTITY(1,1) PRIMARY KEY,
-            [client_id] INT NULL,
-            [provider] NVARCHAR(50) NULL DEFAULT 'stripe',
-            [provider_customer_id] NVARCHAR(255) NULL,
-            [provider_subscription_id] NVARCHAR(255) NULL,
-            [plan] NVARCHAR(50) NULL DEFAULT 'free',
-            [status] NVARCHAR(20) NULL DEFAULT 'inactive',
-            [monthly_fee] DECIMAL(10,2) NULL DEFAULT 0,
-            [last_payment_date] DATETIME NULL,
-            [next_payment_due] DATETIME NULL,
-            [created_at] DATETIME NULL DEFAULT GETUTCDATE(),
-            CONSTRAINT [FK_subscriptions_client_auth] FOREIGN KEY ([client_id]) REFERENCES [dbo].[client_auth]([id])
-          )
-        END
+    storage.get_storage().ensure_table(
+        cur,
+        "subscriptions",
         """
+        [id] INT IDENTITY(1,1) PRIMARY KEY,
+        [client_id] INT NULL,
+        [provider] NVARCHAR(50) NULL DEFAULT 'stripe',
+        [provider_customer_id] NVARCHAR(255) NULL,
+        [provider_subscription_id] NVARCHAR(255) NULL,
+        [plan] NVARCHAR(50) NULL DEFAULT 'free',
+        [status] NVARCHAR(20) NULL DEFAULT 'inactive',
+        [monthly_fee] DECIMAL(10,2) NULL DEFAULT 0,
+        [last_payment_date] DATETIME NULL,
+        [next_payment_due] DATETIME NULL,
+        [created_at] DATETIME NULL DEFAULT GETUTCDATE(),
+        CONSTRAINT [FK_subscriptions_client_auth] FOREIGN KEY ([client_id]) REFERENCES [dbo].[client_auth]([id])
+        """,
     )
 
 
@@ -71,28 +69,69 @@ def system_health():
     }
     try:
         from qb_app import scheduler as _sched  # noqa: WPS433
+        from qb_app import telemetry  # noqa: WPS433
+
+        def _iso(v):
+            return v.isoformat() if isinstance(v, datetime) else v
 
-        status["scheduler_status"] = "running"
+        # Scheduler runs in whichever process holds the lease
+        holder = None
+        if _sched.is_leader():
+            status["scheduler_status"] = "running"
+            status["scheduler_leader"] = "this process"
+        else:
+            try:
+                from qb_app.leader import current_holder  # noqa: WPS433
+
+                holder = current_holder("scheduler")
+            except Exception:
+                holder = None
+            status["scheduler_status"] = "running" if holder else "no leader"
+            status["scheduler_leader"] = holder["owner"] if holder else None
+
+        stats = telemetry.job_stats()
+        last_started = {
+            name: (s.get("last_run") or {}).get("started_at") for name, s in stats.items()
+        }
         jobs = []
-        try:
-            # Best-effort next run hints
+        for sj in _sched.job_schedule(last_started):
+            s = stats.get(sj["id"]) or {}
+            last = s.get("last_run") or {}
             jobs.append({
-                "name": "job_token_refresh",
-                "last_run": None,
-                "next_run": "configured",
-                "status": "scheduled",
+                "name": sj["id"],
+                "next_run": sj["next_run"],
+                "next_run_exact": sj["exact"],
+                "last_run": _iso(last.get("started_at")),
+                "last_run_end": _iso(last.get("ended_at")),
+                "last_duration_ms": last.get("duration_ms"),
+                "last_status": last.get("status"),
+                "rows_synced": last.get("rows_synced"),
+                "api_calls": last.get("api_calls"),
+                "errors": last.get("errors"),
+                "runs": s.get("runs", 0),
+                "failures": s.get("failures", 0),
+                "p50_ms": s.get("p50_ms"),
+                "p95_ms": s.get("p95_ms"),
+                "status": "scheduled" if sj["next_run"] else "idle",
             })
-            jobs.append({
-                "name": "job_daily_sync",
-                "last_run": None,
-                "next_run": "configured",
-                "status": "scheduled",
-            })
-        except Exception:
-            pass
         status["jobs"] = jobs
-    except Exception:
+        # Queue-run jobs (per-client daily sync, onboarding) have no schedule
+        status["queued_jobs"] = [
+            {
+                "name": name,
+                "runs": s["runs"],
+                "failures": s["failures"],
+                "p50_ms": s["p50_ms"],
+                "p95_ms": s["p95_ms"],
+                "last_run": _iso(s["last_run"]["started_at"]),
+                "last_status": s["last_run"]["status"],
+            }
+            for name, s in sorted(stats.items())
+            if name.startswith("job:")
+        ]
+    except Exception as e:
         status["scheduler_status"] = "unavailable"
+        status["error"] = str(e)
     return jsonify(status)
 
 
@@ -224,67 +263,185 @@ def retry_payment(sub_id: int):
 @admin_bp.post("/run_job")
 @admin_required
 def run_job():
-    job = ((request.get_json(silent=True) or {}).get("job") or "").strip().lower()
+    """Start a scheduler job in the background.
+
+    Body: {"job": "token_refresh" | "daily_sync" | "forecast_refresh", "client_id"?: int, "profile"?: bool}.
+    With client_id, daily_sync syncs just that client (instead of planning
+    the per-client jobs). With profile, the run is captured with cProfile;
+    the response carries profile_id for /api/admin/profiles/<id>.
+    """
+    body = request.get_json(silent=True) or {}
+    job = (body.get("job") or "").strip().lower()
+    profile = str(body.get("profile") or "").strip().lower() in ("1", "true", "yes")
+    client_id = body.get("client_id")
 
     try:
         from qb_app import scheduler as _sched  # noqa: WPS433
+        from qb_app import profiling
         import threading
 
-        def _run(fn, name: str):
+        def _run(fn, name: str, profile_id=None):
             try:
                 print(f"[scheduler][manual] starting {name}", flush=True)
-                fn()
+                if profile_id:
+                    profiling.profile_call(name, fn, profile_id=profile_id)
+                else:
+                    fn()
                 print(f"[scheduler][manual] finished {name}", flush=True)
             except Exception as e:  # noqa: BLE001
                 print(f"[scheduler][manual] error {name}: {e}", flush=True)
 
-        if job in ("token_refresh", "job_token_refresh"):
-            t = threading.Thread(target=_run, args=(_sched.job_token_refresh, "job_token_refresh"), daemon=True)
+        def _start(fn, name: str, label: str):
+            profile_id = profiling.new_profile_id(name) if profile else None
+            t = threading.Thread(target=_run, args=(fn, name, profile_id), daemon=True)
             t.start()
-            return jsonify({"status": "started", "job": "token_refresh"})
+            out = {"status": "started", "job": label}
+            if profile_id:
+                out["profile_id"] = profile_id
+            return jsonify(out)
+
+        if job in ("token_refresh", "job_token_refresh"):
+            return _start(_sched.job_token_refresh, "job_token_refresh", "token_refresh")
         if job in ("daily_sync", "job_daily_sync"):
-            t = threading.Thread(target=_run, args=(_sched.job_daily_sync, "job_daily_sync"), daemon=True)
-            t.start()
-            return jsonify({"status": "started", "job": "daily_sync"})
+            if client_id is not None:
+                from qb_app import daily_qb_sync, telemetry
 
-        # Optional: try scheduling via APScheduler instance if exported in future
-        try:
-            sched = getattr(_sched, "SCHEDULER", None)
-            if sched is not None:
-                if job in ("token_refresh", "job_token_refresh"):
-                    sched.add_job(_sched.job_token_refresh, id="manual_token_refresh", replace_existing=True)
-                    return jsonify({"status": "started", "job": "token_refresh"})
-                if job in ("daily_sync", "job_daily_sync"):
-                    sched.add_job(_sched.job_daily_sync, id="manual_daily_sync", replace_existing=True)
-                    return jsonify({"status": "started", "job": "daily_sync"})
-        except Exception:
-            pass
+                cid = int(client_id)
+
+                def _sync_one():
+                    with telemetry.record_run("daily_sync:manual", client_id=cid):
+                        daily_qb_sync.sync_one(cid)
+
+                return _start(_sync_one, f"daily_sync_client_{cid}", "daily_sync")
+            return _start(_sched.job_daily_sync, "job_daily_sync", "daily_sync")
+        if job in ("forecast_refresh", "job_forecast_refresh"):
+            return _start(_sched.job_forecast_refresh, "job_forecast_refresh", "forecast_refresh")
 
         return jsonify({"error": "Unknown job"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@admin_bp.get("/logs")
+@admin_bp.get("/profiles")
 @admin_required
-def admin_logs():
-    # Best-effort file tail; falls back to empty list
+def list_profiles():
+    from qb_app import profiling
+
+    return jsonify({"profiles": profiling.list_profiles()})
+
+
+@admin_bp.get("/profiles/<profile_id>")
+@admin_required
+def download_profile(profile_id: str):
+    """Download a stored profile: ?format=txt (summary) or prof (pstats dump, default)."""
+    from qb_app import profiling
+    from flask import send_file
+
+    fmt = (request.args.get("format") or "prof").strip().lower()
+    path = profiling.profile_path(profile_id, fmt)
+    if not path:
+        return jsonify({"error": "Profile not found"}), 404
+    if fmt == "txt":
+        return send_file(path, mimetype="text/plain")
+    return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=f"{profile_id}.prof")
+
+
+def _log_file() -> str:
+    """First existing debug log path (falls back to applog.LOG_PATH)."""
     paths = [
+        applog.LOG_PATH,
         os.path.join(os.getcwd(), "qb_app", "logs", "callback_debug.log"),
         "/home/site/wwwroot/qb_app/logs/callback_debug.log",
     ]
-    lines = []
     for p in paths:
+        if os.path.exists(p):
+            return p
+    return applog.LOG_PATH
+
+
+def _read_log(path: str, since, fid, n: int) -> dict:
+    """Tail ``n`` lines, or read lines after offset ``since`` of file ``fid``."""
+    current = applog.file_id(path)
+    if since is None:
+        lines, offset = applog.tail_lines(path, n)
+        return {"lines": lines, "offset": offset, "file_id": current, "reset": False}
+    if fid and current and fid != current:
+        since = 0  # rotated since the client's last read
+    lines, offset, reset = applog.read_since(path, since)
+    return {
+        "lines": lines,
+        "offset": offset,
+        "file_id": current,
+        "reset": reset or bool(fid and current and fid != current),
+    }
+
+
+@admin_bp.get("/logs")
+@admin_required
+def admin_logs():
+    """Tail the debug log, or return lines appended since ``?since=<offset>``.
+
+    Query params:
+      - lines: lines to tail when ``since`` is absent (default 25, max 1000)
+      - since, file_id: offset/file_id from the previous response
+      - wait: long-poll up to this many seconds for new lines (max LOG_POLL_MAX_WAIT_SECONDS)
+    """
+    path = _log_file()
+    n = max(min(request.args.get("lines", default=25, type=int) or 25, 1000), 1)
+    since = request.args.get("since", type=int)
+    fid = (request.args.get("file_id") or "").strip() or None
+    max_wait = float(os.getenv("LOG_POLL_MAX_WAIT_SECONDS", "25") or 25)
+    wait = max(min(request.args.get("wait", default=0, type=float) or 0, max_wait), 0)
+    try:
+        out = _read_log(path, since, fid, n)
+        deadline = time.monotonic() + wait
+        while since is not None and not out["lines"] and time.monotonic() < deadline:
+            time.sleep(0.5)
+            out = _read_log(path, out["offset"], out["file_id"], n)
+    except Exception:
+        out = {"lines": [], "offset": 0, "file_id": None, "reset": False}
+    return jsonify(out)
+
+
+@admin_bp.get("/logs/stream")
+@admin_required
+def admin_logs_stream():
+    """Server-Sent Events stream of new log lines.
+
+    Starts with the last ``?lines=`` lines (or at ``?since=`` / Last-Event-ID)
+    and pushes appended lines as they are written. Closes after
+    LOG_SSE_MAX_SECONDS; EventSource reconnects and resumes from the last id.
+    """
+    path = _log_file()
+    n = max(min(request.args.get("lines", default=25, type=int) or 25, 1000), 1)
+    since = request.args.get("since", type=int)
+    last_id = (request.headers.get("Last-Event-ID") or "").strip()
+    fid = (request.args.get("file_id") or "").strip() or None
+    if last_id and "@" in last_id:
+        off, _, fid = last_id.partition("@")
         try:
-            if os.path.exists(p):
-                with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                    lines = f.read().splitlines()
-                break
-        except Exception:
-            continue
-    if lines:
-        lines = lines[-25:]
-    return jsonify({"lines": lines})
+            since = int(off)
+        except ValueError:
+            since = None
+    interval = float(os.getenv("LOG_SSE_INTERVAL_SECONDS", "1") or 1)
+    max_seconds = float(os.getenv("LOG_SSE_MAX_SECONDS", "300") or 300)
+
+    def _events():
+        deadline = time.monotonic() + max_seconds
+        out = _read_log(path, since, fid, n)
+        while True:
+            if out["lines"] or out["reset"]:
+                payload = json.dumps({"lines": out["lines"], "reset": out["reset"]})
+                yield f"id: {out['offset']}@{out['file_id'] or ''}\nevent: lines\ndata: {payload}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(interval)
+            out = _read_log(path, out["offset"], out["file_id"], n)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(_events()), mimetype="text/event-stream", headers=headers)
 
 
 @admin_bp.post("/promote")
@@ -312,24 +469,14 @@ def promote_user():
             conn = get_connection()
             cur = conn.cursor()
             # Operate on app_admins only; do not modify users table
+            store = storage.get_storage()
             if is_admin:
-                cur.execute(
-                    """
-                    IF OBJECT_ID('dbo.app_admins','U') IS NULL
-                        CREATE TABLE app_admins (email NVARCHAR(255) NOT NULL UNIQUE)
-                    IF NOT EXISTS (SELECT 1 FROM app_admins WHERE LOWER(email)=LOWER(?))
-                        INSERT INTO app_admins (email) VALUES (?)
-                    """,
-                    (email, email),
-                )
-            else:
-                cur.execute(
-                    """
-                    IF OBJECT_ID('dbo.app_admins','U') IS NOT NULL
-                        DELETE FROM app_admins WHERE LOWER(email)=LOWER(?)
-                    """,
-                    (email,),
-                )
+                store.ensure_table(cur, "app_admins", "email NVARCHAR(255) NOT NULL UNIQUE")
+                cur.execute("SELECT 1 FROM app_admins WHERE LOWER(email)=LOWER(?)", (email,))
+                if cur.fetchone() is None:
+                    cur.execute("INSERT INTO app_admins (email) VALUES (?)", (email,))
+            elif store.table_exists(cur, "app_admins"):
+                cur.execute("DELETE FROM app_admins WHERE LOWER(email)=LOWER(?)", (email,))
             conn.commit()
             conn.close()
             return jsonify({"message": f"{email} admin={int(is_admin)}"})
@@ -355,19 +502,10 @@ def promote_user():
             if not requester_email:
                 conn.close()
                 return jsonify({"error": "Unauthorized"}), 403
-            cur.execute(
-                """
-                IF OBJECT_ID('dbo.app_admins','U') IS NULL
-                    SELECT 0
-                ELSE
-                    SELECT CASE WHEN EXISTS (
-                      SELECT 1 FROM app_admins WHERE LOWER(email)=LOWER(?)
-                    ) THEN 1 ELSE 0 END
-                """,
-                (requester_email,),
-            )
-            rr = cur.fetchone()
-            is_admin_req = bool(rr[0]) if rr and rr[0] is not None else False
+            is_admin_req = False
+            if storage.get_storage().table_exists(cur, "app_admins"):
+                cur.execute("SELECT 1 FROM app_admins WHERE LOWER(email)=LOWER(?)", (requester_email,))
+                is_admin_req = cur.fetchone() is not None
             conn.close()
             if not is_admin_req:
                 return jsonify({"error": "Forbidden"}), 403
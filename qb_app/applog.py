@@ -0,0 +1,310 @@
+"""Non-blocking, structured application logging.
+
+Every record goes through a ``QueueHandler`` on the root logger; one
+``QueueListener`` thread per process writes it to stdout (Azure Log Stream)
+and to a size-rotated debug file that the admin log feed tails. Request
+threads only enqueue, so they never wait on console or disk I/O. All worker
+processes append to the same file; rotation is coordinated with a file lock.
+
+Records are rendered as one JSON object per line (``LOG_FORMAT=json``, the
+default) or as plain text (``LOG_FORMAT=text``). Fields bound with
+``log_context(job_id=..., client_auth_id=...)`` and keyword fields passed via
+``extra=`` are attached to every record, so runs can be filtered and
+aggregated by job, client and entity. ``LOG_LEVEL`` (default INFO) hides
+per-page DEBUG chatter in production.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: no cross-process lock
+    fcntl = None
+
+
+LOG_PATH = os.getenv("APP_LOG_PATH", "/home/site/wwwroot/qb_app/logs/callback_debug.log")
+_MAX_BYTES = int(os.getenv("APP_LOG_MAX_BYTES", str(10 * 1024 * 1024)) or 10 * 1024 * 1024)
+_BACKUPS = int(os.getenv("APP_LOG_BACKUPS", "5") or 5)
+
+_LOCK = threading.Lock()
+_PID: Optional[int] = None
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_QUEUE_HANDLER: Optional[logging.handlers.QueueHandler] = None
+
+_CONTEXT: contextvars.ContextVar = contextvars.ContextVar("applog_context", default={})
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "ctx"}
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach ``fields`` to every record logged in this block (thread/task local)."""
+    token = _CONTEXT.set({**_CONTEXT.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    out = dict(getattr(record, "ctx", None) or {})
+    for k, v in record.__dict__.items():
+        if k not in _RECORD_ATTRS and not k.startswith("_"):
+            out[k] = v
+    return out
+
+
+class _ContextFilter(logging.Filter):
+    """Snapshot the caller's log context before the record crosses threads."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        ctx = _CONTEXT.get()
+        if ctx and not hasattr(record, "ctx"):
+            record.ctx = ctx
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        doc.update(_fields(record))
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self) -> None:
+        super().__init__("[%(asctime)s] %(levelname)s %(name)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def _formatter() -> logging.Formatter:
+    if (os.getenv("LOG_FORMAT") or "json").strip().lower() == "text":
+        return TextFormatter()
+    return JsonFormatter()
+
+
+def _level() -> int:
+    name = (os.getenv("LOG_LEVEL") or "INFO").strip().upper()
+    return logging.getLevelName(name) if isinstance(logging.getLevelName(name), int) else logging.INFO
+
+
+class SharedRotatingFileHandler(logging.handlers.WatchedFileHandler):
+    """Size-rotated log file shared by several processes (gunicorn workers).
+
+    ``RotatingFileHandler`` rotates per process: one worker renames the file
+    while the others keep appending to the old inode. Here every write
+    takes an ``flock`` on ``<file>.lock``, reopens the file if the inode at
+    the path changed (another process rotated it), and rotates only when
+    the file on disk is over ``max_bytes``.
+    """
+
+    def __init__(self, filename: str, max_bytes: int, backups: int) -> None:
+        super().__init__(filename, encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock_file = None
+
+    def _rotate(self) -> None:
+        self.stream.close()
+        self.stream = None
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.baseFilename}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.baseFilename}.{i + 1}")
+            os.replace(self.baseFilename, f"{self.baseFilename}.1")
+        else:
+            os.remove(self.baseFilename)
+        self.stream = self._open()
+        self._statstream()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record) + self.terminator
+            if self._lock_file is None:
+                self._lock_file = open(self.baseFilename + ".lock", "a")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self.reopenIfNeeded()
+                if self.stream is None:
+                    self.stream = self._open()
+                    self._statstream()
+                size = os.fstat(self.stream.fileno()).st_size
+                if self.max_bytes and size and size + len(msg.encode("utf-8")) > self.max_bytes:
+                    self._rotate()
+                self.stream.write(msg)
+                self.stream.flush()
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def _file_handler() -> Optional[logging.Handler]:
+    try:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        if fcntl is None:  # Windows dev boxes run one process
+            return logging.handlers.RotatingFileHandler(
+                LOG_PATH, maxBytes=_MAX_BYTES, backupCount=_BACKUPS, encoding="utf-8", delay=True
+            )
+        fh = SharedRotatingFileHandler(LOG_PATH, _MAX_BYTES, _BACKUPS)
+    except Exception:
+        return None
+    return fh
+
+
+def configure(level: Optional[int] = None) -> None:
+    """Install the queue handler on the root logger and start the writer thread.
+
+    Idempotent; after a fork the child gets its own queue and writer thread.
+    """
+    global _PID, _LISTENER, _QUEUE_HANDLER
+    with _LOCK:
+        if _PID == os.getpid():
+            return
+        root = logging.getLogger()
+        # Drop basicConfig stream handlers and an inherited (pre-fork) queue
+        # handler; leave host-installed handlers (e.g. Azure Functions) alone
+        for h in list(root.handlers):
+            if h is _QUEUE_HANDLER or type(h) is logging.StreamHandler:
+                root.removeHandler(h)
+
+        q: "queue.SimpleQueue" = queue.SimpleQueue()
+        fmt = _formatter()
+        stream = logging.StreamHandler(sys.stdout)
+        sinks = [stream]
+        fh = _file_handler()
+        if fh is not None:
+            sinks.append(fh)
+        for h in sinks:
+            h.setFormatter(fmt)
+
+        _QUEUE_HANDLER = logging.handlers.QueueHandler(q)
+        _QUEUE_HANDLER.addFilter(_ContextFilter())
+        root.addHandler(_QUEUE_HANDLER)
+        root.setLevel(level if level is not None else _level())
+        _LISTENER = logging.handlers.QueueListener(q, *sinks, respect_handler_level=True)
+        _LISTENER.start()
+        _PID = os.getpid()
+
+
+def shutdown() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _PID, _LISTENER
+    with _LOCK:
+        if _LISTENER is not None and _PID == os.getpid():
+            try:
+                _LISTENER.stop()
+            except Exception:
+                pass
+        _LISTENER = None
+        _PID = None
+
+
+atexit.register(shutdown)
+
+
+def get_logger(name: str = "qb_app") -> logging.Logger:
+    """A plain ``logging.getLogger``: safe at import time.
+
+    Records reach the queue once the entry point has called ``configure``
+    (``create_app``, the gunicorn ``post_fork`` hook, the timer functions).
+    """
+    return logging.getLogger(name)
+
+
+# ---- Reading the debug file (admin log feed) ----
+
+def file_id(path: str) -> Optional[str]:
+    """Identity of the file currently at ``path`` (changes when it is rotated)."""
+    try:
+        st = os.stat(path)
+        return f"{st.st_dev}:{st.st_ino}"
+    except OSError:
+        return None
+
+
+def tail_lines(path: str, n: int = 25, block_size: int = 8192) -> Tuple[List[str], int]:
+    """Return the last ``n`` complete lines and the offset just after them.
+
+    Reads fixed-size blocks backwards from the end, so the cost depends on
+    the lines returned, not on the file size. A trailing partial line (still
+    being written) is left for the next ``read_since``.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            pos = end
+            data = b""
+            while pos > 0 and data.count(b"\n") <= n:
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+    except OSError:
+        return [], 0
+    cut = data.rfind(b"\n") + 1
+    offset = end - (len(data) - cut)
+    lines = data[:cut].decode("utf-8", errors="replace").splitlines()
+    return lines[-n:] if n > 0 else [], offset
+
+
+def read_since(path: str, offset: int, max_bytes: int = 256 * 1024) -> Tuple[List[str], int, bool]:
+    """Read complete lines written after ``offset``.
+
+    Returns ``(lines, new_offset, reset)``. ``reset`` is True when the file
+    is now shorter than ``offset`` (it was rotated or truncated) and reading
+    restarted from the beginning. At most ``max_bytes`` are read per call.
+    """
+    reset = False
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            if offset < 0 or offset > end:
+                offset, reset = 0, True
+            if offset == end:
+                return [], offset, reset
+            f.seek(offset)
+            data = f.read(min(end - offset, max_bytes))
+    except OSError:
+        return [], 0, offset > 0
+    cut = data.rfind(b"\n") + 1
+    if cut == 0:
+        if len(data) < max_bytes:
+            return [], offset, reset
+        cut = len(data)  # one huge line; return it rather than stall
+    lines = data[:cut].decode("utf-8", errors="replace").splitlines()
+    return lines, offset + cut, reset
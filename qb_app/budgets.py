@@ -0,0 +1,175 @@
+"""Budgets: planned amounts per account and month, compared in ``qb_app.variance``.
+
+A client can keep several named budgets (``budgets``), each with one row
+per (AccountId, month) in ``budget_lines``. Saving a budget replaces its
+lines and bumps its ``revision``; variance results are cached under that
+revision and the client's data version. Budgets with the same name in
+several clients form a multi-entity budget.
+"""
+
+import datetime as dt
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from qb_app import gl_cube, storage
+
+
+MAX_LINES = 100_000
+INSERT_BATCH = 5000
+
+Line = Tuple[str, dt.date, float]  # (AccountId, month, amount)
+
+
+def ensure_budget_tables(cur) -> None:
+    store = storage.get_storage()
+    store.ensure_table(
+        cur,
+        "budgets",
+        """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        client_auth_id INT NOT NULL,
+        name NVARCHAR(100) NOT NULL,
+        description NVARCHAR(500) NULL,
+        revision INT NOT NULL DEFAULT 1,
+        created_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        updated_at DATETIME NOT NULL DEFAULT GETUTCDATE()
+        """,
+        ("CREATE UNIQUE INDEX UX_budgets_client_name ON budgets (client_auth_id, name)",),
+    )
+    store.ensure_table(
+        cur,
+        "budget_lines",
+        """
+        budget_id INT NOT NULL,
+        AccountId NVARCHAR(50) NOT NULL,
+        month DATE NOT NULL,
+        amount DECIMAL(18,2) NOT NULL,
+        CONSTRAINT PK_budget_lines PRIMARY KEY (budget_id, AccountId, month)
+        """,
+    )
+
+
+def parse_lines(lines) -> List[Line]:
+    """``[{"account_id", "month": "2025-01", "amount"}]`` -> lines (ValueError if bad).
+
+    Repeated (account, month) pairs are summed.
+    """
+    if not isinstance(lines, list):
+        raise ValueError("'lines' must be a list of {account_id, month, amount}")
+    if len(lines) > MAX_LINES:
+        raise ValueError(f"a budget has at most {MAX_LINES} lines")
+    merged: Dict[Tuple[str, dt.date], float] = {}
+    for i, line in enumerate(lines):
+        if not isinstance(line, dict):
+            raise ValueError(f"line {i}: must be an object")
+        account_id = str(line.get("account_id") or "").strip()
+        if not account_id:
+            raise ValueError(f"line {i}: account_id is required")
+        month = gl_cube.month_of(line.get("month"))
+        if month is None:
+            raise ValueError(f"line {i}: month must be YYYY-MM")
+        try:
+            amount = float(line.get("amount"))
+        except (TypeError, ValueError):
+            raise ValueError(f"line {i}: amount must be a number")
+        merged[(account_id, month)] = merged.get((account_id, month), 0.0) + amount
+    return [(a, m, round(v, 2)) for (a, m), v in merged.items()]
+
+
+def list_budgets(cur, client_auth_id: int) -> List[dict]:
+    ensure_budget_tables(cur)
+    cur.execute(
+        """
+        SELECT b.id, b.name, b.description, b.revision, b.updated_at,
+               COUNT(l.budget_id), MIN(l.month), MAX(l.month)
+        FROM budgets b LEFT JOIN budget_lines l ON l.budget_id = b.id
+        WHERE b.client_auth_id = ?
+        GROUP BY b.id, b.name, b.description, b.revision, b.updated_at
+        ORDER BY b.name
+        """,
+        (int(client_auth_id),),
+    )
+    return [
+        {"id": int(r[0]), "name": r[1], "description": r[2], "revision": int(r[3]), "updated_at": r[4],
+         "lines": int(r[5]), "first_month": gl_cube.month_of(r[6]), "last_month": gl_cube.month_of(r[7])}
+        for r in cur.fetchall()
+    ]
+
+
+def find_budgets(cur, client_ids: Iterable[int], name: str) -> Dict[int, dict]:
+    """client_auth_id -> {id, revision} of the budget called ``name`` (clients without one are left out)."""
+    ensure_budget_tables(cur)
+    ids = [int(c) for c in client_ids]
+    if not ids:
+        return {}
+    cur.execute(
+        f"SELECT client_auth_id, id, revision FROM budgets WHERE name = ? "
+        f"AND client_auth_id IN ({', '.join(['?'] * len(ids))})",
+        (name, *ids),
+    )
+    return {int(r[0]): {"id": int(r[1]), "revision": int(r[2])} for r in cur.fetchall()}
+
+
+def month_span(cur, budget_ids: Iterable[int]) -> Tuple[Optional[dt.date], Optional[dt.date]]:
+    """First and last month budgeted across ``budget_ids``."""
+    ids = [int(b) for b in budget_ids]
+    if not ids:
+        return None, None
+    cur.execute(
+        f"SELECT MIN(month), MAX(month) FROM budget_lines WHERE budget_id IN ({', '.join(['?'] * len(ids))})",
+        tuple(ids),
+    )
+    row = cur.fetchone()
+    return gl_cube.month_of(row[0]), gl_cube.month_of(row[1])
+
+
+def load_lines(cur, budget_id: int, start: Optional[dt.date] = None, end: Optional[dt.date] = None) -> List[Line]:
+    sql = "SELECT AccountId, month, amount FROM budget_lines WHERE budget_id = ?"
+    params: list = [int(budget_id)]
+    if start is not None:
+        sql += " AND month >= ?"
+        params.append(start)
+    if end is not None:
+        sql += " AND month <= ?"
+        params.append(end)
+    cur.execute(sql + " ORDER BY AccountId, month", tuple(params))
+    return [(str(r[0]), gl_cube.month_of(r[1]), float(r[2])) for r in cur.fetchall()]
+
+
+def save_budget(cur, client_auth_id: int, name: str, description: Optional[str], lines: List[Line]) -> int:
+    """Create or replace a budget's lines (no commit); returns its new revision."""
+    ensure_budget_tables(cur)
+    cid = int(client_auth_id)
+    cur.execute(
+        """
+        UPDATE budgets SET revision = revision + 1, description = ?, updated_at = ?
+        WHERE client_auth_id = ? AND name = ?
+        """,
+        (description, dt.datetime.utcnow(), cid, name),
+    )
+    if cur.rowcount == 0:
+        cur.execute(
+            "INSERT INTO budgets (client_auth_id, name, description, revision) VALUES (?, ?, ?, 1)",
+            (cid, name, description),
+        )
+    cur.execute("SELECT id, revision FROM budgets WHERE client_auth_id = ? AND name = ?", (cid, name))
+    budget_id, revision = cur.fetchone()
+    cur.execute("DELETE FROM budget_lines WHERE budget_id = ?", (int(budget_id),))
+    cur.fast_executemany = True  # pyodbc: one round trip per batch
+    rows = [(int(budget_id), a, m, v) for a, m, v in lines]
+    for i in range(0, len(rows), INSERT_BATCH):
+        cur.executemany(
+            "INSERT INTO budget_lines (budget_id, AccountId, month, amount) VALUES (?, ?, ?, ?)",
+            rows[i:i + INSERT_BATCH],
+        )
+    return int(revision)
+
+
+def delete_budget(cur, client_auth_id: int, name: str) -> bool:
+    ensure_budget_tables(cur)
+    cur.execute("SELECT id FROM budgets WHERE client_auth_id = ? AND name = ?", (int(client_auth_id), name))
+    row = cur.fetchone()
+    if not row:
+        return False
+    cur.execute("DELETE FROM budget_lines WHERE budget_id = ?", (int(row[0]),))
+    cur.execute("DELETE FROM budgets WHERE id = ?", (int(row[0]),))
+    return True
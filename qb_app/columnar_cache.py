@@ -0,0 +1,487 @@
+"""Per-client columnar snapshot of ``qb_transactions`` on local disk.
+
+Analytics that scan a client's whole history (the Sheets pivot) read this
+snapshot instead of re-reading every line from Azure SQL:
+each column is a NumPy ``.npy`` file opened with ``np.load(mmap_mode="r")``,
+so a load maps the files instead of copying them and a scan runs at memory
+speed. Strings (account, class, vendor...) are dictionary-encoded as int32
+codes; the dictionaries live in ``meta.json`` and only ever grow, so codes
+stay valid across segments. Code 0 is ``''`` (missing), as in ``gl_monthly``.
+
+Layout under ``COLUMNAR_CACHE_DIR/client_<id>/``::
+
+    meta.json               data version, max id, segments, dictionaries
+    <segment>.<column>.npy  one file per column per segment
+    deleted_<n>.npy         sorted ids deleted since their segment was written
+
+``refresh`` is incremental and runs after every sync. Rows above the cached
+max ``id`` become a new segment. Ids that disappeared are recorded as
+tombstones, since the sync replaces a changed transaction's lines with new
+rows. Once tombstones or segments pile up, the live rows are compacted into
+one segment from the mapped files, without reading SQL. ``load`` refreshes
+first when the client's ``client_data_version`` moved, so every worker
+reads current data even if the sync ran elsewhere.
+
+Parquet would need pyarrow; plain ``.npy`` keeps this on NumPy alone.
+"""
+
+import datetime as dt
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from qb_app import applog, data_version
+from qb_app.result_cache import LRUCache
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: no cross-process lock
+    fcntl = None
+
+
+_logger = applog.get_logger("qb_app.columnar_cache")
+
+CACHE_DIR = os.getenv("COLUMNAR_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "qb_columnar")
+ENABLED = os.getenv("COLUMNAR_CACHE_DISABLED", "0") != "1"
+FETCH_BATCH = int(os.getenv("COLUMNAR_FETCH_BATCH", "50000") or 50000)
+MAX_SEGMENTS = int(os.getenv("COLUMNAR_MAX_SEGMENTS", "16") or 16)
+COMPACT_DELETED_RATIO = float(os.getenv("COLUMNAR_COMPACT_DELETED_RATIO", "0.2") or 0.2)
+FORMAT = 1
+
+# Snapshot column -> qb_transactions column
+NUMERIC = {"id": "id", "txn_date": "TxnDate", "amount": "LineAmount"}
+ENCODED = {
+    "account_id": "AccountId",
+    "account": "AccountName",
+    "class": "Class",
+    "department": "Department",
+    "customer": "Customer",
+    "vendor": "Vendor",
+    "txn_type": "TxnType",
+}
+COLUMNS = tuple(NUMERIC) + tuple(ENCODED)
+TIME_KEYS = ("month", "quarter", "year")  # group_sum buckets of txn_date
+_SELECT = ", ".join(list(NUMERIC.values()) + list(ENCODED.values()))
+
+# (client_auth_id, data version) -> Snapshot
+_snapshots = LRUCache("columnar", int(os.getenv("COLUMNAR_SNAPSHOT_CACHE_SIZE", "32") or 32))
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
+
+
+def client_dir(client_auth_id: int) -> str:
+    return os.path.join(CACHE_DIR, f"client_{int(client_auth_id)}")
+
+
+@contextmanager
+def _locked(path: str):
+    """One writer per client across this host's processes."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), "w") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_meta(client_auth_id: int) -> Optional[dict]:
+    try:
+        with open(os.path.join(client_dir(client_auth_id), "meta.json")) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return meta if meta.get("format") == FORMAT else None
+
+
+def _write_meta(path: str, meta: dict) -> None:
+    tmp = os.path.join(path, f"meta.json.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, "meta.json"))  # atomic: readers see old or new
+
+
+def _empty_meta(client_auth_id: int) -> dict:
+    return {
+        "format": FORMAT,
+        "client_auth_id": int(client_auth_id),
+        "data_version": None,
+        "max_id": 0,
+        "rows": 0,
+        "next_file": 1,
+        "segments": [],
+        "deleted": None,
+        "deleted_count": 0,
+        "dictionaries": {name: [""] for name in ENCODED},
+        "refreshed_at": None,
+    }
+
+
+class _Encoder:
+    """Appends unseen strings to the meta dictionaries and returns codes."""
+
+    def __init__(self, dictionaries: Dict[str, List[str]]) -> None:
+        self.dictionaries = dictionaries
+        self.lookup = {name: {v: i for i, v in enumerate(values)} for name, values in dictionaries.items()}
+
+    def encode(self, name: str, values) -> np.ndarray:
+        lookup, values_list = self.lookup[name], self.dictionaries[name]
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            v = "" if v is None else str(v)
+            code = lookup.get(v)
+            if code is None:
+                code = lookup[v] = len(values_list)
+                values_list.append(v)
+            codes[i] = code
+        return codes
+
+
+def _columns_from_rows(rows, encoder: _Encoder) -> Dict[str, np.ndarray]:
+    cols = list(zip(*rows))
+    out = {
+        "id": np.fromiter(cols[0], dtype=np.int64, count=len(rows)),
+        "txn_date": np.array([str(d)[:10] if d is not None else "NaT" for d in cols[1]], dtype="datetime64[D]"),
+        "amount": np.fromiter((0.0 if v is None else float(v) for v in cols[2]), dtype=np.float64, count=len(rows)),
+    }
+    for i, name in enumerate(ENCODED, start=3):
+        out[name] = encoder.encode(name, cols[i])
+    return out
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    cols = {"id": np.empty(0, np.int64), "txn_date": np.empty(0, "datetime64[D]"), "amount": np.empty(0, np.float64)}
+    cols.update({name: np.empty(0, np.int32) for name in ENCODED})
+    return cols
+
+
+def _fetch(conn, client_auth_id: int, after_id: int, encoder: _Encoder) -> Dict[str, np.ndarray]:
+    """Rows with id > ``after_id`` as column arrays, read ``FETCH_BATCH`` at a time."""
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT {_SELECT} FROM qb_transactions WHERE client_auth_id = ? AND id > ? ORDER BY id",
+        (int(client_auth_id), int(after_id)),
+    )
+    parts = []
+    while True:
+        rows = cur.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        parts.append(_columns_from_rows(rows, encoder))
+    if not parts:
+        return _empty_columns()
+    return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+
+def _write_segment(path: str, meta: dict, columns: Dict[str, np.ndarray]) -> dict:
+    name = f"{meta['next_file']:06d}"
+    meta["next_file"] += 1
+    for col in COLUMNS:
+        np.save(os.path.join(path, f"{name}.{col}.npy"), columns[col])
+    rows = int(len(columns["id"]))
+    return {"name": name, "rows": rows,
+            "min_id": int(columns["id"].min()) if rows else 0, "max_id": int(columns["id"].max()) if rows else 0}
+
+
+def _open_segment(path: str, segment: dict, names: Sequence[str] = COLUMNS) -> Dict[str, np.ndarray]:
+    return {col: np.load(os.path.join(path, f"{segment['name']}.{col}.npy"), mmap_mode="r") for col in names}
+
+
+def _open_deleted(path: str, meta: dict) -> np.ndarray:
+    if not meta.get("deleted"):
+        return np.empty(0, np.int64)
+    return np.load(os.path.join(path, meta["deleted"]), mmap_mode="r")
+
+
+def _live_ids(conn, client_auth_id: int, max_id: int) -> np.ndarray:
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM qb_transactions WHERE client_auth_id = ? AND id <= ?", (int(client_auth_id), max_id))
+    ids = []
+    while True:
+        rows = cur.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        ids.append(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+    return np.concatenate(ids) if ids else np.empty(0, np.int64)
+
+
+def _cleanup(path: str, meta: dict) -> None:
+    """Remove files no longer named by ``meta`` (open maps stay valid on POSIX)."""
+    keep = {f"{s['name']}.{c}.npy" for s in meta["segments"] for c in COLUMNS}
+    if meta.get("deleted"):
+        keep.add(meta["deleted"])
+    for fname in os.listdir(path):
+        if fname.endswith(".npy") and fname not in keep:
+            try:
+                os.remove(os.path.join(path, fname))
+            except OSError:
+                pass
+
+
+def refresh(conn, client_auth_id: int, force: bool = False) -> dict:
+    """Bring the client's snapshot up to its current data version; returns a summary.
+
+    Incremental unless there is no snapshot yet (or ``force``).
+    """
+    t0 = time.perf_counter()
+    cid = int(client_auth_id)
+    path = client_dir(cid)
+    with _locked(path):
+        cur = conn.cursor()
+        # Read before the rows: writes that land meanwhile leave the snapshot stale
+        version = data_version.get_version(cur, cid)
+        conn.commit()
+        meta = None if force else read_meta(cid)
+        if meta is not None and meta["data_version"] == version:
+            return {"client_id": cid, "status": "fresh", "data_version": version, "rows": meta["rows"]}
+        full = meta is None
+        if full:
+            meta = _empty_meta(cid)
+        encoder = _Encoder(meta["dictionaries"])
+
+        deleted = np.asarray(_open_deleted(path, meta))
+        removed = 0
+        if not full and meta["max_id"]:
+            cached = np.concatenate(
+                [np.asarray(_open_segment(path, s, ("id",))["id"]) for s in meta["segments"]] or [np.empty(0, np.int64)]
+            )
+            cached = cached[~np.isin(cached, deleted)] if len(deleted) else cached
+            cur.execute(
+                "SELECT COUNT(*) FROM qb_transactions WHERE client_auth_id = ? AND id <= ?", (cid, meta["max_id"])
+            )
+            # Ids are never reused, so an unchanged count means nothing was deleted
+            if int(cur.fetchone()[0]) != len(cached):
+                gone = np.setdiff1d(cached, _live_ids(conn, cid, meta["max_id"]), assume_unique=True)
+                removed = int(len(gone))
+                deleted = np.union1d(deleted, gone)
+
+        new = _fetch(conn, cid, meta["max_id"], encoder)
+        conn.commit()
+        if len(new["id"]):
+            meta["segments"].append(_write_segment(path, meta, new))
+            meta["max_id"] = max(meta["max_id"], int(new["id"].max()))
+
+        stored = sum(s["rows"] for s in meta["segments"])
+        compacted = False
+        if len(meta["segments"]) > MAX_SEGMENTS or (len(deleted) and len(deleted) > COMPACT_DELETED_RATIO * stored):
+            live = {}
+            segments = [_open_segment(path, s) for s in meta["segments"]]
+            for col in COLUMNS:
+                live[col] = np.concatenate([np.asarray(s[col]) for s in segments]) if segments else _empty_columns()[col]
+            if len(deleted):
+                keep = ~np.isin(live["id"], deleted)
+                live = {col: arr[keep] for col, arr in live.items()}
+            meta["segments"] = [_write_segment(path, meta, live)] if len(live["id"]) else []
+            deleted = np.empty(0, np.int64)
+            compacted = True
+
+        if removed or compacted:
+            meta["deleted"] = None
+            if len(deleted):
+                meta["deleted"] = f"deleted_{meta['next_file']:06d}.npy"
+                meta["next_file"] += 1
+                np.save(os.path.join(path, meta["deleted"]), deleted.astype(np.int64))
+        meta["deleted_count"] = int(len(deleted))
+        meta["rows"] = sum(s["rows"] for s in meta["segments"]) - meta["deleted_count"]
+        meta["data_version"] = version
+        meta["refreshed_at"] = dt.datetime.utcnow().isoformat()
+        _write_meta(path, meta)
+        _cleanup(path, meta)
+
+    summary = {
+        "client_id": cid,
+        "status": "built" if full else "refreshed",
+        "data_version": version,
+        "rows": meta["rows"],
+        "appended": int(len(new["id"])),
+        "deleted": removed,
+        "segments": len(meta["segments"]),
+        "compacted": compacted,
+        "duration_ms": int((time.perf_counter() - t0) * 1000),
+    }
+    _log("columnar cache refreshed", **summary)
+    return summary
+
+
+def drop(client_auth_id: int) -> None:
+    """Delete a client's snapshot (rebuilt on next ``load``/``refresh``)."""
+    shutil.rmtree(client_dir(client_auth_id), ignore_errors=True)
+
+
+class Snapshot:
+    """A client's transaction lines as column arrays (live rows only)."""
+
+    def __init__(self, client_auth_id: int, meta: dict, segments: List[Dict[str, np.ndarray]],
+                 deleted: np.ndarray) -> None:
+        self.client_auth_id = int(client_auth_id)
+        self.data_version = meta["data_version"]
+        self.dictionaries = meta["dictionaries"]
+        self.segments = segments
+        self.deleted = deleted
+        self._columns: Dict[str, np.ndarray] = {}
+        self._keep: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.column("id"))
+
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy map for a single clean segment; otherwise built once and kept."""
+        arr = self._columns.get(name)
+        if arr is None:
+            if name not in COLUMNS:
+                raise KeyError(f"unknown column {name!r}")
+            if len(self.segments) == 1 and not len(self.deleted):
+                arr = self.segments[0][name]
+            else:
+                parts = [s[name] for s in self.segments]
+                arr = np.concatenate(parts) if parts else _empty_columns()[name]
+                if len(self.deleted):
+                    if self._keep is None:
+                        ids = np.concatenate([s["id"] for s in self.segments])
+                        self._keep = ~np.isin(ids, self.deleted)
+                    arr = arr[self._keep]
+            self._columns[name] = arr
+        return arr
+
+    def codes(self, name: str, values: Sequence[str]) -> np.ndarray:
+        """Codes of ``values`` in column ``name`` (values not present are skipped)."""
+        lookup = {v: i for i, v in enumerate(self.dictionaries[name])}
+        return np.array([lookup[v] for v in values if v in lookup], dtype=np.int32)
+
+    def labels(self, name: str) -> np.ndarray:
+        return np.array(self.dictionaries[name], dtype=object)
+
+    def mask(self, start: Optional[dt.date] = None, end: Optional[dt.date] = None,
+             exclude_types: Sequence[str] = (), **equals) -> np.ndarray:
+        """Rows with TxnDate in [start, end], not of ``exclude_types``, and
+        ``column=value`` (or any of a list of values) for each of ``equals``."""
+        keep = np.ones(len(self), dtype=bool)
+        dates = self.column("txn_date")
+        if start is not None:
+            keep &= dates >= np.datetime64(start, "D")
+        if end is not None:
+            keep &= dates <= np.datetime64(end, "D")
+        if exclude_types:
+            keep &= ~np.isin(self.column("txn_type"), self.codes("txn_type", exclude_types))
+        for name, value in equals.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            keep &= np.isin(self.column(name), self.codes(name, list(values)))
+        return keep
+
+    def _key(self, name: str) -> Tuple[np.ndarray, object]:
+        if name in ("month", "quarter"):
+            months = self.column("txn_date").astype("datetime64[M]").astype(np.int64)
+            return (months if name == "month" else months // 3), None
+        if name == "year":
+            return self.column("txn_date").astype("datetime64[Y]").astype(np.int64), None
+        if name in ENCODED:
+            return self.column(name), self.labels(name)
+        raise KeyError(f"cannot group by {name!r}")
+
+    def group_sum(self, by: Sequence[str], mask: Optional[np.ndarray] = None,
+                  value: str = "amount") -> Tuple[List[tuple], np.ndarray, np.ndarray]:
+        """Sum ``value`` per distinct combination of ``by`` (encoded columns,
+        ``month``, ``quarter`` or ``year``); returns (keys, sums, line counts).
+        Months are dates, years ints and quarters ``year * 10 + quarter``."""
+        values = self.column(value)
+        valid = np.ones(len(values), dtype=bool) if mask is None else mask.copy()
+        if any(name in TIME_KEYS for name in by):
+            valid &= ~np.isnat(self.column("txn_date"))
+        values = np.asarray(values)[valid]
+        if not by:
+            return [()], np.array([values.sum()]), np.array([len(values)])
+        cols, labels, offsets, dims = [], [], [], []
+        for name in by:
+            col, lab = self._key(name)
+            col = np.asarray(col)[valid].astype(np.int64)
+            low = int(col.min()) if len(col) else 0
+            cols.append(col - low)
+            labels.append(lab)
+            offsets.append(low)
+            dims.append(int(cols[-1].max()) + 1 if len(col) else 1)
+        # One int64 key per row; a dense bincount when the key space is small
+        flat = np.ravel_multi_index(cols, dims)
+        size = int(np.prod(dims))
+        if size <= 4 * len(flat) + 1_000_000:
+            counts = np.bincount(flat, minlength=size)
+            sums = np.bincount(flat, weights=values, minlength=size)
+            uniq = np.flatnonzero(counts)
+            sums, counts = sums[uniq], counts[uniq]
+        else:
+            uniq, inverse = np.unique(flat, return_inverse=True)
+            sums = np.bincount(inverse, weights=values, minlength=len(uniq))
+            counts = np.bincount(inverse, minlength=len(uniq))
+        parts = np.unravel_index(uniq, dims)
+        decoded = []
+        for name, part, lab, low in zip(by, parts, labels, offsets):
+            if name == "month":
+                decoded.append([dt.date(1970 + m // 12, m % 12 + 1, 1) for m in (part + low).tolist()])
+            elif name == "quarter":
+                decoded.append([(1970 + q // 4) * 10 + q % 4 + 1 for q in (part + low).tolist()])
+            elif name == "year":
+                decoded.append([1970 + y for y in (part + low).tolist()])
+            else:
+                decoded.append(lab[part + low].tolist())
+        return list(zip(*decoded)), sums, counts
+
+
+def _open(client_auth_id: int, meta: dict) -> Snapshot:
+    path = client_dir(client_auth_id)
+    segments = [_open_segment(path, s) for s in meta["segments"]]
+    return Snapshot(client_auth_id, meta, segments, _open_deleted(path, meta))
+
+
+def available(client_auth_id: int) -> bool:
+    """Whether this host has a snapshot for the client (``load`` then only tops it up)."""
+    return ENABLED and read_meta(client_auth_id) is not None
+
+
+def load(conn, client_auth_id: int) -> Snapshot:
+    """The client's current snapshot, refreshing it first if the data moved."""
+    cid = int(client_auth_id)
+    cur = conn.cursor()
+    version = data_version.get_version(cur, cid)
+    conn.commit()
+    snap = _snapshots.get((cid, version))
+    if snap is not None:
+        return snap
+    for _ in range(3):
+        meta = read_meta(cid)
+        if meta is None or meta["data_version"] != version:
+            refresh(conn, cid)
+            meta = read_meta(cid)
+        try:
+            snap = _open(cid, meta)
+            break
+        except FileNotFoundError:  # compacted between reading meta and opening; read it again
+            continue
+    else:
+        raise RuntimeError(f"columnar snapshot for client {cid} kept changing while loading")
+    if snap.data_version == version:
+        _snapshots.put((cid, version), snap)
+    return snap
+
+
+def refresh_after_sync(conn, client_auth_id: int) -> None:
+    """Sync hook: refresh the snapshot, logging (not raising) failures."""
+    if not ENABLED:
+        return
+    try:
+        refresh(conn, client_auth_id)
+    except Exception as e:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        _log(f"columnar cache refresh failed: {e}", logging.ERROR, client_auth_id=int(client_auth_id))
@@ -1,8 +1,9 @@
 """Wrapper to expose daily_qb_sync package via qb_app namespace.
 
 Used by the in-process scheduler to import as
-`from qb_app import daily_qb_sync` then call `daily_qb_sync.main(None)`.
+`from qb_app import daily_qb_sync` then call `daily_qb_sync.main(None)`
+(whole batch) or `daily_qb_sync.sync_one(client_id)` (one client).
 """
 
-from daily_qb_sync import main  # re-export
+from daily_qb_sync import main, sync_one, send_sync_report  # re-export
 
@@ -0,0 +1,64 @@
+"""Per-client data version, bumped whenever a client's ledger data changes.
+
+``client_data_version`` holds one row per client_auth_id with a counter per
+kind of input:
+
+- ``version``: ledger data. Writers of ``qb_transactions`` (onboarding, the
+  daily sync, cube rebuilds) bump it.
+- ``drivers_version``: forecast driver definitions (see ``qb_app.drivers``).
+- ``accounts_version``: the chart of accounts hierarchy (see
+  ``qb_app.account_hierarchy``).
+
+Writers call ``bump`` inside the same SQL transaction as their writes, so a
+reader that sees the new rows also sees the new version. Derived results
+(forecasts, variances...) are cached under the versions they were computed
+from and are recomputed only after one of them moves.
+"""
+
+from qb_app import storage
+
+
+COUNTERS = ("version", "drivers_version", "accounts_version")
+
+
+def ensure_client_data_version_table(cur) -> None:
+    store = storage.get_storage()
+    store.ensure_table(
+        cur,
+        "client_data_version",
+        """
+        client_auth_id INT NOT NULL PRIMARY KEY,
+        version INT NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL DEFAULT GETUTCDATE()
+        """,
+    )
+    for counter in COUNTERS[1:]:
+        store.add_column(cur, "client_data_version", counter, "INT NOT NULL DEFAULT 0")
+
+
+def _counter(counter: str) -> str:
+    if counter not in COUNTERS:
+        raise ValueError(f"unknown data version counter {counter!r}")
+    return counter
+
+
+def bump(cur, client_auth_id: int, counter: str = "version") -> None:
+    """Increment one of the client's counters (no commit; commit with the data)."""
+    col = _counter(counter)
+    ensure_client_data_version_table(cur)
+    cid = int(client_auth_id)
+    cur.execute(
+        f"UPDATE client_data_version SET {col} = {col} + 1, updated_at = GETUTCDATE() WHERE client_auth_id = ?",
+        (cid,),
+    )
+    if cur.rowcount == 0:
+        cur.execute(f"INSERT INTO client_data_version (client_auth_id, {col}) VALUES (?, 1)", (cid,))
+
+
+def get_version(cur, client_auth_id: int, counter: str = "version") -> int:
+    """Current value; 0 for a client whose data never changed."""
+    col = _counter(counter)
+    ensure_client_data_version_table(cur)
+    cur.execute(f"SELECT {col} FROM client_data_version WHERE client_auth_id = ?", (int(client_auth_id),))
+    row = cur.fetchone()
+    return int(row[0]) if row and row[0] is not None else 0
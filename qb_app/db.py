@@ -1,5 +1,18 @@
 import os
-import pyodbc
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from qb_app import metrics, storage
+
+
+_METRICS_DISABLED = (os.getenv("METRICS_DISABLED") or "").strip().lower() in ("1", "true", "yes")
+# Idle connections kept per process for reuse (0 disables pooling)
+_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8") or 0)
+# Idle connections older than this are closed instead of reused
+_POOL_RECYCLE_SECONDS = float(os.getenv("DB_POOL_RECYCLE_SECONDS", "300") or 300)
+# Idle connections older than this are checked with SELECT 1 before reuse (0: always)
+_POOL_PING_SECONDS = float(os.getenv("DB_POOL_PING_SECONDS", "10") or 0)
 
 
 def _build_connection_string():
@@ -25,26 +38,272 @@ def _build_connection_string():
     return conn_str
 
 
+class InstrumentedCursor:
+    """Cursor proxy that times execute/executemany per statement fingerprint."""
+
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _timed(self, method, sql, *args):
+        fp = metrics.fingerprint(sql) if isinstance(sql, str) else "?"
+        t0 = time.perf_counter()
+        try:
+            method(sql, *args)
+        except Exception:
+            metrics.DB_QUERY_ERRORS.inc(statement=fp)
+            raise
+        finally:
+            metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - t0, statement=fp)
+        return self  # pyodbc returns the cursor, allowing cur.execute(...).fetchone()
+
+    def execute(self, sql, *params):
+        return self._timed(self._cursor.execute, sql, *params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(self._cursor.executemany, sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name in InstrumentedCursor.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)  # e.g. fast_executemany
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are instrumented."""
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor())
+
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name in InstrumentedConnection.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)  # e.g. autocommit
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+class ConnectionPool:
+    """Per-process pool of idle connections.
+
+    Connections are handed out one borrower at a time and come back on
+    ``close()`` after a rollback. The pool belongs to the process that
+    filled it: after a fork the child starts empty and never touches the
+    parent's sockets (see ``reset``).
+    """
+
+    def __init__(self, size: int, recycle_seconds: float, ping_seconds: float = 0) -> None:
+        self.size = max(int(size), 0)
+        self.recycle_seconds = recycle_seconds
+        self.ping_seconds = ping_seconds
+        self._lock = threading.Lock()
+        self._idle: List[Tuple[object, float]] = []  # (raw connection, returned at)
+        self._pid = os.getpid()
+        self._orphans: List[object] = []  # inherited across a fork; never closed here
+
+    def _check_pid(self) -> None:
+        if self._pid != os.getpid():
+            self._orphans.extend(conn for conn, _ in self._idle)
+            self._idle = []
+            self._pid = os.getpid()
+
+    def acquire(self) -> Optional[object]:
+        """A live idle connection, or None when a new one must be opened.
+
+        Connections idle for more than ``ping_seconds`` run ``SELECT 1``
+        first: Azure SQL drops idle sockets (serverless auto-pause, gateway
+        idle timeout), and a dead one must fail here, not in the request.
+        """
+        while True:
+            stale = []
+            conn = None
+            idle_for = 0.0
+            now = time.monotonic()
+            with self._lock:
+                self._check_pid()
+                while self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    if now - returned_at > self.recycle_seconds:
+                        stale.append(candidate)
+                        continue
+                    conn, idle_for = candidate, now - returned_at
+                    break
+            for c in stale:
+                _close_quietly(c)
+            if conn is None or idle_for <= self.ping_seconds or _alive(conn):
+                return conn
+            _close_quietly(conn)  # dead: try the next idle one
+
+    def release(self, conn, pid: int) -> None:
+        """Return ``conn`` (opened in process ``pid``) or close it."""
+        if pid != os.getpid():
+            return  # opened before a fork: leave it to the parent
+        try:
+            conn.rollback()
+            if getattr(conn, "autocommit", False):
+                conn.autocommit = False
+        except Exception:
+            _close_quietly(conn)
+            return
+        with self._lock:
+            self._check_pid()
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        _close_quietly(conn)
+
+    def reset(self) -> None:
+        """Forget idle connections; closes them only if this process opened them."""
+        with self._lock:
+            inherited = self._pid != os.getpid()
+            idle, self._idle = self._idle, []
+            self._pid = os.getpid()
+            if inherited:
+                self._orphans.extend(conn for conn, _ in idle)
+                idle = []
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+    def idle_count(self) -> int:
+        with self._lock:
+            self._check_pid()
+            return len(self._idle)
+
+
+def _alive(conn) -> bool:
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class PooledConnection:
+    """Connection proxy whose ``close()`` returns the connection to the pool."""
+
+    __slots__ = ("_conn", "_pool", "_pid")
+
+    def __init__(self, conn, pool: ConnectionPool):
+        self._conn = conn
+        self._pool = pool
+        self._pid = os.getpid()
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn, self._pid)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise AttributeError(f"connection is closed ({name})")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name in PooledConnection.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+POOL = ConnectionPool(_POOL_SIZE, _POOL_RECYCLE_SECONDS, _POOL_PING_SECONDS)
+
+
+def reset_pool() -> None:
+    """Start this process with an empty pool (gunicorn post_fork)."""
+    POOL.reset()
+
+
 def get_connection():
-    """Create a new pyodbc connection to Azure SQL using env vars with simple retries."""
-    conn_str = _build_connection_string()
+    """Open a connection on the configured storage backend with simple retries.
+
+    Azure SQL (pyodbc) by default; STORAGE_BACKEND=sqlite uses a local file
+    (see ``qb_app.storage``). With DB_POOL_SIZE > 0 (default 8) ``close()``
+    returns the connection to a per-process pool for the next caller.
+    Connect time and statement timings are recorded in ``qb_app.metrics``
+    (set METRICS_DISABLED=1 to skip statement timing).
+    """
+    if POOL.size:
+        t0 = time.perf_counter()
+        conn = POOL.acquire()
+        if conn is not None:
+            metrics.DB_CONNECT_SECONDS.observe(time.perf_counter() - t0, outcome="pooled")
+            return _wrap(PooledConnection(conn, POOL))
+    backend = storage.get_storage()
     last_err = None
     for attempt in range(1, 4):
+        t0 = time.perf_counter()
         try:
-            return pyodbc.connect(conn_str)
+            conn = backend.connect()
+            metrics.DB_CONNECT_SECONDS.observe(time.perf_counter() - t0, outcome="ok")
+            if POOL.size:
+                conn = PooledConnection(conn, POOL)
+            return _wrap(conn)
         except Exception as e:  # noqa: BLE001
+            metrics.DB_CONNECT_SECONDS.observe(time.perf_counter() - t0, outcome="error")
             last_err = e
             try:
-                import time
-
                 time.sleep(1.5 * attempt)
             except Exception:
                 pass
     raise last_err
 
 
+def _wrap(conn):
+    return conn if _METRICS_DISABLED else InstrumentedConnection(conn)
+
+
 def row_to_dict(cursor, row):
-    """Convert a single pyodbc row into a dict using column names."""
+    """Convert a single DB row into a dict using column names."""
     if row is None:
         return None
     cols = [c[0] for c in cursor.description]
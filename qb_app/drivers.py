@@ -0,0 +1,366 @@
+"""Driver-based planning: a graph of monthly drivers over the forecast horizon.
+
+A driver is a named monthly series computed from GL account forecasts,
+constants or other drivers:
+
+- ``constant``: ``{"value": 12}`` or per-month ``{"values": [...]}`` (the
+  last value repeats)
+- ``account``: baseline forecast of ``{"account_ids": [...]}`` from
+  ``qb_accounts``/``gl_monthly``, summed (``"sign": -1`` to flip it)
+- ``growth``: ``{"base": driver, "rate_pct": 5, "period": "year"}``; the
+  base compounded month by month (``period`` ``"month"`` for a monthly rate)
+- ``percent_of``: ``{"base": driver, "pct": 12.5}``
+- ``product``: ``{"inputs": [driver, ...]}``, e.g. headcount x cost
+- ``sum``: ``{"inputs": [driver, ...], "weights": [1, -1]}``
+
+``DriverGraph`` keeps every driver's series as a NumPy array plus the
+reverse dependency edges and a topological order. ``set_driver`` recomputes
+only the edited driver and its downstream subgraph, in topological order,
+so an edit costs a handful of array operations however large the graph is.
+``overlay`` evaluates a scenario's overrides the same way without touching
+the graph (see ``qb_app.scenarios``). Definitions live in
+``forecast_drivers``; each write bumps the client's ``drivers_version``
+(see ``qb_app.data_version``).
+"""
+
+import datetime as dt
+import json
+import threading
+from collections import ChainMap, deque
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from qb_app import data_version, storage
+
+
+KINDS = ("constant", "account", "growth", "percent_of", "product", "sum")
+MAX_NAME_LENGTH = 100
+
+Definition = Tuple[str, dict]  # (kind, params)
+
+
+def ensure_forecast_drivers_table(cur) -> None:
+    storage.get_storage().ensure_table(
+        cur,
+        "forecast_drivers",
+        """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        client_auth_id INT NOT NULL,
+        name NVARCHAR(100) NOT NULL,
+        kind NVARCHAR(20) NOT NULL,
+        params NVARCHAR(MAX) NULL,
+        created_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        updated_at DATETIME NOT NULL DEFAULT GETUTCDATE()
+        """,
+        ("CREATE UNIQUE INDEX UX_forecast_drivers_client_name ON forecast_drivers (client_auth_id, name)",),
+    )
+
+
+# ---- definitions ----
+
+def _refs(kind: str, params: dict) -> List[str]:
+    if kind in ("growth", "percent_of"):
+        return [params["base"]]
+    if kind in ("product", "sum"):
+        return list(params["inputs"])
+    return []
+
+
+def _number(params: dict, key: str) -> float:
+    try:
+        return float(params[key])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"'{key}' must be a number")
+
+
+def _numbers(values: list, message: str) -> List[float]:
+    try:
+        return [float(v) for v in values]
+    except (TypeError, ValueError):
+        raise ValueError(message)
+
+
+def validate(name: str, kind: str, params: Optional[dict]) -> dict:
+    """Check a definition's shape (not its references); returns clean params."""
+    if not isinstance(name, str) or not name.strip() or len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"name must be 1-{MAX_NAME_LENGTH} characters")
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    if params is not None and not isinstance(params, dict):
+        raise ValueError("'params' must be an object")
+    params = dict(params or {})
+    if kind == "constant":
+        if "values" in params:
+            values = params["values"]
+            if not isinstance(values, list) or not values:
+                raise ValueError("'values' must be a non-empty list")
+            params["values"] = _numbers(values, "'values' must be numbers")
+        else:
+            params["value"] = _number(params, "value")
+    elif kind == "account":
+        ids = params.get("account_ids")
+        if isinstance(ids, (str, int)):
+            ids = [ids]
+        if not ids:
+            raise ValueError("'account_ids' must list at least one account")
+        params["account_ids"] = [str(a) for a in ids]
+        params["sign"] = -1 if params.get("sign") in (-1, "-1") else 1
+    elif kind in ("growth", "percent_of"):
+        if not isinstance(params.get("base"), str) or not params["base"]:
+            raise ValueError("'base' must name a driver")
+        if kind == "growth":
+            params["rate_pct"] = _number(params, "rate_pct")
+            params["period"] = params.get("period") or "year"
+            if params["period"] not in ("month", "year"):
+                raise ValueError("'period' must be 'month' or 'year'")
+        else:
+            params["pct"] = _number(params, "pct")
+    else:
+        inputs = params.get("inputs")
+        if not isinstance(inputs, list) or not inputs or not all(isinstance(i, str) for i in inputs):
+            raise ValueError("'inputs' must list driver names")
+        if kind == "sum" and params.get("weights") is not None:
+            weights = params["weights"]
+            if not isinstance(weights, list) or len(weights) != len(inputs):
+                raise ValueError("'weights' must have one number per input")
+            params["weights"] = _numbers(weights, "'weights' must be numbers")
+    return params
+
+
+# ---- graph ----
+
+def _compute(kind: str, p: dict, values: Mapping[str, np.ndarray], baselines: Dict[str, np.ndarray],
+             h: int) -> np.ndarray:
+    if kind == "constant":
+        if "values" in p:
+            vals = np.asarray(p["values"][:h], dtype=float)
+            return np.concatenate([vals, np.full(h - len(vals), vals[-1])]) if len(vals) < h else vals
+        return np.full(h, p["value"])
+    if kind == "account":
+        out = np.zeros(h)
+        for account_id in p["account_ids"]:
+            row = baselines.get(account_id)
+            if row is not None:
+                out += row
+        return out * p.get("sign", 1)
+    if kind == "growth":
+        rate = p["rate_pct"] / 100.0
+        monthly = rate if p.get("period") == "month" else (1 + rate) ** (1 / 12.0) - 1
+        return values[p["base"]] * (1 + monthly) ** np.arange(1, h + 1)
+    if kind == "percent_of":
+        return values[p["base"]] * (p["pct"] / 100.0)
+    inputs = np.stack([values[i] for i in p["inputs"]])
+    if kind == "product":
+        return inputs.prod(axis=0)
+    weights = p.get("weights")
+    return inputs.sum(axis=0) if weights is None else np.asarray(weights) @ inputs
+
+
+def _downstream(names: Iterable[str], children: Dict[str, List[str]], position: Dict[str, int]) -> List[str]:
+    seen = set(names)
+    stack = list(seen)
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return sorted(seen, key=position.__getitem__)
+
+
+class DriverGraph:
+    """Monthly driver series for one client and horizon.
+
+    ``baselines`` maps AccountId -> forecast row (length ``horizon``).
+    Mutations go through ``set_driver``/``remove_driver``; hold ``lock``
+    around them (and around reads) when the graph is shared.
+    """
+
+    def __init__(self, definitions: Dict[str, Definition], baselines: Dict[str, np.ndarray],
+                 months: List[dt.date]) -> None:
+        self.definitions = dict(definitions)
+        self.baselines = baselines
+        self.months = months
+        self.horizon = len(months)
+        self.values: Dict[str, np.ndarray] = {}
+        self.lock = threading.Lock()
+        self.order, self.position, self.children = self._link(self.definitions)
+        for name in self.order:
+            self.values[name] = self._compute(name)
+
+    @staticmethod
+    def _link(definitions: Dict[str, Definition]):
+        """Topological order (Kahn), position index and reverse edges."""
+        children: Dict[str, List[str]] = {name: [] for name in definitions}
+        indegree = dict.fromkeys(definitions, 0)
+        for name, (kind, params) in definitions.items():
+            for ref in set(_refs(kind, params)):
+                if ref not in definitions:
+                    raise ValueError(f"driver {name!r} references unknown driver {ref!r}")
+                children[ref].append(name)
+                indegree[name] += 1
+        ready = deque(sorted(n for n, d in indegree.items() if d == 0))
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            for child in children[name]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        if len(order) != len(definitions):
+            cyclic = sorted(n for n, d in indegree.items() if d > 0)
+            raise ValueError(f"driver cycle through {', '.join(cyclic)}")
+        return order, {name: i for i, name in enumerate(order)}, children
+
+    def _compute(self, name: str) -> np.ndarray:
+        kind, params = self.definitions[name]
+        return _compute(kind, params, self.values, self.baselines, self.horizon)
+
+    def downstream(self, name: str) -> List[str]:
+        """``name`` and every driver that depends on it, in topological order."""
+        return _downstream([name], self.children, self.position)
+
+    def set_driver(self, name: str, kind: str, params: dict) -> List[str]:
+        """Add or replace a definition; returns the recomputed drivers.
+
+        Raises ValueError (leaving the graph unchanged) for unknown
+        references or a cycle.
+        """
+        old = self.definitions.get(name)
+        if old is not None and set(_refs(*old)) == set(_refs(kind, params)):
+            self.definitions[name] = (kind, params)  # same edges: order still valid
+        else:
+            definitions = dict(self.definitions)
+            definitions[name] = (kind, params)
+            self.order, self.position, self.children = self._link(definitions)
+            self.definitions = definitions
+        dirty = self.downstream(name)
+        for driver in dirty:
+            self.values[driver] = self._compute(driver)
+        return dirty
+
+    def remove_driver(self, name: str) -> None:
+        """Drop a driver nothing else depends on (ValueError otherwise)."""
+        if name not in self.definitions:
+            return
+        if self.children.get(name):
+            raise ValueError(f"driver {name!r} is used by {', '.join(sorted(self.children[name]))}")
+        definitions = dict(self.definitions)
+        del definitions[name]
+        self.order, self.position, self.children = self._link(definitions)
+        self.definitions = definitions
+        self.values.pop(name, None)
+
+    def overlay(self, overrides: Dict[str, Definition]) -> "Overlay":
+        """Evaluate ``overrides`` (a scenario) on top of this graph without changing it.
+
+        Only the overridden drivers and their downstream subgraph are
+        computed; every other series is shared with the graph. Raises
+        ValueError for unknown references or a cycle.
+        """
+        if not overrides:
+            return Overlay(self, self.definitions, self.order, {}, [])
+        definitions = ChainMap(dict(overrides), self.definitions)
+        same_edges = all(
+            name in self.definitions and set(_refs(*self.definitions[name])) == set(_refs(*d))
+            for name, d in overrides.items()
+        )
+        if same_edges:
+            order, position, children = self.order, self.position, self.children
+        else:
+            order, position, children = self._link(definitions)
+        changed = _downstream(overrides, children, position)
+        own: Dict[str, np.ndarray] = {}
+        values = ChainMap(own, self.values)
+        for name in changed:
+            kind, params = definitions[name]
+            own[name] = _compute(kind, params, values, self.baselines, self.horizon)
+        return Overlay(self, definitions, order, own, changed)
+
+    def refs(self, name: str) -> List[str]:
+        return _refs(*self.definitions[name])
+
+    def series(self, names: Optional[Iterable[str]] = None) -> Dict[str, list]:
+        return {n: self.values[n].round(2).tolist() for n in (self.order if names is None else names)}
+
+
+class Overlay:
+    """A scenario's view of a DriverGraph (copy-on-write).
+
+    ``own`` holds the series of the ``changed`` drivers (the overrides and
+    their downstream subgraph); ``value`` falls back to the base graph for
+    the rest. Read it under the base graph's lock.
+    """
+
+    __slots__ = ("base", "definitions", "order", "own", "changed")
+
+    def __init__(self, base: DriverGraph, definitions: Mapping[str, Definition], order: List[str],
+                 own: Dict[str, np.ndarray], changed: List[str]) -> None:
+        self.base = base
+        self.definitions = definitions
+        self.order = order
+        self.own = own
+        self.changed = changed
+
+    def value(self, name: str) -> np.ndarray:
+        series = self.own.get(name)
+        return self.base.values[name] if series is None else series
+
+
+# ---- persistence ----
+
+def load_definitions(cur, client_auth_id: int) -> Dict[str, Definition]:
+    ensure_forecast_drivers_table(cur)
+    cur.execute("SELECT name, kind, params FROM forecast_drivers WHERE client_auth_id = ?", (int(client_auth_id),))
+    return {r[0]: (r[1], json.loads(r[2] or "{}")) for r in cur.fetchall()}
+
+
+def save_definition(cur, client_auth_id: int, name: str, kind: str, params: dict) -> None:
+    """Upsert a definition and bump the client's drivers_version (no commit)."""
+    ensure_forecast_drivers_table(cur)
+    storage.get_storage().upsert(
+        cur,
+        "forecast_drivers",
+        ("client_auth_id", "name"),
+        {
+            "client_auth_id": int(client_auth_id),
+            "name": name,
+            "kind": kind,
+            "params": json.dumps(params),
+            "updated_at": dt.datetime.utcnow(),
+        },
+    )
+    data_version.bump(cur, client_auth_id, "drivers_version")
+
+
+def delete_definition(cur, client_auth_id: int, name: str) -> bool:
+    ensure_forecast_drivers_table(cur)
+    cur.execute("DELETE FROM forecast_drivers WHERE client_auth_id = ? AND name = ?", (int(client_auth_id), name))
+    deleted = cur.rowcount > 0
+    if deleted:
+        data_version.bump(cur, client_auth_id, "drivers_version")
+    return deleted
+
+
+def baselines(conn, client_auth_id: int, horizon: int,
+              method: str = "holt_winters") -> Tuple[Dict[str, np.ndarray], List[dt.date]]:
+    """Per-account baseline forecasts (classes summed) and their months."""
+    from qb_app import forecast
+
+    matrix = forecast.load_matrix(conn, client_auth_id)
+    months = matrix.future_months(horizon)
+    if not matrix.keys:
+        # No history yet: plan from the current month
+        i = dt.date.today().year * 12 + dt.date.today().month - 1
+        return {}, [dt.date((i + k) // 12, (i + k) % 12 + 1, 1) for k in range(horizon)]
+    values = forecast.forecast(matrix.values, horizon, method)
+    return {account_id: values[i] for i, (account_id, _) in enumerate(matrix.keys)}, months
+
+
+def build_graph(conn, client_auth_id: int, horizon: int, method: str = "holt_winters") -> DriverGraph:
+    rows, months = baselines(conn, client_auth_id, horizon, method)
+    cur = conn.cursor()
+    definitions = load_definitions(cur, client_auth_id)
+    conn.commit()
+    return DriverGraph(definitions, rows, months)
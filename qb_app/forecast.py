@@ -0,0 +1,228 @@
+"""Statistical forecasts over a client's monthly GL series.
+
+``load_matrix`` reads ``gl_monthly`` (see ``qb_app.gl_cube``) joined to
+``qb_accounts`` into a dense float matrix, one row per account (or per
+account and class) and one column per month, zero-filled between the first
+and last month with activity. The models take that matrix and return a
+``rows x horizon`` matrix; every model works on all rows at once with array
+operations, so a 500-account chart costs about as much as one account:
+
+- ``seasonal_naive``: the value from the same month last year
+- ``linear_trend``: least-squares line per row, extrapolated
+- ``holt_winters``: additive level/trend/season smoothing. The time loop
+  is vectorized over rows, and the smoothing grid is stacked into the row
+  axis so each row gets its best parameters in the same pass.
+- ``auto``: per row, whichever model had the lowest error on a holdout of
+  the last months
+
+    m = load_matrix(conn, client_auth_id)
+    values = forecast(m.values, horizon=12, method="holt_winters")
+"""
+
+import datetime as dt
+import itertools
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from qb_app import gl_cube, storage
+
+
+SEASON = 12
+METHODS = ("seasonal_naive", "linear_trend", "holt_winters", "auto")
+# (alpha, beta, gamma) candidates for holt_winters; each row keeps its best
+HW_GRID = list(itertools.product((0.1, 0.3, 0.6), (0.01, 0.1), (0.05, 0.3)))
+
+_ACCOUNT_FIELDS = ("Name", "FullyQualifiedName", "AccountType", "Classification")
+
+
+class GLMatrix:
+    """Dense monthly series: ``values[i, j]`` is row ``keys[i]`` in ``months[j]``."""
+
+    __slots__ = ("keys", "months", "values", "accounts")
+
+    def __init__(self, keys: List[Tuple[str, str]], months: List[dt.date], values: np.ndarray,
+                 accounts: Dict[str, dict]) -> None:
+        self.keys = keys  # (AccountId, Class); Class is "" unless by_class
+        self.months = months
+        self.values = values
+        self.accounts = accounts  # AccountId -> Name/AccountType/... from qb_accounts
+
+    def future_months(self, horizon: int) -> List[dt.date]:
+        if not self.months:
+            return []
+        return [_add_months(self.months[-1], k) for k in range(1, horizon + 1)]
+
+
+def _month_index(d: dt.date) -> int:
+    return d.year * 12 + d.month - 1
+
+
+def _add_months(d: dt.date, n: int) -> dt.date:
+    i = _month_index(d) + n
+    return dt.date(i // 12, i % 12 + 1, 1)
+
+
+def _load_accounts(cur, client_auth_id: int) -> Dict[str, dict]:
+    store = storage.get_storage()
+    if not store.table_exists(cur, "qb_accounts"):
+        return {}
+    fields = [f for f in _ACCOUNT_FIELDS if f in set(store.columns(cur, "qb_accounts"))]
+    cols = ", ".join(["Id"] + fields)
+    cur.execute(f"SELECT {cols} FROM qb_accounts WHERE client_auth_id = ?", (int(client_auth_id),))
+    return {str(r[0]): dict(zip(fields, r[1:])) for r in cur.fetchall()}
+
+
+def load_matrix(conn, client_auth_id: int, by_class: bool = False,
+                start: Optional[dt.date] = None, end: Optional[dt.date] = None) -> GLMatrix:
+    """Read the client's gl_monthly cells into a GLMatrix."""
+    cur = conn.cursor()
+    gl_cube.ensure_gl_monthly_table(cur)
+    class_col = "Class" if by_class else "''"
+    # Month as an integer index (year * 12 + month - 1): no date objects per row
+    sql = f"""
+        SELECT AccountId, {class_col} AS Class, YEAR(month) * 12 + MONTH(month) - 1 AS month_ix, SUM(amount)
+        FROM gl_monthly
+        WHERE client_auth_id = ?
+    """
+    params: list = [int(client_auth_id)]
+    if start is not None:
+        sql += " AND month >= ?"
+        params.append(gl_cube.month_of(start))
+    if end is not None:
+        sql += " AND month <= ?"
+        params.append(gl_cube.month_of(end))
+    sql += f" GROUP BY AccountId, {'Class, ' if by_class else ''}month"
+    cur.execute(sql, tuple(params))
+    rows = cur.fetchall()
+    accounts = _load_accounts(cur, client_auth_id)
+    conn.commit()
+    if not rows:
+        return GLMatrix([], [], np.zeros((0, 0)), accounts)
+
+    account_ids, classes, month_col, amounts = zip(*rows)
+    month_ix = np.fromiter(month_col, dtype=np.int64, count=len(rows))
+    first = int(month_ix.min())
+    n_months = int(month_ix.max()) - first + 1
+    key_ix: Dict[Tuple[str, str], int] = {}
+    row_ix = np.fromiter(
+        (key_ix.setdefault((str(a), c or ""), len(key_ix)) for a, c in zip(account_ids, classes)),
+        dtype=np.int64, count=len(rows),
+    )
+    values = np.zeros((len(key_ix), n_months))
+    np.add.at(values, (row_ix, month_ix - first), np.array(amounts, dtype=float))
+    months = [dt.date((first + j) // 12, (first + j) % 12 + 1, 1) for j in range(n_months)]
+    return GLMatrix(list(key_ix), months, values, accounts)
+
+
+# ---- models: (rows x T) -> (rows x horizon) ----
+
+def seasonal_naive(y: np.ndarray, horizon: int, season: int = SEASON) -> np.ndarray:
+    n, t = y.shape
+    if t == 0:
+        return np.zeros((n, horizon))
+    if t < season:
+        return np.repeat(y[:, -1:], horizon, axis=1)
+    cols = t - season + (np.arange(horizon) % season)
+    return y[:, cols]
+
+
+def linear_trend(y: np.ndarray, horizon: int) -> np.ndarray:
+    n, t = y.shape
+    if t == 0:
+        return np.zeros((n, horizon))
+    if t == 1:
+        return np.repeat(y, horizon, axis=1)
+    x = np.arange(t, dtype=float)
+    xc = x - x.mean()
+    y_mean = y.mean(axis=1)
+    slope = (y - y_mean[:, None]) @ xc / (xc @ xc)
+    intercept = y_mean - slope * x.mean()
+    future = np.arange(t, t + horizon, dtype=float)
+    return intercept[:, None] + slope[:, None] * future[None, :]
+
+
+def _holt_winters_pass(y: np.ndarray, alpha: np.ndarray, beta: np.ndarray, gamma: np.ndarray,
+                       season: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """One smoothing pass over time for all rows; returns level, trend, seasonals, SSE."""
+    n, t = y.shape
+    seasonal = t >= 2 * season
+    if seasonal:
+        # The first season's mean sits at its middle month; level starts at its
+        # last month, and the seasonals are what is left once the trend is out
+        first = y[:, :season].mean(axis=1)
+        trend = (y[:, season:2 * season].mean(axis=1) - first) / season
+        offsets = np.arange(season) - (season - 1) / 2
+        seas = y[:, :season] - first[:, None] - trend[:, None] * offsets[None, :]
+        level = first + trend * (season - 1) / 2
+        start = season
+    else:
+        level = y[:, 0].copy()
+        trend = (y[:, 1] - y[:, 0]) if t > 1 else np.zeros(n)
+        seas = np.zeros((n, season))
+        start = 1
+    sse = np.zeros(n)
+    for i in range(start, t):
+        j = i % season
+        s = seas[:, j]
+        err = y[:, i] - (level + trend + s)
+        sse += err * err
+        new_level = alpha * (y[:, i] - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        if seasonal:
+            seas[:, j] = gamma * (y[:, i] - new_level) + (1 - gamma) * s
+        level = new_level
+    return level, trend, seas, sse
+
+
+def holt_winters(y: np.ndarray, horizon: int, season: int = SEASON,
+                 grid: Sequence[Tuple[float, float, float]] = HW_GRID) -> np.ndarray:
+    """Additive Holt-Winters; trend-only (Holt) with fewer than two seasons of data."""
+    n, t = y.shape
+    if t < 2 or n == 0:
+        return seasonal_naive(y, horizon, season)
+    g = len(grid)
+    params = np.asarray(grid, dtype=float)
+    # Row r of the stacked problem is series r % n with parameter set r // n
+    stacked = np.tile(y, (g, 1))
+    alpha, beta, gamma = (np.repeat(params[:, k], n) for k in range(3))
+    level, trend, seas, sse = _holt_winters_pass(stacked, alpha, beta, gamma, season)
+    best = sse.reshape(g, n).argmin(axis=0) * n + np.arange(n)
+    level, trend, seas = level[best], trend[best], seas[best]
+    steps = np.arange(1, horizon + 1, dtype=float)
+    season_cols = (t + np.arange(horizon)) % season
+    return level[:, None] + trend[:, None] * steps[None, :] + seas[:, season_cols]
+
+
+MODELS: Dict[str, Callable[[np.ndarray, int], np.ndarray]] = {
+    "seasonal_naive": seasonal_naive,
+    "linear_trend": linear_trend,
+    "holt_winters": holt_winters,
+}
+
+
+def auto(y: np.ndarray, horizon: int, holdout: int = 6) -> np.ndarray:
+    """Per row, the model with the lowest mean absolute error on the last ``holdout`` months."""
+    n, t = y.shape
+    if t <= holdout + 2:
+        return holt_winters(y, horizon)
+    train, test = y[:, :-holdout], y[:, -holdout:]
+    names = list(MODELS)
+    errors = np.stack([np.abs(MODELS[m](train, holdout) - test).mean(axis=1) for m in names])
+    choice = errors.argmin(axis=0)
+    out = np.empty((n, horizon))
+    for k, m in enumerate(names):
+        rows = choice == k
+        if rows.any():
+            out[rows] = MODELS[m](y[rows], horizon)
+    return out
+
+
+def forecast(values: np.ndarray, horizon: int = 12, method: str = "holt_winters") -> np.ndarray:
+    """Forecast every row of ``values`` ``horizon`` months ahead."""
+    if method == "auto":
+        return auto(values, horizon)
+    model = MODELS.get(method)
+    if model is None:
+        raise ValueError(f"unknown forecast method {method!r} (expected one of {', '.join(METHODS)})")
+    return model(np.asarray(values, dtype=float), int(horizon))
@@ -0,0 +1,276 @@
+"""Nightly forecast refresh for every client whose data changed.
+
+Each successful per-client ``daily_sync`` job queues one shared
+``forecast_refresh`` job, due ``FORECAST_REFRESH_COALESCE_SECONDS`` later;
+syncs finishing before it runs join the same job, so one pooled run covers
+every client that changed meanwhile (the legacy single-batch sync runs one
+full refresh when it finishes). A client is
+pending when its ``client_data_version`` differs from the version recorded
+in ``forecast_refresh_state`` for the configured method and horizon, so the
+nightly cost follows how many clients changed, not how many exist.
+
+Pending clients are split into chunks and each chunk runs in a worker
+process (``ProcessPoolExecutor``, spawn context: the scheduler runs in a
+threaded web worker, which is not safe to fork). A worker opens its own
+connection, forecasts each client with ``qb_app.forecast`` and replaces the
+client's rows in ``forecast_results`` with one bulk insert, committing the
+rows and the client's state together. A run that dies part-way is simply
+run again: finished clients are already up to date and are skipped.
+
+    python -c "from qb_app import forecast_refresh; print(forecast_refresh.run())"
+"""
+
+import datetime as dt
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional
+
+from qb_app import applog, data_version, storage, telemetry
+from qb_app.db import get_connection
+
+
+_logger = applog.get_logger("qb_app.forecast_refresh")
+
+REFRESH_ENABLED = os.getenv("FORECAST_REFRESH_DISABLED", "0") != "1"
+REFRESH_METHOD = os.getenv("FORECAST_REFRESH_METHOD", "auto")
+REFRESH_HORIZON = int(os.getenv("FORECAST_REFRESH_HORIZON", "12") or 12)
+REFRESH_PROCESSES = int(os.getenv("FORECAST_REFRESH_PROCESSES", "0") or 0)  # 0: one per CPU
+REFRESH_CHUNK = int(os.getenv("FORECAST_REFRESH_CHUNK", "25") or 25)
+REFRESH_COALESCE_SECONDS = int(os.getenv("FORECAST_REFRESH_COALESCE_SECONDS", "600") or 600)
+INSERT_BATCH = 5000
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
+
+
+def ensure_tables(cur) -> None:
+    store = storage.get_storage()
+    store.ensure_table(
+        cur,
+        "forecast_results",
+        """
+        client_auth_id INT NOT NULL,
+        method NVARCHAR(20) NOT NULL,
+        horizon INT NOT NULL,
+        AccountId NVARCHAR(50) NOT NULL,
+        Class NVARCHAR(255) NOT NULL DEFAULT '',
+        month DATE NOT NULL,
+        amount DECIMAL(18,2) NOT NULL,
+        data_version INT NOT NULL,
+        computed_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        CONSTRAINT PK_forecast_results PRIMARY KEY (client_auth_id, method, horizon, AccountId, Class, month)
+        """,
+    )
+    store.ensure_table(
+        cur,
+        "forecast_refresh_state",
+        """
+        client_auth_id INT NOT NULL,
+        method NVARCHAR(20) NOT NULL,
+        horizon INT NOT NULL,
+        data_version INT NULL,
+        status NVARCHAR(20) NOT NULL,
+        rows_written INT NOT NULL DEFAULT 0,
+        error NVARCHAR(MAX) NULL,
+        refreshed_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        CONSTRAINT PK_forecast_refresh_state PRIMARY KEY (client_auth_id, method, horizon)
+        """,
+    )
+
+
+def pending_clients(cur, method: str, horizon: int, client_ids: Optional[Iterable[int]] = None) -> List[int]:
+    """Active clients whose stored forecasts are older than their data."""
+    ensure_tables(cur)
+    data_version.ensure_client_data_version_table(cur)
+    sql = """
+        SELECT c.id FROM client_auth c
+        LEFT JOIN client_data_version v ON v.client_auth_id = c.id
+        LEFT JOIN forecast_refresh_state s
+          ON s.client_auth_id = c.id AND s.method = ? AND s.horizon = ?
+        WHERE c.active = 1
+          AND (s.data_version IS NULL OR s.data_version <> COALESCE(v.version, 0))
+    """
+    params: list = [method, int(horizon)]
+    if client_ids is not None:
+        ids = [int(c) for c in client_ids]
+        if not ids:
+            return []
+        sql += f" AND c.id IN ({', '.join(['?'] * len(ids))})"
+        params.extend(ids)
+    cur.execute(sql + " ORDER BY c.id", tuple(params))
+    return [int(r[0]) for r in cur.fetchall()]
+
+
+def _save_state(cur, client_id: int, method: str, horizon: int, version: int, rows: int) -> None:
+    storage.get_storage().upsert(
+        cur,
+        "forecast_refresh_state",
+        ("client_auth_id", "method", "horizon"),
+        {
+            "client_auth_id": client_id,
+            "method": method,
+            "horizon": horizon,
+            "data_version": version,
+            "status": "ok",
+            "rows_written": rows,
+            "error": None,
+            "refreshed_at": dt.datetime.utcnow(),
+        },
+    )
+
+
+def _save_failure(cur, client_id: int, method: str, horizon: int, error: str) -> None:
+    # Keep the last good data_version: the client stays pending for the next run
+    cur.execute(
+        """
+        UPDATE forecast_refresh_state SET status = 'failed', error = ?, refreshed_at = GETUTCDATE()
+        WHERE client_auth_id = ? AND method = ? AND horizon = ?
+        """,
+        (error, client_id, method, horizon),
+    )
+    if cur.rowcount == 0:
+        cur.execute(
+            """
+            INSERT INTO forecast_refresh_state (client_auth_id, method, horizon, data_version, status, error)
+            VALUES (?, ?, ?, NULL, 'failed', ?)
+            """,
+            (client_id, method, horizon, error),
+        )
+
+
+def refresh_client(conn, client_id: int, method: str, horizon: int) -> Dict[str, int]:
+    """Recompute and store one client's forecasts (commits)."""
+    from qb_app import forecast
+
+    cur = conn.cursor()
+    # Read before the data: rows written meanwhile leave the client pending
+    version = data_version.get_version(cur, client_id)
+    matrix = forecast.load_matrix(conn, client_id, by_class=True)
+    months = matrix.future_months(horizon)
+    rows = []
+    if matrix.keys:
+        values = forecast.forecast(matrix.values, horizon, method).round(2).tolist()
+        for (account_id, class_name), series in zip(matrix.keys, values):
+            rows.extend(
+                (client_id, method, horizon, account_id, class_name, month, amount, version)
+                for month, amount in zip(months, series)
+            )
+    cur.execute(
+        "DELETE FROM forecast_results WHERE client_auth_id = ? AND method = ? AND horizon = ?",
+        (client_id, method, horizon),
+    )
+    cur.fast_executemany = True  # pyodbc: one round trip per batch
+    for i in range(0, len(rows), INSERT_BATCH):
+        cur.executemany(
+            """
+            INSERT INTO forecast_results
+                (client_auth_id, method, horizon, AccountId, Class, month, amount, data_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows[i:i + INSERT_BATCH],
+        )
+    _save_state(cur, client_id, method, horizon, version, len(rows))
+    conn.commit()
+    return {"rows": len(rows), "data_version": version}
+
+
+def refresh_chunk(client_ids: List[int], method: str, horizon: int) -> List[dict]:
+    """Worker entry point: refresh a chunk of clients on one connection."""
+    results = []
+    conn = get_connection()
+    try:
+        for client_id in client_ids:
+            t0 = time.perf_counter()
+            try:
+                out = refresh_client(conn, client_id, method, horizon)
+                results.append(dict(out, client_id=client_id, status="ok",
+                                    ms=int((time.perf_counter() - t0) * 1000)))
+            except Exception as e:
+                _log(f"forecast refresh failed: {e}", logging.ERROR, client_id=client_id)
+                try:
+                    conn.rollback()
+                    _save_failure(conn.cursor(), client_id, method, horizon, str(e)[:2000])
+                    conn.commit()
+                except Exception:
+                    pass
+                results.append({"client_id": client_id, "status": "failed", "error": str(e)})
+    finally:
+        conn.close()
+    return results
+
+
+def _chunks(ids: List[int], processes: int) -> List[List[int]]:
+    # Small enough to spread over every process, capped so one slow chunk cannot dominate
+    size = max(1, min(REFRESH_CHUNK, math.ceil(len(ids) / max(processes, 1))))
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def run(method: Optional[str] = None, horizon: Optional[int] = None,
+        client_ids: Optional[Iterable[int]] = None, processes: Optional[int] = None,
+        pool: bool = False) -> dict:
+    """Refresh every pending client; returns a summary.
+
+    ``processes`` 1 runs in this process (no pool), as does a single chunk,
+    unless ``pool`` is set: callers on a web worker's threads always fit in
+    spawned processes so the worker keeps serving requests.
+    """
+    from qb_app import forecast
+
+    method = method or REFRESH_METHOD
+    if method not in forecast.METHODS:
+        raise ValueError(f"unknown forecast method {method!r}")
+    horizon = int(horizon or REFRESH_HORIZON)
+    processes = int(processes or REFRESH_PROCESSES or os.cpu_count() or 1)
+
+    t0 = time.perf_counter()
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        pending = pending_clients(cur, method, horizon, client_ids)
+        cur.execute("SELECT COUNT(*) FROM client_auth WHERE active = 1")
+        active = int(cur.fetchone()[0])
+        conn.commit()
+    finally:
+        conn.close()
+
+    results: List[dict] = []
+    chunks = _chunks(pending, processes)
+    inline = not pool and (processes <= 1 or len(chunks) <= 1)
+    if inline:
+        for chunk in chunks:
+            results.extend(refresh_chunk(chunk, method, horizon))
+    elif chunks:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks)), mp_context=ctx,
+                                 initializer=applog.configure) as pool:
+            futures = {pool.submit(refresh_chunk, chunk, method, horizon): chunk for chunk in chunks}
+            for fut in as_completed(futures):
+                try:
+                    results.extend(fut.result())
+                except Exception as e:  # worker process died; its clients stay pending
+                    _log(f"forecast refresh chunk failed: {e}", logging.ERROR, clients=len(futures[fut]))
+                    results.extend({"client_id": c, "status": "failed", "error": str(e)} for c in futures[fut])
+
+    failed = [r for r in results if r["status"] != "ok"]
+    if failed:
+        telemetry.incr("errors", len(failed))
+    summary = {
+        "method": method,
+        "horizon": horizon,
+        "active_clients": active,
+        "pending": len(pending),
+        "skipped": max(active - len(pending), 0),
+        "refreshed": len(results) - len(failed),
+        "failed": len(failed),
+        "processes": 0 if not chunks else 1 if inline else min(processes, len(chunks)),
+        "chunks": len(chunks),
+        "rows_written": sum(r.get("rows", 0) for r in results),
+        "duration_ms": int((time.perf_counter() - t0) * 1000),
+    }
+    _log("forecast refresh finished", **summary)
+    return summary
@@ -0,0 +1,173 @@
+"""Monthly GL cube materialized from ``qb_transactions``.
+
+``gl_monthly`` holds one row per (client_auth_id, AccountId, Class,
+Department, month) with the summed ``LineAmount`` and line count, so P&L
+style reads scan thousands of rows instead of every transaction line.
+
+The loaders keep it current incrementally: ``insert_transactions`` adds
+each written line to a delta map (``add_line``) and applies it with
+``apply_deltas`` in the same SQL transaction; the daily sync subtracts the
+old lines of a changed transaction before reinserting it. ``rebuild``
+recomputes a client from scratch (backfill or repair).
+
+Missing Class/Department are stored as ``''`` so they can be part of the
+key. Lines without an account or date, and non-posting types (purchase
+orders, time activity), are not part of the cube.
+"""
+
+import datetime as dt
+import logging
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from qb_app import applog, data_version, storage
+
+
+_logger = applog.get_logger("qb_app.gl_cube")
+
+# Entity types that do not post to the general ledger
+NON_POSTING_TYPES = ("PurchaseOrder", "TimeActivity", "Estimate")
+
+Key = Tuple[str, str, str, dt.date]  # (AccountId, Class, Department, month)
+Deltas = Dict[Key, list]  # key -> [amount, line_count]
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
+
+
+def ensure_gl_monthly_table(cur) -> None:
+    storage.get_storage().ensure_table(
+        cur,
+        "gl_monthly",
+        """
+        client_auth_id INT NOT NULL,
+        AccountId NVARCHAR(50) NOT NULL,
+        Class NVARCHAR(255) NOT NULL DEFAULT '',
+        Department NVARCHAR(255) NOT NULL DEFAULT '',
+        month DATE NOT NULL,
+        amount DECIMAL(18,2) NOT NULL DEFAULT 0,
+        line_count INT NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        CONSTRAINT PK_gl_monthly PRIMARY KEY (client_auth_id, AccountId, Class, Department, month)
+        """,
+        ("CREATE INDEX IX_gl_monthly_client_month ON gl_monthly (client_auth_id, month)",),
+    )
+
+
+def month_of(txn_date) -> Optional[dt.date]:
+    """First day of the month for a date, datetime or ``YYYY-MM-DD...`` string."""
+    if txn_date is None:
+        return None
+    if isinstance(txn_date, (dt.date, dt.datetime)):
+        return dt.date(txn_date.year, txn_date.month, 1)
+    text = str(txn_date)
+    if len(text) < 7:
+        return None
+    try:
+        return dt.date(int(text[:4]), int(text[5:7]), 1)
+    except ValueError:
+        return None
+
+
+def add_line(deltas: Deltas, account_id, class_name, department, txn_date, amount, sign: int = 1) -> None:
+    """Add one transaction line (``sign=-1`` to remove it) to ``deltas``."""
+    month = month_of(txn_date)
+    if not account_id or month is None:
+        return
+    key = (str(account_id), class_name or "", department or "", month)
+    value = Decimal(str(amount)) if amount is not None else Decimal(0)
+    slot = deltas.get(key)
+    if slot is None:
+        deltas[key] = [sign * value, sign]
+    else:
+        slot[0] += sign * value
+        slot[1] += sign
+
+
+def add_lines(deltas: Deltas, rows: Iterable, sign: int = 1) -> None:
+    """``add_line`` for rows of (AccountId, Class, Department, TxnDate, LineAmount)."""
+    for account_id, class_name, department, txn_date, amount in rows:
+        add_line(deltas, account_id, class_name, department, txn_date, amount, sign)
+
+
+def apply_deltas(cur, client_auth_id: int, deltas: Deltas) -> int:
+    """Fold ``deltas`` into gl_monthly (no commit); returns cells touched.
+
+    Cells whose last line was removed are deleted.
+    """
+    if not deltas:
+        return 0
+    ensure_gl_monthly_table(cur)
+    cid = int(client_auth_id)
+    emptied = False
+    touched = 0
+    for (account_id, class_name, department, month), (amount, count) in deltas.items():
+        if not count and not amount:
+            continue
+        params = (account_id, class_name, department, month)
+        cur.execute(
+            """
+            UPDATE gl_monthly
+            SET amount = amount + ?, line_count = line_count + ?, updated_at = GETUTCDATE()
+            WHERE client_auth_id = ? AND AccountId = ? AND Class = ? AND Department = ? AND month = ?
+            """,
+            (amount, count, cid) + params,
+        )
+        if cur.rowcount == 0:
+            cur.execute(
+                """
+                INSERT INTO gl_monthly (client_auth_id, AccountId, Class, Department, month, amount, line_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (cid,) + params + (amount, count),
+            )
+        emptied = emptied or count < 0
+        touched += 1
+    if emptied:
+        cur.execute("DELETE FROM gl_monthly WHERE client_auth_id = ? AND line_count <= 0", (cid,))
+    return touched
+
+
+def _posting_filter() -> str:
+    types = ", ".join(f"'{t}'" for t in NON_POSTING_TYPES)
+    return f"AccountId IS NOT NULL AND TxnDate IS NOT NULL AND (TxnType IS NULL OR TxnType NOT IN ({types}))"
+
+
+def rebuild(cur, client_auth_id: int) -> int:
+    """Recompute a client's cube from qb_transactions (no commit); returns cells."""
+    ensure_gl_monthly_table(cur)
+    cid = int(client_auth_id)
+    cur.execute("DELETE FROM gl_monthly WHERE client_auth_id = ?", (cid,))
+    cur.execute(
+        f"""
+        INSERT INTO gl_monthly (client_auth_id, AccountId, Class, Department, month, amount, line_count)
+        SELECT client_auth_id, AccountId, ISNULL(Class, ''), ISNULL(Department, ''),
+               DATEFROMPARTS(YEAR(TxnDate), MONTH(TxnDate), 1),
+               SUM(ISNULL(LineAmount, 0)), COUNT(*)
+        FROM qb_transactions
+        WHERE client_auth_id = ? AND {_posting_filter()}
+        GROUP BY client_auth_id, AccountId, ISNULL(Class, ''), ISNULL(Department, ''),
+                 DATEFROMPARTS(YEAR(TxnDate), MONTH(TxnDate), 1)
+        """,
+        (cid,),
+    )
+    cur.execute("SELECT COUNT(*) FROM gl_monthly WHERE client_auth_id = ?", (cid,))
+    cells = int(cur.fetchone()[0])
+    data_version.bump(cur, cid)
+    _log("gl cube rebuilt", client_auth_id=cid, cells=cells)
+    return cells
+
+
+def ensure_built(cur, client_auth_id: int) -> bool:
+    """Backfill the cube for a client that has transactions but no cells yet."""
+    ensure_gl_monthly_table(cur)
+    cid = int(client_auth_id)
+    cur.execute("SELECT TOP 1 1 FROM gl_monthly WHERE client_auth_id = ?", (cid,))
+    if cur.fetchone():
+        return False
+    cur.execute("SELECT TOP 1 1 FROM qb_transactions WHERE client_auth_id = ?", (cid,))
+    if not cur.fetchone():
+        return False
+    rebuild(cur, cid)
+    return True
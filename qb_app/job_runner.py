@@ -1,33 +1,580 @@
+"""SQL-backed background job queue.
+
+Jobs live in the ``job_queue`` table so they survive restarts and are shared
+by every gunicorn worker and container. Each process runs one dispatcher
+thread that claims due jobs with a time-limited lease (``UPDLOCK, READPAST``
+so concurrent claimers never block each other), runs them on a small local
+pool, renews leases while they run and requeues failures with exponential
+backoff. A job whose owner dies is picked up again once its lease expires.
+
+At most one queued/running job exists per (job_type, client_id); enqueueing
+a duplicate returns the existing job id. Handlers publish structured
+progress (``set_progress``/``add_progress``) into the job's ``progress``
+JSON column, which the integrations API exposes to the frontend.
+"""
+
+import json
+import logging
 import os
+import socket
+import threading
+import time
+import traceback
 from concurrent.futures import ThreadPoolExecutor
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional, Tuple
 
+from qb_app import applog, storage, telemetry
+from qb_app.db import get_connection, fetchone_dict, fetchall_dict
 
-# A small, in-process job runner for background tasks.
+
+# Local concurrency (per process) and soft cluster-wide cap on running jobs
 _MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "2") or 2)
-_EXECUTOR: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=_MAX_WORKERS)
+_GLOBAL_MAX_RUNNING = int(os.getenv("JOB_GLOBAL_MAX_RUNNING", "4") or 4)
+_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300") or 300)
+_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5") or 5)
+_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "30") or 30)
+_RETRY_MAX_SECONDS = 3600
+# Idle polling backs off from MIN to MAX; a local enqueue wakes it at once
+_POLL_MIN_SECONDS = float(os.getenv("JOB_POLL_MIN_SECONDS", "1") or 1)
+_POLL_MAX_SECONDS = float(os.getenv("JOB_POLL_MAX_SECONDS", "30") or 30)
+# Progress is buffered in memory and written at most this often per job
+_PROGRESS_FLUSH_SECONDS = float(os.getenv("JOB_PROGRESS_FLUSH_SECONDS", "2") or 2)
+
+_HANDLERS: Dict[str, Callable[[Optional[int]], None]] = {}
+
+_SCHEMA_READY = False
+_STATE_LOCK = threading.Lock()
+_STARTED_PID: Optional[int] = None
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_RUNNING: Dict[int, float] = {}  # job id -> local start time
+_CURRENT = threading.local()  # progress state of the job on this thread
+
+_JOB_COLUMNS = """
+    id, job_type, client_id, status, attempts, max_attempts, run_after,
+    lease_owner, lease_expires, last_error, progress, created_at, started_at, finished_at
+"""
+
+
+_logger = applog.get_logger("qb_app.jobs")
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
+
+
+def worker_id() -> str:
+    """Identify this process as a lease owner (hostname:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_job_table(cur) -> None:
+    store = storage.get_storage()
+    store.ensure_table(
+        cur,
+        "job_queue",
+        """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        job_type NVARCHAR(50) NOT NULL,
+        client_id INT NULL,
+        status NVARCHAR(20) NOT NULL DEFAULT 'queued',
+        attempts INT NOT NULL DEFAULT 0,
+        max_attempts INT NOT NULL DEFAULT 5,
+        run_after DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        lease_owner NVARCHAR(200) NULL,
+        lease_expires DATETIME NULL,
+        last_error NVARCHAR(MAX) NULL,
+        progress NVARCHAR(MAX) NULL,
+        created_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        started_at DATETIME NULL,
+        finished_at DATETIME NULL
+        """,
+        indexes=(
+            "CREATE INDEX IX_job_queue_claim ON job_queue (status, run_after)",
+            "CREATE UNIQUE INDEX UX_job_queue_active ON job_queue (job_type, client_id)"
+            " WHERE status IN ('queued', 'running')",
+        ),
+    )
+    store.add_column(cur, "job_queue", "progress")
+
+
+def _ensure_schema(conn) -> None:
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    cur = conn.cursor()
+    ensure_job_table(cur)
+    conn.commit()
+    _SCHEMA_READY = True
+
+
+def register_handler(job_type: str, fn: Callable[[Optional[int]], None]) -> None:
+    """Register the callable that runs jobs of ``job_type`` (receives client_id)."""
+    _HANDLERS[job_type] = fn
 
 
-def submit_onboarding(client_id: int, logger: Optional[Callable[[str], None]] = None) -> None:
-    """Queue an onboarding job to run in the background.
+def _run_onboarding(client_id: Optional[int]) -> None:
+    from qb_app.onboard_loader import run_onboarding
 
-    The job logs start/finish to the provided logger (defaults to print).
+    run_onboarding(int(client_id))
+
+
+def _run_daily_sync(client_id: Optional[int]) -> None:
+    from qb_app import daily_qb_sync, forecast_refresh
+
+    results = daily_qb_sync.sync_one(int(client_id))
+    # Kept on the job record for the daily summary report
+    set_progress(results=results)
+    # Stored forecasts follow the sync instead of a fixed clock offset; syncs
+    # finishing before the refresh is due share one pooled run
+    if forecast_refresh.REFRESH_ENABLED and any(r.get("status") == "successful" for r in results):
+        enqueue("forecast_refresh", delay_seconds=forecast_refresh.REFRESH_COALESCE_SECONDS)
+
+
+def _run_forecast_refresh(client_id: Optional[int]) -> None:
+    from qb_app import forecast_refresh
+
+    ids = None if client_id is None else [client_id]
+    # Syncs that finish while a round runs were deduplicated onto this job, so
+    # go again while a round still finds work
+    rounds = []
+    while len(rounds) < 3:
+        rounds.append(forecast_refresh.run(client_ids=ids, pool=True))
+        if not rounds[-1]["refreshed"]:
+            break
+    failed = rounds[-1]["failed"]
+    set_progress(rounds=len(rounds), refreshed=sum(r["refreshed"] for r in rounds), failed=failed)
+    if failed:
+        # Failed clients stay pending in forecast_refresh_state; let the queue retry them
+        raise RuntimeError(f"forecast refresh failed for {failed} client(s)")
+
+
+register_handler("onboarding", _run_onboarding)
+register_handler("daily_sync", _run_daily_sync)
+register_handler("forecast_refresh", _run_forecast_refresh)
+
+
+def _active_job_id(cur, job_type: str, cid: Optional[int]) -> Optional[int]:
+    client_clause = "client_id IS NULL" if cid is None else "client_id = ?"
+    cur.execute(
+        f"""
+        SELECT TOP 1 id FROM job_queue
+        WHERE job_type = ? AND {client_clause} AND status IN ('queued', 'running')
+        ORDER BY id DESC
+        """,
+        (job_type,) if cid is None else (job_type, cid),
+    )
+    row = cur.fetchone()
+    return int(row[0]) if row else None
+
+
+def enqueue(
+    job_type: str,
+    client_id: Optional[int] = None,
+    delay_seconds: int = 0,
+    max_attempts: Optional[int] = None,
+) -> Tuple[int, bool]:
+    """Queue a job unless one is already queued/running for the same client.
+
+    Returns (job_id, created).
+    """
+    cid = int(client_id) if client_id is not None else None
+    conn = get_connection()
+    try:
+        _ensure_schema(conn)
+        cur = conn.cursor()
+        # SQLite's unique index lets NULL client_ids repeat; look for the active job first
+        existing = _active_job_id(cur, job_type, cid) if cid is None else None
+        if existing is not None:
+            return existing, False
+        try:
+            cur.execute(
+                """
+                INSERT INTO job_queue (job_type, client_id, max_attempts, run_after)
+                OUTPUT inserted.id
+                VALUES (?, ?, ?, DATEADD(SECOND, ?, GETUTCDATE()))
+                """,
+                (job_type, cid, int(max_attempts or _MAX_ATTEMPTS), int(delay_seconds or 0)),
+            )
+            row = cur.fetchone()
+            conn.commit()
+            job_id = int(row[0])
+            created = True
+        except Exception:
+            # Unique index on active (job_type, client_id) rejected a duplicate
+            conn.rollback()
+            job_id = _active_job_id(cur, job_type, cid)
+            if job_id is None:
+                raise
+            created = False
+    finally:
+        conn.close()
+    _WAKE.set()
+    return job_id, created
+
+
+def _decode_job(job: Optional[dict]) -> Optional[dict]:
+    if job is not None:
+        try:
+            job["progress"] = json.loads(job.get("progress") or "{}")
+        except Exception:
+            job["progress"] = {}
+    return job
+
+
+def get_job(job_id: int) -> Optional[dict]:
+    """Return the job row with ``progress`` decoded, or None."""
+    conn = get_connection()
+    try:
+        _ensure_schema(conn)
+        cur = conn.cursor()
+        cur.execute(f"SELECT {_JOB_COLUMNS} FROM job_queue WHERE id = ?", (int(job_id),))
+        return _decode_job(fetchone_dict(cur))
+    finally:
+        conn.close()
+
+
+def latest_job(job_type: str, client_id: int) -> Optional[dict]:
+    """Return the most recent job of ``job_type`` for a client, or None."""
+    conn = get_connection()
+    try:
+        _ensure_schema(conn)
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT TOP 1 {_JOB_COLUMNS} FROM job_queue WHERE job_type = ? AND client_id = ? ORDER BY id DESC",
+            (job_type, int(client_id)),
+        )
+        return _decode_job(fetchone_dict(cur))
+    finally:
+        conn.close()
+
+
+def list_jobs(job_type: str, since_hours: int = 24) -> list:
+    """Jobs of ``job_type`` created in the last ``since_hours`` hours."""
+    conn = get_connection()
+    try:
+        _ensure_schema(conn)
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            SELECT {_JOB_COLUMNS} FROM job_queue
+            WHERE job_type = ? AND created_at >= DATEADD(HOUR, -?, GETUTCDATE())
+            ORDER BY id
+            """,
+            (job_type, int(since_hours)),
+        )
+        return [_decode_job(j) for j in fetchall_dict(cur)]
+    finally:
+        conn.close()
+
+
+def current_job_id() -> Optional[int]:
+    """Id of the job running on this thread (None outside the job runner)."""
+    state = getattr(_CURRENT, "state", None)
+    return state["id"] if state else None
+
+
+def _flush_progress(state: dict, force: bool = False) -> None:
+    now = time.monotonic()
+    if not force and now - state["last_flush"] < _PROGRESS_FLUSH_SECONDS:
+        return
+    progress = state["progress"]
+    elapsed = now - state["started"]
+    progress["elapsed_seconds"] = round(elapsed, 1)
+    total = progress.get("entities_total")
+    done = progress.get("entities_done")
+    if total and done:
+        progress["eta_seconds"] = round(elapsed / done * max(total - done, 0), 1)
+    state["last_flush"] = now
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("UPDATE job_queue SET progress = ? WHERE id = ?", (json.dumps(progress, default=str), state["id"]))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:  # noqa: BLE001
+        _log(f"[jobs] progress write failed for job_id={state['id']}: {e}")
+
+
+def set_progress(**fields) -> None:
+    """Set progress fields on the current job (no-op outside a job)."""
+    state = getattr(_CURRENT, "state", None)
+    if not state:
+        return
+    state["progress"].update(fields)
+    _flush_progress(state)
+
+
+def add_progress(**deltas: int) -> None:
+    """Increment numeric progress counters on the current job (no-op outside a job)."""
+    state = getattr(_CURRENT, "state", None)
+    if not state:
+        return
+    progress = state["progress"]
+    for key, n in deltas.items():
+        progress[key] = (progress.get(key) or 0) + n
+    _flush_progress(state)
+
+
+def submit_onboarding(client_id: int, logger: Optional[Callable[[str], None]] = None) -> int:
+    """Queue an onboarding job in the durable job table and return its id.
+
+    Logs queue state to the provided logger (defaults to print).
     """
     if logger is None:
         logger = print
 
     cid = int(client_id)
+    job_id, created = enqueue("onboarding", cid)
+    if created:
+        logger(f"[onboarding] queued client_id={cid} job_id={job_id}")
+    else:
+        logger(f"[onboarding] already queued client_id={cid} job_id={job_id}")
+    start_workers()
+    return job_id
 
-    def _job() -> None:
+
+def _claim(conn) -> Optional[dict]:
+    types = list(_HANDLERS.keys())
+    if not types:
+        return None
+    placeholders = ", ".join(["?"] * len(types))
+    cur = conn.cursor()
+    if storage.get_storage().name == "sqlite":
+        # No UPDATE-through-CTE; SQLite serializes writers, so a subquery is enough
+        cur.execute(
+            f"""
+            UPDATE job_queue
+            SET status = 'running',
+                attempts = attempts + 1,
+                lease_owner = ?,
+                lease_expires = DATEADD(SECOND, ?, GETUTCDATE()),
+                started_at = COALESCE(started_at, GETUTCDATE())
+            WHERE id = (
+              SELECT id FROM job_queue
+              WHERE job_type IN ({placeholders})
+                AND (
+                  (status = 'queued' AND run_after <= GETUTCDATE())
+                  OR (status = 'running' AND lease_expires < GETUTCDATE())
+                )
+                AND (? <= 0 OR (
+                  SELECT COUNT(1) FROM job_queue
+                  WHERE status = 'running' AND lease_expires >= GETUTCDATE()
+                ) < ?)
+              ORDER BY run_after, id
+              LIMIT 1
+            )
+            RETURNING id, job_type, client_id, attempts, max_attempts
+            """,
+            (worker_id(), _LEASE_SECONDS, *types, _GLOBAL_MAX_RUNNING, _GLOBAL_MAX_RUNNING),
+        )
+        job = fetchone_dict(cur)
+        conn.commit()
+        return job
+    cur.execute(
+        f"""
+        WITH next_job AS (
+          SELECT TOP (1) *
+          FROM job_queue WITH (UPDLOCK, READPAST, ROWLOCK)
+          WHERE job_type IN ({placeholders})
+            AND (
+              (status = 'queued' AND run_after <= GETUTCDATE())
+              OR (status = 'running' AND lease_expires < GETUTCDATE())
+            )
+            AND (? <= 0 OR (
+              SELECT COUNT(1) FROM job_queue WITH (READCOMMITTED)
+              WHERE status = 'running' AND lease_expires >= GETUTCDATE()
+            ) < ?)
+          ORDER BY run_after, id
+        )
+        UPDATE next_job
+        SET status = 'running',
+            attempts = attempts + 1,
+            lease_owner = ?,
+            lease_expires = DATEADD(SECOND, ?, GETUTCDATE()),
+            started_at = COALESCE(started_at, GETUTCDATE())
+        OUTPUT inserted.id, inserted.job_type, inserted.client_id, inserted.attempts, inserted.max_attempts;
+        """,
+        (*types, _GLOBAL_MAX_RUNNING, _GLOBAL_MAX_RUNNING, worker_id(), _LEASE_SECONDS),
+    )
+    job = fetchone_dict(cur)
+    conn.commit()
+    return job
+
+
+def _renew_leases(conn) -> None:
+    with _STATE_LOCK:
+        ids = list(_RUNNING.keys())
+    if not ids:
+        return
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        UPDATE job_queue SET lease_expires = DATEADD(SECOND, ?, GETUTCDATE())
+        WHERE lease_owner = ? AND status = 'running' AND id IN ({', '.join(['?'] * len(ids))})
+        """,
+        (_LEASE_SECONDS, worker_id(), *ids),
+    )
+    conn.commit()
+
+
+def _finish(job: dict, error: Optional[str]) -> None:
+    job_id = int(job["id"])
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        if error is None:
+            cur.execute(
+                """
+                UPDATE job_queue
+                SET status = 'done', finished_at = GETUTCDATE(), lease_owner = NULL, lease_expires = NULL
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (job_id, worker_id()),
+            )
+        elif int(job["attempts"]) < int(job["max_attempts"]):
+            delay = min(_RETRY_BASE_SECONDS * 2 ** (int(job["attempts"]) - 1), _RETRY_MAX_SECONDS)
+            cur.execute(
+                """
+                UPDATE job_queue
+                SET status = 'queued', run_after = DATEADD(SECOND, ?, GETUTCDATE()),
+                    lease_owner = NULL, lease_expires = NULL, last_error = ?
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (delay, error, job_id, worker_id()),
+            )
+            _log(f"[jobs] job {job_id} failed (attempt {job['attempts']}); retrying in {delay}s")
+        else:
+            cur.execute(
+                """
+                UPDATE job_queue
+                SET status = 'failed', finished_at = GETUTCDATE(), lease_owner = NULL,
+                    lease_expires = NULL, last_error = ?
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (error, job_id, worker_id()),
+            )
+            _log(f"[jobs] job {job_id} failed permanently after {job['attempts']} attempts")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _execute(job: dict, slots: threading.BoundedSemaphore) -> None:
+    job_id = int(job["id"])
+    job_type = job["job_type"]
+    cid = job.get("client_id")
+    error = None
+    _CURRENT.state = {"id": job_id, "progress": {}, "started": time.monotonic(), "last_flush": 0.0}
+    try:
+        if int(job["attempts"]) > int(job["max_attempts"]):
+            # Reclaimed after lease expiry more times than allowed
+            error = "lease expired; attempts exhausted"
+        else:
+            # Every record logged while the job runs carries its ids
+            with applog.log_context(job_id=job_id, job_type=job_type, client_auth_id=cid):
+                _log(f"[jobs] start {job_type}", attempt=job["attempts"])
+                t0 = time.perf_counter()
+                with telemetry.record_run(f"job:{job_type}", client_id=cid):
+                    _HANDLERS[job_type](int(cid) if cid is not None else None)
+                _log(f"[jobs] done {job_type}", duration_ms=int((time.perf_counter() - t0) * 1000))
+    except Exception as e:  # noqa: BLE001
+        error = f"{e}\n{traceback.format_exc()}"
+        _log(f"[jobs] error {job_type}: {e}", logging.ERROR, job_id=job_id, job_type=job_type, client_auth_id=cid)
+    finally:
+        state = _CURRENT.state
+        _CURRENT.state = None
+        with _STATE_LOCK:
+            _RUNNING.pop(job_id, None)
+        if state["progress"]:
+            _flush_progress(state, force=True)
+        try:
+            _finish(job, error)
+        except Exception as e:  # noqa: BLE001
+            # Lease will expire and another worker retries the job
+            _log(f"[jobs] could not record result for job_id={job_id}: {e}")
+        slots.release()
+        _WAKE.set()
+
+
+def _dispatch_loop() -> None:
+    executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix="job")
+    slots = threading.BoundedSemaphore(_MAX_WORKERS)
+    renew_every = max(_LEASE_SECONDS / 3.0, 1.0)
+    last_renew = time.monotonic()
+    idle = _POLL_MIN_SECONDS
+    conn = None
+
+    while not _STOP.is_set():
         try:
-            logger(f"[onboarding] start client_id={cid}")
-            from qb_app.onboard_loader import run_onboarding
+            if conn is None:
+                conn = get_connection()
+                _ensure_schema(conn)
+
+            if time.monotonic() - last_renew >= renew_every:
+                _renew_leases(conn)
+                last_renew = time.monotonic()
+
+            job = None
+            if slots.acquire(blocking=False):
+                try:
+                    job = _claim(conn)
+                finally:
+                    if job is None:
+                        slots.release()
 
-            run_onboarding(cid)
-            logger(f"[onboarding] done client_id={cid}")
+            if job is not None:
+                with _STATE_LOCK:
+                    _RUNNING[int(job["id"])] = time.monotonic()
+                executor.submit(_execute, job, slots)
+                idle = _POLL_MIN_SECONDS
+                continue
         except Exception as e:  # noqa: BLE001
-            logger(f"[onboarding] error client_id={cid}: {e}")
+            _log(f"[jobs] dispatcher error: {e}")
+            try:
+                if conn is not None:
+                    conn.close()
+            except Exception:
+                pass
+            conn = None
+
+        _WAKE.wait(timeout=min(idle, renew_every))
+        if _WAKE.is_set():
+            _WAKE.clear()
+            idle = _POLL_MIN_SECONDS
+        else:
+            idle = min(idle * 2, _POLL_MAX_SECONDS)
+
+    executor.shutdown(wait=False)
+    try:
+        if conn is not None:
+            conn.close()
+    except Exception:
+        pass
+
+
+def start_workers() -> None:
+    """Start this process's dispatcher thread (idempotent, fork-aware)."""
+    global _STARTED_PID
+    if os.getenv("JOB_WORKERS_DISABLED", "0") == "1":
+        return
+    with _STATE_LOCK:
+        if _STARTED_PID == os.getpid():
+            return
+        _STARTED_PID = os.getpid()
+        _RUNNING.clear()
+    _STOP.clear()
+    t = threading.Thread(target=_dispatch_loop, name="job-dispatcher", daemon=True)
+    t.start()
+    _log(f"[jobs] dispatcher started ({worker_id()}, workers={_MAX_WORKERS})")
 
-    logger(f"[onboarding] queued client_id={cid}")
-    _EXECUTOR.submit(_job)
 
+def stop_workers() -> None:
+    """Ask the dispatcher to exit; running jobs finish or their leases expire."""
+    global _STARTED_PID
+    _STOP.set()
+    _WAKE.set()
+    with _STATE_LOCK:
+        _STARTED_PID = None
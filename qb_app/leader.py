@@ -0,0 +1,172 @@
+"""Lease-based leader election backed by a row in SQL.
+
+Every candidate process runs a small thread that tries to take or renew a
+named lease in ``app_leases``. The holder renews it every few seconds; if
+the holder dies, its lease expires after ``ttl`` seconds and the next
+candidate to poll takes over. A holder that cannot renew steps down before
+its lease could have expired, so two processes never both believe they
+lead.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Optional
+
+from qb_app import applog, storage
+from qb_app.db import get_connection
+
+
+_logger = applog.get_logger("qb_app.leader")
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
+
+
+def ensure_lease_table(cur) -> None:
+    storage.get_storage().ensure_table(
+        cur,
+        "app_leases",
+        """
+        name NVARCHAR(100) NOT NULL PRIMARY KEY,
+        owner NVARCHAR(200) NOT NULL,
+        acquired_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        expires_at DATETIME NOT NULL
+        """,
+    )
+
+
+def current_holder(name: str) -> Optional[dict]:
+    """Return {"owner", "acquired_at", "expires_at"} for a live lease, else None."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        ensure_lease_table(cur)
+        cur.execute(
+            "SELECT owner, acquired_at, expires_at FROM app_leases WHERE name = ? AND expires_at >= GETUTCDATE()",
+            (name,),
+        )
+        row = cur.fetchone()
+        conn.commit()
+        if not row:
+            return None
+        return {"owner": row[0], "acquired_at": row[1], "expires_at": row[2]}
+    finally:
+        conn.close()
+
+
+class LeaderLease:
+    """Hold a named SQL lease; call ``on_elected``/``on_revoked`` on transitions."""
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: int = 15,
+        renew_seconds: int = 5,
+        on_elected: Optional[Callable[[], None]] = None,
+        on_revoked: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.name = name
+        self.ttl = max(int(ttl_seconds), 3)
+        self.renew = max(min(int(renew_seconds), self.ttl // 3), 1)
+        self.on_elected = on_elected
+        self.on_revoked = on_revoked
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._leader = False
+        self._last_ok = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+
+    def is_leader(self) -> bool:
+        # Treat the lease as lost one renew interval before it could expire
+        return self._leader and (time.monotonic() - self._last_ok) < (self.ttl - self.renew)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop campaigning and release the lease if held."""
+        self._stop.set()
+        if self._leader:
+            try:
+                cur = self._cursor()
+                cur.execute("DELETE FROM app_leases WHERE name = ? AND owner = ?", (self.name, self.owner))
+                self._conn.commit()
+            except Exception:
+                pass
+            self._set_leader(False)
+
+    def _cursor(self):
+        if self._conn is None:
+            self._conn = get_connection()
+            cur = self._conn.cursor()
+            ensure_lease_table(cur)
+            self._conn.commit()
+        return self._conn.cursor()
+
+    def _try_acquire(self) -> bool:
+        cur = self._cursor()
+        cur.execute(
+            """
+            UPDATE app_leases
+            SET acquired_at = CASE WHEN owner = ? THEN acquired_at ELSE GETUTCDATE() END,
+                owner = ?,
+                expires_at = DATEADD(SECOND, ?, GETUTCDATE())
+            WHERE name = ? AND (owner = ? OR expires_at < GETUTCDATE())
+            """,
+            (self.owner, self.owner, self.ttl, self.name, self.owner),
+        )
+        got = cur.rowcount == 1
+        if not got:
+            try:
+                cur.execute(
+                    "INSERT INTO app_leases (name, owner, expires_at) VALUES (?, ?, DATEADD(SECOND, ?, GETUTCDATE()))",
+                    (self.name, self.owner, self.ttl),
+                )
+                got = True
+            except Exception:
+                # Row exists and is held by a live owner
+                self._conn.rollback()
+                return False
+        self._conn.commit()
+        return got
+
+    def _set_leader(self, leader: bool) -> None:
+        if leader == self._leader:
+            return
+        self._leader = leader
+        cb = self.on_elected if leader else self.on_revoked
+        _log(f"[leader][{self.name}] {'acquired' if leader else 'lost'} by {self.owner}")
+        if cb:
+            try:
+                cb()
+            except Exception as e:  # noqa: BLE001
+                _log(f"[leader][{self.name}] callback error: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._try_acquire():
+                    self._last_ok = time.monotonic()
+                    self._set_leader(True)
+                else:
+                    self._set_leader(False)
+            except Exception as e:  # noqa: BLE001
+                _log(f"[leader][{self.name}] lease check failed: {e}")
+                try:
+                    if self._conn is not None:
+                        self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+                if self._leader and not self.is_leader():
+                    self._set_leader(False)
+            self._stop.wait(self.renew)
@@ -1,21 +1,20 @@
 import os
 import time
 import json
-import pyodbc
-import requests
 from datetime import datetime
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
 from qb_app.db import get_connection, fetchone_dict
+from qb_app.job_runner import set_progress, add_progress
+from qb_app import applog, data_version, gl_cube, qb_http, telemetry
 import logging
 
-# === Logging setup ===
-logging.basicConfig(level=logging.INFO, format="%(message)s")
+_logger = applog.get_logger(__name__)
 
-def log(msg):
-    """Unified print + log output."""
-    print(msg)
-    logging.info(msg)
+
+def log(msg, level=logging.INFO, **fields):
+    """Structured log line; ``fields`` become JSON keys (see qb_app.applog)."""
+    _logger.log(level, msg, extra=fields)
 
 # === Load environment (works locally or in Azure) ===
 load_dotenv()
@@ -26,19 +25,25 @@ USER = os.getenv("SQL_USER")
 PASSWORD = os.getenv("SQL_PASSWORD")
 ENCRYPTION_SECRET = os.getenv("ENCRYPTION_SECRET")
 
+# Transaction entities loaded at onboarding and kept current by the daily sync
+TRANSACTION_ENTITIES = [
+    "Invoice", "SalesReceipt", "Payment", "CreditMemo", "RefundReceipt",
+    "Purchase", "Bill", "BillPayment", "VendorCredit", "Check",
+    "Deposit", "Transfer", "JournalEntry", "TimeActivity", "PurchaseOrder"
+]
+
 # === Retry logic for Azure wake-up ===
 def connect_with_retry(max_retries=5, delay=20):
     """Tries multiple times to connect to SQL in case the Azure SQL serverless database is paused."""
     for attempt in range(1, max_retries + 1):
         try:
-            log(f"Attempt {attempt}: Connecting to {SERVER}/{DB}...")
+            log("sql connect", logging.DEBUG, attempt=attempt, server=SERVER, db=DB)
             conn = get_connection()
-            log("✅ SQL connection established.")
             return conn
         except Exception as e:
-            log(f"⚠️ Attempt {attempt} failed: {e}")
+            log(f"sql connect failed: {e}", logging.WARNING, attempt=attempt)
             if attempt < max_retries:
-                log(f"⏳ Waiting {delay}s before retry...")
+                log("sql connect retry", logging.DEBUG, delay_seconds=delay)
                 time.sleep(delay)
             else:
                 raise
@@ -58,7 +63,7 @@ def get_client_auth(conn):
 # === Fetch data from QuickBooks ===
 def fetch_qb_data(entity, realm_id, access_token):
     """Fetches transaction data for a given entity from QuickBooks."""
-    url = f"https://quickbooks.api.intuit.com/v3/company/{realm_id}/query"
+    url = qb_http.company_url(realm_id, "query")
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Accept": "application/json",
@@ -67,92 +72,193 @@ def fetch_qb_data(entity, realm_id, access_token):
 
     # 5-year lookback
     query = f"select * from {entity} where TxnDate >= '2020-01-01' startposition 1 maxresults 1000"
-    response = requests.post(url, headers=headers, data=query)
+    t0 = time.perf_counter()
+    response = qb_http.post(url, entity=entity, headers=headers, data=query)
+    add_progress(pages_fetched=1)
+    telemetry.incr("api_calls")
+    duration_ms = int((time.perf_counter() - t0) * 1000)
     if response.status_code != 200:
-        log(f"❌ {entity} error {response.status_code}: {response.text}")
+        telemetry.incr("errors")
+        log(f"qb query error: {response.text[:500]}", logging.ERROR,
+            entity=entity, status=response.status_code, duration_ms=duration_ms)
         return []
     data = response.json()
-    return data.get("QueryResponse", {}).get(entity, [])
+    records = data.get("QueryResponse", {}).get(entity, [])
+    log("qb page fetched", logging.DEBUG, entity=entity, page=1, rows=len(records), duration_ms=duration_ms)
+    return records
 
 # === Insert transactions into SQL ===
+def _insert_lines(cursor, client_auth_id, entity, t, deltas):
+    """Insert one transaction's lines (no commit, raises on error); returns lines written.
+
+    Posting lines are added to ``deltas`` (None skips the cube).
+    """
+    TxnId = t.get("Id")
+    DocNumber = t.get("DocNumber")
+    TxnDate = t.get("TxnDate")
+    TotalAmt = t.get("TotalAmt")
+    Currency = t.get("CurrencyRef", {}).get("value")
+    ExchangeRate = t.get("ExchangeRate")
+    PrivateNote = t.get("PrivateNote")
+    Customer = t.get("CustomerRef", {}).get("name")
+    Vendor = t.get("VendorRef", {}).get("name")
+    EntityRef = t.get("EntityRef", {}).get("name")
+    AccountRef = t.get("AccountRef", {}).get("name") if "AccountRef" in t else None
+    CreatedTime = t.get("MetaData", {}).get("CreateTime")
+    UpdatedTime = t.get("MetaData", {}).get("LastUpdatedTime")
+
+    written = 0
+    for line in t.get("Line", []):
+        detail = (
+            line.get("AccountBasedExpenseLineDetail") or
+            line.get("SalesItemLineDetail") or
+            line.get("JournalEntryLineDetail") or
+            line.get("DepositLineDetail") or
+            line.get("PaymentLineDetail") or
+            {}
+        )
+
+        AccountName = detail.get("AccountRef", {}).get("name")
+        AccountId = detail.get("AccountRef", {}).get("value")
+        GLCode = AccountId
+        Class = detail.get("ClassRef", {}).get("name")
+        Department = detail.get("DepartmentRef", {}).get("name")
+        Item = detail.get("ItemRef", {}).get("name")
+        TaxCode = detail.get("TaxCodeRef", {}).get("value")
+        BillableStatus = detail.get("BillableStatus")
+        LinkedTxnIds = ", ".join(
+            [lt.get("TxnId") for lt in line.get("LinkedTxn", [])]
+        ) if line.get("LinkedTxn") else None
+        LineAmount = line.get("Amount")
+        Description = line.get("Description")
+
+        cursor.execute("""
+            INSERT INTO qb_transactions (
+                client_auth_id, TxnId, DocNumber, TxnType, TxnDate, TotalAmt, LineAmount,
+                Currency, ExchangeRate, AccountName, AccountId, GLCode, Class,
+                Department, Item, TaxCode, BillableStatus, LinkedTxnIds,
+                Customer, Vendor, AccountRef, Description, Memo, CreatedTime, UpdatedTime, InsertedAt
+            )
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,GETUTCDATE())
+        """, (
+            client_auth_id, TxnId, DocNumber, entity, TxnDate, TotalAmt, LineAmount,
+            Currency, ExchangeRate, AccountName, AccountId, GLCode, Class,
+            Department, Item, TaxCode, BillableStatus, LinkedTxnIds,
+            Customer or EntityRef, Vendor or EntityRef, AccountRef,
+            Description, PrivateNote, CreatedTime, UpdatedTime
+        ))
+
+        written += 1
+        if deltas is not None:
+            gl_cube.add_line(deltas, AccountId, Class, Department, TxnDate, LineAmount)
+    return written
+
 def insert_transactions(conn, client_auth_id, entity, transactions):
-    """Inserts transaction records into qb_transactions table."""
+    """Inserts transaction records into qb_transactions table; returns rows written.
+
+    The written lines are added to the gl_monthly cube, and the client's data
+    version is bumped, in the same commit.
+    """
     if not transactions:
-        log(f"⚠️ No {entity} records found.")
-        return
+        return 0
 
     cursor = conn.cursor()
     inserted_count = 0
+    deltas = {} if entity not in gl_cube.NON_POSTING_TYPES else None
 
     for t in transactions:
         try:
-            TxnId = t.get("Id")
-            DocNumber = t.get("DocNumber")
-            TxnDate = t.get("TxnDate")
-            TotalAmt = t.get("TotalAmt")
-            Currency = t.get("CurrencyRef", {}).get("value")
-            ExchangeRate = t.get("ExchangeRate")
-            PrivateNote = t.get("PrivateNote")
-            Customer = t.get("CustomerRef", {}).get("name")
-            Vendor = t.get("VendorRef", {}).get("name")
-            EntityRef = t.get("EntityRef", {}).get("name")
-            AccountRef = t.get("AccountRef", {}).get("name") if "AccountRef" in t else None
-            CreatedTime = t.get("MetaData", {}).get("CreateTime")
-            UpdatedTime = t.get("MetaData", {}).get("LastUpdatedTime")
-
-            for line in t.get("Line", []):
-                detail = (
-                    line.get("AccountBasedExpenseLineDetail") or
-                    line.get("SalesItemLineDetail") or
-                    line.get("JournalEntryLineDetail") or
-                    line.get("DepositLineDetail") or
-                    line.get("PaymentLineDetail") or
-                    {}
-                )
-
-                AccountName = detail.get("AccountRef", {}).get("name")
-                AccountId = detail.get("AccountRef", {}).get("value")
-                GLCode = AccountId
-                Class = detail.get("ClassRef", {}).get("name")
-                Department = detail.get("DepartmentRef", {}).get("name")
-                Item = detail.get("ItemRef", {}).get("name")
-                TaxCode = detail.get("TaxCodeRef", {}).get("value")
-                BillableStatus = detail.get("BillableStatus")
-                LinkedTxnIds = ", ".join(
-                    [lt.get("TxnId") for lt in line.get("LinkedTxn", [])]
-                ) if line.get("LinkedTxn") else None
-                LineAmount = line.get("Amount")
-                Description = line.get("Description")
-
-                cursor.execute("""
-                    INSERT INTO qb_transactions (
-                        client_auth_id, TxnId, DocNumber, TxnType, TxnDate, TotalAmt, LineAmount,
-                        Currency, ExchangeRate, AccountName, AccountId, GLCode, Class,
-                        Department, Item, TaxCode, BillableStatus, LinkedTxnIds,
-                        Customer, Vendor, AccountRef, Description, Memo, CreatedTime, UpdatedTime, InsertedAt
-                    )
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,GETUTCDATE())
-                """, (
-                    client_auth_id, TxnId, DocNumber, entity, TxnDate, TotalAmt, LineAmount,
-                    Currency, ExchangeRate, AccountName, AccountId, GLCode, Class,
-                    Department, Item, TaxCode, BillableStatus, LinkedTxnIds,
-                    Customer or EntityRef, Vendor or EntityRef, AccountRef,
-                    Description, PrivateNote, CreatedTime, UpdatedTime
-                ))
-
-                inserted_count += 1
+            inserted_count += _insert_lines(cursor, client_auth_id, entity, t, deltas)
         except Exception as e:
-            log(f"❌ Insert error for {entity}: {e}")
+            telemetry.incr("errors")
+            log(f"insert error: {e}", logging.ERROR, entity=entity, txn_id=t.get("Id"))
             continue
 
+    try:
+        gl_cube.apply_deltas(cursor, client_auth_id, deltas)
+    except Exception as e:
+        # The cube can be rebuilt from qb_transactions; never lose the lines
+        telemetry.incr("errors")
+        log(f"gl cube update failed: {e}", logging.ERROR, entity=entity)
+    if inserted_count:
+        _bump_version(cursor, client_auth_id, entity)
     conn.commit()
-    log(f"✅ Inserted {inserted_count} {entity} records.")
+    telemetry.incr("rows_synced", inserted_count)
+    return inserted_count
+
+def _bump_version(cursor, client_auth_id, entity):
+    try:
+        data_version.bump(cursor, client_auth_id)
+    except Exception as e:
+        telemetry.incr("errors")
+        log(f"data version bump failed: {e}", logging.ERROR, entity=entity)
+
+# === Replace changed transactions (daily sync) ===
+def _replace(cursor, client_auth_id, entity, transactions):
+    """Delete these transactions' stored lines and insert their current ones.
+
+    gl_monthly and the data version move with them. No commit; raises on
+    any error so the caller can roll the whole unit back. Returns rows written.
+    """
+    txn_ids = sorted({str(t.get("Id")) for t in transactions if t.get("Id") is not None})
+    deltas = {} if entity not in gl_cube.NON_POSTING_TYPES else None
+    removed = 0
+    for i in range(0, len(txn_ids), 500):
+        chunk = txn_ids[i:i + 500]
+        where = f"client_auth_id = ? AND TxnType = ? AND TxnId IN ({', '.join(['?'] * len(chunk))})"
+        params = (client_auth_id, entity, *chunk)
+        if deltas is not None:
+            cursor.execute(
+                f"SELECT AccountId, Class, Department, TxnDate, LineAmount FROM qb_transactions WHERE {where}",
+                params,
+            )
+            gl_cube.add_lines(deltas, cursor.fetchall(), sign=-1)
+        cursor.execute(f"DELETE FROM qb_transactions WHERE {where}", params)
+        removed += max(cursor.rowcount, 0)
+    written = 0
+    for t in transactions:
+        written += _insert_lines(cursor, client_auth_id, entity, t, deltas)
+    gl_cube.apply_deltas(cursor, client_auth_id, deltas)
+    if removed or written:
+        data_version.bump(cursor, client_auth_id)
+    return written
+
+def replace_transactions(conn, client_auth_id, entity, transactions):
+    """Swap the stored lines of these transactions for their current version.
+
+    All of them are replaced in one commit. If that fails, each transaction
+    is retried as its own unit, so a bad record never leaves another one
+    deleted without its new lines. Returns (rows written, transactions that
+    failed and kept their old lines).
+    """
+    if not transactions:
+        return 0, 0
+    cursor = conn.cursor()
+    try:
+        written = _replace(cursor, client_auth_id, entity, transactions)
+        conn.commit()
+        failed = 0
+    except Exception as e:
+        conn.rollback()
+        log(f"batch replace failed, retrying per transaction: {e}", logging.WARNING, entity=entity)
+        written = failed = 0
+        for t in transactions:
+            try:
+                written += _replace(cursor, client_auth_id, entity, [t])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                failed += 1
+                telemetry.incr("errors")
+                log(f"replace error: {e}", logging.ERROR, entity=entity, txn_id=t.get("Id"))
+    telemetry.incr("rows_synced", written)
+    return written, failed
 
 # === Main process ===
 def main(client_id=None):
     """Load full QuickBooks transaction history for a new client."""
     if client_id is None:
-        raise Exception("❌ client_id is required to run load_all_transactions.")
+        raise Exception("client_id is required to run load_all_transactions.")
 
     conn = connect_with_retry()
 
@@ -162,37 +268,48 @@ def main(client_id=None):
     record = fetchone_dict(cursor)
 
     if not record:
-        raise Exception(f"❌ No QuickBooks client found with id={client_id}")
+        raise Exception(f"No QuickBooks client found with id={client_id}")
 
     client_auth_id = record["id"]
     realm_id = record["realm_id"]
     fernet = Fernet(ENCRYPTION_SECRET)
     access_token = fernet.decrypt(record["access_token_enc"].encode()).decode()
 
-    entities = [
-        "Invoice", "SalesReceipt", "Payment", "CreditMemo", "RefundReceipt",
-        "Purchase", "Bill", "BillPayment", "VendorCredit", "Check",
-        "Deposit", "Transfer", "JournalEntry", "TimeActivity", "PurchaseOrder"
-    ]
+    entities = TRANSACTION_ENTITIES
 
-    log(f"\n📘 Starting initial QuickBooks transaction history load for NEW client {client_auth_id} ({realm_id})...\n")
+    with applog.log_context(client_auth_id=client_auth_id, realm_id=realm_id):
+        t_start = time.perf_counter()
+        log("history load started", entities=len(entities))
 
-    # === Step 1: Load transactions ===
-    for entity in entities:
-        log(f"🔹 Fetching {entity} records...")
-        txns = fetch_qb_data(entity, realm_id, access_token)
-        insert_transactions(conn, client_auth_id, entity, txns)
+        # Reference data counts as one more unit of work for progress/ETA
+        set_progress(phase="transactions", entities_total=len(entities) + 1, entities_done=0, rows_written=0)
 
-    # === Step 2: Load reference data ===
-    try:
-        from qb_app.load_qb_reference_data import load_all_reference_data
-        log(f"\n📦 Now loading reference data for client {client_auth_id} ({realm_id})...")
-        log(">>> ENTERING reference-data section <<<")
-        load_all_reference_data(realm_id, access_token, client_auth_id, conn)
-        log(">>> EXITING reference-data section <<<")
-        log(f"✅ Finished reference data load for client {client_auth_id}\n")
-    except Exception as e:
-        log(f"⚠️ Reference data load failed: {e}")
+        # === Step 1: Load transactions ===
+        total_rows = 0
+        for i, entity in enumerate(entities, start=1):
+            set_progress(current_entity=entity)
+            t0 = time.perf_counter()
+            txns = fetch_qb_data(entity, realm_id, access_token)
+            written = insert_transactions(conn, client_auth_id, entity, txns)
+            duration_ms = int((time.perf_counter() - t0) * 1000)
+            # One summary line per entity: rows/duration give throughput
+            log("entity loaded", entity=entity, records=len(txns), rows=written, duration_ms=duration_ms)
+            total_rows += written
+            add_progress(rows_written=written)
+            set_progress(entities_done=i)
+
+        from qb_app import columnar_cache
+        columnar_cache.refresh_after_sync(conn, client_auth_id)
+
+        # === Step 2: Load reference data ===
+        try:
+            from qb_app.load_qb_reference_data import load_all_reference_data
+            set_progress(phase="reference_data", current_entity="reference_data")
+            load_all_reference_data(realm_id, access_token, client_auth_id, conn)
+        except Exception as e:
+            log(f"reference data load failed: {e}", logging.ERROR)
 
-    conn.close()
-    log("\n🎉 Initial QuickBooks transaction history load complete for new client!")
+        set_progress(phase="complete", current_entity=None, entities_done=len(entities) + 1)
+        conn.close()
+        log("history load complete", rows=total_rows,
+            duration_ms=int((time.perf_counter() - t_start) * 1000))
@@ -1,17 +1,17 @@
 import os
 import time
-import requests
 # Using shared DB connection from caller; no direct DB driver import needed.
 from dotenv import load_dotenv
 import logging
+from qb_app.job_runner import add_progress
+from qb_app import account_hierarchy, applog, qb_http, storage, telemetry
 
-# === Logging setup ===
-logging.basicConfig(level=logging.INFO, format="%(message)s")
+_logger = applog.get_logger(__name__)
 
-def log(msg):
-    """Unified print + log output."""
-    print(msg)
-    logging.info(msg)
+
+def log(msg, level=logging.INFO, **fields):
+    """Structured log line; ``fields`` become JSON keys (see qb_app.applog)."""
+    _logger.log(level, msg, extra=fields)
 
 # === Load environment (works locally or Azure) ===
 load_dotenv()
@@ -30,23 +30,18 @@ def ensure_columns_exist(table, columns, conn):
     Checks if all columns in 'columns' exist in the SQL table.
     If any are missing, it auto-creates them as NVARCHAR(MAX).
     """
+    store = storage.get_storage()
     cursor = conn.cursor()
-    cursor.execute(f"""
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_NAME = '{table.replace('dbo.', '')}'
-    """)
-    existing_cols = {row[0] for row in cursor.fetchall()}
+    existing_cols = set(store.columns(cursor, table))
 
     missing = [col for col in columns if col not in existing_cols and col != "client_auth_id"]
 
     for col in missing:
         try:
-            alter_sql = f"ALTER TABLE {table} ADD [{col}] NVARCHAR(MAX) NULL;"
-            cursor.execute(alter_sql)
-            log(f"🧱 Added missing column '{col}' to {table}")
+            store.add_column(cursor, table, col, "NVARCHAR(MAX) NULL")
+            log("added column", table=table, column=col)
         except Exception as e:
-            log(f"⚠️ Failed to add column {col} to {table}: {e}")
+            log(f"failed to add column: {e}", logging.WARNING, table=table, column=col)
 
     conn.commit()
 
@@ -54,53 +49,56 @@ def ensure_columns_exist(table, columns, conn):
 # 🧩 Shared Helper: Run UPSERT (auto-extends schema)
 # ==============================================================
 
+def _flatten(rec):
+    """
+    Primitive fields as-is; references such as ``ParentRef: {"value": "12"}``
+    become ``ParentId: "12"``. Other nested JSON is skipped.
+    """
+    clean_rec = {}
+    for k, v in rec.items():
+        if isinstance(v, (str, int, float, bool, type(None))):
+            clean_rec[k] = v
+        elif isinstance(v, dict) and k.endswith("Ref") and "value" in v:
+            clean_rec[k[:-3] + "Id"] = v["value"]
+    return clean_rec
+
+
 def upsert_to_sql(table, records, client_auth_id, conn):
     """
-    Inserts or updates QuickBooks reference data into Azure SQL.
+    Inserts or updates QuickBooks reference data (MERGE on Azure SQL).
     Automatically adds new columns if missing.
     """
     if not records:
-        log(f"⚠️ No records returned for {table}")
-        return
+        return 0
 
+    store = storage.get_storage()
     cursor = conn.cursor()
     inserted = 0
 
     for rec in records:
-        # Flatten only primitive fields (skip nested JSON)
-        clean_rec = {k: v for k, v in rec.items()
-                     if isinstance(v, (str, int, float, bool, type(None)))}
+        clean_rec = _flatten(rec)
+        if table == "qb_accounts":
+            # A sub-account moved to the top level has no ParentRef; clear the stored one
+            clean_rec.setdefault("ParentId", None)
         if "Id" not in clean_rec:
             continue
 
         # ✅ Auto-create missing columns
         ensure_columns_exist(table, clean_rec.keys(), conn)
 
-        cols = list(clean_rec.keys())
-        vals = [clean_rec[c] for c in cols]
-        updates = [f"{c} = ?" for c in cols]
-
-        sql = f"""
-        MERGE {table} AS target
-        USING (SELECT ? AS client_auth_id, {', '.join(['?'] * len(cols))}) AS src ({', '.join(['client_auth_id'] + cols)})
-        ON target.client_auth_id = src.client_auth_id AND target.Id = src.Id
-        WHEN MATCHED THEN
-            UPDATE SET {', '.join(updates)}
-        WHEN NOT MATCHED THEN
-            INSERT ({', '.join(['client_auth_id'] + cols)})
-            VALUES ({', '.join(['?'] * (len(cols) + 1))});
-        """
-
-        params = [client_auth_id] + vals + vals + [client_auth_id] + vals
+        row = {"client_auth_id": client_auth_id, **clean_rec}
 
         try:
-            cursor.execute(sql, tuple(params))
+            store.upsert(cursor, table, ("client_auth_id", "Id"), row)
             inserted += 1
         except Exception as e:
-            log(f"❌ SQL UPSERT failed for {table}: {e}")
+            telemetry.incr("errors")
+            log(f"upsert failed: {e}", logging.ERROR, table=table, record_id=clean_rec.get("Id"))
 
     conn.commit()
-    log(f"✅ {table} upserted ({inserted} rows)")
+    add_progress(rows_written=inserted)
+    telemetry.incr("rows_synced", inserted)
+    return inserted
 
 # ==============================================================
 # 🧩 Shared Helper: Query QuickBooks (with pagination)
@@ -117,21 +115,27 @@ def qb_query(entity, realm_id, access_token):
         "Accept": "application/json"
     }
 
+    page = 0
     while True:
+        page += 1
         query = f"SELECT * FROM {entity} STARTPOSITION {start_position} MAXRESULTS {max_results}"
-        url = f"https://quickbooks.api.intuit.com/v3/company/{realm_id}/query?query={query}"
+        url = qb_http.company_url(realm_id, f"query?query={query}")
 
         try:
-            r = requests.get(url, headers=headers)
+            t0 = time.perf_counter()
+            r = qb_http.get(url, entity=entity, headers=headers)
+            add_progress(pages_fetched=1)
+            telemetry.incr("api_calls")
             r.raise_for_status()
             data = r.json()
             records = data.get("QueryResponse", {}).get(entity, [])
+            log("qb page fetched", logging.DEBUG, entity=entity, page=page, rows=len(records),
+                duration_ms=int((time.perf_counter() - t0) * 1000))
 
             if not records:
                 break
 
             all_records.extend(records)
-            log(f"   → Retrieved {len(records)} records (total {len(all_records)}) for {entity}")
 
             if len(records) < max_results:
                 break
@@ -139,10 +143,10 @@ def qb_query(entity, realm_id, access_token):
             start_position += max_results
             time.sleep(0.3)  # avoid rate limiting
         except Exception as e:
-            log(f"❌ Failed to load {entity}: {e}")
+            telemetry.incr("errors")
+            log(f"qb query failed: {e}", logging.ERROR, entity=entity, page=page)
             break
 
-    log(f"✅ Finished loading {len(all_records)} total {entity} records")
     return all_records
 
 # ==============================================================
@@ -152,38 +156,45 @@ def qb_query(entity, realm_id, access_token):
 def load_accounts(realm_id, token, client_auth_id, conn):
     data = qb_query("Account", realm_id, token)
     if data:
-        log("\n🔍 Keys in Account response: " + str(list(data[0].keys())))
-    upsert_to_sql("qb_accounts", data, client_auth_id, conn)
+        log("response keys", logging.DEBUG, entity="Account", keys=list(data[0].keys()))
+    rows = upsert_to_sql("qb_accounts", data, client_auth_id, conn)
+    try:
+        account_hierarchy.rebuild(conn.cursor(), client_auth_id)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        log(f"account hierarchy rebuild failed: {e}", logging.WARNING)
+    return len(data), rows
 
 def load_classes(realm_id, token, client_auth_id, conn):
     data = qb_query("Class", realm_id, token)
     if data:
-        log("\n🔍 Keys in Class response: " + str(list(data[0].keys())))
-    upsert_to_sql("qb_classes", data, client_auth_id, conn)
+        log("response keys", logging.DEBUG, entity="Class", keys=list(data[0].keys()))
+    return len(data), upsert_to_sql("qb_classes", data, client_auth_id, conn)
 
 def load_customers(realm_id, token, client_auth_id, conn):
     data = qb_query("Customer", realm_id, token)
     if data:
-        log("\n🔍 Keys in Customer response: " + str(list(data[0].keys())))
-    upsert_to_sql("qb_customers", data, client_auth_id, conn)
+        log("response keys", logging.DEBUG, entity="Customer", keys=list(data[0].keys()))
+    return len(data), upsert_to_sql("qb_customers", data, client_auth_id, conn)
 
 def load_employees(realm_id, token, client_auth_id, conn):
     data = qb_query("Employee", realm_id, token)
     if data:
-        log("\n🔍 Keys in Employee response: " + str(list(data[0].keys())))
-    upsert_to_sql("qb_employees", data, client_auth_id, conn)
+        log("response keys", logging.DEBUG, entity="Employee", keys=list(data[0].keys()))
+    return len(data), upsert_to_sql("qb_employees", data, client_auth_id, conn)
 
 def load_items(realm_id, token, client_auth_id, conn):
     data = qb_query("Item", realm_id, token)
     if data:
-        log("\n🔍 Keys in Item response: " + str(list(data[0].keys())))
-    upsert_to_sql("qb_items", data, client_auth_id, conn)
+        log("response keys", logging.DEBUG, entity="Item", keys=list(data[0].keys()))
+    return len(data), upsert_to_sql("qb_items", data, client_auth_id, conn)
 
 def load_vendors(realm_id, token, client_auth_id, conn):
     data = qb_query("Vendor", realm_id, token)
     if data:
-        log("\n🔍 Keys in Vendor response: " + str(list(data[0].keys())))
-    upsert_to_sql("qb_vendors", data, client_auth_id, conn)
+        log("response keys", logging.DEBUG, entity="Vendor", keys=list(data[0].keys()))
+    return len(data), upsert_to_sql("qb_vendors", data, client_auth_id, conn)
 
 # ==============================================================
 # 🧩 Master Wrapper: Load All Reference Data
@@ -191,8 +202,6 @@ def load_vendors(realm_id, token, client_auth_id, conn):
 
 def load_all_reference_data(realm_id, access_token, client_auth_id, conn):
     """Loads all non-transaction QuickBooks reference data."""
-    log(f"\n📦 Loading reference data for client {client_auth_id} ({realm_id})")
-
     loaders = [
         load_accounts,
         load_classes,
@@ -202,9 +211,12 @@ def load_all_reference_data(realm_id, access_token, client_auth_id, conn):
         load_vendors
     ]
 
-    for fn in loaders:
-        log(f"→ Running {fn.__name__}()")
-        fn(realm_id, access_token, client_auth_id, conn)
-        time.sleep(0.5)  # small pause to avoid rate limiting
-
-    log("✅ All reference tables loaded\n")
+    with applog.log_context(client_auth_id=client_auth_id, realm_id=realm_id):
+        for fn in loaders:
+            entity = fn.__name__.replace("load_", "")
+            t0 = time.perf_counter()
+            with applog.log_context(entity=entity):
+                records, rows = fn(realm_id, access_token, client_auth_id, conn)
+                log("entity loaded", records=records, rows=rows,
+                    duration_ms=int((time.perf_counter() - t0) * 1000))
+            time.sleep(0.5)  # small pause to avoid rate limiting
@@ -0,0 +1,245 @@
+"""In-process latency timers and counters, exposed in Prometheus text format.
+
+Instrumented hot paths:
+
+- ``db_connect_seconds``: ``get_connection`` connect time
+- ``db_query_seconds``: every ``cursor.execute``/``executemany``, labelled
+  by a normalized statement fingerprint
+- ``qb_http_request_seconds`` / ``qb_http_requests_total``: QuickBooks API
+  calls by entity and status (see ``qb_app.qb_http``)
+- ``http_request_seconds`` / ``http_requests_total``: Flask requests by
+  endpoint
+- ``job_run_seconds``: scheduled and queued job runs (see ``telemetry``)
+- ``result_cache_requests_total``: result cache hits/misses by cache (see
+  ``result_cache``)
+
+Metrics are per process; with several Gunicorn workers each scrape sees the
+worker that served it. ``/metrics`` requires ``METRICS_TOKEN``; with no
+token configured it answers 404, so statement fingerprints and endpoint
+names are never public by default.
+"""
+
+import abc
+import hmac
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from flask import Response, g, request
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: Dict[str, "_Metric"] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        with _REGISTRY_LOCK:
+            _REGISTRY[name] = self
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """Prometheus exposition lines for this metric."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, n: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + n
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += seconds
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._values.items()]
+        lines = []
+        for key, (counts, total, n) in items:
+            cum = 0
+            for bound, c in zip(self.buckets, counts):
+                cum += c
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {cum}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {n}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {n}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format."""
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    out: List[str] = []
+    for m in metrics:
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        out.extend(m.render())
+    return "\n".join(out) + "\n"
+
+
+# ---- Metrics for the instrumented hot paths ----
+
+DB_CONNECT_SECONDS = Histogram("db_connect_seconds", "Time to open a SQL connection", ("outcome",))
+DB_QUERY_SECONDS = Histogram("db_query_seconds", "cursor.execute time by statement fingerprint", ("statement",))
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Failed cursor.execute calls", ("statement",))
+QB_HTTP_SECONDS = Histogram("qb_http_request_seconds", "QuickBooks API call time", ("entity",))
+QB_HTTP_REQUESTS = Counter("qb_http_requests_total", "QuickBooks API calls", ("entity", "status"))
+HTTP_SECONDS = Histogram("http_request_seconds", "Flask request time by endpoint", ("method", "endpoint"))
+HTTP_REQUESTS = Counter("http_requests_total", "Flask requests", ("method", "endpoint", "status"))
+JOB_RUN_SECONDS = Histogram(
+    "job_run_seconds", "Scheduled/queued job run time", ("job", "status"),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+CACHE_REQUESTS = Counter("result_cache_requests_total", "Result cache lookups", ("cache", "outcome"))
+
+
+# ---- SQL statement fingerprints ----
+
+_MAX_FINGERPRINTS = int(os.getenv("METRICS_MAX_FINGERPRINTS", "200") or 200)
+_FINGERPRINTS: Dict[str, str] = {}  # raw statement -> fingerprint
+_SEEN: set = set()  # distinct fingerprints
+_FP_LOCK = threading.Lock()
+_FP_RULES = [
+    (re.compile(r"--[^\n]*"), " "),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?+)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def fingerprint(sql: str) -> str:
+    """Normalize a statement: literals -> ?, value lists collapsed, whitespace squeezed.
+
+    Cached per raw statement; past METRICS_MAX_FINGERPRINTS distinct
+    fingerprints, new statements are reported as "other".
+    """
+    fp = _FINGERPRINTS.get(sql)
+    if fp is not None:
+        return fp
+    fp = sql
+    for rx, repl in _FP_RULES:
+        fp = rx.sub(repl, fp)
+    fp = fp.strip()[:160]
+    with _FP_LOCK:
+        if fp not in _SEEN:
+            if len(_SEEN) >= _MAX_FINGERPRINTS:
+                fp = "other"
+            else:
+                _SEEN.add(fp)
+        if len(_FINGERPRINTS) < _MAX_FINGERPRINTS * 20:
+            _FINGERPRINTS[sql] = fp
+    return fp
+
+
+# ---- Flask integration ----
+
+def _endpoint() -> str:
+    rule = getattr(request, "url_rule", None)
+    return rule.rule if rule is not None else "unmatched"
+
+
+def _before_request() -> None:
+    g._metrics_t0 = time.perf_counter()
+
+
+def _after_request(response):
+    t0 = g.pop("_metrics_t0", None)
+    if t0 is not None:
+        elapsed = time.perf_counter() - t0
+        endpoint = _endpoint()
+        HTTP_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint)
+        HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    return response
+
+
+def _teardown_request(exc: Optional[BaseException]) -> None:
+    # Unhandled exceptions skip after_request; count them as 500s
+    t0 = g.pop("_metrics_t0", None)
+    if t0 is not None:
+        endpoint = _endpoint()
+        HTTP_SECONDS.observe(time.perf_counter() - t0, method=request.method, endpoint=endpoint)
+        HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=500)
+
+
+def metrics_view():
+    token = (os.getenv("METRICS_TOKEN") or "").strip()
+    if not token:
+        return Response("Not Found\n", status=404, mimetype="text/plain")
+    auth = (request.headers.get("Authorization") or "").strip()
+    provided = auth[7:].strip() if auth.lower().startswith("bearer ") else (request.args.get("token") or "")
+    if not hmac.compare_digest(provided.encode(), token.encode()):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    return Response(render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+def init_app(app) -> None:
+    """Time every request and serve GET /metrics (idempotent)."""
+    if app.extensions.get("qb_metrics"):
+        return
+    app.extensions["qb_metrics"] = True
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
@@ -0,0 +1,177 @@
+"""On-demand cProfile capture for single requests and job runs.
+
+Admins add ``?__profile=1`` to any API call (the profile is stored and its
+id returned in the ``X-Profile-Id`` header) or ``?__profile=text`` (the
+response body is replaced by the top functions by cumulative time).
+``POST /api/admin/run_job`` accepts ``"profile": true`` for job runs.
+
+Profiles are written to ``PROFILE_DIR`` as ``<id>.prof`` (load with
+``pstats``/snakeviz) plus a ``<id>.txt`` summary, keeping the newest
+``PROFILE_KEEP``, and are listed/downloaded via ``/api/admin/profiles``.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Tuple
+
+from flask import Response, g, request
+
+from qb_app import applog
+
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/home/site/wwwroot/qb_app/profiles")
+_KEEP = int(os.getenv("PROFILE_KEEP", "50") or 50)
+_TOP = int(os.getenv("PROFILE_TOP_FUNCTIONS", "60") or 60)
+_ID_RE = re.compile(r"^[0-9TZ]+-[a-z0-9_.-]+-[0-9a-f]{8}$")
+
+_logger = applog.get_logger("qb_app.profiling")
+
+
+def _dir() -> str:
+    for d in (PROFILE_DIR, os.path.join(tempfile.gettempdir(), "qb_profiles")):
+        try:
+            os.makedirs(d, exist_ok=True)
+            return d
+        except OSError:
+            continue
+    raise OSError("no writable profile directory")
+
+
+def new_profile_id(label: str) -> str:
+    slug = re.sub(r"[^a-z0-9_.-]+", "_", (label or "run").lower()).strip("_")[:60] or "run"
+    return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{slug}-{uuid.uuid4().hex[:8]}"
+
+
+def summarize(prof: cProfile.Profile, top: int = _TOP) -> str:
+    buf = io.StringIO()
+    stats = pstats.Stats(prof, stream=buf)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+    return buf.getvalue()
+
+
+def save(prof: cProfile.Profile, profile_id: str, header: str = "") -> str:
+    """Write ``<id>.prof`` and ``<id>.txt``; prune old profiles. Returns the summary."""
+    d = _dir()
+    prof.dump_stats(os.path.join(d, f"{profile_id}.prof"))
+    text = (header + "\n" if header else "") + summarize(prof)
+    with open(os.path.join(d, f"{profile_id}.txt"), "w", encoding="utf-8") as f:
+        f.write(text)
+    _prune(d)
+    _logger.info("profile saved", extra={"profile_id": profile_id})
+    return text
+
+
+def _prune(d: str) -> None:
+    ids = sorted(p[:-5] for p in os.listdir(d) if p.endswith(".prof"))
+    for old in ids[:-_KEEP] if _KEEP > 0 else []:
+        for ext in (".prof", ".txt"):
+            try:
+                os.remove(os.path.join(d, old + ext))
+            except OSError:
+                pass
+
+
+def profile_call(label: str, fn: Callable, *args, profile_id: Optional[str] = None, **kwargs) -> Tuple[object, str]:
+    """Run ``fn`` under cProfile, store the profile and return ``(result, profile_id)``."""
+    profile_id = profile_id or new_profile_id(label)
+    prof = cProfile.Profile()
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        prof.enable()
+        try:
+            return fn(*args, **kwargs), profile_id
+        finally:
+            prof.disable()
+    except Exception as e:
+        status = f"error: {e}"
+        raise
+    finally:
+        wall = time.perf_counter() - t0
+        try:
+            save(prof, profile_id, header=f"{label} wall={wall:.3f}s status={status}")
+        except Exception as e:  # noqa: BLE001
+            _logger.warning(f"could not save profile {profile_id}: {e}")
+
+
+def list_profiles() -> List[dict]:
+    try:
+        d = _dir()
+        names = os.listdir(d)
+    except OSError:
+        return []
+    out = []
+    for name in sorted((n for n in names if n.endswith(".prof")), reverse=True):
+        pid = name[:-5]
+        st = os.stat(os.path.join(d, name))
+        out.append({"id": pid, "bytes": st.st_size, "created_at": datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat()})
+    return out
+
+
+def profile_path(profile_id: str, fmt: str = "prof") -> Optional[str]:
+    """Path of a stored profile (``fmt`` = prof|txt), or None if invalid/missing."""
+    if not _ID_RE.match(profile_id or "") or fmt not in ("prof", "txt"):
+        return None
+    path = os.path.join(_dir(), f"{profile_id}.{fmt}")
+    return path if os.path.exists(path) else None
+
+
+# ---- Flask integration ----
+
+def _before_request() -> None:
+    mode = (request.args.get("__profile") or "").strip().lower()
+    if mode not in ("1", "true", "text"):
+        return
+    from qb_app.utils import is_admin_request  # lazy: utils imports routes_auth
+
+    if not is_admin_request():
+        return
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except Exception as e:  # noqa: BLE001 (another profiler already active)
+        _logger.warning(f"profiling unavailable: {e}")
+        return
+    g._profile = (prof, mode, time.perf_counter())
+
+
+def _after_request(response):
+    state = g.pop("_profile", None)
+    if state is None:
+        return response
+    prof, mode, t0 = state
+    prof.disable()
+    label = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+    profile_id = new_profile_id(label.replace("/", "_"))
+    try:
+        text = save(prof, profile_id, header=f"{label} wall={time.perf_counter() - t0:.3f}s status={response.status_code}")
+    except Exception as e:  # noqa: BLE001
+        _logger.warning(f"could not save profile: {e}")
+        return response
+    if mode == "text":
+        response = Response(text, mimetype="text/plain")
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+def _teardown_request(exc) -> None:
+    state = g.pop("_profile", None)
+    if state is not None:
+        state[0].disable()
+
+
+def init_app(app) -> None:
+    """Enable ``?__profile=`` for admin callers (idempotent)."""
+    if app.extensions.get("qb_profiling"):
+        return
+    app.extensions["qb_profiling"] = True
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
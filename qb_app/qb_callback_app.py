@@ -1,48 +1,37 @@
 import os
 import time
-import requests
-from flask import Flask, request, redirect
-from flask_cors import CORS
-from dotenv import load_dotenv
+from flask import request, redirect
 from encrypt_qb_token import encrypt_token
 from qb_app.db import get_connection
 from qb_app.job_runner import submit_onboarding
-import sys, logging
-from qb_app import app
-# Ensure all web routes and background scheduler are registered even when
-# the app entrypoint is qb_app.qb_callback_app:app (Gunicorn startup override).
-try:
-    import qb_app.web_routes  # noqa: F401
-    import qb_app.scheduler   # noqa: F401  # starts APScheduler on import
-except Exception as _e:
-    # Do not crash app if optional imports fail; log for diagnostics
-    try:
-        print(f"[scheduler] import warning: {_e}")
-    except Exception:
-        pass
+from qb_app import app, applog, qb_http, storage
 
-# Load environment variables
-load_dotenv()
-app.logger.addHandler(logging.StreamHandler(sys.stdout))
-app.logger.setLevel(logging.INFO)
-app.config['PROPAGATE_EXCEPTIONS'] = True
-CORS(app, resources={r"/*": {"origins": "*"}}, allow_headers=["Content-Type", "Authorization"])
+# Routes here register on the shared app; qb_app.create_app() does the
+# startup work (env, CORS, metrics, web_routes, background threads).
+
+
+_logger = applog.get_logger("qb_app.callback")
 
 
 def log(message: str) -> None:
-    """Log to console and append to a file if available."""
-    print(message)
-    try:
-        app.logger.info(message)
-    except Exception:
-        pass
-    try:
-        log_path = "/home/site/wwwroot/qb_app/logs/callback_debug.log"
-        os.makedirs(os.path.dirname(log_path), exist_ok=True)
-        with open(log_path, "a") as f:
-            f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
-    except Exception:
-        pass
+    """Log to console and the debug file (written by the background log thread)."""
+    _logger.info(message)
+
+
+def _ensure_tokens_table(cur) -> None:
+    storage.get_storage().ensure_table(
+        cur,
+        "quickbooks_tokens",
+        """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        user_id INT NOT NULL,
+        realm_id NVARCHAR(100),
+        access_token NVARCHAR(MAX),
+        refresh_token NVARCHAR(MAX),
+        expires_at DATETIME,
+        CONSTRAINT FK_quickbooks_tokens_users FOREIGN KEY (user_id) REFERENCES users(id)
+        """,
+    )
 
 
 @app.route("/api/qb/oauth/callback")
@@ -79,8 +68,9 @@ def qb_callback():
         log(f"Using redirect_uri: {redirect_uri}")
         # Small buffer to accommodate slow Intuit redirects
         time.sleep(1)
-        response = requests.post(
-            "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer",
+        response = qb_http.post(
+            qb_http.QB_OAUTH_TOKEN_URL,
+            entity="oauth_token",
             auth=(os.getenv("QB_CLIENT_ID"), os.getenv("QB_CLIENT_SECRET")),
             headers={
                 "Accept": "application/json",
@@ -155,22 +145,7 @@ def qb_callback():
             )
             # Also store tokens linked to the requesting user if provided
             try:
-                cur.execute(
-                    """
-                    IF NOT EXISTS (SELECT 1 FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[quickbooks_tokens]') AND type in (N'U'))
-                    BEGIN
-                        CREATE TABLE quickbooks_tokens (
-                            id INT IDENTITY(1,1) PRIMARY KEY,
-                            user_id INT NOT NULL,
-                            realm_id NVARCHAR(100),
-                            access_token NVARCHAR(MAX),
-                            refresh_token NVARCHAR(MAX),
-                            expires_at DATETIME,
-                            CONSTRAINT FK_quickbooks_tokens_users FOREIGN KEY (user_id) REFERENCES users(id)
-                        )
-                    END
-                    """
-                )
+                _ensure_tokens_table(cur)
                 if user_id:
                     cur.execute(
                         """
@@ -193,9 +168,9 @@ def qb_callback():
         log("Fetching company info for new client...")
         company_name = "Unknown Company"
         try:
-            company_url = f"https://quickbooks.api.intuit.com/v3/company/{realm_id}/companyinfo/{realm_id}"
+            company_url = qb_http.company_url(realm_id, f"companyinfo/{realm_id}")
             headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json"}
-            r = requests.get(company_url, headers=headers)
+            r = qb_http.get(company_url, entity="CompanyInfo", headers=headers)
             if r.status_code == 200:
                 company_name = r.json().get("CompanyInfo", {}).get("CompanyName", "Unknown Company")
             log(f"Company name: {company_name}")
@@ -222,22 +197,7 @@ def qb_callback():
             new_client_id = int(row2[0])
         # Also store tokens linked to the requesting user if provided
         try:
-            cur.execute(
-                """
-                IF NOT EXISTS (SELECT 1 FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[quickbooks_tokens]') AND type in (N'U'))
-                BEGIN
-                    CREATE TABLE quickbooks_tokens (
-                        id INT IDENTITY(1,1) PRIMARY KEY,
-                        user_id INT NOT NULL,
-                        realm_id NVARCHAR(100),
-                        access_token NVARCHAR(MAX),
-                        refresh_token NVARCHAR(MAX),
-                        expires_at DATETIME,
-                        CONSTRAINT FK_quickbooks_tokens_users FOREIGN KEY (user_id) REFERENCES users(id)
-                    )
-                END
-                """
-            )
+            _ensure_tokens_table(cur)
             if user_id:
                 cur.execute(
                     """
@@ -274,4 +234,11 @@ def qb_callback():
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Same app as wsgi.py (blueprints, logging, metrics); no background threads
+    import sys
+
+    from qb_app import create_app
+
+    # The routes above are already on ``app``; create_app's import must reuse them
+    sys.modules.setdefault("qb_app.qb_callback_app", sys.modules[__name__])
+    create_app(background=False).run(debug=True)
@@ -0,0 +1,80 @@
+"""Shared HTTP client for QuickBooks API calls.
+
+All QuickBooks requests go through one pooled ``requests.Session`` per
+process (keep-alive instead of a new TLS handshake per call) and are timed
+in ``qb_app.metrics`` by entity and status.
+
+``QB_API_BASE`` / ``QB_OAUTH_TOKEN_URL`` override the Intuit endpoints
+(e.g. to point at a local fake server for benchmarks).
+"""
+
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+
+from qb_app import metrics
+
+
+QB_API_BASE = (os.getenv("QB_API_BASE") or "https://quickbooks.api.intuit.com").rstrip("/")
+QB_OAUTH_TOKEN_URL = os.getenv("QB_OAUTH_TOKEN_URL") or "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
+_TIMEOUT = float(os.getenv("QB_HTTP_TIMEOUT_SECONDS", "60") or 60)
+
+_LOCK = threading.Lock()
+_SESSION: Optional[requests.Session] = None
+_PID: Optional[int] = None
+
+
+def company_url(realm_id, path: str) -> str:
+    """``{QB_API_BASE}/v3/company/{realm_id}/{path}``."""
+    return f"{QB_API_BASE}/v3/company/{realm_id}/{path.lstrip('/')}"
+
+
+def session() -> requests.Session:
+    """The process-wide session (recreated after a fork)."""
+    global _SESSION, _PID
+    if _SESSION is None or _PID != os.getpid():
+        with _LOCK:
+            if _SESSION is None or _PID != os.getpid():
+                s = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _SESSION, _PID = s, os.getpid()
+    return _SESSION
+
+
+def reset_session() -> None:
+    """Drop pooled connections (e.g. in a freshly forked worker)."""
+    global _SESSION, _PID
+    with _LOCK:
+        old, _SESSION, _PID = _SESSION, None, None
+    if old is not None:
+        try:
+            old.close()
+        except Exception:
+            pass
+
+
+def request(method: str, url: str, entity: str = "other", **kwargs) -> requests.Response:
+    """Send a request through the shared session, timed per entity/status."""
+    kwargs.setdefault("timeout", _TIMEOUT)
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        resp = session().request(method, url, **kwargs)
+        status = str(resp.status_code)
+        return resp
+    finally:
+        metrics.QB_HTTP_SECONDS.observe(time.perf_counter() - t0, entity=entity)
+        metrics.QB_HTTP_REQUESTS.inc(entity=entity, status=status)
+
+
+def get(url: str, entity: str = "other", **kwargs) -> requests.Response:
+    return request("GET", url, entity=entity, **kwargs)
+
+
+def post(url: str, entity: str = "other", **kwargs) -> requests.Response:
+    return request("POST", url, entity=entity, **kwargs)
@@ -0,0 +1,50 @@
+"""Small in-process LRU caches for computed API results.
+
+Keys must carry everything the result depends on, including the client's
+data version (see ``qb_app.data_version``), so entries never need explicit
+invalidation: a new version simply misses and stale entries age out. Each
+Gunicorn worker has its own caches; lookups and misses are counted in
+``result_cache_requests_total``.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from qb_app import metrics
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with at most ``maxsize`` entries."""
+
+    def __init__(self, name: str, maxsize: int = 256) -> None:
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+        metrics.CACHE_REQUESTS.inc(cache=self.name, outcome="hit" if value is not None else "miss")
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -5,7 +5,7 @@ from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from qb_app.db import get_connection, fetchone_dict
-from qb_app import app
+from qb_app import app, storage
 
 
 auth_bp = Blueprint("auth_bp", __name__, url_prefix="/api/users")
@@ -379,19 +379,9 @@ def me():
         is_admin_flag = False
         if email:
             try:
-                cur.execute(
-                    """
-                    IF OBJECT_ID('dbo.app_admins','U') IS NULL
-                        SELECT 0
-                    ELSE
-                        SELECT CASE WHEN EXISTS (
-                          SELECT 1 FROM app_admins WHERE LOWER(email) = LOWER(?)
-                        ) THEN 1 ELSE 0 END
-                    """,
-                    (email,),
-                )
-                r = cur.fetchone()
-                is_admin_flag = bool(r[0]) if r and r[0] is not None else False
+                if storage.get_storage().table_exists(cur, "app_admins"):
+                    cur.execute("SELECT 1 FROM app_admins WHERE LOWER(email) = LOWER(?)", (email,))
+                    is_admin_flag = cur.fetchone() is not None
             except Exception:
                 is_admin_flag = False
         conn.close()
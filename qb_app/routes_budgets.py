@@ -0,0 +1,245 @@
+"""Budgets and budget vs actual variance (``/api/budgets``).
+
+Variance reports are cached per worker under each client's data and
+accounts versions and budget revision, so a repeat load is a dictionary
+lookup until a sync, an accounts load or a budget save moves one of them.
+"""
+
+import os
+import time
+
+from flask import Blueprint, jsonify, request
+
+from qb_app import data_version, gl_cube
+from qb_app.db import get_connection
+from qb_app.result_cache import LRUCache
+from qb_app.routes_auth import jwt_required
+from qb_app.utils import client_id_for_user, client_ids_for_user
+
+
+budgets_bp = Blueprint("budgets_bp", __name__, url_prefix="/api/budgets")
+
+# ((client, data version, accounts version, budget id, revision), ...) + (start, end, by_client) -> payload
+_variance_cache = LRUCache("variance", int(os.getenv("VARIANCE_CACHE_SIZE", "128") or 128))
+
+
+def _user_id() -> int:
+    return int(getattr(request, "user_id", 0) or 0)
+
+
+def _client_id(cur):
+    return client_id_for_user(cur, _user_id(), request.args.get("client_id"))
+
+
+def _client_ids(cur):
+    """``client_ids=1,2`` (all must be the user's), else the single ``_client_id``."""
+    raw = request.args.get("client_ids")
+    if not raw:
+        client_id = _client_id(cur)
+        return [client_id] if client_id is not None else None
+    try:
+        wanted = sorted({int(c) for c in raw.split(",") if c.strip()})
+    except ValueError:
+        return None
+    allowed = set(client_ids_for_user(cur, _user_id()))
+    return wanted if wanted and all(c in allowed for c in wanted) else None
+
+
+def _month_arg(name: str):
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    month = gl_cube.month_of(raw)
+    if month is None:
+        raise ValueError(f"{name} must be YYYY-MM")
+    return month
+
+
+def _summary(b: dict) -> dict:
+    updated = b.get("updated_at")
+    return {
+        "name": b["name"],
+        "description": b.get("description"),
+        "revision": b["revision"],
+        "updated_at": updated.isoformat() if hasattr(updated, "isoformat") else updated,
+        "lines": b["lines"],
+        "first_month": b["first_month"].isoformat() if b["first_month"] else None,
+        "last_month": b["last_month"].isoformat() if b["last_month"] else None,
+    }
+
+
+@budgets_bp.get("")
+@jwt_required()
+def list_budgets():
+    from qb_app import budgets
+
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            rows = budgets.list_budgets(cur, client_id)
+            conn.commit()
+        finally:
+            conn.close()
+        return jsonify({"client_id": client_id, "budgets": [_summary(b) for b in rows]})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@budgets_bp.get("/<name>")
+@jwt_required()
+def get_budget(name: str):
+    """A budget's lines, optionally limited to ``start``..``end`` (YYYY-MM)."""
+    from qb_app import budgets
+
+    try:
+        start, end = _month_arg("start"), _month_arg("end")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            found = budgets.find_budgets(cur, [client_id], name).get(client_id)
+            if found is None:
+                return jsonify({"error": "not_found"}), 404
+            lines = budgets.load_lines(cur, found["id"], start, end)
+            conn.commit()
+        finally:
+            conn.close()
+        return jsonify(
+            {
+                "client_id": client_id,
+                "name": name,
+                "revision": found["revision"],
+                "lines": [{"account_id": a, "month": m.isoformat(), "amount": v} for a, m, v in lines],
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@budgets_bp.put("/<name>")
+@jwt_required()
+def put_budget(name: str):
+    """Create or replace a budget.
+
+    Body: ``{"description": ..., "lines": [{"account_id", "month": "2025-01", "amount"}]}``.
+    """
+    from qb_app import budgets
+
+    body = request.get_json(silent=True) or {}
+    if not name.strip() or len(name) > 100:
+        return jsonify({"error": "budget name must be 1-100 characters"}), 400
+    try:
+        lines = budgets.parse_lines(body.get("lines"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            revision = budgets.save_budget(cur, client_id, name, body.get("description"), lines)
+            conn.commit()
+        finally:
+            conn.close()
+        return jsonify({"ok": True, "client_id": client_id, "name": name, "revision": revision, "lines": len(lines)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@budgets_bp.delete("/<name>")
+@jwt_required()
+def delete_budget(name: str):
+    from qb_app import budgets
+
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            deleted = budgets.delete_budget(cur, client_id, name)
+            conn.commit()
+        finally:
+            conn.close()
+        if not deleted:
+            return jsonify({"error": "not_found"}), 404
+        return jsonify({"ok": True, "deleted": name})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@budgets_bp.get("/<name>/variance")
+@jwt_required()
+def get_variance(name: str):
+    """Actual vs budget by account, rolled up the chart of accounts.
+
+    Query: ``start``/``end`` (YYYY-MM; default the budgeted months),
+    ``client_ids=1,2`` to consolidate several clients (default the user's
+    client) and ``by_client=1`` to add each client's own rows.
+    """
+    from qb_app import budgets, variance
+
+    try:
+        start, end = _month_arg("start"), _month_arg("end")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    by_client = request.args.get("by_client", "0") in ("1", "true")
+    try:
+        t0 = time.perf_counter()
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_ids = _client_ids(cur)
+            if client_ids is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            found = budgets.find_budgets(cur, client_ids, name)
+            if not found:
+                return jsonify({"error": "not_found"}), 404
+            if start is None or end is None:
+                first, last = budgets.month_span(cur, [b["id"] for b in found.values()])
+                start, end = start or first, end or last
+            if start is None or end is None:
+                return jsonify({"error": "budget has no lines; pass start and end"}), 400
+            if end < start:
+                return jsonify({"error": "end must not be before start"}), 400
+            months = variance.month_range(start, end)
+            if len(months) > variance.MAX_MONTHS:
+                return jsonify({"error": f"at most {variance.MAX_MONTHS} months per report"}), 400
+            versions = tuple(
+                (cid, data_version.get_version(cur, cid), data_version.get_version(cur, cid, "accounts_version"),
+                 (found.get(cid) or {}).get("id"), (found.get(cid) or {}).get("revision"))
+                for cid in client_ids
+            )
+            conn.commit()
+            key = versions + (start, end, by_client)
+            payload = _variance_cache.get(key)
+            cached = payload is not None
+            if payload is None:
+                payload = variance.report(conn, {cid: found.get(cid) for cid in client_ids}, months, by_client)
+                _variance_cache.put(key, payload)
+        finally:
+            conn.close()
+        return jsonify(
+            dict(
+                payload,
+                budget=name,
+                client_ids=client_ids,
+                data_versions=[v[1] for v in versions],
+                cached=cached,
+                elapsed_ms=round((time.perf_counter() - t0) * 1000, 2),
+            )
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
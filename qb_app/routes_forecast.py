@@ -0,0 +1,431 @@
+"""Driver-based planning API (``/api/forecast/drivers`` and ``/scenarios``).
+
+A client's driver graph for one (horizon, method) is cached per worker
+under its data and driver versions. An edit made through this worker
+updates the cached graph in place, recomputing only the edited driver's
+downstream subgraph, and re-files it under the new version; other workers
+rebuild on their next read. Scenario overlays are cached on top of that
+key per (scenario id, revision).
+"""
+
+import os
+import time
+from typing import Optional
+
+from flask import Blueprint, jsonify, request
+
+from qb_app import data_version
+from qb_app.db import get_connection
+from qb_app.result_cache import LRUCache
+from qb_app.routes_auth import jwt_required
+from qb_app.utils import client_id_for_user, forecast_query_args
+
+
+forecast_bp = Blueprint("forecast_bp", __name__, url_prefix="/api/forecast")
+
+# (client_auth_id, horizon, method, data version, drivers version) -> DriverGraph
+_graph_cache = LRUCache("driver_graph", int(os.getenv("DRIVER_GRAPH_CACHE_SIZE", "64") or 64))
+# (scenario id, revision) + graph key -> drivers.Overlay
+_scenario_cache = LRUCache("scenario", int(os.getenv("SCENARIO_CACHE_SIZE", "256") or 256))
+
+RESERVED_SCENARIO_NAMES = ("base", "compare")
+
+
+def _client_id(cur):
+    user_id = int(getattr(request, "user_id", 0) or 0)
+    return client_id_for_user(cur, user_id, request.args.get("client_id"))
+
+
+def _graph_key(cur, client_id: int, horizon: int, method: str) -> tuple:
+    return (
+        client_id,
+        horizon,
+        method,
+        data_version.get_version(cur, client_id),
+        data_version.get_version(cur, client_id, "drivers_version"),
+    )
+
+
+def _load_graph(conn, client_id: int, horizon: int, method: str):
+    from qb_app import drivers
+
+    key = _graph_key(conn.cursor(), client_id, horizon, method)
+    conn.commit()
+    graph = _graph_cache.get(key)
+    if graph is None:
+        graph = drivers.build_graph(conn, client_id, horizon, method)
+        _graph_cache.put(key, graph)
+    return key, graph
+
+
+def _refile(cur, key: tuple, graph) -> None:
+    """Move an edited graph to the key of the version our write produced.
+
+    If another writer got in between, drop it instead; the next read rebuilds.
+    """
+    _graph_cache.discard(key)
+    if data_version.get_version(cur, key[0], "drivers_version") == key[4] + 1:
+        _graph_cache.put(key[:4] + (key[4] + 1,), graph)
+
+
+def _driver_payload(graph, name: str) -> dict:
+    kind, params = graph.definitions[name]
+    return {
+        "name": name,
+        "kind": kind,
+        "params": params,
+        "depends_on": graph.refs(name),
+        "values": graph.values[name].round(2).tolist(),
+    }
+
+
+@forecast_bp.get("/drivers")
+@jwt_required()
+def list_drivers():
+    """Every driver of the user's client with its monthly values, in dependency order."""
+    horizon, method, error = forecast_query_args()
+    if error:
+        return error
+    try:
+        conn = get_connection()
+        try:
+            client_id = _client_id(conn.cursor())
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            key, graph = _load_graph(conn, client_id, horizon, method)
+        finally:
+            conn.close()
+        with graph.lock:
+            items = [_driver_payload(graph, name) for name in graph.order]
+            months = [m.isoformat() for m in graph.months]
+        return jsonify(
+            {
+                "client_id": client_id,
+                "horizon": horizon,
+                "method": method,
+                "months": months,
+                "drivers_version": key[4],
+                "drivers": items,
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@forecast_bp.put("/drivers/<name>")
+@jwt_required()
+def put_driver(name: str):
+    """Create or replace a driver; returns the drivers it recomputed.
+
+    Body: ``{"kind": ..., "params": {...}}`` (see ``qb_app.drivers``).
+    """
+    from qb_app import drivers
+
+    horizon, method, error = forecast_query_args()
+    if error:
+        return error
+    body = request.get_json(silent=True) or {}
+    kind = body.get("kind")
+    try:
+        params = drivers.validate(name, kind, body.get("params"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            key, graph = _load_graph(conn, client_id, horizon, method)
+            with graph.lock:
+                t0 = time.perf_counter()
+                try:
+                    dirty = graph.set_driver(name, kind, params)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+                recompute_ms = (time.perf_counter() - t0) * 1000
+                try:
+                    drivers.save_definition(cur, client_id, name, kind, params)
+                    conn.commit()
+                except Exception:
+                    _graph_cache.discard(key)  # graph is ahead of the table now
+                    raise
+                _refile(cur, key, graph)
+                payload = {
+                    "driver": _driver_payload(graph, name),
+                    "recomputed": [{"name": n, "values": v} for n, v in graph.series(dirty).items()],
+                    "recompute_ms": round(recompute_ms, 3),
+                }
+        finally:
+            conn.close()
+        return jsonify(payload)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@forecast_bp.delete("/drivers/<name>")
+@jwt_required()
+def delete_driver(name: str):
+    """Delete a driver no other driver depends on (409 otherwise)."""
+    from qb_app import drivers
+
+    horizon, method, error = forecast_query_args()
+    if error:
+        return error
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            key, graph = _load_graph(conn, client_id, horizon, method)
+            with graph.lock:
+                if name not in graph.definitions:
+                    return jsonify({"error": "not_found"}), 404
+                try:
+                    graph.remove_driver(name)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 409
+                try:
+                    drivers.delete_definition(cur, client_id, name)
+                    conn.commit()
+                except Exception:
+                    _graph_cache.discard(key)
+                    raise
+                _refile(cur, key, graph)
+        finally:
+            conn.close()
+        return jsonify({"ok": True, "deleted": name})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _overlay(graph, key: tuple, scenario: Optional[dict]):
+    """Scenario overlay from the cache or computed now; call under ``graph.lock``."""
+    if scenario is None:
+        return graph.overlay({})
+    skey = (scenario["id"], scenario["revision"]) + key
+    overlay = _scenario_cache.get(skey)
+    if overlay is None:
+        overlay = graph.overlay(scenario["overrides"])
+        _scenario_cache.put(skey, overlay)
+    return overlay
+
+
+def _scenario_summary(scenario: dict) -> dict:
+    updated = scenario.get("updated_at")
+    return {
+        "name": scenario["name"],
+        "description": scenario.get("description"),
+        "revision": scenario["revision"],
+        "updated_at": updated.isoformat() if hasattr(updated, "isoformat") else updated,
+        "overrides": {d: {"kind": k, "params": p} for d, (k, p) in scenario["overrides"].items()},
+    }
+
+
+@forecast_bp.get("/scenarios")
+@jwt_required()
+def list_scenarios():
+    from qb_app import scenarios
+
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            rows = scenarios.load_scenarios(cur, client_id)
+            conn.commit()
+        finally:
+            conn.close()
+        return jsonify({"client_id": client_id, "scenarios": [_scenario_summary(s) for s in rows.values()]})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@forecast_bp.get("/scenarios/compare")
+@jwt_required()
+def compare_scenarios():
+    """Selected drivers under several scenarios, with deltas against the first.
+
+    Query: ``names=base,upside,downside`` and optional ``drivers=a,b`` (default
+    every driver), plus ``horizon``/``method``.
+    """
+    from qb_app import scenarios
+
+    horizon, method, error = forecast_query_args()
+    if error:
+        return error
+    names = [n.strip() for n in (request.args.get("names") or "").split(",") if n.strip()]
+    if not names:
+        return jsonify({"error": "names is required (comma-separated scenario names)"}), 400
+    wanted = [d.strip() for d in (request.args.get("drivers") or "").split(",") if d.strip()]
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            rows = scenarios.load_scenarios(cur, client_id, names)
+            missing = [n for n in names if n != scenarios.BASE and n not in rows]
+            if missing:
+                return jsonify({"error": "not_found", "scenarios": missing}), 404
+            key, graph = _load_graph(conn, client_id, horizon, method)
+        finally:
+            conn.close()
+        with graph.lock:
+            t0 = time.perf_counter()
+            overlays = []
+            for name in names:
+                try:
+                    overlays.append((name, _overlay(graph, key, rows.get(name))))
+                except ValueError as e:
+                    return jsonify({"error": str(e), "scenario": name}), 409
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            driver_names = wanted or list(dict.fromkeys(d for _, o in overlays for d in o.order))
+            unknown = [d for d in driver_names if all(d not in o.definitions for _, o in overlays)]
+            if unknown:
+                return jsonify({"error": "unknown drivers", "drivers": unknown}), 400
+            _, reference = overlays[0]
+            result = []
+            for name, overlay in overlays:
+                series = []
+                for d in driver_names:
+                    # Scenario-only drivers have no values (or delta) elsewhere
+                    values = overlay.value(d) if d in overlay.definitions else None
+                    delta = values - reference.value(d) if values is not None and d in reference.definitions else None
+                    series.append(
+                        {
+                            "name": d,
+                            "values": values.round(2).tolist() if values is not None else None,
+                            "delta": delta.round(2).tolist() if delta is not None else None,
+                        }
+                    )
+                result.append({"name": name, "changed": list(overlay.changed), "drivers": series})
+            months = [m.isoformat() for m in graph.months]
+        return jsonify(
+            {
+                "client_id": client_id,
+                "horizon": horizon,
+                "method": method,
+                "months": months,
+                "baseline": names[0],
+                "evaluate_ms": round(elapsed_ms, 3),
+                "scenarios": result,
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@forecast_bp.get("/scenarios/<name>")
+@jwt_required()
+def get_scenario(name: str):
+    """Every driver under one scenario; ``changed`` marks what differs from base."""
+    from qb_app import scenarios
+
+    horizon, method, error = forecast_query_args()
+    if error:
+        return error
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            scenario = scenarios.load_scenarios(cur, client_id, [name]).get(name)
+            if scenario is None and name != scenarios.BASE:
+                return jsonify({"error": "not_found"}), 404
+            key, graph = _load_graph(conn, client_id, horizon, method)
+        finally:
+            conn.close()
+        with graph.lock:
+            try:
+                overlay = _overlay(graph, key, scenario)
+            except ValueError as e:
+                return jsonify({"error": str(e), "scenario": name}), 409
+            changed = set(overlay.changed)
+            items = [
+                {"name": d, "values": overlay.value(d).round(2).tolist(), "changed": d in changed}
+                for d in overlay.order
+            ]
+            months = [m.isoformat() for m in graph.months]
+        payload = _scenario_summary(scenario) if scenario else {"name": name, "overrides": {}}
+        return jsonify(dict(payload, client_id=client_id, horizon=horizon, method=method, months=months,
+                            drivers=items))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@forecast_bp.put("/scenarios/<name>")
+@jwt_required()
+def put_scenario(name: str):
+    """Create or replace a scenario.
+
+    Body: ``{"description": ..., "overrides": {driver: {"kind", "params"}}}``.
+    Overrides are checked against the current driver set (400 on unknown
+    references or cycles) before they are saved.
+    """
+    from qb_app import scenarios
+
+    if name in RESERVED_SCENARIO_NAMES:
+        return jsonify({"error": f"'{name}' is a reserved scenario name"}), 400
+    horizon, method, error = forecast_query_args()
+    if error:
+        return error
+    body = request.get_json(silent=True) or {}
+    try:
+        overrides = scenarios.validate_overrides(body.get("overrides") or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    description = (body.get("description") or "").strip()[:500] or None
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            key, graph = _load_graph(conn, client_id, horizon, method)
+            with graph.lock:
+                try:
+                    overlay = graph.overlay(overrides)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+            revision = scenarios.save_scenario(cur, client_id, name, description, overrides)
+            scenario = scenarios.load_scenarios(cur, client_id, [name])[name]
+            conn.commit()
+        finally:
+            conn.close()
+        _scenario_cache.put((scenario["id"], revision) + key, overlay)
+        return jsonify(dict(_scenario_summary(scenario), changed=list(overlay.changed)))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@forecast_bp.delete("/scenarios/<name>")
+@jwt_required()
+def delete_scenario(name: str):
+    from qb_app import scenarios
+
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            deleted = scenarios.delete_scenario(cur, client_id, name)
+            conn.commit()
+        finally:
+            conn.close()
+        if not deleted:
+            return jsonify({"error": "not_found"}), 404
+        return jsonify({"ok": True, "deleted": name})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
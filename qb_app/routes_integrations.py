@@ -1,9 +1,14 @@
 import os
-from flask import Blueprint, jsonify, request
+import json
+import time
+import datetime as dt
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 from qb_app.routes_auth import jwt_required
 from qb_app.db import get_connection, fetchone_dict
-from qb_app.job_runner import submit_onboarding
+from qb_app import storage
+from qb_app.utils import client_ids_for_user
+from qb_app.job_runner import submit_onboarding, get_job, latest_job
 
 
 integrations_bp = Blueprint("integrations_bp", __name__, url_prefix="/api/integrations")
@@ -12,26 +17,53 @@ integrations_bp = Blueprint("integrations_bp", __name__, url_prefix="/api/integr
 def _already_onboarded(cur, client_id: int) -> bool:
     try:
         # Check if any transactions exist for this client
-        cur.execute(
-            """
-            IF OBJECT_ID('dbo.qb_transactions', 'U') IS NOT NULL
-            SELECT TOP 1 1 FROM qb_transactions WHERE client_auth_id = ?
-            ELSE SELECT 0
-            """,
-            (int(client_id),),
-        )
-        row = cur.fetchone()
-        if not row:
-            return False
-        # When table absent, SELECT 0 returns a single row with 0
-        try:
-            return bool(row[0])
-        except Exception:
+        if not storage.get_storage().table_exists(cur, "qb_transactions"):
             return False
+        cur.execute("SELECT TOP 1 1 FROM qb_transactions WHERE client_auth_id = ?", (int(client_id),))
+        return cur.fetchone() is not None
     except Exception:
         return False
 
 
+def _job_payload(job: dict) -> dict:
+    def _iso(v):
+        return v.isoformat() if isinstance(v, (dt.datetime, dt.date)) else v
+
+    err = (job.get("last_error") or "").strip()
+    return {
+        "job_id": int(job["id"]),
+        "type": job.get("job_type"),
+        "client_id": job.get("client_id"),
+        "status": job.get("status"),
+        "attempts": job.get("attempts"),
+        "max_attempts": job.get("max_attempts"),
+        "progress": job.get("progress") or {},
+        "error": err.splitlines()[0] if err else None,
+        "created_at": _iso(job.get("created_at")),
+        "started_at": _iso(job.get("started_at")),
+        "finished_at": _iso(job.get("finished_at")),
+        "next_attempt_at": _iso(job.get("run_after")) if job.get("status") == "queued" else None,
+    }
+
+
+def _authorized_job(job_id: int):
+    """Load a job the current user may see; returns (job, error_response)."""
+    user_id = int(getattr(request, "user_id", 0) or 0)
+    if not user_id:
+        return None, (jsonify({"error": "Unauthorized"}), 401)
+    job = get_job(job_id)
+    if not job:
+        return None, (jsonify({"error": "not_found"}), 404)
+    conn = get_connection()
+    try:
+        allowed = client_ids_for_user(conn.cursor(), user_id)
+    finally:
+        conn.close()
+    if job.get("client_id") not in allowed:
+        return None, (jsonify({"error": "not_found"}), 404)
+    return job, None
+
+
 @integrations_bp.post("/start_onboarding")
 @jwt_required()
 def start_onboarding():
@@ -50,17 +82,11 @@ def start_onboarding():
 
         # Find the user's latest linked realm (if any)
         try:
-            cur.execute(
-                """
-                IF OBJECT_ID('dbo.quickbooks_tokens','U') IS NULL
-                    SELECT NULL AS realm_id
-                ELSE
-                    SELECT TOP 1 realm_id FROM quickbooks_tokens WHERE user_id = ? ORDER BY id DESC
-                """,
-                (user_id,),
-            )
-            row = cur.fetchone()
-            realm_id = row[0] if row and row[0] is not None else None
+            realm_id = None
+            if storage.get_storage().table_exists(cur, "quickbooks_tokens"):
+                cur.execute("SELECT TOP 1 realm_id FROM quickbooks_tokens WHERE user_id = ? ORDER BY id DESC", (user_id,))
+                row = cur.fetchone()
+                realm_id = row[0] if row and row[0] is not None else None
         except Exception:
             realm_id = None
 
@@ -75,15 +101,88 @@ def start_onboarding():
             conn.close()
             return jsonify({"error": "no_client_record", "message": "Client record not found for realm"}), 400
         client_id = int(row[0])
+        conn.close()
 
-        # Safety: skip if already onboarded
-        if _already_onboarded(cur, client_id):
+        # The job record answers "already onboarded / in progress" cheaply;
+        # only clients that predate the job queue fall back to the table probe.
+        job = latest_job("onboarding", client_id)
+        if job and job.get("status") == "done":
+            return jsonify({"ok": True, "already_onboarded": True, "job_id": int(job["id"])}), 200
+        if job and job.get("status") in ("queued", "running"):
+            return jsonify({"ok": True, "in_progress": True, "client_id": client_id, "job_id": int(job["id"])}), 200
+        if not job:
+            conn = get_connection()
+            onboarded = _already_onboarded(conn.cursor(), client_id)
             conn.close()
-            return jsonify({"ok": True, "already_onboarded": True}), 200
+            if onboarded:
+                return jsonify({"ok": True, "already_onboarded": True}), 200
 
-        conn.close()
-        submit_onboarding(client_id)
-        return jsonify({"ok": True, "started": True, "client_id": client_id}), 202
+        job_id = submit_onboarding(client_id)
+        return jsonify({"ok": True, "started": True, "client_id": client_id, "job_id": job_id}), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+
+@integrations_bp.get("/jobs")
+@jwt_required()
+def latest_jobs():
+    """Latest job of ?type= (default onboarding) for each of the user's clients."""
+    try:
+        user_id = int(getattr(request, "user_id", 0) or 0)
+        job_type = (request.args.get("type") or "onboarding").strip()
+        conn = get_connection()
+        try:
+            client_ids = client_ids_for_user(conn.cursor(), user_id)
+        finally:
+            conn.close()
+        jobs = [latest_job(job_type, cid) for cid in client_ids]
+        return jsonify({"jobs": [_job_payload(j) for j in jobs if j]})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@integrations_bp.get("/jobs/<int:job_id>")
+@jwt_required()
+def job_status(job_id: int):
+    try:
+        job, err = _authorized_job(job_id)
+        if err:
+            return err
+        return jsonify(_job_payload(job))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@integrations_bp.get("/jobs/<int:job_id>/events")
+@jwt_required()
+def job_events(job_id: int):
+    """Server-Sent Events stream of job progress until it finishes.
+
+    Sends an event whenever the job record changes; the stream closes when
+    the job reaches done/failed or after JOB_SSE_MAX_SECONDS (client reconnects).
+    """
+    job, err = _authorized_job(job_id)
+    if err:
+        return err
+    interval = float(os.getenv("JOB_SSE_INTERVAL_SECONDS", "2") or 2)
+    max_seconds = float(os.getenv("JOB_SSE_MAX_SECONDS", "300") or 300)
+
+    def _events():
+        deadline = time.monotonic() + max_seconds
+        last = None
+        current = job
+        while True:
+            payload = json.dumps(_job_payload(current), default=str)
+            if payload != last:
+                yield f"event: progress\ndata: {payload}\n\n"
+                last = payload
+            else:
+                yield ": keep-alive\n\n"
+            if current.get("status") in ("done", "failed") or time.monotonic() >= deadline:
+                return
+            time.sleep(interval)
+            current = get_job(job_id) or current
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(_events()), mimetype="text/event-stream", headers=headers)
@@ -0,0 +1,486 @@
+"""Transaction detail for the Sheets page (``/api/sheets/transactions``).
+
+- ``GET /transactions``: one page of ``qb_transactions`` lines, newest first,
+  with keyset pagination on (TxnDate, id): the ``next_cursor`` of one page is
+  the ``cursor`` of the next, so page 1,000 costs the same index seek as
+  page 1 (no OFFSET). ``columns=`` picks the columns returned.
+- ``GET /transactions/pivot``: grouped in process from the client's columnar
+  snapshot (``qb_app.columnar_cache``) when this host has one and it holds
+  every dimension and filter asked for; otherwise GROUP BY in SQL, so only
+  the aggregated cells leave the database.
+- ``GET /transactions/export``: CSV or XLSX of every matching line, read with
+  ``fetchmany`` in batches and streamed as a chunked response, so memory
+  stays flat however many rows match.
+
+Filters shared by all three: ``start``/``end`` (TxnDate, inclusive),
+``account``, ``account_id``, ``class``, ``department``, ``customer``,
+``vendor``, ``type`` and ``item``; repeat a filter to match any of several values.
+"""
+
+import base64
+import csv
+import datetime as dt
+import decimal
+import io
+import json
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from qb_app.db import get_connection
+from qb_app.routes_auth import jwt_required
+from qb_app.utils import client_id_for_user
+
+
+sheets_bp = Blueprint("sheets_bp", __name__, url_prefix="/api/sheets")
+
+COLUMNS = (
+    "id", "TxnId", "DocNumber", "TxnType", "TxnDate", "TotalAmt", "LineAmount", "Currency", "ExchangeRate",
+    "AccountName", "AccountId", "GLCode", "Class", "Department", "Item", "TaxCode", "BillableStatus",
+    "Customer", "Vendor", "Description", "Memo", "CreatedTime", "UpdatedTime",
+)
+DEFAULT_COLUMNS = (
+    "TxnDate", "TxnType", "DocNumber", "AccountName", "Class", "Customer", "Vendor", "Description", "LineAmount",
+)
+# Query parameter -> column, for filters and pivot dimensions
+FIELDS = {
+    "account": "AccountName",
+    "account_id": "AccountId",
+    "class": "Class",
+    "department": "Department",
+    "customer": "Customer",
+    "vendor": "Vendor",
+    "type": "TxnType",
+    "item": "Item",
+}
+TIME_BUCKETS = {
+    "month": "DATEFROMPARTS(YEAR(TxnDate), MONTH(TxnDate), 1)",
+    "quarter": "YEAR(TxnDate) * 10 + (MONTH(TxnDate) + 2) / 3",
+    "year": "YEAR(TxnDate)",
+}
+AGGREGATES = {"sum": "SUM(LineAmount)", "avg": "AVG(LineAmount)", "min": "MIN(LineAmount)",
+              "max": "MAX(LineAmount)", "count": "COUNT(*)"}
+
+# Query parameter -> columnar snapshot column (``item`` is not in the snapshot)
+SNAPSHOT_FIELDS = {
+    "account": "account",
+    "account_id": "account_id",
+    "class": "class",
+    "department": "department",
+    "customer": "customer",
+    "vendor": "vendor",
+    "type": "txn_type",
+}
+SNAPSHOT_AGGREGATES = ("sum", "count")  # AVG/MIN/MAX skip NULL amounts in SQL
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("SHEETS_MAX_PAGE_SIZE", "1000") or 1000)
+MAX_PIVOT_CELLS = int(os.getenv("SHEETS_MAX_PIVOT_CELLS", "200000") or 200000)
+MAX_PIVOT_COLUMNS = int(os.getenv("SHEETS_MAX_PIVOT_COLUMNS", "400") or 400)
+EXPORT_BATCH = int(os.getenv("SHEETS_EXPORT_BATCH", "5000") or 5000)
+XLSX_MAX_ROWS = 1_048_575  # Excel's row limit, less the header
+STREAM_CHUNK = 64 * 1024
+
+def _client_id(cur):
+    user_id = int(getattr(request, "user_id", 0) or 0)
+    return client_id_for_user(cur, user_id, request.args.get("client_id"))
+
+
+def _columns() -> List[str]:
+    raw = request.args.get("columns")
+    if not raw:
+        return list(DEFAULT_COLUMNS)
+    cols = [c.strip() for c in raw.split(",") if c.strip()]
+    unknown = [c for c in cols if c not in COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(unknown)}")
+    return list(dict.fromkeys(cols))
+
+
+def _date_arg(name: str) -> Optional[dt.date]:
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    try:
+        return dt.date.fromisoformat(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def _where(client_id: int) -> Tuple[str, list]:
+    """WHERE clause and parameters for the client plus the request's filters."""
+    # TxnDate is always set by the sync; the NOT NULL keeps the keyset total
+    clauses = ["client_auth_id = ?", "TxnDate IS NOT NULL"]
+    params: list = [client_id]
+    start, end = _date_arg("start"), _date_arg("end")
+    if start:
+        clauses.append("TxnDate >= ?")
+        params.append(start)
+    if end:
+        clauses.append("TxnDate <= ?")
+        params.append(end)
+    for arg, column in FIELDS.items():
+        values = [v for v in request.args.getlist(arg) if v != ""]
+        if len(values) == 1:
+            clauses.append(f"{column} = ?")
+        elif values:
+            clauses.append(f"{column} IN ({', '.join(['?'] * len(values))})")
+        params.extend(values)
+    return " AND ".join(clauses), params
+
+
+def _encode_cursor(txn_date, row_id) -> str:
+    raw = json.dumps([str(txn_date)[:10], int(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> Tuple[dt.date, int]:
+    try:
+        txn_date, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return dt.date.fromisoformat(txn_date), int(row_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _json_value(v):
+    if isinstance(v, decimal.Decimal):
+        return float(v)
+    if isinstance(v, (dt.date, dt.datetime)):
+        return v.isoformat()
+    return v
+
+
+@sheets_bp.get("/transactions")
+@jwt_required()
+def list_transactions():
+    """One page of transaction lines, newest first.
+
+    Query: ``columns``, ``limit`` (default 100), ``cursor`` (from the previous
+    page's ``next_cursor``), ``client_id`` and the filters above.
+    """
+    try:
+        columns = _columns()
+        limit = int(request.args.get("limit", PAGE_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        token = request.args.get("cursor")
+        after = _decode_cursor(token) if token else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            try:
+                where, params = _where(client_id)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if after:
+                # (TxnDate, id) < cursor, with a plain range on TxnDate for the index seek
+                where += " AND TxnDate <= ? AND (TxnDate < ? OR id < ?)"
+                params.extend([after[0], after[0], after[1]])
+            # TxnDate and id ride along for the next cursor
+            select = columns + [c for c in ("TxnDate", "id") if c not in columns]
+            cur.execute(
+                f"SELECT TOP {limit + 1} {', '.join(select)} FROM qb_transactions "
+                f"WHERE {where} ORDER BY TxnDate DESC, id DESC",
+                tuple(params),
+            )
+            rows = cur.fetchall()
+        finally:
+            conn.close()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = _encode_cursor(last[select.index("TxnDate")], last[select.index("id")])
+        return jsonify(
+            {
+                "client_id": client_id,
+                "columns": columns,
+                "rows": [[_json_value(v) for v in r[:len(columns)]] for r in rows],
+                "has_more": has_more,
+                "next_cursor": next_cursor,
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _dimension(name: str) -> str:
+    if name in FIELDS:
+        return FIELDS[name]
+    if name in TIME_BUCKETS:
+        return TIME_BUCKETS[name]
+    raise ValueError(f"unknown dimension {name!r}; use one of {', '.join(list(FIELDS) + list(TIME_BUCKETS))}")
+
+
+def _dimension_value(name: str, v):
+    if v is None:
+        return None
+    if name == "month":
+        return str(v)[:10]
+    if name == "quarter":
+        return f"{int(v) // 10}-Q{int(v) % 10}"
+    if name == "year":
+        return int(v)
+    return v
+
+
+def _snapshot_cells(conn, client_id: int, dims: List[str], agg: str) -> Optional[list]:
+    """Pivot cells (dims..., aggregate, count) from the columnar snapshot, or
+    None when SQL has to answer: no snapshot on this host, or a dimension,
+    filter or aggregate the snapshot does not have."""
+    import numpy as np
+
+    from qb_app import columnar_cache
+
+    if agg not in SNAPSHOT_AGGREGATES:
+        return None
+    if any(d not in SNAPSHOT_FIELDS and d not in TIME_BUCKETS for d in dims):
+        return None
+    filters = {arg: [v for v in request.args.getlist(arg) if v != ""] for arg in FIELDS}
+    if any(values and arg not in SNAPSHOT_FIELDS for arg, values in filters.items()):
+        return None
+    if not columnar_cache.available(client_id):
+        return None
+    snap = columnar_cache.load(conn, client_id)
+    mask = snap.mask(_date_arg("start"), _date_arg("end"),
+                     **{SNAPSHOT_FIELDS[arg]: values for arg, values in filters.items() if values})
+    mask &= ~np.isnat(np.asarray(snap.column("txn_date")))  # as TxnDate IS NOT NULL
+    keys, sums, counts = snap.group_sum([SNAPSHOT_FIELDS.get(d, d) for d in dims], mask)
+    values = (sums if agg == "sum" else counts).tolist()
+    # Missing strings are '' in the snapshot and NULL in SQL
+    return [
+        tuple(None if v == "" else v for v in key) + (value, count)
+        for key, value, count in zip(keys, values, counts.tolist())
+    ]
+
+
+def _sort_key(v):
+    return (v is None, "" if v is None else str(v))
+
+
+@sheets_bp.get("/transactions/pivot")
+@jwt_required()
+def pivot_transactions():
+    """Aggregate LineAmount by ``rows`` (one or more dimensions) and an
+    optional ``columns`` dimension; ``agg`` is sum, avg, min, max or count.
+
+    Dimensions: account, account_id, class, department, customer, vendor,
+    type, item, month, quarter, year.
+    """
+    try:
+        row_dims = [d.strip() for d in (request.args.get("rows") or "account").split(",") if d.strip()]
+        col_dim = (request.args.get("columns") or "").strip() or None
+        agg = (request.args.get("agg") or "sum").lower()
+        if agg not in AGGREGATES:
+            raise ValueError(f"agg must be one of {', '.join(AGGREGATES)}")
+        if col_dim in row_dims:
+            raise ValueError("columns must differ from rows")
+        dims = row_dims + ([col_dim] if col_dim else [])
+        exprs = [_dimension(d) for d in dims]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = _client_id(cur)
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            try:
+                where, params = _where(client_id)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            cells = _snapshot_cells(conn, client_id, dims, agg)
+            source = "snapshot"
+            if cells is None:
+                source = "sql"
+                group = ", ".join(exprs)
+                cur.execute(
+                    f"SELECT {group}, {AGGREGATES[agg]}, COUNT(*) FROM qb_transactions "
+                    f"WHERE {where} GROUP BY {group}",
+                    tuple(params),
+                )
+                cells = cur.fetchmany(MAX_PIVOT_CELLS + 1)
+        finally:
+            conn.close()
+        if len(cells) > MAX_PIVOT_CELLS:
+            return jsonify({"error": f"pivot has more than {MAX_PIVOT_CELLS} cells; narrow the filters"}), 400
+
+        n = len(row_dims)
+        col_keys = [None]
+        if col_dim:
+            col_keys = sorted({_dimension_value(col_dim, c[n]) for c in cells}, key=_sort_key)
+            if len(col_keys) > MAX_PIVOT_COLUMNS:
+                return jsonify({"error": f"more than {MAX_PIVOT_COLUMNS} pivot columns; narrow the filters"}), 400
+        col_index = {k: i for i, k in enumerate(col_keys)}
+        table = {}
+        for c in cells:
+            key = tuple(_dimension_value(d, v) for d, v in zip(row_dims, c[:n]))
+            values = table.setdefault(key, [None] * len(col_keys))
+            col = col_index[_dimension_value(col_dim, c[n]) if col_dim else None]
+            value = _json_value(c[len(dims)])
+            values[col] = value if agg == "count" or value is None else round(value, 2)
+        # Totals are only meaningful for additive aggregates
+        additive = agg in ("sum", "count")
+        out_rows = []
+        for key in sorted(table, key=lambda k: [_sort_key(v) for v in k]):
+            values = table[key]
+            total = round(sum(v for v in values if v is not None), 2) if additive else None
+            out_rows.append({"key": list(key), "values": values, "total": total})
+        column_totals = None
+        if additive:
+            column_totals = [
+                round(sum(r["values"][i] for r in out_rows if r["values"][i] is not None), 2)
+                for i in range(len(col_keys))
+            ]
+        return jsonify(
+            {
+                "client_id": client_id,
+                "rows": row_dims,
+                "columns": col_dim,
+                "agg": agg,
+                "column_keys": col_keys if col_dim else [agg],
+                "data": out_rows,
+                "column_totals": column_totals,
+                "grand_total": round(sum(column_totals), 2) if additive else None,
+                "source": source,
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _batches(client_id: int, columns: List[str], where: str, params: list):
+    """Matching rows in (TxnDate, id) order, ``EXPORT_BATCH`` at a time.
+
+    Owns its connection: exports outlive the request handler's frame.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT {', '.join(columns)} FROM qb_transactions WHERE {where} ORDER BY TxnDate, id",
+            tuple(params),
+        )
+        while True:
+            batch = cur.fetchmany(EXPORT_BATCH)
+            if not batch:
+                return
+            yield batch
+    finally:
+        conn.close()
+
+
+def _csv_stream(columns: List[str], batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _write_xlsx(path: str, columns: List[str], batches) -> Tuple[int, bool]:
+    """Write rows to ``path`` with openpyxl's write-only (streaming) mode;
+    returns (rows written, truncated)."""
+    from openpyxl import Workbook  # only needed for exports
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Transactions")
+    ws.append(columns)
+    written = 0
+    for batch in batches:
+        for row in batch:
+            if written >= XLSX_MAX_ROWS:
+                batches.close()
+                wb.save(path)
+                return written, True
+            ws.append([ILLEGAL_CHARACTERS_RE.sub("", v) if isinstance(v, str) else v for v in row])
+            written += 1
+    wb.save(path)
+    return written, False
+
+
+def _file_stream(path: str):
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK)
+                if not chunk:
+                    return
+                yield chunk
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@sheets_bp.get("/transactions/export")
+@jwt_required()
+def export_transactions():
+    """Every matching line as ``format=csv`` (default) or ``xlsx``, oldest first.
+
+    CSV streams straight from the cursor. XLSX is a zip, so it is written
+    row by row to a temp file first and then streamed; it stops at Excel's
+    row limit and says so in ``X-Export-Truncated``.
+    """
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in ("csv", "xlsx"):
+        return jsonify({"error": "format must be csv or xlsx"}), 400
+    try:
+        columns = _columns()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        conn = get_connection()
+        try:
+            client_id = _client_id(conn.cursor())
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            try:
+                where, params = _where(client_id)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        finally:
+            conn.close()
+
+        filename = f"transactions_{client_id}_{dt.date.today().isoformat()}.{fmt}"
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"}
+        batches = _batches(client_id, columns, where, params)
+        if fmt == "csv":
+            return Response(stream_with_context(_csv_stream(columns, batches)),
+                            mimetype="text/csv", headers=headers)
+
+        fd, path = tempfile.mkstemp(prefix="sheets_export_", suffix=".xlsx")
+        os.close(fd)
+        try:
+            written, truncated = _write_xlsx(path, columns, batches)
+        except Exception:
+            os.remove(path)
+            raise
+        headers["Content-Length"] = str(os.path.getsize(path))
+        headers["X-Export-Rows"] = str(written)
+        if truncated:
+            headers["X-Export-Truncated"] = "1"
+        return Response(
+            _file_stream(path),
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers,
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
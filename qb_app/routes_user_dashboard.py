@@ -1,78 +1,71 @@
 import datetime as dt
+import os
 from typing import Optional, Dict, Any, List
 
 from flask import Blueprint, jsonify, request
 
 from qb_app.db import get_connection, fetchone_dict, fetchall_dict
 from qb_app.routes_auth import jwt_required
+from qb_app.utils import client_id_for_user, forecast_query_args
+from qb_app import data_version, storage
+from qb_app.result_cache import LRUCache
 
 
 user_dashboard_bp = Blueprint("user_dashboard_bp", __name__, url_prefix="/api")
 
+# (client_auth_id, method, horizon, by_class, data version) -> response payload
+_forecast_cache = LRUCache("forecast", int(os.getenv("FORECAST_CACHE_SIZE", "256") or 256))
+
 
 def _ensure_company_tables(cur) -> None:
-    # companies table
-    cur.execute(
-        """
-        IF NOT EXISTS (
-          SELECT 1 FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[companies]') AND type in (N'U')
-        )
-        BEGIN
-          CREATE TABLE companies (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            name NVARCHAR(255),
-            owner_id INT,
-            subscription_plan NVARCHAR(100),
-            status NVARCHAR(50) DEFAULT 'Active',
-            created_at DATETIME DEFAULT GETUTCDATE()
-          )
-        END
+    store = storage.get_storage()
+    store.ensure_table(
+        cur,
+        "companies",
         """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        name NVARCHAR(255),
+        owner_id INT,
+        subscription_plan NVARCHAR(100),
+        status NVARCHAR(50) DEFAULT 'Active',
+        created_at DATETIME DEFAULT GETUTCDATE()
+        """,
     )
     # optional settings columns on companies
-    cur.execute("IF COL_LENGTH('companies','industry') IS NULL ALTER TABLE companies ADD industry NVARCHAR(100) NULL")
-    cur.execute("IF COL_LENGTH('companies','timezone') IS NULL ALTER TABLE companies ADD timezone NVARCHAR(100) NULL")
-    cur.execute("IF COL_LENGTH('companies','currency') IS NULL ALTER TABLE companies ADD currency NVARCHAR(10) NULL")
-    cur.execute("IF COL_LENGTH('companies','address') IS NULL ALTER TABLE companies ADD address NVARCHAR(255) NULL")
-    cur.execute("IF COL_LENGTH('companies','phone') IS NULL ALTER TABLE companies ADD phone NVARCHAR(50) NULL")
-    cur.execute("IF COL_LENGTH('companies','email') IS NULL ALTER TABLE companies ADD email NVARCHAR(255) NULL")
-
-    # user_company_map table
-    cur.execute(
-        """
-        IF NOT EXISTS (
-          SELECT 1 FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[user_company_map]') AND type in (N'U')
-        )
-        BEGIN
-          CREATE TABLE user_company_map (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            user_id INT,
-            company_id INT,
-            role NVARCHAR(50),
-            status NVARCHAR(50) DEFAULT 'Active',
-            last_login DATETIME NULL
-          )
-        END
+    for column, sqltype in (
+        ("industry", "NVARCHAR(100) NULL"),
+        ("timezone", "NVARCHAR(100) NULL"),
+        ("currency", "NVARCHAR(10) NULL"),
+        ("address", "NVARCHAR(255) NULL"),
+        ("phone", "NVARCHAR(50) NULL"),
+        ("email", "NVARCHAR(255) NULL"),
+    ):
+        store.add_column(cur, "companies", column, sqltype)
+
+    store.ensure_table(
+        cur,
+        "user_company_map",
         """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        user_id INT,
+        company_id INT,
+        role NVARCHAR(50),
+        status NVARCHAR(50) DEFAULT 'Active',
+        last_login DATETIME NULL
+        """,
     )
 
-    # audit_log table
-    cur.execute(
-        """
-        IF NOT EXISTS (
-          SELECT 1 FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[audit_log]') AND type in (N'U')
-        )
-        BEGIN
-          CREATE TABLE audit_log (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            user_id INT NULL,
-            company_id INT NULL,
-            action NVARCHAR(100) NOT NULL,
-            details NVARCHAR(MAX) NULL,
-            created_at DATETIME DEFAULT GETUTCDATE()
-          )
-        END
+    store.ensure_table(
+        cur,
+        "audit_log",
         """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        user_id INT NULL,
+        company_id INT NULL,
+        action NVARCHAR(100) NOT NULL,
+        details NVARCHAR(MAX) NULL,
+        created_at DATETIME DEFAULT GETUTCDATE()
+        """,
     )
 
 
@@ -618,3 +611,76 @@ def update_company_settings():
         )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+def _forecast_payload(matrix, values, horizon: int) -> Dict[str, Any]:
+    series = []
+    for (account_id, class_name), row in zip(matrix.keys, values.round(2).tolist()):
+        acct = matrix.accounts.get(account_id, {})
+        series.append(
+            {
+                "account_id": account_id,
+                "account_name": acct.get("FullyQualifiedName") or acct.get("Name"),
+                "account_type": acct.get("AccountType"),
+                "class": class_name or None,
+                "values": row,
+            }
+        )
+    return {
+        "history_start": _fmt_date(matrix.months[0]) if matrix.months else None,
+        "history_end": _fmt_date(matrix.months[-1]) if matrix.months else None,
+        "months": [_fmt_date(m) for m in matrix.future_months(horizon)],
+        "series": series,
+    }
+
+
+@user_dashboard_bp.get("/forecast")
+@jwt_required()
+def get_forecast():
+    """Forecast every account (and class) of the user's client.
+
+    Query: ``horizon`` (months, default 12), ``method`` (see
+    ``qb_app.forecast.METHODS``), ``by_class`` (default 1), ``client_id``.
+    Results are cached per data version, so repeat loads skip the model run
+    until the next sync writes new transactions.
+    """
+    from qb_app import forecast  # numpy; keep it out of app startup
+
+    horizon, method, error = forecast_query_args()
+    if error:
+        return error
+    by_class = (request.args.get("by_class") or "1").strip().lower() not in ("0", "false", "no")
+
+    try:
+        user_id = int(getattr(request, "user_id", 0) or 0)
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            client_id = client_id_for_user(cur, user_id, request.args.get("client_id"))
+            if client_id is None:
+                return jsonify({"error": "not_connected", "message": "Connect QuickBooks first"}), 404
+            version = data_version.get_version(cur, client_id)
+            conn.commit()
+            key = (client_id, method, horizon, by_class, version)
+            payload = _forecast_cache.get(key)
+            cached = payload is not None
+            if not cached:
+                matrix = forecast.load_matrix(conn, client_id, by_class=by_class)
+                values = forecast.forecast(matrix.values, horizon, method)
+                payload = _forecast_payload(matrix, values, horizon)
+                _forecast_cache.put(key, payload)
+        finally:
+            conn.close()
+        return jsonify(
+            dict(
+                payload,
+                client_id=client_id,
+                method=method,
+                horizon=horizon,
+                by_class=by_class,
+                data_version=version,
+                cached=cached,
+            )
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,134 @@
+"""What-if scenarios: sparse driver overrides on a client's base driver set.
+
+A scenario (``forecast_scenarios``) stores only the drivers it changes
+(``forecast_scenario_overrides``: driver name -> kind/params, or a driver
+that exists only in the scenario). It is evaluated with
+``DriverGraph.overlay``: the overridden drivers and their downstream
+subgraph are recomputed, everything else is the base graph's arrays, so
+comparing N scenarios costs N small subgraphs rather than N full graphs.
+
+Each save bumps the scenario's ``revision``; results are cached per
+(scenario, revision) on top of the base graph's data/driver versions.
+``base`` is the implicit scenario with no overrides.
+"""
+
+import datetime as dt
+import json
+from typing import Dict, Iterable, Optional
+
+from qb_app import drivers, storage
+
+
+BASE = "base"
+
+
+def ensure_scenario_tables(cur) -> None:
+    store = storage.get_storage()
+    store.ensure_table(
+        cur,
+        "forecast_scenarios",
+        """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        client_auth_id INT NOT NULL,
+        name NVARCHAR(100) NOT NULL,
+        description NVARCHAR(500) NULL,
+        revision INT NOT NULL DEFAULT 1,
+        created_at DATETIME NOT NULL DEFAULT GETUTCDATE(),
+        updated_at DATETIME NOT NULL DEFAULT GETUTCDATE()
+        """,
+        ("CREATE UNIQUE INDEX UX_forecast_scenarios_client_name ON forecast_scenarios (client_auth_id, name)",),
+    )
+    store.ensure_table(
+        cur,
+        "forecast_scenario_overrides",
+        """
+        scenario_id INT NOT NULL,
+        driver_name NVARCHAR(100) NOT NULL,
+        kind NVARCHAR(20) NOT NULL,
+        params NVARCHAR(MAX) NULL,
+        CONSTRAINT PK_forecast_scenario_overrides PRIMARY KEY (scenario_id, driver_name)
+        """,
+    )
+
+
+def validate_overrides(overrides) -> Dict[str, drivers.Definition]:
+    """``{driver: {"kind": ..., "params": {...}}}`` -> clean definitions (ValueError if bad)."""
+    if not isinstance(overrides, dict):
+        raise ValueError("'overrides' must map driver names to {kind, params}")
+    clean = {}
+    for name, spec in overrides.items():
+        if not isinstance(spec, dict):
+            raise ValueError(f"override {name!r} must be an object with kind and params")
+        clean[name] = (spec.get("kind"), drivers.validate(name, spec.get("kind"), spec.get("params")))
+    return clean
+
+
+def load_scenarios(cur, client_auth_id: int, names: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """Scenarios by name with their overrides (all, or just ``names``)."""
+    ensure_scenario_tables(cur)
+    sql = "SELECT id, name, description, revision, updated_at FROM forecast_scenarios WHERE client_auth_id = ?"
+    params: list = [int(client_auth_id)]
+    if names is not None:
+        names = [n for n in names if n != BASE]
+        if not names:
+            return {}
+        sql += f" AND name IN ({', '.join(['?'] * len(names))})"
+        params.extend(names)
+    cur.execute(sql, tuple(params))
+    scenarios = {
+        r[1]: {"id": int(r[0]), "name": r[1], "description": r[2], "revision": int(r[3]), "updated_at": r[4],
+               "overrides": {}}
+        for r in cur.fetchall()
+    }
+    if scenarios:
+        by_id = {s["id"]: s for s in scenarios.values()}
+        ids = list(by_id)
+        cur.execute(
+            f"SELECT scenario_id, driver_name, kind, params FROM forecast_scenario_overrides "
+            f"WHERE scenario_id IN ({', '.join(['?'] * len(ids))})",
+            tuple(ids),
+        )
+        for scenario_id, driver_name, kind, raw in cur.fetchall():
+            by_id[int(scenario_id)]["overrides"][driver_name] = (kind, json.loads(raw or "{}"))
+    return scenarios
+
+
+def save_scenario(cur, client_auth_id: int, name: str, description: Optional[str],
+                  overrides: Dict[str, drivers.Definition]) -> int:
+    """Create or replace a scenario's overrides (no commit); returns its new revision."""
+    ensure_scenario_tables(cur)
+    cid = int(client_auth_id)
+    cur.execute(
+        """
+        UPDATE forecast_scenarios SET revision = revision + 1, description = ?, updated_at = ?
+        WHERE client_auth_id = ? AND name = ?
+        """,
+        (description, dt.datetime.utcnow(), cid, name),
+    )
+    if cur.rowcount == 0:
+        cur.execute(
+            "INSERT INTO forecast_scenarios (client_auth_id, name, description, revision) VALUES (?, ?, ?, 1)",
+            (cid, name, description),
+        )
+    cur.execute("SELECT id, revision FROM forecast_scenarios WHERE client_auth_id = ? AND name = ?", (cid, name))
+    scenario_id, revision = cur.fetchone()
+    cur.execute("DELETE FROM forecast_scenario_overrides WHERE scenario_id = ?", (int(scenario_id),))
+    if overrides:
+        cur.executemany(
+            "INSERT INTO forecast_scenario_overrides (scenario_id, driver_name, kind, params) VALUES (?, ?, ?, ?)",
+            [(int(scenario_id), d, kind, json.dumps(params)) for d, (kind, params) in overrides.items()],
+        )
+    return int(revision)
+
+
+def delete_scenario(cur, client_auth_id: int, name: str) -> bool:
+    ensure_scenario_tables(cur)
+    cur.execute(
+        "SELECT id FROM forecast_scenarios WHERE client_auth_id = ? AND name = ?", (int(client_auth_id), name)
+    )
+    row = cur.fetchone()
+    if not row:
+        return False
+    cur.execute("DELETE FROM forecast_scenario_overrides WHERE scenario_id = ?", (int(row[0]),))
+    cur.execute("DELETE FROM forecast_scenarios WHERE id = ?", (int(row[0]),))
+    return True
@@ -1,18 +1,21 @@
 import os
+import logging
 import traceback
-import datetime
-from datetime import datetime, timezone
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
 import time
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from qb_app import qb_token_refresh, daily_qb_sync
+from qb_app.db import get_connection
+from qb_app import applog, telemetry
 
 
-def _log(msg: str) -> None:
-    try:
-        print(msg, flush=True)
-    except Exception:
-        pass
+_logger = applog.get_logger("qb_app.scheduler")
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
 
 
 def _run_with_retries(fn, name: str, tries: int = 5, backoff_sec: int = 20) -> None:
@@ -20,55 +23,201 @@ def _run_with_retries(fn, name: str, tries: int = 5, backoff_sec: int = 20) -> N
     for attempt in range(1, tries + 1):
         try:
             fn()
-            _log(f"[scheduler][{name}] done (attempt {attempt})")
-            try:
-                print(f"[scheduler][{name}] done (attempt {attempt})", flush=True)
-            except Exception:
-                pass
+            _log(f"[scheduler][{name}] done", job=name, attempt=attempt)
             return
         except Exception as e:  # noqa: BLE001
-            _log(f"[scheduler][{name}] error on attempt {attempt}: {e}\n{traceback.format_exc()}")
+            telemetry.incr("errors")
+            delay = backoff_sec * attempt
+            _log(
+                f"[scheduler][{name}] error: {e}\n{traceback.format_exc()}",
+                logging.ERROR, job=name, attempt=attempt, retry_in_seconds=delay if attempt < tries else None,
+            )
             if attempt < tries:
-                delay = backoff_sec * attempt
-                try:
-                    print(f"[scheduler][{name}] retrying in {delay}s", flush=True)
-                except Exception:
-                    pass
                 time.sleep(delay)
             else:
-                _log(f"[scheduler][{name}] giving up after {tries} attempts")
+                _log(f"[scheduler][{name}] giving up after {tries} attempts", logging.ERROR, job=name)
 
 
 def job_token_refresh() -> None:
+    from qb_app import qb_token_refresh
+
     start = datetime.now(timezone.utc).isoformat()
-    _log(f"[scheduler][token_refresh] start {start}")
-    # Explicit visibility in container logs
+    _log(f"[scheduler][token_refresh] start {start}", job="token_refresh")
+    with telemetry.record_run("token_refresh"):
+        _run_with_retries(lambda: qb_token_refresh.main(None), "token_refresh")
+
+
+def _stagger_mode() -> str:
+    """hash (default), timezone, or off (legacy single batch)."""
+    return (os.getenv("DAILY_SYNC_STAGGER_MODE", "hash") or "hash").strip().lower()
+
+
+def _window_seconds() -> int:
+    return int(os.getenv("DAILY_SYNC_WINDOW_MINUTES", "180") or 180) * 60
+
+
+def slot_delay_seconds(client_id: int, window_seconds: int) -> int:
+    """Stable per-client offset within the window (same slot every day)."""
+    return zlib.crc32(f"daily_sync:{int(client_id)}".encode()) % max(int(window_seconds), 1)
+
+
+def timezone_delay_seconds(client_id: int, tz_name: Optional[str], now: datetime) -> Optional[int]:
+    """Seconds until DAILY_SYNC_LOCAL_HOUR in the client's timezone, plus jitter.
+
+    Returns None when the timezone is missing or unknown.
+    """
+    if not tz_name:
+        return None
     try:
-        print("[scheduler][token_refresh] start", flush=True)
+        tz = ZoneInfo(tz_name.strip())
     except Exception:
-        pass
-    _run_with_retries(lambda: qb_token_refresh.main(None), "token_refresh")
+        return None
+    local_hour = int(os.getenv("DAILY_SYNC_LOCAL_HOUR", "3") or 3)
+    jitter = int(os.getenv("DAILY_SYNC_TZ_JITTER_MINUTES", "30") or 30) * 60
+    local_now = now.astimezone(tz)
+    target = local_now.replace(hour=local_hour, minute=0, second=0, microsecond=0)
+    if target <= local_now:
+        target += timedelta(days=1)
+    return int((target - local_now).total_seconds()) + slot_delay_seconds(client_id, jitter)
+
+
+def _active_clients_with_timezone() -> list:
+    """[(client_id, timezone or None)] for active clients."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        try:
+            # Timezone lives on the owning company: client_auth -> realm -> user -> company
+            cur.execute(
+                """
+                SELECT c.id, MAX(co.timezone) AS timezone
+                FROM client_auth c
+                LEFT JOIN quickbooks_tokens t ON t.realm_id = c.realm_id
+                LEFT JOIN companies co ON co.owner_id = t.user_id
+                WHERE c.active = 1
+                GROUP BY c.id
+                """
+            )
+        except Exception:
+            conn.rollback()
+            cur.execute("SELECT id, NULL AS timezone FROM client_auth WHERE active = 1")
+        return [(int(r[0]), r[1]) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def _plan_daily_sync() -> None:
+    """Enqueue one daily_sync job per active client at its staggered slot."""
+    from qb_app import job_runner
+
+    mode = _stagger_mode()
+    window = _window_seconds()
+    now = datetime.now(timezone.utc)
+    planned = 0
+    for client_id, tz_name in _active_clients_with_timezone():
+        delay = timezone_delay_seconds(client_id, tz_name, now) if mode == "timezone" else None
+        if delay is None:
+            delay = slot_delay_seconds(client_id, window)
+        _job_id, created = job_runner.enqueue("daily_sync", client_id, delay_seconds=delay)
+        planned += int(created)
+    _log(f"[scheduler][daily_sync] planned {planned} client jobs ({mode}, window {window // 60}m)")
 
 
 def job_daily_sync() -> None:
+    from qb_app import daily_qb_sync, forecast_refresh
+
     start = datetime.now(timezone.utc).isoformat()
     _log(f"[scheduler][daily_sync] start {start}")
-    # Explicit visibility in container logs
+    with telemetry.record_run("daily_sync"):
+        if _stagger_mode() == "off":
+            _run_with_retries(lambda: daily_qb_sync.main(None), "daily_sync")
+            if forecast_refresh.REFRESH_ENABLED:
+                job_forecast_refresh()  # the batch is done; refresh whatever it changed
+            return
+        # Only the planning step retries here; each client job retries on its own
+        # (and queues its client's forecast_refresh job once it succeeds)
+        _run_with_retries(_plan_daily_sync, "daily_sync")
+
+
+def job_daily_sync_report() -> None:
+    """Email the summary of per-client daily_sync jobs from the last 24h."""
+    from qb_app import daily_qb_sync, job_runner
+
+    def _report():
+        results = []
+        for job in job_runner.list_jobs("daily_sync", since_hours=24):
+            job_results = (job.get("progress") or {}).get("results") or []
+            if job.get("status") == "failed" and not job_results:
+                err = (job.get("last_error") or "").strip().splitlines()
+                job_results = [{
+                    "client_id": job.get("client_id"),
+                    "client_name": f"Client {job.get('client_id')}",
+                    "status": "failed",
+                    "runtime_seconds": 0,
+                    "message": err[0] if err else "failed",
+                }]
+            results.extend(job_results)
+        daily_qb_sync.send_sync_report(logging.getLogger("azure"), results)
+
+    with telemetry.record_run("daily_sync_report"):
+        _run_with_retries(_report, "daily_sync_report")
+
+
+def job_forecast_refresh() -> None:
+    """Recompute stored forecasts for clients whose data changed since the last run."""
+    from qb_app import forecast_refresh
+
+    with telemetry.record_run("forecast_refresh"):
+        # Restartable: a retry skips the clients the failed attempt finished
+        # Always pooled: this runs on a web worker's scheduler thread
+        _run_with_retries(lambda: forecast_refresh.run(pool=True), "forecast_refresh", tries=3)
+
+
+def _ensure_app_indexes() -> None:
+    from qb_app import storage
+
+    store = storage.get_storage()
+    conn = get_connection()
     try:
-        print("[scheduler][daily_sync] start", flush=True)
-    except Exception:
-        pass
-    _run_with_retries(lambda: daily_qb_sync.main(None), "daily_sync")
+        cur = conn.cursor()
+        for table, ddl in storage.APP_INDEXES:
+            if store.table_exists(cur, table):
+                store.ensure_index(cur, table, ddl, online=True)
+                conn.commit()
+    finally:
+        conn.close()
 
 
-def _start_scheduler() -> None:
-    if os.getenv("SCHEDULER_DISABLED", "0") == "1":
-        _log("[scheduler] disabled by env")
-        return
+def job_ensure_indexes() -> None:
+    """Build missing APP_INDEXES once per leader start (online, so syncs keep writing)."""
+    with telemetry.record_run("ensure_indexes"):
+        _run_with_retries(_ensure_app_indexes, "ensure_indexes", tries=3)
+
+
+SCHEDULER = None  # BackgroundScheduler while this process is the leader
+_LEASE = None
+
+
+def is_leader() -> bool:
+    """True when this process currently owns the scheduler lease."""
+    if _LEASE is None:
+        return SCHEDULER is not None
+    return _LEASE.is_leader()
+
+
+def _build_scheduler(preview: bool = False):
+    from apscheduler.schedulers.background import BackgroundScheduler
 
-    # Only start one scheduler per process; configure misfire handling so jobs
-    # still run shortly after container cold start. Coalesce avoids bursts.
+    # Configure misfire handling so jobs still run shortly after container
+    # cold start or leader failover. Coalesce avoids bursts.
+    options = {}
+    if preview:
+        # Never started; silence "Adding job tentatively" on every health check
+        quiet = logging.getLogger("qb_app.scheduler.preview")
+        quiet.setLevel(logging.WARNING)
+        options["logger"] = quiet
     sched = BackgroundScheduler(
+        **options,
         timezone="UTC",
         job_defaults={
             "misfire_grace_time": int(os.getenv("MISFIRE_GRACE_SECONDS", "3600") or 3600),
@@ -77,7 +226,7 @@ def _start_scheduler() -> None:
         },
     )
     # Hourly token refresh
-    j_refresh = sched.add_job(
+    sched.add_job(
         job_token_refresh,
         trigger="interval",
         minutes=int(os.getenv("TOKEN_REFRESH_INTERVAL_MIN", "60") or 60),
@@ -89,7 +238,7 @@ def _start_scheduler() -> None:
     # Daily sync at 03:00 UTC by default
     hour = int(os.getenv("DAILY_SYNC_HOUR_UTC", "3") or 3)
     minute = int(os.getenv("DAILY_SYNC_MINUTE_UTC", "0") or 0)
-    j_daily = sched.add_job(
+    sched.add_job(
         job_daily_sync,
         trigger="cron",
         hour=hour,
@@ -99,34 +248,139 @@ def _start_scheduler() -> None:
         max_instances=1,
         coalesce=True,
     )
+    if _stagger_mode() != "off":
+        # Summary email once the staggered client jobs have had time to run
+        default_delay = 1410 if _stagger_mode() == "timezone" else _window_seconds() // 60 + 30
+        delay = int(os.getenv("DAILY_SYNC_REPORT_DELAY_MINUTES", str(default_delay)) or default_delay)
+        at = (hour * 60 + minute + delay) % 1440
+        sched.add_job(
+            job_daily_sync_report,
+            trigger="cron",
+            hour=at // 60,
+            minute=at % 60,
+            id="daily_sync_report",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
     # Heartbeat every 30 minutes for visibility in Log Stream
     def heartbeat():
         try:
-            print(f"[heartbeat] Scheduler running - {datetime.datetime.utcnow().isoformat()} UTC", flush=True)
+            _log(f"[heartbeat] Scheduler running - {datetime.now(timezone.utc).isoformat()} UTC", logging.DEBUG)
         except Exception:
             pass
-    j_heartbeat = sched.add_job(heartbeat, "interval", minutes=30, id="heartbeat", replace_existing=True)
+    sched.add_job(heartbeat, "interval", minutes=30, id="heartbeat", replace_existing=True)
+    if not preview:
+        # One-off, on the scheduler's pool: an index build never blocks a request or the lease
+        sched.add_job(job_ensure_indexes, id="ensure_indexes", replace_existing=True)
+    return sched
+
+
+def job_schedule(last_started: Optional[dict] = None) -> list:
+    """Next run time of each scheduled job.
+
+    Exact (from the live APScheduler jobs) in the leader process. Elsewhere
+    it is derived from the configured triggers, with interval jobs projected
+    from their last recorded start in ``last_started`` ({job_id: datetime}).
+    """
+    now = datetime.now(timezone.utc)
+    sched = SCHEDULER
+    exact = sched is not None
+    if sched is None:
+        sched = _build_scheduler(preview=True)  # not started; used only for its triggers
+    out = []
+    for job in sched.get_jobs():
+        if job.id in ("heartbeat", "ensure_indexes"):
+            continue
+        if exact:
+            nxt = job.next_run_time
+        else:
+            interval = getattr(job.trigger, "interval", None)
+            last = (last_started or {}).get(job.id)
+            if interval is not None and last is not None:
+                nxt = last + interval
+                while nxt <= now:
+                    nxt += interval
+            else:
+                nxt = job.trigger.get_next_fire_time(None, now)
+        out.append({"id": job.id, "next_run": nxt.isoformat() if nxt else None, "exact": exact})
+    return out
+
+
+def _on_elected() -> None:
+    global SCHEDULER
+    if SCHEDULER is not None:
+        return
+    sched = _build_scheduler()
     sched.start()
+    SCHEDULER = sched
     # Log next planned runs for visibility
     try:
-        if j_refresh and j_refresh.next_run_time:
-            print(f"[scheduler] token_refresh next: {j_refresh.next_run_time.isoformat()}", flush=True)
-        if j_daily and j_daily.next_run_time:
-            print(f"[scheduler] daily_sync  next: {j_daily.next_run_time.isoformat()}", flush=True)
+        for job in sched.get_jobs():
+            if job.next_run_time and job.id != "heartbeat":
+                _log(f"[scheduler] {job.id} next: {job.next_run_time.isoformat()}", job=job.id)
     except Exception:
         pass
     _log("[scheduler] started (token_refresh interval, daily_sync cron, heartbeat interval)")
-    try:
-        print("[scheduler] started (token_refresh interval, daily_sync cron, heartbeat interval)", flush=True)
-    except Exception:
-        pass
 
 
-# Start scheduler on import
-try:
-    _start_scheduler()
-except Exception as e:  # noqa: BLE001
-    _log(f"[scheduler] failed to start: {e}\n{traceback.format_exc()}")
+def _on_revoked() -> None:
+    global SCHEDULER
+    sched, SCHEDULER = SCHEDULER, None
+    if sched is not None:
+        try:
+            # Running jobs finish; nothing new is scheduled here
+            sched.shutdown(wait=False)
+        except Exception:
+            pass
+        _log("[scheduler] stopped (leadership lost)")
+
+
+def _start_scheduler() -> None:
+    """Campaign for the scheduler lease; only the leader runs the jobs.
 
+    Every gunicorn worker/container calls this, but the APScheduler instance
+    is created only in the process holding the ``scheduler`` lease in SQL.
+    If the leader dies, another process takes over within about
+    SCHEDULER_LEASE_TTL_SECONDS.
+    """
+    global _LEASE
+    if os.getenv("SCHEDULER_DISABLED", "0") == "1":
+        _log("[scheduler] disabled by env")
+        return
+    if _LEASE is not None:
+        return
+
+    if os.getenv("SCHEDULER_LEADER_ELECTION", "1") == "0":
+        # Single-process deployments (local dev) can skip the SQL lease
+        _on_elected()
+        return
+
+    from qb_app.leader import LeaderLease
+
+    _LEASE = LeaderLease(
+        "scheduler",
+        ttl_seconds=int(os.getenv("SCHEDULER_LEASE_TTL_SECONDS", "15") or 15),
+        renew_seconds=int(os.getenv("SCHEDULER_LEASE_RENEW_SECONDS", "5") or 5),
+        on_elected=_on_elected,
+        on_revoked=_on_revoked,
+    )
+    _LEASE.start()
+    _log("[scheduler] campaigning for leadership")
+
+
+def start() -> None:
+    """Start this process's scheduler campaign; never raises (see create_app)."""
+    try:
+        _start_scheduler()
+    except Exception as e:  # noqa: BLE001
+        _log(f"[scheduler] failed to start: {e}\n{traceback.format_exc()}")
 
 
+def stop() -> None:
+    """Release the lease (if held) and stop the scheduler, e.g. on worker exit."""
+    global _LEASE
+    lease, _LEASE = _LEASE, None
+    if lease is not None:
+        lease.stop()  # leadership passes to another process without waiting for the TTL
+    _on_revoked()
@@ -0,0 +1,523 @@
+"""Storage backends behind ``qb_app.db.get_connection``.
+
+``STORAGE_BACKEND`` selects the engine:
+
+- ``azure_sql`` (default): pyodbc + ODBC Driver 18 against Azure SQL
+- ``sqlite``: a local SQLite file (``SQLITE_PATH``) for benchmarks, load
+  tests and offline development. Statements written in T-SQL are rewritten
+  on the fly (GETUTCDATE/DATEADD, TOP -> LIMIT, OUTPUT inserted -> RETURNING,
+  YEAR/MONTH/DATEFROMPARTS, ``dbo.``/bracket quoting, table hints,
+  IDENTITY/NVARCHAR(MAX) in DDL) and the core tables that Azure SQL already
+  has are created on first use.
+
+Code that needs dialect-specific SQL (DDL, upserts, existence probes) goes
+through the helpers on the active backend instead of writing T-SQL inline::
+
+    store = storage.get_storage()
+    store.ensure_table(cur, "job_run_log", "id INT IDENTITY(1,1) PRIMARY KEY, ...")
+    if store.table_exists(cur, "app_admins"): ...
+    store.upsert(cur, "qb_accounts", ("client_auth_id", "Id"), row)
+"""
+
+import abc
+import datetime as dt
+import decimal
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+BACKEND = (os.getenv("STORAGE_BACKEND") or "azure_sql").strip().lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH") or os.path.join(tempfile.gettempdir(), "qb_app.sqlite3")
+# Load tests: add this much latency to every SQLite connect to approximate Azure SQL
+SQLITE_CONNECT_DELAY_MS = float(os.getenv("SQLITE_CONNECT_DELAY_MS", "0") or 0)
+
+
+def _bare(table: str) -> str:
+    """``[dbo].[x]`` / ``dbo.x`` -> ``x``."""
+    return table.replace("[", "").replace("]", "").split(".")[-1]
+
+
+_CREATE_INDEX_RE = re.compile(r"(?i)^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+(\w+)")
+
+
+def _index_name(index_ddl: str) -> str:
+    return _CREATE_INDEX_RE.match(index_ddl).group(2)
+
+
+def _if_not_exists(index_ddl: str) -> str:
+    return _CREATE_INDEX_RE.sub(r"CREATE \1INDEX IF NOT EXISTS \2", index_ddl, count=1)
+
+
+class Storage(abc.ABC):
+    """Dialect-specific helpers shared by all backends."""
+
+    name = ""
+
+    @abc.abstractmethod
+    def connect(self):
+        """A new DB-API connection to this backend."""
+
+    @abc.abstractmethod
+    def table_exists(self, cur, table: str) -> bool:
+        """True when ``table`` exists."""
+
+    @abc.abstractmethod
+    def columns(self, cur, table: str) -> List[str]:
+        """Column names of ``table``."""
+
+    @abc.abstractmethod
+    def ensure_table(self, cur, table: str, columns_ddl: str, indexes: Sequence[str] = ()) -> None:
+        """Create ``table`` (T-SQL column list) and its ``CREATE INDEX`` statements if missing."""
+
+    @abc.abstractmethod
+    def add_column(self, cur, table: str, column: str, sqltype: str = "NVARCHAR(MAX) NULL") -> bool:
+        """Add ``column`` unless it exists; returns True when added."""
+
+    @abc.abstractmethod
+    def ensure_index(self, cur, table: str, index_ddl: str, online: bool = False) -> None:
+        """Run a ``CREATE INDEX`` on an existing table unless that index exists.
+
+        ``online`` builds it without blocking writers where the backend can.
+        """
+
+    @abc.abstractmethod
+    def upsert(self, cur, table: str, keys: Sequence[str], row: Dict[str, object]) -> None:
+        """Update the row matching ``keys`` or insert it."""
+
+
+class AzureSqlStorage(Storage):
+    name = "azure_sql"
+
+    def connect(self):
+        import pyodbc  # only needed for Azure SQL
+        from qb_app.db import _build_connection_string
+
+        return pyodbc.connect(_build_connection_string())
+
+    def table_exists(self, cur, table: str) -> bool:
+        cur.execute("SELECT CASE WHEN OBJECT_ID(?, 'U') IS NULL THEN 0 ELSE 1 END", (f"dbo.{_bare(table)}",))
+        row = cur.fetchone()
+        return bool(row and row[0])
+
+    def columns(self, cur, table: str) -> List[str]:
+        cur.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?", (_bare(table),))
+        return [r[0] for r in cur.fetchall()]
+
+    def ensure_table(self, cur, table: str, columns_ddl: str, indexes: Sequence[str] = ()) -> None:
+        name = _bare(table)
+        body = "".join(f"  {ix};\n" for ix in indexes)
+        cur.execute(
+            f"IF OBJECT_ID('dbo.{name}','U') IS NULL\nBEGIN\n  CREATE TABLE {name} ({columns_ddl});\n{body}END"
+        )
+
+    def add_column(self, cur, table: str, column: str, sqltype: str = "NVARCHAR(MAX) NULL") -> bool:
+        name = _bare(table)
+        cur.execute(f"SELECT COL_LENGTH('{name}', '{column}')")
+        row = cur.fetchone()
+        if row and row[0] is not None:
+            return False
+        cur.execute(f"ALTER TABLE {name} ADD [{column}] {sqltype}")
+        return True
+
+    def ensure_index(self, cur, table: str, index_ddl: str, online: bool = False) -> None:
+        name = _bare(table)
+        index = _index_name(index_ddl)
+        cur.execute(
+            f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{index}' AND object_id = OBJECT_ID('dbo.{name}'))\n"
+            f"  {index_ddl}{' WITH (ONLINE = ON)' if online else ''}"
+        )
+
+    def upsert(self, cur, table: str, keys: Sequence[str], row: Dict[str, object]) -> None:
+        cols = list(row.keys())
+        vals = [row[c] for c in cols]
+        on = " AND ".join(f"target.[{k}] = src.[{k}]" for k in keys)
+        updates = ", ".join(f"[{c}] = src.[{c}]" for c in cols if c not in keys)
+        col_list = ", ".join(f"[{c}]" for c in cols)
+        cur.execute(
+            f"""
+            MERGE {table} AS target
+            USING (SELECT {', '.join(['?'] * len(cols))}) AS src ({col_list})
+            ON {on}
+            {f'WHEN MATCHED THEN UPDATE SET {updates}' if updates else ''}
+            WHEN NOT MATCHED THEN
+                INSERT ({col_list}) VALUES ({', '.join(f'src.[{c}]' for c in cols)});
+            """,
+            tuple(vals),
+        )
+
+
+# ---- SQLite ----
+
+_KW = r"(?i)"
+_SIMPLE_RULES = [
+    (re.compile(_KW + r"\bWITH\s*\(\s*(?:UPDLOCK|READPAST|ROWLOCK|READCOMMITTED|NOLOCK|HOLDLOCK)"
+                      r"(?:\s*,\s*(?:UPDLOCK|READPAST|ROWLOCK|READCOMMITTED|NOLOCK|HOLDLOCK))*\s*\)"), ""),
+    (re.compile(_KW + r"\[dbo\]\.|\bdbo\."), ""),
+    (re.compile(r"\[([^\]\s]+)\]"), r'"\1"'),
+    (re.compile(r"\bN'"), "'"),
+    (re.compile(_KW + r"\b(?:GETUTCDATE|SYSUTCDATETIME|GETDATE|SYSDATETIME)\s*\(\s*\)"), "CURRENT_TIMESTAMP"),
+    (re.compile(_KW + r"\b(?:BIG)?INT\s+IDENTITY\s*\(\s*\d+\s*,\s*\d+\s*\)\s+PRIMARY\s+KEY"),
+     "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(_KW + r"\s*IDENTITY\s*\(\s*\d+\s*,\s*\d+\s*\)"), ""),
+    (re.compile(_KW + r"\bN?VARCHAR\s*\(\s*MAX\s*\)"), "TEXT"),
+    (re.compile(_KW + r"\bDATETIME2(?:\s*\(\s*\d+\s*\))?"), "DATETIME"),
+    (re.compile(_KW + r"\bLEN\s*\("), "LENGTH("),
+    (re.compile(_KW + r"\bISNULL\s*\("), "IFNULL("),
+]
+_DATEADD_RE = re.compile(_KW + r"\bDATEADD\s*\(")
+_DATE_UNITS = {"second": "seconds", "ss": "seconds", "minute": "minutes", "mi": "minutes", "hour": "hours",
+               "hh": "hours", "day": "days", "dd": "days", "month": "months", "mm": "months", "year": "years"}
+# Date-part functions as native SQLite expressions ({0}, {1}... are the arguments)
+_DATE_CALLS = {
+    "YEAR": "CAST(strftime('%Y', {0}) AS INTEGER)",
+    "MONTH": "CAST(strftime('%m', {0}) AS INTEGER)",
+    "DATEFROMPARTS": "printf('%04d-%02d-%02d', {0}, {1}, {2})",
+}
+_DATE_CALL_RE = re.compile(_KW + r"\b(YEAR|MONTH|DATEFROMPARTS)\s*\(")
+_TOP_RE = re.compile(_KW + r"\bSELECT(\s+DISTINCT)?\s+TOP\s*(?:\(\s*(\d+|\?)\s*\)|(\d+|\?))\s+")
+_OUTPUT_RE = re.compile(_KW + r"\bOUTPUT\s+((?:inserted\.\w+|inserted\.\*)(?:\s*,\s*(?:inserted\.\w+|inserted\.\*))*)")
+
+
+def _split_args(s: str, start: int):
+    """Split the argument list that opens at ``start`` (after '('); returns (args, end)."""
+    depth, args, cur, i = 0, [], start, start
+    while i < len(s):
+        ch = s[i]
+        if ch == "'":
+            i = s.index("'", i + 1)
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            if depth == 0:
+                args.append(s[cur:i])
+                return args, i
+            depth -= 1
+        elif ch == "," and depth == 0:
+            args.append(s[cur:i])
+            cur = i + 1
+        i += 1
+    raise ValueError("unbalanced parentheses")
+
+
+def _group_end(s: str, pos: int) -> int:
+    """Index of the ')' closing the group that contains ``pos`` (or len(s))."""
+    depth, i = 0, pos
+    while i < len(s):
+        ch = s[i]
+        if ch == "'":
+            i = s.index("'", i + 1)
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            if depth == 0:
+                return i
+            depth -= 1
+        i += 1
+    return len(s)
+
+
+def _rewrite_dateadd(s: str) -> str:
+    m = _DATEADD_RE.search(s)
+    while m:
+        args, end = _split_args(s, m.end())
+        unit = _DATE_UNITS.get(args[0].strip().lower(), args[0].strip().lower() + "s")
+        base = _rewrite_dateadd(args[2].strip())
+        repl = f"datetime({base}, ({args[1].strip()}) || ' {unit}')"
+        s = s[:m.start()] + repl + s[end + 1:]
+        m = _DATEADD_RE.search(s, m.start() + len(repl))
+    return s
+
+
+def _rewrite_date_calls(s: str) -> str:
+    m = _DATE_CALL_RE.search(s)
+    while m:
+        args, end = _split_args(s, m.end())
+        repl = _DATE_CALLS[m.group(1).upper()].format(*(_rewrite_date_calls(a.strip()) for a in args))
+        s = s[:m.start()] + repl + s[end + 1:]
+        m = _DATE_CALL_RE.search(s, m.start() + len(repl))
+    return s
+
+
+def _rewrite_top(s: str) -> str:
+    # Right to left so earlier offsets stay valid; LIMIT goes where the SELECT's group ends
+    for m in reversed(list(_TOP_RE.finditer(s))):
+        n = m.group(2) or m.group(3)
+        end = _group_end(s, m.end())
+        tail = s[m.end():end].rstrip().rstrip(";")
+        if "?" in s[m.end():end] and n == "?":
+            raise ValueError("TOP ? with later parameters is not supported on SQLite")
+        s = f"{s[:m.start()]}SELECT{m.group(1) or ''} {tail} LIMIT {n}{s[end:]}"
+    return s
+
+
+def _rewrite_output(s: str) -> str:
+    m = _OUTPUT_RE.search(s)
+    if not m:
+        return s
+    cols = re.sub(r"(?i)inserted\.", "", m.group(1))
+    s = (s[:m.start()] + s[m.end():]).rstrip().rstrip(";")
+    return f"{s} RETURNING {cols}"
+
+
+@lru_cache(maxsize=2048)
+def translate(sql: str) -> str:
+    """Rewrite the T-SQL subset this app uses into SQLite SQL."""
+    s = sql
+    for rx, repl in _SIMPLE_RULES:
+        s = rx.sub(repl, s)
+    s = _rewrite_dateadd(s)
+    s = _rewrite_date_calls(s)
+    s = _rewrite_top(s)
+    s = _rewrite_output(s)
+    return s
+
+
+def _adapt_datetime(v: dt.datetime) -> str:
+    if v.tzinfo is not None:
+        v = v.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return v.isoformat(" ")
+
+
+def _convert_datetime(b: bytes):
+    try:
+        return dt.datetime.fromisoformat(b.decode())
+    except ValueError:
+        return b.decode()
+
+
+sqlite3.register_adapter(dt.datetime, _adapt_datetime)
+sqlite3.register_adapter(dt.date, lambda v: v.isoformat())
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter("DATE", lambda b: dt.date.fromisoformat(b.decode()[:10]))
+sqlite3.register_converter("DATETIME", _convert_datetime)
+sqlite3.register_converter("TIMESTAMP", _convert_datetime)
+
+
+class SqliteCursor:
+    """sqlite3 cursor that accepts T-SQL and pyodbc-style calls."""
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self._cursor = cursor
+        self.fast_executemany = False  # pyodbc knob; accepted and ignored
+
+    @staticmethod
+    def _params(params: tuple):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            return tuple(params[0])
+        return params
+
+    def execute(self, sql: str, *params):
+        self._cursor.execute(translate(sql), self._params(params))
+        return self
+
+    def executemany(self, sql: str, seq_of_params: Iterable):
+        self._cursor.executemany(translate(sql), seq_of_params)
+        return self
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SqliteConnection:
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self._conn = conn
+
+    def cursor(self) -> SqliteCursor:
+        return SqliteCursor(self._conn.cursor())
+
+    def execute(self, sql: str, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def rollback(self) -> None:
+        self._conn.rollback()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+# Tables that exist in Azure SQL but are not created by the app itself
+CORE_TABLES = {
+    "users": """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        email NVARCHAR(255) NOT NULL UNIQUE,
+        company_name NVARCHAR(255) NULL,
+        password_hash NVARCHAR(255) NULL,
+        created_at DATETIME DEFAULT GETUTCDATE()
+    """,
+    "auth": """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        user_id INT NOT NULL,
+        jwt_token NVARCHAR(MAX) NOT NULL,
+        expires_at DATETIME NULL
+    """,
+    "client_auth": """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        client_name NVARCHAR(255) NULL,
+        realm_id NVARCHAR(100) NOT NULL,
+        access_token_enc NVARCHAR(MAX) NULL,
+        refresh_token_enc NVARCHAR(MAX) NULL,
+        token_expiry DATETIME NULL,
+        last_refresh DATETIME NULL,
+        last_run_time DATETIME NULL,
+        active BIT NOT NULL DEFAULT 1,
+        created_at DATETIME DEFAULT GETUTCDATE()
+    """,
+    "qb_transactions": """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        client_auth_id INT NOT NULL,
+        TxnId NVARCHAR(50), DocNumber NVARCHAR(100), TxnType NVARCHAR(50), TxnDate DATE,
+        TotalAmt DECIMAL(18,2), LineAmount DECIMAL(18,2), Currency NVARCHAR(10), ExchangeRate DECIMAL(18,6),
+        AccountName NVARCHAR(255), AccountId NVARCHAR(50), GLCode NVARCHAR(50), Class NVARCHAR(255),
+        Department NVARCHAR(255), Item NVARCHAR(255), TaxCode NVARCHAR(50), BillableStatus NVARCHAR(50),
+        LinkedTxnIds NVARCHAR(MAX), Customer NVARCHAR(255), Vendor NVARCHAR(255), AccountRef NVARCHAR(255),
+        Description NVARCHAR(MAX), Memo NVARCHAR(MAX), CreatedTime NVARCHAR(50), UpdatedTime NVARCHAR(50),
+        InsertedAt DATETIME
+    """,
+    "sync_run_log": """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        client_auth_id INT NULL,
+        client_name NVARCHAR(255) NULL,
+        status NVARCHAR(20) NULL,
+        message NVARCHAR(MAX) NULL,
+        runtime_seconds FLOAT NULL,
+        run_time DATETIME DEFAULT GETUTCDATE()
+    """,
+}
+_REFERENCE_TABLES = ("qb_accounts", "qb_classes", "qb_customers", "qb_employees", "qb_items", "qb_vendors")
+CORE_TABLES.update({t: "client_auth_id INT NOT NULL, Id NVARCHAR(50) NOT NULL" for t in _REFERENCE_TABLES})
+CORE_INDEXES = {
+    "auth": ("CREATE INDEX IX_auth_token ON auth (jwt_token)",),
+    "qb_transactions": (
+        "CREATE INDEX IX_qb_transactions_client ON qb_transactions (client_auth_id, TxnType, TxnId)",
+        "CREATE INDEX IX_qb_transactions_client_date ON qb_transactions (client_auth_id, TxnDate, id)",
+    ),
+    **{t: (f"CREATE UNIQUE INDEX UX_{t}_client_id ON {t} (client_auth_id, Id)",) for t in _REFERENCE_TABLES},
+}
+# Added after the Azure tables were live; the scheduler leader builds them at
+# startup (online), never a request. SQLite gets them from CORE_INDEXES.
+APP_INDEXES = (
+    ("qb_transactions", "CREATE INDEX IX_qb_transactions_client_date ON qb_transactions (client_auth_id, TxnDate, id)"),
+)
+
+
+class SqliteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH) -> None:
+        self.path = path
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def connect(self) -> SqliteConnection:
+        if SQLITE_CONNECT_DELAY_MS > 0:
+            time.sleep(SQLITE_CONNECT_DELAY_MS / 1000.0)
+        raw = sqlite3.connect(self.path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        raw.execute("PRAGMA busy_timeout = 30000")
+        conn = SqliteConnection(raw)
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    raw.execute("PRAGMA journal_mode = WAL")
+                    cur = conn.cursor()
+                    for table, ddl in CORE_TABLES.items():
+                        self.ensure_table(cur, table, ddl, CORE_INDEXES.get(table, ()))
+                    conn.commit()
+                    self._ready = True
+        return conn
+
+    def table_exists(self, cur, table: str) -> bool:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (_bare(table),))
+        return cur.fetchone() is not None
+
+    def columns(self, cur, table: str) -> List[str]:
+        cur.execute(f'PRAGMA table_info("{_bare(table)}")')
+        return [r[1] for r in cur.fetchall()]
+
+    def ensure_table(self, cur, table: str, columns_ddl: str, indexes: Sequence[str] = ()) -> None:
+        name = _bare(table)
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns_ddl})")
+        for ix in indexes:
+            cur.execute(_if_not_exists(ix))
+
+    def add_column(self, cur, table: str, column: str, sqltype: str = "NVARCHAR(MAX) NULL") -> bool:
+        if column in self.columns(cur, table):
+            return False
+        cur.execute(f'ALTER TABLE {_bare(table)} ADD COLUMN "{column}" {sqltype}')
+        return True
+
+    def ensure_index(self, cur, table: str, index_ddl: str, online: bool = False) -> None:
+        cur.execute(_if_not_exists(index_ddl))
+
+    def upsert(self, cur, table: str, keys: Sequence[str], row: Dict[str, object]) -> None:
+        name = _bare(table)
+        cols = list(row.keys())
+        sets = [c for c in cols if c not in keys]
+        where = " AND ".join(f'"{k}" = ?' for k in keys)
+        key_vals = tuple(row[k] for k in keys)
+        if sets:
+            assignments = ", ".join(f'"{c}" = ?' for c in sets)
+            cur.execute(f"UPDATE {name} SET {assignments} WHERE {where}", tuple(row[c] for c in sets) + key_vals)
+            if cur.rowcount > 0:
+                return
+        elif cur.execute(f"SELECT 1 FROM {name} WHERE {where}", key_vals).fetchone():
+            return
+        col_list = ", ".join(f'"{c}"' for c in cols)
+        cur.execute(
+            f"INSERT INTO {name} ({col_list}) VALUES ({', '.join(['?'] * len(cols))})",
+            tuple(row[c] for c in cols),
+        )
+
+
+_STORAGE: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    """The backend selected by STORAGE_BACKEND (created once per process)."""
+    global _STORAGE
+    if _STORAGE is None:
+        if BACKEND == "sqlite":
+            _STORAGE = SqliteStorage()
+        elif BACKEND in ("azure_sql", "azure", "mssql"):
+            _STORAGE = AzureSqlStorage()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {BACKEND}")
+    return _STORAGE
@@ -0,0 +1,230 @@
+"""Per-run telemetry for scheduled and queued jobs.
+
+Each run is recorded with start/end time, duration and counters (rows
+synced, API calls, errors). Runs are kept in an in-memory ring buffer for
+this process and persisted to ``job_run_log`` so any worker can report on
+runs executed elsewhere (e.g. by the scheduler leader).
+
+Code under a run increments counters with ``incr("api_calls")``; outside a
+run these calls are no-ops.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from qb_app import applog, metrics, storage
+from qb_app.db import get_connection, fetchall_dict
+
+
+_RING_SIZE = int(os.getenv("TELEMETRY_RING_SIZE", "500") or 500)
+_RING: deque = deque(maxlen=_RING_SIZE)
+_RING_LOCK = threading.Lock()
+_CURRENT = threading.local()
+_SCHEMA_READY = False
+
+COUNTERS = ("rows_synced", "api_calls", "errors")
+
+
+_logger = applog.get_logger("qb_app.telemetry")
+
+
+def _log(msg: str, level: int = logging.INFO, **fields) -> None:
+    _logger.log(level, msg, extra=fields)
+
+
+def ensure_run_log_table(cur) -> None:
+    storage.get_storage().ensure_table(
+        cur,
+        "job_run_log",
+        """
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        job_name NVARCHAR(100) NOT NULL,
+        client_id INT NULL,
+        host NVARCHAR(200) NULL,
+        started_at DATETIME NOT NULL,
+        ended_at DATETIME NOT NULL,
+        duration_ms INT NOT NULL,
+        status NVARCHAR(20) NOT NULL,
+        rows_synced INT NOT NULL DEFAULT 0,
+        api_calls INT NOT NULL DEFAULT 0,
+        errors INT NOT NULL DEFAULT 0,
+        error NVARCHAR(MAX) NULL
+        """,
+        indexes=("CREATE INDEX IX_job_run_log_job ON job_run_log (job_name, id)",),
+    )
+
+
+def incr(counter: str, n: int = 1) -> None:
+    """Add ``n`` to a counter of the run active on this thread (if any)."""
+    run = getattr(_CURRENT, "run", None)
+    if run is not None and n:
+        run["counters"][counter] = run["counters"].get(counter, 0) + int(n)
+
+
+def _persist(run: dict) -> None:
+    global _SCHEMA_READY
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        if not _SCHEMA_READY:
+            ensure_run_log_table(cur)
+            _SCHEMA_READY = True
+        c = run["counters"]
+        cur.execute(
+            """
+            INSERT INTO job_run_log (job_name, client_id, host, started_at, ended_at, duration_ms,
+                                     status, rows_synced, api_calls, errors, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                run["job"], run["client_id"], run["host"],
+                run["started_at"].replace(tzinfo=None), run["ended_at"].replace(tzinfo=None),
+                run["duration_ms"], run["status"],
+                c.get("rows_synced", 0), c.get("api_calls", 0), c.get("errors", 0),
+                (run.get("error") or "")[:4000] or None,
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def record_run(job: str, client_id: Optional[int] = None):
+    """Time the enclosed block as one run of ``job`` and record it."""
+    run = {
+        "job": job,
+        "client_id": int(client_id) if client_id is not None else None,
+        "host": f"{socket.gethostname()}:{os.getpid()}",
+        "started_at": datetime.now(timezone.utc),
+        "counters": {k: 0 for k in COUNTERS},
+        "status": "running",
+    }
+    outer = getattr(_CURRENT, "run", None)
+    _CURRENT.run = run
+    t0 = time.perf_counter()
+    try:
+        yield run
+        run["status"] = "error" if run["counters"].get("errors") else "ok"
+    except Exception as e:
+        run["status"] = "failed"
+        run["error"] = str(e)
+        run["counters"]["errors"] = run["counters"].get("errors", 0) + 1
+        raise
+    finally:
+        _CURRENT.run = outer
+        run["ended_at"] = datetime.now(timezone.utc)
+        run["duration_ms"] = int((time.perf_counter() - t0) * 1000)
+        metrics.JOB_RUN_SECONDS.observe(run["duration_ms"] / 1000.0, job=job, status=run["status"])
+        if outer is not None:
+            # Nested runs roll their counters up into the enclosing run
+            for k, v in run["counters"].items():
+                outer["counters"][k] = outer["counters"].get(k, 0) + v
+        with _RING_LOCK:
+            _RING.append(run)
+        try:
+            _persist(run)
+        except Exception as e:  # noqa: BLE001
+            _log(f"[telemetry] could not persist run {job}: {e}")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (None for an empty list)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(int(-(-pct * len(ordered) // 100)) - 1, 0)
+    return ordered[min(k, len(ordered) - 1)]
+
+
+def _summarize(runs: List[dict]) -> Dict[str, dict]:
+    """Group runs (newest first) by job and compute last-run info and p50/p95."""
+    out: Dict[str, dict] = {}
+    for r in runs:
+        s = out.setdefault(r["job"], {"runs": 0, "durations": [], "last": None, "failures": 0})
+        s["runs"] += 1
+        s["durations"].append(r["duration_ms"])
+        if r["status"] != "ok":
+            s["failures"] += 1
+        if s["last"] is None:
+            s["last"] = r
+    summary = {}
+    for job, s in out.items():
+        last = s["last"]
+        summary[job] = {
+            "runs": s["runs"],
+            "failures": s["failures"],
+            "p50_ms": percentile(s["durations"], 50),
+            "p95_ms": percentile(s["durations"], 95),
+            "last_run": {
+                "started_at": last["started_at"],
+                "ended_at": last["ended_at"],
+                "duration_ms": last["duration_ms"],
+                "status": last["status"],
+                "client_id": last.get("client_id"),
+                "rows_synced": last["counters"].get("rows_synced", 0),
+                "api_calls": last["counters"].get("api_calls", 0),
+                "errors": last["counters"].get("errors", 0),
+            },
+        }
+    return summary
+
+
+def recent_runs(limit: int = 50) -> List[dict]:
+    """Runs recorded by this process, newest first."""
+    with _RING_LOCK:
+        return list(reversed(_RING))[:limit]
+
+
+def job_stats(per_job: int = 50, days: int = 30) -> Dict[str, dict]:
+    """Stats over the last ``per_job`` runs of each job from job_run_log.
+
+    Falls back to this process's ring buffer if SQL is unavailable.
+    """
+    try:
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            ensure_run_log_table(cur)
+            cur.execute(
+                """
+                SELECT job_name, client_id, started_at, ended_at, duration_ms, status,
+                       rows_synced, api_calls, errors
+                FROM (
+                  SELECT *, ROW_NUMBER() OVER (PARTITION BY job_name ORDER BY id DESC) AS rn
+                  FROM job_run_log
+                  WHERE started_at >= DATEADD(DAY, -?, GETUTCDATE())
+                ) x
+                WHERE rn <= ?
+                ORDER BY job_name, rn
+                """,
+                (int(days), int(per_job)),
+            )
+            rows = fetchall_dict(cur)
+            conn.commit()
+        finally:
+            conn.close()
+        runs = [
+            {
+                "job": r["job_name"],
+                "client_id": r.get("client_id"),
+                "started_at": r["started_at"].replace(tzinfo=timezone.utc) if r.get("started_at") else None,
+                "ended_at": r["ended_at"].replace(tzinfo=timezone.utc) if r.get("ended_at") else None,
+                "duration_ms": int(r["duration_ms"] or 0),
+                "status": r["status"],
+                "counters": {k: int(r.get(k) or 0) for k in COUNTERS},
+            }
+            for r in rows
+        ]
+    except Exception as e:  # noqa: BLE001
+        _log(f"[telemetry] job_run_log unavailable, using in-memory runs: {e}")
+        with _RING_LOCK:
+            runs = list(reversed(_RING))
+    return _summarize(runs)
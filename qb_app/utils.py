@@ -4,6 +4,10 @@ from flask import request, jsonify
 
 from qb_app.routes_auth import jwt_required
 from qb_app.db import get_connection, fetchone_dict
+from qb_app import storage
+
+
+FORECAST_MAX_HORIZON = int(os.getenv("FORECAST_MAX_HORIZON", "36") or 36)
 
 
 def admin_required(fn):
@@ -54,19 +58,10 @@ def admin_required(fn):
                 # 3) Admin via app_admins table
                 if user_email:
                     try:
-                        cur.execute(
-                            """
-                            IF OBJECT_ID('dbo.app_admins','U') IS NULL
-                                SELECT 0
-                            ELSE
-                                SELECT CASE WHEN EXISTS (
-                                  SELECT 1 FROM app_admins WHERE LOWER(email) = LOWER(?)
-                                ) THEN 1 ELSE 0 END
-                            """,
-                            (user_email,),
-                        )
-                        r = cur.fetchone()
-                        is_admin_tbl = bool(r[0]) if r and r[0] is not None else False
+                        is_admin_tbl = False
+                        if storage.get_storage().table_exists(cur, "app_admins"):
+                            cur.execute("SELECT 1 FROM app_admins WHERE LOWER(email) = LOWER(?)", (user_email,))
+                            is_admin_tbl = cur.fetchone() is not None
                         conn.close()
                         if is_admin_tbl:
                             return fn(*args, **kwargs)
@@ -83,3 +78,59 @@ def admin_required(fn):
         return inner(*args, **kwargs)
 
     return wrapper
+
+
+def is_admin_request() -> bool:
+    """True if the current request would pass ``admin_required``.
+
+    For opt-in admin features on non-admin routes (e.g. ``?__profile=1``);
+    never produces an error response itself.
+    """
+    try:
+        return admin_required(lambda: True)() is True
+    except Exception:
+        return False
+
+
+def client_ids_for_user(cur, user_id: int) -> list:
+    """All client_auth ids linked to the user's QuickBooks realms."""
+    if not storage.get_storage().table_exists(cur, "quickbooks_tokens"):
+        return []
+    cur.execute(
+        """
+        SELECT DISTINCT c.id FROM client_auth c
+        JOIN quickbooks_tokens t ON t.realm_id = c.realm_id
+        WHERE t.user_id = ?
+        """,
+        (int(user_id),),
+    )
+    return [int(r[0]) for r in cur.fetchall() if r[0] is not None]
+
+
+def client_id_for_user(cur, user_id: int, requested=None):
+    """The client a data API call is about: ``requested`` if the user may see
+    it, else the user's most recently connected client. None if neither."""
+    allowed = client_ids_for_user(cur, user_id)
+    if requested not in (None, ""):
+        try:
+            requested = int(requested)
+        except (TypeError, ValueError):
+            return None
+        return requested if requested in allowed else None
+    return max(allowed) if allowed else None
+
+
+def forecast_query_args():
+    """``(horizon, method, error_response)`` from ``?horizon=&method=``."""
+    from qb_app import forecast  # numpy; only loaded by forecast routes
+
+    try:
+        horizon = int(request.args.get("horizon", 12))
+    except (TypeError, ValueError):
+        return None, None, (jsonify({"error": "horizon must be an integer"}), 400)
+    if not 1 <= horizon <= FORECAST_MAX_HORIZON:
+        return None, None, (jsonify({"error": f"horizon must be between 1 and {FORECAST_MAX_HORIZON}"}), 400)
+    method = (request.args.get("method") or "holt_winters").strip()
+    if method not in forecast.METHODS:
+        return None, None, (jsonify({"error": f"method must be one of {', '.join(forecast.METHODS)}"}), 400)
+    return horizon, method, None
@@ -0,0 +1,243 @@
+"""Budget vs actual variance over the monthly GL cube.
+
+For each client, actuals come from ``gl_monthly`` (``forecast.load_matrix``)
+and budgets from ``budget_lines`` (``qb_app.budgets``), each as an
+accounts x months matrix. The two are joined on a shared account index, so
+actual, budget and variance are whole-matrix operations. Rows then roll up
+the chart of accounts using the client's nested-set hierarchy
+(``qb_app.account_hierarchy``): accounts are laid out in preorder, so every
+node's subtotal is one slice of a prefix sum, whatever its depth. Several
+clients (entities) consolidate by adding their trees path by path.
+
+    r = report(conn, {client_id: {"id": budget_id}}, month_range(start, end))
+"""
+
+import datetime as dt
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from qb_app import account_hierarchy, budgets, forecast
+
+
+MAX_MONTHS = 60
+# Classification whose favorable variance is spending less than budget
+UNDER_IS_FAVORABLE = ("Expense",)
+OVER_IS_FAVORABLE = ("Revenue",)
+
+
+def _month_index(d: dt.date) -> int:
+    return d.year * 12 + d.month - 1
+
+
+def month_range(start: dt.date, end: dt.date) -> List[dt.date]:
+    first, last = _month_index(start), _month_index(end)
+    return [dt.date(i // 12, i % 12 + 1, 1) for i in range(first, last + 1)]
+
+
+def actual_matrix(conn, client_auth_id: int, months: List[dt.date]) -> Tuple[List[str], np.ndarray, Dict[str, dict]]:
+    """(AccountIds, accounts x months actuals, qb_accounts fields) for ``months``."""
+    m = forecast.load_matrix(conn, client_auth_id, start=months[0], end=months[-1])
+    ids = [account_id for account_id, _ in m.keys]
+    values = np.zeros((len(ids), len(months)))
+    if m.months:
+        offset = _month_index(m.months[0]) - _month_index(months[0])
+        values[:, offset:offset + len(m.months)] = m.values
+    return ids, values, m.accounts
+
+
+def budget_matrix(lines: Sequence[budgets.Line], months: List[dt.date]) -> Tuple[List[str], np.ndarray]:
+    first = _month_index(months[0])
+    index: Dict[str, int] = {}
+    rows = np.fromiter((index.setdefault(a, len(index)) for a, _, _ in lines), dtype=np.int64, count=len(lines))
+    cols = np.fromiter((_month_index(m) - first for _, m, _ in lines), dtype=np.int64, count=len(lines))
+    values = np.zeros((len(index), len(months)))
+    np.add.at(values, (rows, cols), np.fromiter((v for _, _, v in lines), dtype=float, count=len(lines)))
+    return list(index), values
+
+
+def join(actual_ids: List[str], actual: np.ndarray, budget_ids: List[str],
+         budget: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Align both matrices on one account index (accounts in either)."""
+    index = {a: i for i, a in enumerate(actual_ids)}
+    ids = list(actual_ids)
+    for b in budget_ids:
+        if b not in index:
+            index[b] = len(ids)
+            ids.append(b)
+    a = np.zeros((len(ids), actual.shape[1]))
+    a[:len(actual_ids)] = actual
+    b = np.zeros_like(a)
+    if budget_ids:
+        b[np.fromiter((index[x] for x in budget_ids), dtype=np.int64, count=len(budget_ids))] = budget
+    return ids, a, b
+
+
+class Rollup:
+    """Account tree nodes (ordered parent first) with actual and budget per month."""
+
+    __slots__ = ("nodes", "actual", "budget")
+
+    def __init__(self, nodes: List[dict], actual: np.ndarray, budget: np.ndarray) -> None:
+        self.nodes = nodes  # path, name, depth, parent, account_id, classification
+        self.actual = actual
+        self.budget = budget
+
+
+def _ordered(nodes: List[dict], actual: np.ndarray, budget: np.ndarray) -> Rollup:
+    order = sorted(range(len(nodes)), key=lambda i: nodes[i]["path"].split(":"))
+    return Rollup([nodes[i] for i in order], actual[order], budget[order])
+
+
+def _subtotals(values: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Sum of ``values[start:end]`` per node, from one prefix sum in whole cents."""
+    cents = np.zeros((len(values) + 1, values.shape[1]), dtype=np.int64)
+    np.cumsum(np.rint(values * 100).astype(np.int64), axis=0, out=cents[1:])
+    return (cents[end] - cents[start]) / 100
+
+
+def rollup(ids: List[str], tree: List[dict], actual: np.ndarray, budget: np.ndarray) -> Rollup:
+    """Roll account rows up the nested-set ``tree`` (``account_hierarchy.load``).
+
+    Rows sit at their account's preorder position, so a node's subtotal is
+    the range ``[lft, rgt]`` of a prefix sum. Accounts missing from the tree
+    are added as roots; nodes with nothing under them are left out.
+    """
+    tree = list(tree)
+    pos = {node["account_id"]: i for i, node in enumerate(tree)}
+    top = max((n["rgt"] for n in tree), default=0)  # the last preorder row is a leaf, not the last root
+    for account_id in ids:
+        if account_id not in pos:
+            pos[account_id] = len(tree)
+            top += 2
+            name = f"Account {account_id}"
+            tree.append({"account_id": account_id, "parent_id": None, "name": name, "path": name,
+                         "classification": None, "depth": 0, "lft": top - 1, "rgt": top})
+    rows = np.fromiter((pos[a] for a in ids), dtype=np.int64, count=len(ids))
+    leaf_actual = np.zeros((len(tree), actual.shape[1]))
+    leaf_budget = np.zeros_like(leaf_actual)
+    np.add.at(leaf_actual, rows, actual)
+    np.add.at(leaf_budget, rows, budget)
+    lft = np.fromiter((n["lft"] for n in tree), dtype=np.int64, count=len(tree))
+    rgt = np.fromiter((n["rgt"] for n in tree), dtype=np.int64, count=len(tree))
+    start = np.arange(len(tree))
+    end = np.searchsorted(lft, rgt, side="right")
+    present = np.zeros((len(tree), 1))
+    present[rows] = 1
+    keep = np.flatnonzero(_subtotals(present, start, end)[:, 0] > 0)
+    paths = {n["account_id"]: n["path"] for n in tree}
+    nodes = [
+        {
+            "path": tree[i]["path"],
+            "name": tree[i]["name"],
+            "depth": tree[i]["depth"],
+            "parent": paths.get(tree[i]["parent_id"]),
+            "account_id": tree[i]["account_id"],
+            "classification": tree[i]["classification"],
+        }
+        for i in keep
+    ]
+    return Rollup(nodes, _subtotals(leaf_actual, start, end)[keep], _subtotals(leaf_budget, start, end)[keep])
+
+
+def consolidate(rollups: Sequence[Rollup]) -> Rollup:
+    """Add several clients' trees path by path (account ids differ per client, so they are dropped)."""
+    node_ix: Dict[str, int] = {}
+    nodes: List[dict] = []
+    positions = []
+    for r in rollups:
+        pos = []
+        for node in r.nodes:
+            j = node_ix.get(node["path"])
+            if j is None:
+                j = node_ix[node["path"]] = len(nodes)
+                nodes.append(dict(node, account_id=None))
+            elif not nodes[j]["classification"]:
+                nodes[j]["classification"] = node["classification"]
+            pos.append(j)
+        positions.append(np.array(pos, dtype=np.int64))
+    width = rollups[0].actual.shape[1] if rollups else 0
+    actual = np.zeros((len(nodes), width))
+    budget = np.zeros_like(actual)
+    for r, pos in zip(rollups, positions):
+        actual[pos] += r.actual  # paths are unique within one tree
+        budget[pos] += r.budget
+    return _ordered(nodes, actual, budget)
+
+
+def client_rollup(conn, client_auth_id: int, budget_id: Optional[int], months: List[dt.date]) -> Rollup:
+    actual_ids, actual, _ = actual_matrix(conn, client_auth_id, months)
+    cur = conn.cursor()
+    lines = budgets.load_lines(cur, budget_id, months[0], months[-1]) if budget_id else []
+    account_hierarchy.ensure_built(cur, client_auth_id)
+    tree = account_hierarchy.load(cur, client_auth_id)
+    conn.commit()
+    budget_ids, budget = budget_matrix(lines, months)
+    ids, actual, budget = join(actual_ids, actual, budget_ids, budget)
+    return rollup(ids, tree, actual, budget)
+
+
+def _cells(values: np.ndarray) -> list:
+    """Rounded floats, NaN -> None."""
+    return np.where(np.isnan(values), None, values.round(2)).tolist()
+
+
+def rows_payload(r: Rollup) -> List[dict]:
+    actual, budget = r.actual, r.budget
+    variance = actual - budget
+    actual_total, budget_total = actual.sum(axis=1), budget.sum(axis=1)
+    variance_total = actual_total - budget_total
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(budget != 0, variance / np.abs(budget) * 100, np.nan)
+        pct_total = np.where(budget_total != 0, variance_total / np.abs(budget_total) * 100, np.nan)
+    cols = [_cells(m) for m in (actual, budget, variance, pct)]
+    totals = [_cells(t) for t in (actual_total, budget_total, variance_total, pct_total)]
+    out = []
+    for i, node in enumerate(r.nodes):
+        classification = node["classification"]
+        favorable = None
+        if classification in OVER_IS_FAVORABLE:
+            favorable = bool(variance_total[i] >= 0)
+        elif classification in UNDER_IS_FAVORABLE:
+            favorable = bool(variance_total[i] <= 0)
+        out.append(dict(
+            node,
+            actual=cols[0][i], budget=cols[1][i], variance=cols[2][i], variance_pct=cols[3][i],
+            actual_total=totals[0][i], budget_total=totals[1][i], variance_total=totals[2][i],
+            variance_pct_total=totals[3][i], favorable=favorable,
+        ))
+    return out
+
+
+def summary_payload(r: Rollup) -> List[dict]:
+    """Top-level totals per classification (Revenue, Expense...)."""
+    totals: Dict[str, List[float]] = {}
+    for node, a, b in zip(r.nodes, r.actual.sum(axis=1), r.budget.sum(axis=1)):
+        if node["depth"] == 0:
+            t = totals.setdefault(node["classification"] or "Other", [0.0, 0.0])
+            t[0] += a
+            t[1] += b
+    return [
+        {"classification": c, "actual": round(a, 2), "budget": round(b, 2), "variance": round(a - b, 2)}
+        for c, (a, b) in sorted(totals.items())
+    ]
+
+
+def report(conn, budgets_by_client: Dict[int, Optional[dict]], months: List[dt.date],
+           by_client: bool = False) -> dict:
+    """Variance for one or more clients, consolidated; ``by_client`` adds each client's own tree."""
+    rollups = {
+        cid: client_rollup(conn, cid, (b or {}).get("id"), months) for cid, b in budgets_by_client.items()
+    }
+    total = consolidate(list(rollups.values())) if len(rollups) > 1 else next(iter(rollups.values()))
+    payload = {
+        "months": [m.isoformat() for m in months],
+        "summary": summary_payload(total),
+        "rows": rows_payload(total),
+    }
+    if by_client:
+        payload["entities"] = [
+            {"client_id": cid, "has_budget": budgets_by_client[cid] is not None, "rows": rows_payload(r)}
+            for cid, r in rollups.items()
+        ]
+    return payload
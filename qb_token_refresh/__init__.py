@@ -1,10 +1,9 @@
 import os
 import time
-import pyodbc
 import requests
-import azure.functions as func
 from datetime import datetime, timedelta
 from encrypt_qb_token import encrypt_token, decrypt_token  # ✅ shared encryption/decryption
+from qb_app import applog, qb_http, telemetry
 
 
 # === SQL connection with retry ===
@@ -34,7 +33,7 @@ def connect_to_sql(max_retries=3, delay=15):
 def refresh_qb_tokens(realm_id, refresh_token):
     QB_CLIENT_ID = os.getenv("QB_CLIENT_ID")
     QB_CLIENT_SECRET = os.getenv("QB_CLIENT_SECRET")
-    url = "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer"
+    url = qb_http.QB_OAUTH_TOKEN_URL
 
     auth_string = requests.auth._basic_auth_str(QB_CLIENT_ID, QB_CLIENT_SECRET)
     headers = {
@@ -48,7 +47,8 @@ def refresh_qb_tokens(realm_id, refresh_token):
         "refresh_token": refresh_token
     }
 
-    response = requests.post(url, headers=headers, data=data)
+    response = qb_http.post(url, entity="oauth_token", headers=headers, data=data)
+    telemetry.incr("api_calls")
     if response.status_code != 200:
         raise Exception(f"Refresh failed for realm {realm_id}: {response.text}")
     return response.json()
@@ -79,7 +79,10 @@ def update_sql(cursor, client_id, access_token, refresh_token, expires_in):
 
 
 # === Main Azure Function ===
-def main(mytimer: func.TimerRequest) -> None:
+# mytimer is unannotated (binding from function.json) to keep azure.functions
+# out of the web app's imports
+def main(mytimer) -> None:
+    applog.configure()
     utc_timestamp = datetime.utcnow().replace(tzinfo=None)
     print(f"🚀 Starting QuickBooks Token Refresh at {utc_timestamp} UTC")
 
@@ -112,7 +115,9 @@ def main(mytimer: func.TimerRequest) -> None:
 
             conn.commit()
             print(f"✅ Successfully refreshed tokens for realm {client['realm_id']}")
+            telemetry.incr("rows_synced")
         except Exception as e:
+            telemetry.incr("errors")
             print(f"❌ Error refreshing tokens for realm {client['realm_id']}: {e}")
             conn.rollback()
 
@@ -30,4 +30,8 @@ export const updateCompanyUser = (userId, payload) => api.patch(`/api/company/us
 export const updateCompanySettings = (payload) => api.patch("/api/company/settings", payload);
 export const getAuditLog = (params = {}) => api.get("/api/company/audit-log", { params });
 
+// Background jobs (onboarding progress)
+export const getJob = (jobId) => api.get(`/api/integrations/jobs/${jobId}`);
+export const getLatestJobs = (type = "onboarding") => api.get("/api/integrations/jobs", { params: { type } });
+
 export default api;
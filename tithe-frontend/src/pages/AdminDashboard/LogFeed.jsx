@@ -1,20 +1,41 @@
 import { useEffect, useState } from 'react'
 import api from '../../api/api'
 
+const MAX_LINES = 500
+
 export default function LogFeed() {
   const [lines, setLines] = useState([])
 
   useEffect(() => {
     let active = true
-    const load = async () => {
-      try {
-        const res = await api.get('/api/admin/logs')
-        if (active) setLines(res.data?.lines || [])
-      } catch {}
+    let cursor = null // { offset, file_id } from the previous response
+
+    // Long-poll: the server answers as soon as new lines are written
+    // (or after `wait` seconds), so each request only carries new lines.
+    const poll = async () => {
+      while (active) {
+        try {
+          const params = cursor
+            ? { since: cursor.offset, file_id: cursor.file_id || undefined, wait: 25 }
+            : { lines: 100 }
+          const res = await api.get('/api/admin/logs', { params })
+          if (!active) return
+          const data = res.data || {}
+          const incoming = data.lines || []
+          cursor = { offset: data.offset || 0, file_id: data.file_id }
+          if (params.since === undefined) {
+            setLines(incoming)
+          } else if (data.reset || incoming.length) {
+            setLines((prev) => (data.reset ? incoming : [...prev, ...incoming]).slice(-MAX_LINES))
+          }
+        } catch {
+          // Back off on errors (expired token, server restart)
+          await new Promise((r) => setTimeout(r, 15_000))
+        }
+      }
     }
-    load()
-    const id = setInterval(load, 15_000)
-    return () => { active = false; clearInterval(id) }
+    poll()
+    return () => { active = false }
   }, [])
 
   return (
@@ -30,4 +51,3 @@ export default function LogFeed() {
     </div>
   )
 }
-
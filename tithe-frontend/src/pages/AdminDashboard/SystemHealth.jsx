@@ -33,6 +33,8 @@ export default function SystemHealth() {
             <div key={i} className="flex items-center justify-between text-sm">
               <div>{j.name}</div>
               <div className="text-gray-500">next: {j.next_run || '—'}</div>
+              <div className="text-gray-500">last: {j.last_run || '—'}{j.last_status ? ` (${j.last_status})` : ''}</div>
+              <div className="text-gray-500">p50/p95: {j.p50_ms != null ? `${(j.p50_ms / 1000).toFixed(1)}s / ${(j.p95_ms / 1000).toFixed(1)}s` : '—'}</div>
               <div className="text-gray-500">status: {j.status}</div>
             </div>
           )) || <div className="text-sm text-gray-500">No jobs</div>}
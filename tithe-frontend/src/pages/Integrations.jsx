@@ -1,8 +1,31 @@
-import { useCallback, useMemo, useState } from 'react'
-import { getQBAuthUrl } from '../api/api'
+import { useCallback, useEffect, useMemo, useState } from 'react'
+import { getJob, getLatestJobs, getQBAuthUrl } from '../api/api'
 
 export default function Integrations() {
   const [connecting, setConnecting] = useState(false)
+  const [job, setJob] = useState(null)
+
+  // Pick up an onboarding job that is already queued/running
+  useEffect(() => {
+    getLatestJobs('onboarding')
+      .then((res) => {
+        const active = (res.data?.jobs || []).find((j) => j.status === 'queued' || j.status === 'running')
+        if (active) setJob(active)
+      })
+      .catch(() => {})
+  }, [])
+
+  // Poll the job record (cheap primary-key lookup) until it finishes
+  useEffect(() => {
+    if (!job?.job_id || job.status === 'done' || job.status === 'failed') return undefined
+    const id = setTimeout(async () => {
+      try {
+        const res = await getJob(job.job_id)
+        setJob(res.data)
+      } catch {}
+    }, 3_000)
+    return () => clearTimeout(id)
+  }, [job])
 
   const providers = useMemo(() => ([
     { key: 'quickbooks', name: 'QuickBooks', description: 'Connect your QuickBooks account to sync data.' },
@@ -25,7 +48,7 @@ export default function Integrations() {
         if (r.ok) {
           const data = await r.json().catch(() => ({}))
           if (data?.already_onboarded) alert('QuickBooks already onboarded.')
-          else alert('Onboarding started. You can monitor progress in logs.')
+          else if (data?.job_id) setJob({ job_id: data.job_id, status: 'queued', progress: {} })
           return
         }
       } catch {}
@@ -60,6 +83,21 @@ export default function Integrations() {
           Redirecting to QuickBooks…
         </div>
       )}
+      {job && (
+        <div className="rounded-md border border-gray-200 bg-white p-3 text-sm text-gray-700">
+          <div className="font-medium">QuickBooks onboarding: {job.status}</div>
+          {job.progress?.entities_total ? (
+            <div className="mt-1 text-gray-600">
+              {job.progress.entities_done || 0}/{job.progress.entities_total} entities
+              {' · '}{job.progress.rows_written || 0} rows
+              {' · '}{job.progress.pages_fetched || 0} pages
+              {job.progress.current_entity ? ` · ${job.progress.current_entity}` : ''}
+              {job.status === 'running' && job.progress.eta_seconds != null ? ` · ~${Math.ceil(job.progress.eta_seconds)}s left` : ''}
+            </div>
+          ) : null}
+          {job.error && <div className="mt-1 text-red-600">{job.error}</div>}
+        </div>
+      )}
       <div className="grid gap-6 md:grid-cols-3">
         {providers.map((p) => (
           <div key={p.key} className="rounded-lg border bg-white p-6 shadow-sm">